@@ -0,0 +1,197 @@
+import collections
+import logging
+import os
+import threading
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# The most bytes to read from source files in order to estimate how compressible they are, split
+# evenly across source directories, and the most bytes to read from any one file.
+SAMPLE_BYTES = 16 * 1024 * 1024
+SAMPLE_CHUNK_BYTES = 64 * 1024
+
+# The most directory entries to look at within each source directory while looking for files to
+# sample, so that sampling a huge tree doesn't turn into walking all of it.
+MAX_SAMPLED_ENTRIES_PER_SOURCE = 10000
+
+# Estimated compression ratios (compressed size / original size) at or above which data is
+# considered incompressible or only barely compressible.
+INCOMPRESSIBLE_RATIO = 0.95
+BARELY_COMPRESSIBLE_RATIO = 0.8
+
+# Map from CPU budget to the Borg compression to use for compressible data.
+CPU_BUDGET_COMPRESSION = {'low': 'lz4', 'medium': 'zstd,3', 'high': 'zstd,9'}
+DEFAULT_CPU_BUDGET = 'medium'
+
+# Map from (sources, CPU budget, working directory) to the compression chosen for them earlier in
+# this run, so that backing up a configuration file to each of its repositories only samples its
+# sources once. Only read or change this while holding CHOSEN_COMPRESSIONS_LOCK.
+CHOSEN_COMPRESSIONS = {}
+CHOSEN_COMPRESSIONS_LOCK = threading.Lock()
+
+Sample = collections.namedtuple('Sample', ('file_size', 'sample_size', 'compressed_size'))
+
+
+def sample_file(path, file_size):
+    '''
+    Given the path of a regular file and its size, read a chunk of it from the middle (past any
+    header) and return a Sample of how well that chunk compresses. Return None if the file is empty
+    or can't be read.
+    '''
+    try:
+        with open(path, 'rb') as sampled_file:
+            sampled_file.seek(max(0, file_size // 2 - SAMPLE_CHUNK_BYTES // 2))
+            chunk = sampled_file.read(SAMPLE_CHUNK_BYTES)
+    except OSError:
+        return None
+
+    if not chunk:
+        return None
+
+    # zlib's fastest level is a cheap stand-in for Borg's compressors, which aren't available here.
+    return Sample(file_size, len(chunk), len(zlib.compress(chunk, 1)))
+
+
+def sample_source(source, byte_budget):
+    '''
+    Given a source path and the most bytes to read from it, sample regular files within it,
+    starting with those nearest the top, and return a list of Samples.
+    '''
+    try:
+        if os.path.isfile(source):
+            sample = sample_file(source, os.path.getsize(source))
+            return [sample] if sample else []
+    except OSError:
+        return []
+
+    samples = []
+    sampled_bytes = 0
+    seen_entries = 0
+    pending_directories = collections.deque([source])
+
+    while pending_directories and sampled_bytes < byte_budget:
+        try:
+            with os.scandir(pending_directories.popleft()) as scanned_entries:
+                entries = list(scanned_entries)
+        except OSError:
+            continue
+
+        for entry in entries:
+            seen_entries += 1
+            if seen_entries > MAX_SAMPLED_ENTRIES_PER_SOURCE or sampled_bytes >= byte_budget:
+                return samples
+
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    pending_directories.append(entry.path)
+                    continue
+
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+
+                sample = sample_file(entry.path, entry.stat(follow_symlinks=False).st_size)
+            except OSError:
+                continue
+
+            if sample:
+                samples.append(sample)
+                sampled_bytes += sample.sample_size
+
+    return samples
+
+
+def estimate_compression_ratio(sources, working_directory=None):
+    '''
+    Given a sequence of source paths and an optional working directory that relative source paths
+    are relative to, sample files across the sources and return an estimate of their overall
+    compression ratio (compressed size / original size), weighting each sampled file by its size.
+    Return None if there's nothing to sample.
+    '''
+    if not sources:
+        return None
+
+    byte_budget = SAMPLE_BYTES // len(sources)
+    samples = [
+        sample
+        for source in sources
+        for sample in sample_source(os.path.join(working_directory or '', source), byte_budget)
+    ]
+    total_size = sum(sample.file_size for sample in samples)
+
+    if not total_size:
+        return None
+
+    return (
+        sum(sample.file_size * sample.compressed_size / sample.sample_size for sample in samples)
+        / total_size
+    )
+
+
+def choose_compression(sources, cpu_budget=None, working_directory=None, log_prefix=''):
+    '''
+    Given a sequence of source paths, a CPU budget ("low", "medium", or "high", defaulting to
+    medium), an optional working directory that relative source paths are relative to, and a prefix
+    to use in log entries, estimate how compressible the sources are and return a Borg compression
+    setting suited to them: "none" for incompressible data, "lz4" for barely compressible data, and
+    otherwise the compression for the CPU budget. Return None if there's nothing to sample, so
+    Borg's default gets used.
+
+    Raise ValueError if the CPU budget is unknown.
+    '''
+    try:
+        budget_compression = CPU_BUDGET_COMPRESSION[cpu_budget or DEFAULT_CPU_BUDGET]
+    except KeyError:
+        raise ValueError('Unknown compression CPU budget: {}'.format(cpu_budget))
+
+    ratio = estimate_compression_ratio(sources, working_directory)
+
+    if ratio is None:
+        logger.debug(
+            '{}: No source files to sample for compression; using Borg default'.format(log_prefix)
+        )
+        return None
+
+    if ratio >= INCOMPRESSIBLE_RATIO:
+        compression = 'none'
+    elif ratio >= BARELY_COMPRESSIBLE_RATIO:
+        compression = 'lz4'
+    else:
+        compression = budget_compression
+
+    logger.info(
+        '{}: Using compression {} for sources estimated to compress to {:.0%} of their size'.format(
+            log_prefix, compression, ratio
+        )
+    )
+
+    return compression
+
+
+def choose_compression_once(sources, cpu_budget=None, working_directory=None, log_prefix=''):
+    '''
+    Given the same arguments as choose_compression(), return the compression that it chooses. But
+    if a compression has already been chosen for the same sources, CPU budget, and working directory
+    earlier in this run (e.g. for another repository of the same configuration file), then reuse it
+    rather than sampling the sources again.
+
+    Raise ValueError if the CPU budget is unknown.
+    '''
+    key = (tuple(sources), cpu_budget, working_directory)
+
+    # Hold the lock while choosing, so that repositories backed up concurrently wait for the first
+    # one's choice rather than all sampling the same sources at once.
+    with CHOSEN_COMPRESSIONS_LOCK:
+        if key in CHOSEN_COMPRESSIONS:
+            compression = CHOSEN_COMPRESSIONS[key]
+            logger.debug(
+                '{}: Using compression {} chosen earlier in this run'.format(
+                    log_prefix, compression or 'default'
+                )
+            )
+            return compression
+
+        compression = choose_compression(sources, cpu_budget, working_directory, log_prefix)
+        CHOSEN_COMPRESSIONS[key] = compression
+
+        return compression
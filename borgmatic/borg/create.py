@@ -1,15 +1,146 @@
+import concurrent.futures
+import fnmatch
 import glob
 import itertools
 import logging
 import os
 import pathlib
+import sys
 import tempfile
+import threading
+import time
 
-from borgmatic.borg import feature
+from borgmatic.borg import compression as borg_compression
+from borgmatic.borg import environment, feature
+from borgmatic.borg import progress as borg_progress
+from borgmatic.borg import source_snapshot
 from borgmatic.execute import DO_NOT_CAPTURE, execute_command, execute_command_with_processes
 
 logger = logging.getLogger(__name__)
 
+# Map from an expanded glob pattern to a tuple of (a map from each directory read while expanding
+# the pattern to that directory's modification time at the time, and the resulting paths), for
+# globs that have been expanded during this run. A cached expansion is only reused if none of those
+# directories has changed since.
+GLOB_CACHE = {}
+GLOB_CACHE_LOCK = threading.Lock()
+
+# Don't cache a glob expansion if any of the directories it read were modified this recently before
+# reading them, because a filesystem with coarse timestamps could modify such a directory again
+# without changing its modification time.
+RACY_MODIFICATION_SECONDS = 2
+
+
+def directory_modification_time(directory):
+    '''
+    Given a directory path, return its modification time in nanoseconds, or None if it can't be
+    stat-ed (e.g. because it doesn't exist).
+    '''
+    try:
+        return os.stat(directory).st_mtime_ns
+    except OSError:
+        return None
+
+
+def read_directory(directory, directories_only=False):
+    '''
+    Given a directory path and whether to only include subdirectories, return a list of the names
+    of the entries in that directory. Return an empty list if the directory can't be read.
+    '''
+    try:
+        with os.scandir(directory) as entries:
+            return [entry.name for entry in entries if not directories_only or entry.is_dir()]
+    except OSError:
+        return []
+
+
+def scan_glob(pattern, directories_only=False):
+    '''
+    Given a glob pattern and whether to only match directories, expand the pattern the same way
+    that glob.glob() does, by reading each directory along the way with os.scandir(). Return a tuple
+    of (a map from each directory read to its modification time, and a list of the resulting
+    paths).
+    '''
+    (head, tail) = os.path.split(pattern)
+
+    if glob.has_magic(head):
+        (directory_modification_times, parents) = scan_glob(head, directories_only=True)
+    else:
+        (directory_modification_times, parents) = ({}, [head])
+
+    paths = []
+
+    for parent in parents:
+        directory = parent or os.curdir
+
+        # Get the modification time before reading the directory, so that any change made while
+        # it's being read invalidates the cached expansion.
+        directory_modification_times[directory] = directory_modification_time(directory)
+
+        if glob.has_magic(tail):
+            names = read_directory(directory, directories_only)
+
+            # Like glob.glob(), only match hidden files if the pattern explicitly starts with a dot.
+            if not tail.startswith('.'):
+                names = [name for name in names if not name.startswith('.')]
+
+            paths.extend(os.path.join(parent, name) for name in fnmatch.filter(names, tail))
+        elif tail:
+            if os.path.lexists(os.path.join(parent, tail)):
+                paths.append(os.path.join(parent, tail))
+        # A pattern ending with a slash (and therefore an empty tail) only matches directories.
+        elif os.path.isdir(directory):
+            paths.append(os.path.join(parent, tail))
+
+    return (directory_modification_times, paths)
+
+
+def cached_glob(pattern):
+    '''
+    Given a glob pattern, expand it and return a list of the resulting paths. Reuse the expansion
+    from earlier in this run if none of the directories read to expand it have been modified since,
+    as reading large directories can be slow (e.g. over NFS).
+    '''
+    with GLOB_CACHE_LOCK:
+        cached = GLOB_CACHE.get(pattern)
+
+    if cached:
+        (directory_modification_times, paths) = cached
+
+        if all(
+            directory_modification_time(directory) == modification_time
+            for directory, modification_time in directory_modification_times.items()
+        ):
+            return list(paths)
+
+    scan_time_ns = time.time_ns()
+    (directory_modification_times, paths) = scan_glob(pattern)
+
+    if all(
+        modification_time is None
+        or modification_time < scan_time_ns - RACY_MODIFICATION_SECONDS * 1000000000
+        for modification_time in directory_modification_times.values()
+    ):
+        with GLOB_CACHE_LOCK:
+            GLOB_CACHE[pattern] = (directory_modification_times, tuple(paths))
+
+    return paths
+
+
+def map_concurrently(function, items, concurrency):
+    '''
+    Given a function, a sequence of items, and the maximum number of items to call the function on
+    at once, call the function on each item and return a list of the results in the same order as
+    the items. With a concurrency of 1, don't bother starting any threads.
+    '''
+    if concurrency <= 1 or len(items) <= 1:
+        return [function(item) for item in items]
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(concurrency, len(items))
+    ) as executor:
+        return list(executor.map(function, items))
+
 
 def expand_directory(directory):
     '''
@@ -18,19 +149,24 @@ def expand_directory(directory):
     '''
     expanded_directory = os.path.expanduser(directory)
 
-    return glob.glob(expanded_directory) or [expanded_directory]
+    if not glob.has_magic(expanded_directory):
+        return [expanded_directory]
+
+    return cached_glob(expanded_directory) or [expanded_directory]
 
 
-def expand_directories(directories):
+def expand_directories(directories, concurrency=1):
     '''
-    Given a sequence of directory paths, expand tildes and globs in each one. Return all the
-    resulting directories as a single flattened tuple.
+    Given a sequence of directory paths and the maximum number of them to expand at once, expand
+    tildes and globs in each one. Return all the resulting directories as a single flattened tuple.
     '''
     if directories is None:
         return ()
 
     return tuple(
-        itertools.chain.from_iterable(expand_directory(directory) for directory in directories)
+        itertools.chain.from_iterable(
+            map_concurrently(expand_directory, tuple(directories), concurrency)
+        )
     )
 
 
@@ -45,18 +181,29 @@ def expand_home_directories(directories):
     return tuple(os.path.expanduser(directory) for directory in directories)
 
 
-def map_directories_to_devices(directories):
+def get_device(directory):
+    '''
+    Given a directory path, return an identifier for the device on which it resides, or None if the
+    path doesn't exist.
+    '''
+    try:
+        return os.stat(directory).st_dev
+    except OSError:
+        return None
+
+
+def map_directories_to_devices(directories, concurrency=1):
     '''
-    Given a sequence of directories, return a map from directory to an identifier for the device on
-    which that directory resides or None if the path doesn't exist.
+    Given a sequence of directories and the maximum number of them to stat at once, return a map
+    from directory to an identifier for the device on which that directory resides or None if the
+    path doesn't exist.
 
     This is handy for determining whether two different directories are on the same filesystem (have
     the same device identifier).
     '''
-    return {
-        directory: os.stat(directory).st_dev if os.path.exists(directory) else None
-        for directory in directories
-    }
+    directories = tuple(directories)
+
+    return dict(zip(directories, map_concurrently(get_device, directories, concurrency)))
 
 
 def deduplicate_directories(directory_devices):
@@ -75,25 +222,31 @@ def deduplicate_directories(directory_devices):
     even hangs, e.g. when a database hook is using a named pipe for streaming database dumps to
     Borg.
     '''
+    # The path components and device of each given directory. Looking up each directory's parents
+    # in this set takes time proportional to the number of directories times their depth, rather
+    # than comparing every directory to every other.
+    directory_paths = {directory: pathlib.PurePath(directory) for directory in directory_devices}
+    parts_devices = {
+        (path.parts, directory_devices[directory]) for directory, path in directory_paths.items()
+    }
+
     deduplicated = set()
-    directories = sorted(directory_devices.keys())
 
-    for directory in directories:
-        deduplicated.add(directory)
-        parents = pathlib.PurePath(directory).parents
+    for directory, path in directory_paths.items():
+        device = directory_devices[directory]
+        parts = path.parts
 
         # If another directory in the given list is a parent of current directory (even n levels
         # up) and both are on the same filesystem, then the current directory is a duplicate.
-        for other_directory in directories:
-            for parent in parents:
-                if (
-                    pathlib.PurePath(other_directory) == parent
-                    and directory_devices[directory] is not None
-                    and directory_devices[other_directory] == directory_devices[directory]
-                ):
-                    if directory in deduplicated:
-                        deduplicated.remove(directory)
-                    break
+        if device is not None and any(
+            (parts[:length], device) in parts_devices
+            # An absolute path's parents all include its anchor (e.g. "/"), while a relative path's
+            # parents end with ".", which has no parts at all.
+            for length in range(1 if path.anchor else 0, len(parts))
+        ):
+            continue
+
+        deduplicated.add(directory)
 
     return tuple(sorted(deduplicated))
 
@@ -208,6 +361,8 @@ def create_archive(
     json=False,
     files=False,
     stream_processes=None,
+    progress_callback=None,
+    json_stats=False,
 ):
     '''
     Given vebosity/dry-run flags, a local or remote repository path, a location config dict, and a
@@ -215,13 +370,23 @@ def create_archive(
 
     If a sequence of stream processes is given (instances of subprocess.Popen), then execute the
     create command while also triggering the given processes to produce output.
+
+    If progress is requested but borgmatic isn't running in a terminal (e.g. from cron), then log
+    Borg's progress periodically instead of displaying it, and also call any given progress
+    callback with a borgmatic.borg.progress.Progress instance periodically.
+
+    If JSON stats are requested, then also return Borg's JSON output (e.g. for recording archive
+    stats), but without otherwise changing what Borg logs the way that requesting JSON output does.
     '''
+    source_directories_concurrency = location_config.get('source_directories_concurrency', 1)
     sources = deduplicate_directories(
         map_directories_to_devices(
             expand_directories(
                 location_config['source_directories']
-                + borgmatic_source_directories(location_config.get('borgmatic_source_directory'))
-            )
+                + borgmatic_source_directories(location_config.get('borgmatic_source_directory')),
+                source_directories_concurrency,
+            ),
+            source_directories_concurrency,
         )
     )
 
@@ -229,6 +394,37 @@ def create_archive(
         working_directory = os.path.expanduser(location_config.get('working_directory'))
     except TypeError:
         working_directory = None
+
+    # Borg can't be skipped while streaming database dumps, as the dump processes would then wait
+    # forever on their named pipes.
+    skip_if_unchanged = bool(
+        location_config.get('skip_create_if_unchanged') and not stream_processes
+    )
+
+    if skip_if_unchanged:
+        snapshot_path = source_snapshot.make_snapshot_path(
+            repository, location_config, storage_config
+        )
+        snapshot = source_snapshot.take_snapshot(
+            sources,
+            expand_home_directories(location_config.get('exclude_patterns')),
+            expand_home_directories(
+                [
+                    location_config.get('borgmatic_source_directory')
+                    or DEFAULT_BORGMATIC_SOURCE_DIRECTORY
+                ]
+            ),
+            working_directory,
+        )
+
+        if snapshot == source_snapshot.read_snapshot(snapshot_path):
+            logger.info(
+                '{}: Skipping archive creation, as sources are unchanged since last archive'.format(
+                    repository
+                )
+            )
+            return None
+
     pattern_file = write_pattern_file(location_config.get('patterns'))
     exclude_file = write_pattern_file(
         expand_home_directories(location_config.get('exclude_patterns'))
@@ -236,6 +432,10 @@ def create_archive(
     checkpoint_interval = storage_config.get('checkpoint_interval', None)
     chunker_params = storage_config.get('chunker_params', None)
     compression = storage_config.get('compression', None)
+    if compression == 'auto':
+        compression = borg_compression.choose_compression_once(
+            sources, storage_config.get('compression_cpu_budget'), working_directory, repository
+        )
     remote_rate_limit = storage_config.get('remote_rate_limit', None)
     umask = storage_config.get('umask', None)
     lock_wait = storage_config.get('lock_wait', None)
@@ -243,6 +443,10 @@ def create_archive(
     archive_name_format = storage_config.get('archive_name_format', DEFAULT_ARCHIVE_NAME_FORMAT)
     extra_borg_options = storage_config.get('extra_borg_options', {}).get('create', '')
 
+    # Borg's progress display needs a terminal. Elsewhere, have Borg report progress as JSON
+    # instead, so that borgmatic can log it and pass it on.
+    structured_progress = bool(progress and not json and not sys.stderr.isatty())
+
     if feature.available(feature.Feature.ATIME, local_borg_version):
         atime_flags = ('--atime',) if location_config.get('atime') is True else ()
     else:
@@ -299,7 +503,8 @@ def create_archive(
         + (('--debug', '--show-rc') if logger.isEnabledFor(logging.DEBUG) and not json else ())
         + (('--dry-run',) if dry_run else ())
         + (('--progress',) if progress else ())
-        + (('--json',) if json else ())
+        + (('--log-json',) if structured_progress else ())
+        + (('--json',) if json or json_stats else ())
         + (tuple(extra_borg_options.split(' ')) if extra_borg_options else ())
         + (
             '{repository}::{archive_name_format}'.format(
@@ -316,24 +521,62 @@ def create_archive(
     else:
         output_log_level = logging.INFO
 
+    # With JSON stats requested, capture Borg's JSON from stdout in a temporary file, so its stderr
+    # still gets logged as usual.
+    json_stats_file = tempfile.TemporaryFile() if json_stats and not json else None
+
     # The progress output isn't compatible with captured and logged output, as progress messes with
     # the terminal directly.
-    output_file = DO_NOT_CAPTURE if progress else None
+    if json_stats_file:
+        output_file = json_stats_file
+    elif progress and not structured_progress:
+        output_file = DO_NOT_CAPTURE
+    else:
+        output_file = None
+
+    if structured_progress:
+        totals_path = borg_progress.make_totals_path(
+            repository, location_config.get('source_directories')
+        )
+        progress_tracker = borg_progress.Progress_tracker(
+            repository, borg_progress.read_totals(totals_path), progress_callback
+        )
+    else:
+        progress_tracker = None
+
+    borg_environment = environment.make_environment(storage_config)
 
     if stream_processes:
-        return execute_command_with_processes(
+        output = execute_command_with_processes(
             full_command,
             stream_processes,
             output_log_level,
             output_file,
             borg_local_path=local_path,
             working_directory=working_directory,
+            extra_environment=borg_environment,
+            output_line_handler=progress_tracker.handle_line if progress_tracker else None,
+        )
+    else:
+        output = execute_command(
+            full_command,
+            output_log_level,
+            output_file,
+            borg_local_path=local_path,
+            working_directory=working_directory,
+            extra_environment=borg_environment,
+            output_line_handler=progress_tracker.handle_line if progress_tracker else None,
         )
 
-    return execute_command(
-        full_command,
-        output_log_level,
-        output_file,
-        borg_local_path=local_path,
-        working_directory=working_directory,
-    )
+    if skip_if_unchanged and not dry_run:
+        source_snapshot.write_snapshot(snapshot_path, snapshot)
+
+    if progress_tracker and progress_tracker.finished and not dry_run:
+        borg_progress.write_totals(totals_path, progress_tracker.totals())
+
+    if json_stats_file:
+        with json_stats_file:
+            json_stats_file.seek(0)
+            return json_stats_file.read().decode()
+
+    return output
@@ -1,3 +1,4 @@
+import functools
 from enum import Enum
 
 from pkg_resources import parse_version
@@ -20,9 +21,18 @@ FEATURE_TO_MINIMUM_BORG_VERSION = {
 }
 
 
+@functools.lru_cache(maxsize=None)
+def parse_borg_version(borg_version):
+    '''
+    Given a Borg version string, return it parsed into a comparable version object. Cache the
+    result, as the same version gets parsed for every feature check.
+    '''
+    return parse_version(borg_version)
+
+
 def available(feature, borg_version):
     '''
     Given a Borg Feature constant and a Borg version string, return whether that feature is
     available in that version of Borg.
     '''
-    return FEATURE_TO_MINIMUM_BORG_VERSION[feature] <= parse_version(borg_version)
+    return FEATURE_TO_MINIMUM_BORG_VERSION[feature] <= parse_borg_version(borg_version)
@@ -1,6 +1,7 @@
 import logging
 import subprocess
 
+from borgmatic.borg import environment
 from borgmatic.execute import DO_NOT_CAPTURE, execute_command
 
 logger = logging.getLogger(__name__)
@@ -31,9 +32,10 @@ def initialize_repository(
         + (repository,)
     )
     logger.debug(' '.join(info_command))
+    borg_environment = environment.make_environment(storage_config)
 
     try:
-        execute_command(info_command, output_log_level=None)
+        execute_command(info_command, output_log_level=None, extra_environment=borg_environment)
         logger.info('Repository already exists. Skipping initialization.')
         return
     except subprocess.CalledProcessError as error:
@@ -55,4 +57,9 @@ def initialize_repository(
     )
 
     # Do not capture output here, so as to support interactive prompts.
-    execute_command(init_command, output_file=DO_NOT_CAPTURE, borg_local_path=local_path)
+    execute_command(
+        init_command,
+        output_file=DO_NOT_CAPTURE,
+        borg_local_path=local_path,
+        extra_environment=borg_environment,
+    )
@@ -0,0 +1,239 @@
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from borgmatic.borg import source_snapshot
+
+logger = logging.getLogger(__name__)
+
+# The least time between logging progress and between reporting it to monitoring hooks, in seconds
+# of Borg's own event times.
+LOG_INTERVAL_SECONDS = 10
+MONITOR_INTERVAL_SECONDS = 300
+
+Progress = collections.namedtuple(
+    'Progress',
+    (
+        'original_size',
+        'compressed_size',
+        'deduplicated_size',
+        'file_count',
+        'path',
+        'elapsed_seconds',
+        'bytes_per_second',
+        'files_per_second',
+        'eta_seconds',
+    ),
+)
+
+
+def make_totals_path(repository, source_directories):
+    '''
+    Given a repository path and a sequence of configured source directories, return the path of the
+    file recording the totals of the last archive created from those sources in that repository.
+    '''
+    fingerprint = hashlib.sha256(
+        json.dumps([repository, list(source_directories or ())]).encode()
+    ).hexdigest()
+
+    return os.path.join(
+        source_snapshot.get_state_directory(), 'create_totals', '{}.json'.format(fingerprint)
+    )
+
+
+def read_totals(totals_path):
+    '''
+    Given the path of a totals file, return the dict of totals it contains, or None if the file
+    doesn't exist or can't be read.
+    '''
+    try:
+        with open(totals_path) as totals_file:
+            totals = json.load(totals_file)
+    except (OSError, ValueError):
+        return None
+
+    return totals if isinstance(totals, dict) else None
+
+
+def write_totals(totals_path, totals):
+    '''
+    Given the path of a totals file and a dict of totals, write the totals to the file atomically.
+
+    Failing to write the totals isn't an error, as it only means that the next archive's progress
+    won't have an ETA.
+    '''
+    temporary_filename = None
+
+    try:
+        os.makedirs(os.path.dirname(totals_path), mode=0o700, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(totals_path), suffix='.tmp', delete=False
+        ) as temporary_file:
+            temporary_filename = temporary_file.name
+            json.dump(totals, temporary_file)
+
+        os.replace(temporary_filename, totals_path)
+    except OSError as error:
+        logger.debug('Cannot write archive totals {}: {}'.format(totals_path, error))
+
+        if temporary_filename and os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+
+
+def format_size(byte_count):
+    '''
+    Given a number of bytes, return it as a human-readable string with a binary unit.
+    '''
+    for unit in ('B', 'KiB', 'MiB', 'GiB', 'TiB'):
+        if abs(byte_count) < 1024:
+            break
+
+        byte_count /= 1024
+    else:
+        unit = 'PiB'
+
+    return '{:.1f} {}'.format(byte_count, unit) if unit != 'B' else '{} B'.format(int(byte_count))
+
+
+def format_progress(progress):
+    '''
+    Given a Progress, return a one-line human-readable summary of it.
+    '''
+    return 'Progress: {} in {} files at {}/s, {:.1f} files/s, ETA {}{}'.format(
+        format_size(progress.original_size),
+        progress.file_count,
+        format_size(progress.bytes_per_second),
+        progress.files_per_second,
+        'unknown'
+        if progress.eta_seconds is None
+        else datetime.timedelta(seconds=round(progress.eta_seconds)),
+        ': {}'.format(progress.path) if progress.path else '',
+    )
+
+
+def estimate_eta_seconds(original_size, bytes_per_second, previous_totals):
+    '''
+    Given the number of source bytes processed so far, the rate they're being processed at, and a
+    dict of the totals of the previous archive (or None), return the estimated number of seconds
+    until the archive is done, or None if there's no way to tell.
+    '''
+    previous_size = (previous_totals or {}).get('original_size')
+
+    if not previous_size or not bytes_per_second or original_size > previous_size:
+        return None
+
+    return (previous_size - original_size) / bytes_per_second
+
+
+class Progress_tracker:
+    '''
+    A consumer of "borg create --log-json --progress" output lines that turns Borg's
+    "archive_progress" events into Progress instances, logs them at a throttled rate, and reports
+    them to an optional callback at a slower throttled rate (e.g. for monitoring hooks). Borg's
+    other JSON output gets translated back into the plain text that Borg would otherwise print.
+    '''
+
+    def __init__(self, log_prefix, previous_totals=None, progress_callback=None, start_time=None):
+        self.log_prefix = log_prefix
+        self.previous_totals = previous_totals
+        self.progress_callback = progress_callback
+        self.start_time = time.time() if start_time is None else start_time
+        self.last_log_time = None
+        self.last_callback_time = None
+        self.latest = None
+        self.finished = False
+
+    def handle_line(self, line):
+        '''
+        Given a line of Borg output, consume any progress event in it and return the text to log
+        for it instead, or None if there's nothing to log.
+        '''
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return line
+
+        if not isinstance(event, dict):
+            return line
+
+        event_type = event.get('type')
+
+        if event_type == 'archive_progress':
+            self.update(event)
+            return None
+
+        if event_type == 'log_message':
+            return event.get('message')
+
+        if event_type == 'file_status':
+            return '{} {}'.format(event.get('status'), event.get('path'))
+
+        if event_type in ('progress_message', 'progress_percent'):
+            return None
+
+        return line
+
+    def update(self, event):
+        '''
+        Given a Borg "archive_progress" event as a dict, update the latest Progress from it, and log
+        and report the progress if it's been long enough since the last time.
+        '''
+        if event.get('finished'):
+            self.finished = True
+
+            if self.latest:
+                logger.info('{}: {}'.format(self.log_prefix, format_progress(self.latest)))
+
+            return
+
+        event_time = event.get('time') or time.time()
+        elapsed_seconds = max(event_time - self.start_time, 0)
+        original_size = event.get('original_size', 0)
+        file_count = event.get('nfiles', 0)
+        bytes_per_second = original_size / elapsed_seconds if elapsed_seconds else 0
+        self.latest = Progress(
+            original_size=original_size,
+            compressed_size=event.get('compressed_size', 0),
+            deduplicated_size=event.get('deduplicated_size', 0),
+            file_count=file_count,
+            path=event.get('path'),
+            elapsed_seconds=elapsed_seconds,
+            bytes_per_second=bytes_per_second,
+            files_per_second=file_count / elapsed_seconds if elapsed_seconds else 0,
+            eta_seconds=estimate_eta_seconds(original_size, bytes_per_second, self.previous_totals),
+        )
+
+        if self.last_log_time is None or event_time - self.last_log_time >= LOG_INTERVAL_SECONDS:
+            self.last_log_time = event_time
+            logger.info('{}: {}'.format(self.log_prefix, format_progress(self.latest)))
+
+        if not self.progress_callback:
+            return
+
+        if (
+            self.last_callback_time is None
+            or event_time - self.last_callback_time >= MONITOR_INTERVAL_SECONDS
+        ):
+            self.last_callback_time = event_time
+
+            # A monitoring hassle shouldn't interrupt the backup it's monitoring.
+            try:
+                self.progress_callback(self.latest)
+            except (OSError, ValueError) as error:
+                logger.warning('{}: Error reporting progress: {}'.format(self.log_prefix, error))
+
+    def totals(self):
+        '''
+        Return a dict of the totals of the archive as of the latest progress, suitable for writing
+        with write_totals(), or None if there hasn't been any progress.
+        '''
+        if not self.latest:
+            return None
+
+        return {'original_size': self.latest.original_size, 'file_count': self.latest.file_count}
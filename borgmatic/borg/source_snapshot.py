@@ -0,0 +1,216 @@
+import fnmatch
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_CHUNK_SIZE = 1024 * 1024
+
+# Matches the style prefix of a Borg pattern, like "fm:" or "re:".
+PATTERN_STYLE_PREFIX = re.compile(r'^[a-z]{2}:')
+
+
+def get_state_directory():
+    '''
+    Based on the value of the XDG_STATE_HOME and HOME environment variables, return the directory
+    where borgmatic keeps state across runs.
+    '''
+    state_directory = os.getenv('XDG_STATE_HOME') or os.path.join(
+        os.path.expanduser('~'), '.local', 'state'
+    )
+
+    return os.path.join(state_directory, 'borgmatic')
+
+
+def make_snapshot_path(repository, location_config, storage_config):
+    '''
+    Given a repository path, a location config dict, and a storage config dict, return the path of
+    the file containing the source snapshot taken for the last archive created with them. The
+    filename is a hash of all of these, so that any configuration change (e.g. to exclude patterns
+    or compression) results in a new archive rather than a skipped one.
+    '''
+    fingerprint = hashlib.sha256(
+        json.dumps(
+            [repository, location_config, storage_config], sort_keys=True, default=str
+        ).encode()
+    ).hexdigest()
+
+    return os.path.join(get_state_directory(), 'source_snapshots', '{}.json'.format(fingerprint))
+
+
+def excluded(path, exclude_patterns):
+    '''
+    Given a path and a sequence of Borg exclude patterns, return whether the path matches any of the
+    patterns in the styles supported here: fnmatch (Borg's default style, with or without an "fm:"
+    prefix) and path prefix ("pp:"). Patterns of any other style never match, which at worst means
+    that a snapshot covers more paths than Borg actually backs up.
+    '''
+    for pattern in exclude_patterns:
+        if pattern.startswith('pp:'):
+            prefix = PATTERN_STYLE_PREFIX.sub('', pattern, count=1).rstrip(os.path.sep)
+
+            if path == prefix or path.startswith(prefix + os.path.sep):
+                return True
+        elif pattern.startswith('fm:') or not PATTERN_STYLE_PREFIX.match(pattern):
+            if fnmatch.fnmatchcase(
+                path.lstrip(os.path.sep),
+                PATTERN_STYLE_PREFIX.sub('', pattern, count=1).lstrip(os.path.sep),
+            ):
+                return True
+
+    return False
+
+
+def checksum_file(path):
+    '''
+    Given the path of a regular file, return a hex SHA-256 digest of its contents, or None if it
+    can't be read.
+    '''
+    digest = hashlib.sha256()
+
+    try:
+        with open(path, 'rb') as checksummed_file:
+            for chunk in iter(lambda: checksummed_file.read(CHECKSUM_CHUNK_SIZE), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+
+    return digest.hexdigest()
+
+
+def snapshot_source(source, exclude_patterns, checksum_directories, skip_directories):
+    '''
+    Given a source path, a sequence of Borg exclude patterns, a set of directories whose files to
+    checksum rather than stat, and a set of directories to leave out entirely, walk the source
+    without following symlinks and return a dict summarizing it: the maximum modification and
+    status change times of its paths, the number of paths, the number of paths that couldn't be
+    read, and a checksum of the contents of the files in any checksum directories. Return None if
+    the source doesn't exist.
+
+    Checksum directories are for database dumps, which get rewritten from scratch for every backup
+    and so always have new times even when their contents haven't changed.
+    '''
+    try:
+        source_stat = os.lstat(source)
+    except OSError:
+        return None
+
+    checksummed_source = source in checksum_directories
+    summary = {
+        'max_mtime_ns': 0 if checksummed_source else source_stat.st_mtime_ns,
+        'max_ctime_ns': 0 if checksummed_source else source_stat.st_ctime_ns,
+        'paths': 1,
+        'unreadable_paths': 0,
+    }
+    file_checksums = []
+    pending_directories = [(source, checksummed_source)]
+
+    while pending_directories:
+        (directory, checksummed) = pending_directories.pop()
+
+        try:
+            with os.scandir(directory) as scanned_entries:
+                entries = list(scanned_entries)
+        except OSError:
+            summary['unreadable_paths'] += 1
+            continue
+
+        for entry in entries:
+            if entry.path in skip_directories or excluded(entry.path, exclude_patterns):
+                continue
+
+            summary['paths'] += 1
+
+            try:
+                is_directory = entry.is_dir(follow_symlinks=False)
+
+                if checksummed:
+                    if entry.is_file(follow_symlinks=False):
+                        file_checksums.append((entry.path, checksum_file(entry.path)))
+                else:
+                    entry_stat = entry.stat(follow_symlinks=False)
+                    summary['max_mtime_ns'] = max(summary['max_mtime_ns'], entry_stat.st_mtime_ns)
+                    summary['max_ctime_ns'] = max(summary['max_ctime_ns'], entry_stat.st_ctime_ns)
+            except OSError:
+                summary['unreadable_paths'] += 1
+                continue
+
+            if is_directory:
+                pending_directories.append(
+                    (entry.path, checksummed or entry.path in checksum_directories)
+                )
+
+    summary['checksum'] = (
+        hashlib.sha256(json.dumps(sorted(file_checksums)).encode()).hexdigest()
+        if file_checksums
+        else None
+    )
+
+    return summary
+
+
+def take_snapshot(sources, exclude_patterns, checksum_directories, working_directory=None):
+    '''
+    Given a sequence of source paths, a sequence of Borg exclude patterns, a sequence of
+    directories whose files to checksum rather than stat (e.g. database dump directories), and an
+    optional working directory that relative source paths are relative to, return a snapshot of the
+    sources as a dict from source path to its summary as returned by snapshot_source().
+
+    borgmatic's own state directory gets left out of the snapshot, as writing the snapshot there
+    would otherwise change it.
+    '''
+    skip_directories = {get_state_directory()}
+    checksum_directories = set(checksum_directories)
+
+    return {
+        source: snapshot_source(
+            os.path.join(working_directory or '', source),
+            exclude_patterns,
+            checksum_directories,
+            skip_directories,
+        )
+        for source in sources
+    }
+
+
+def read_snapshot(snapshot_path):
+    '''
+    Given the path of a source snapshot file, return the snapshot it contains, or None if the file
+    doesn't exist or can't be read.
+    '''
+    try:
+        with open(snapshot_path) as snapshot_file:
+            return json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+
+def write_snapshot(snapshot_path, snapshot):
+    '''
+    Given the path of a source snapshot file and a snapshot, write the snapshot to the file
+    atomically.
+
+    Failing to write the snapshot isn't an error, as it only means that the next archive won't get
+    skipped.
+    '''
+    temporary_filename = None
+
+    try:
+        os.makedirs(os.path.dirname(snapshot_path), mode=0o700, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(snapshot_path), suffix='.tmp', delete=False
+        ) as temporary_file:
+            temporary_filename = temporary_file.name
+            json.dump(snapshot, temporary_file)
+
+        os.replace(temporary_filename, snapshot_path)
+    except OSError as error:
+        logger.warning('Cannot write source snapshot {}: {}'.format(snapshot_path, error))
+
+        if temporary_filename and os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
@@ -1,25 +1,179 @@
+import json
 import logging
+import os
+import shutil
+import tempfile
+import threading
 
+from borgmatic.borg import environment
 from borgmatic.execute import execute_command
 
 logger = logging.getLogger(__name__)
 
+# Map from resolved Borg binary path to a dict of its identity and version, for binaries whose
+# versions have been looked up during this run. This has the same format as the on-disk cache.
+CACHED_VERSIONS = {}
+CACHED_VERSIONS_LOCK = threading.Lock()
 
-def local_borg_version(local_path='borg'):
+
+def get_version_cache_path():
+    '''
+    Based on the value of the XDG_CACHE_HOME and HOME environment variables, return the path of the
+    file that caches Borg versions across borgmatic runs.
     '''
-    Given a local Borg binary path, return a version string for it.
+    cache_directory = os.getenv('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
 
-    Raise OSError or CalledProcessError if there is a problem running Borg.
-    Raise ValueError if the version cannot be parsed.
+    return os.path.join(cache_directory, 'borgmatic', 'borg_versions.json')
+
+
+def binary_identity(local_path):
+    '''
+    Given a local Borg binary path, return a tuple of its resolved path and a dict of its inode,
+    size, and modification time, which together identify that particular binary so that a cached
+    version gets discarded when Borg gets upgraded. Return (None, None) if the binary can't be
+    found.
     '''
-    full_command = (
-        (local_path, '--version')
-        + (('--info',) if logger.getEffectiveLevel() == logging.INFO else ())
-        + (('--debug', '--show-rc') if logger.isEnabledFor(logging.DEBUG) else ())
+    binary_path = shutil.which(local_path)
+    if not binary_path:
+        return (None, None)
+
+    binary_path = os.path.realpath(binary_path)
+
+    try:
+        binary_stat = os.stat(binary_path)
+    except OSError:
+        return (None, None)
+
+    return (
+        binary_path,
+        {
+            'inode': binary_stat.st_ino,
+            'size': binary_stat.st_size,
+            'mtime_ns': binary_stat.st_mtime_ns,
+        },
     )
-    output = execute_command(full_command, output_log_level=None, borg_local_path=local_path)
+
+
+def read_version_cache(cache_path):
+    '''
+    Given the path of the Borg version cache file, return its contents as a dict from resolved Borg
+    binary path to a dict of that binary's identity and version. Return an empty dict if the cache
+    file doesn't exist or can't be read.
+    '''
+    try:
+        with open(cache_path) as cache_file:
+            cached_versions = json.load(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+    return cached_versions if isinstance(cached_versions, dict) else {}
+
+
+def write_version_cache(cache_path, binary_path, identity, version):
+    '''
+    Given the path of the Borg version cache file, a resolved Borg binary path, a dict of that
+    binary's identity, and its version string, add the version to the cache file, replacing any
+    version cached for an earlier binary at the same path. Write the file atomically, so that
+    borgmatic runs that start at the same time never read a partially written cache.
+
+    Failing to write the cache isn't an error, as it only means that the version gets looked up
+    again next time.
+    '''
+    cached_versions = read_version_cache(cache_path)
+    cached_versions[binary_path] = dict(identity, version=version)
+
+    temporary_filename = None
 
     try:
-        return output.split(' ')[1].strip()
-    except IndexError:
-        raise ValueError('Could not parse Borg version string')
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(cache_path), suffix='.tmp', delete=False
+        ) as temporary_file:
+            temporary_filename = temporary_file.name
+            json.dump(cached_versions, temporary_file)
+
+        os.replace(temporary_filename, cache_path)
+    except OSError as error:
+        logger.debug('Cannot write Borg version cache {}: {}'.format(cache_path, error))
+
+        if temporary_filename and os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+
+
+def cached_identity_matches(cached, identity):
+    '''
+    Given a cached dict of a Borg binary's identity and version (or None) and a dict of the current
+    identity of that binary, return whether the cached entry is for the current binary.
+    '''
+    if not isinstance(cached, dict):
+        return False
+
+    return all(cached.get(key) == value for key, value in identity.items())
+
+
+def cached_borg_version(local_path):
+    '''
+    Given a local Borg binary path, return a tuple of (the binary's resolved path, a dict of its
+    identity, and its version string if cached during this run or a previous one). The version is
+    None if it isn't cached or if the binary has changed since it was cached. The resolved path and
+    identity are None if the binary can't be found.
+
+    The caller must hold CACHED_VERSIONS_LOCK.
+    '''
+    (binary_path, identity) = binary_identity(local_path)
+    if not binary_path:
+        return (None, None, None)
+
+    cached = CACHED_VERSIONS.get(binary_path)
+
+    if not cached_identity_matches(cached, identity):
+        cached = read_version_cache(get_version_cache_path()).get(binary_path)
+
+        if not cached_identity_matches(cached, identity):
+            return (binary_path, identity, None)
+
+        CACHED_VERSIONS[binary_path] = cached
+
+    return (binary_path, identity, cached.get('version'))
+
+
+def local_borg_version(storage_config, local_path='borg'):
+    '''
+    Given a storage configuration dict and a local Borg binary path, return a version string for it.
+    Use a cached version if this same Borg binary has been run before, either earlier in this run
+    or in a previous one, as starting Borg can be slow.
+
+    Raise OSError or CalledProcessError if there is a problem running Borg.
+    Raise ValueError if the version cannot be parsed.
+    '''
+    # Hold the lock while running Borg, so that configuration files run concurrently wait for one
+    # lookup of a given binary's version instead of all running Borg at once.
+    with CACHED_VERSIONS_LOCK:
+        (binary_path, identity, version) = cached_borg_version(local_path)
+        if version:
+            logger.debug('Using cached Borg version {} for {}'.format(version, binary_path))
+            return version
+
+        full_command = (
+            (local_path, '--version')
+            + (('--info',) if logger.getEffectiveLevel() == logging.INFO else ())
+            + (('--debug', '--show-rc') if logger.isEnabledFor(logging.DEBUG) else ())
+        )
+        output = execute_command(
+            full_command,
+            output_log_level=None,
+            borg_local_path=local_path,
+            extra_environment=environment.make_environment(storage_config),
+        )
+
+        try:
+            version = output.split(' ')[1].strip()
+        except IndexError:
+            raise ValueError('Could not parse Borg version string')
+
+        if binary_path:
+            CACHED_VERSIONS[binary_path] = dict(identity, version=version)
+            write_version_cache(get_version_cache_path(), binary_path, identity, version)
+
+        return version
@@ -14,8 +14,10 @@ SUBPARSER_ALIASES = {
     'mount': ['--mount', '-m'],
     'umount': ['--umount', '-u'],
     'restore': ['--restore', '-r'],
+    'verify-dumps': [],
     'list': ['--list', '-l'],
     'info': ['--info', '-i'],
+    'history': [],
     'borg': [],
 }
 
@@ -181,6 +183,41 @@ def parse_arguments(*unparsed_arguments):
         default=None,
         help='Write log messages to this file instead of syslog',
     )
+    global_group.add_argument(
+        '--jobs',
+        type=int,
+        metavar='N',
+        dest='jobs',
+        default=1,
+        help='Run up to N configuration files at once, defaults to 1',
+    )
+    global_group.add_argument(
+        '--repository-jobs',
+        type=int,
+        metavar='N',
+        dest='repository_jobs',
+        help='Run actions for up to N repositories of each configuration file at once, overriding the repository_concurrency option',
+    )
+    global_group.add_argument(
+        '--timings',
+        dest='timings',
+        default=False,
+        action='store_true',
+        help='Display how long each phase of the run took, per configuration file and repository',
+    )
+    global_group.add_argument(
+        '--timings-json',
+        dest='timings_json',
+        default=False,
+        action='store_true',
+        help='Output how long each phase of the run took as JSON',
+    )
+    global_group.add_argument(
+        '--trace-file',
+        type=str,
+        dest='trace_file',
+        help='Write a timeline of the commands, hooks, and actions that ran to this file, in Chrome trace JSON format',
+    )
     global_group.add_argument(
         '--override',
         metavar='SECTION.OPTION=VALUE',
@@ -523,6 +560,39 @@ def parse_arguments(*unparsed_arguments):
         help='Names of databases to restore from archive, defaults to all databases. Note that any databases to restore must be defined in borgmatic\'s configuration',
     )
     restore_group.add_argument(
+        '--database-jobs',
+        metavar='COUNT',
+        type=int,
+        dest='database_jobs',
+        help='Extract the dumps of all databases to restore from the archive in a single pass, and then restore up to this many databases at once. Takes disk space for the extracted dumps',
+    )
+    restore_group.add_argument(
+        '-h', '--help', action='help', help='Show this help message and exit'
+    )
+
+    verify_dumps_parser = subparsers.add_parser(
+        'verify-dumps',
+        aliases=SUBPARSER_ALIASES['verify-dumps'],
+        help='Verify database dumps in an archive against their checksums',
+        description='Verify database dumps in an archive against the checksums recorded when they were backed up, without restoring them',
+        add_help=False,
+    )
+    verify_dumps_group = verify_dumps_parser.add_argument_group('verify-dumps arguments')
+    verify_dumps_group.add_argument(
+        '--repository',
+        help='Path of repository to verify, defaults to the configured repositories',
+    )
+    verify_dumps_group.add_argument(
+        '--archive', help='Name of archive to verify (or "latest")', default='latest'
+    )
+    verify_dumps_group.add_argument(
+        '--database',
+        metavar='NAME',
+        nargs='+',
+        dest='databases',
+        help='Names of databases to verify, defaults to all databases with recorded checksums',
+    )
+    verify_dumps_group.add_argument(
         '-h', '--help', action='help', help='Show this help message and exit'
     )
 
@@ -625,6 +695,28 @@ def parse_arguments(*unparsed_arguments):
     )
     info_group.add_argument('-h', '--help', action='help', help='Show this help message and exit')
 
+    history_parser = subparsers.add_parser(
+        'history',
+        aliases=SUBPARSER_ALIASES['history'],
+        help='Display the recorded history of backups',
+        description='Display the history of backups recorded in the configured history_database',
+        add_help=False,
+    )
+    history_group = history_parser.add_argument_group('history arguments')
+    history_group.add_argument(
+        '--repository',
+        help='Path of repository to show history for, defaults to the configured repositories',
+    )
+    history_group.add_argument(
+        '--last', metavar='N', type=int, help='Show history for the last N backups only'
+    )
+    history_group.add_argument(
+        '--json', dest='json', default=False, action='store_true', help='Output results as JSON'
+    )
+    history_group.add_argument(
+        '-h', '--help', action='help', help='Show this help message and exit'
+    )
+
     borg_parser = subparsers.add_parser(
         'borg',
         aliases=SUBPARSER_ALIASES['borg'],
@@ -657,6 +749,29 @@ def parse_arguments(*unparsed_arguments):
             'The --excludes option has been replaced with exclude_patterns in configuration'
         )
 
+    if arguments['global'].jobs < 1:
+        raise ValueError('The --jobs option must be at least 1')
+
+    if arguments['global'].repository_jobs is not None and arguments['global'].repository_jobs < 1:
+        raise ValueError('The --repository-jobs option must be at least 1')
+
+    if (
+        'restore' in arguments
+        and arguments['restore'].database_jobs is not None
+        and arguments['restore'].database_jobs < 1
+    ):
+        raise ValueError('The --database-jobs option must be at least 1')
+
+    if arguments['global'].timings and any(
+        getattr(sub_arguments, 'json', False) for sub_arguments in arguments.values()
+    ):
+        raise ValueError('The --timings option cannot be used with the --json option')
+
+    if arguments['global'].timings_json and any(
+        getattr(sub_arguments, 'json', False) for sub_arguments in arguments.values()
+    ):
+        raise ValueError('The --timings-json option cannot be used with the --json option')
+
     if 'init' in arguments and arguments['global'].dry_run:
         raise ValueError('The init action cannot be used with the --dry-run option')
 
@@ -1,9 +1,12 @@
 import collections
+import concurrent.futures
 import copy
+import functools
 import json
 import logging
 import os
 import sys
+import threading
 import time
 from queue import Queue
 from subprocess import CalledProcessError
@@ -11,6 +14,7 @@ from subprocess import CalledProcessError
 import colorama
 import pkg_resources
 
+from borgmatic import execute, history, metrics, timing, trace
 from borgmatic.borg import borg as borg_borg
 from borgmatic.borg import check as borg_check
 from borgmatic.borg import compact as borg_compact
@@ -23,13 +27,19 @@ from borgmatic.borg import info as borg_info
 from borgmatic.borg import init as borg_init
 from borgmatic.borg import list as borg_list
 from borgmatic.borg import mount as borg_mount
+from borgmatic.borg import progress as borg_progress
 from borgmatic.borg import prune as borg_prune
 from borgmatic.borg import umount as borg_umount
 from borgmatic.borg import version as borg_version
 from borgmatic.commands.arguments import parse_arguments
 from borgmatic.config import checks, collect, convert, validate
-from borgmatic.hooks import command, dispatch, dump, monitor
-from borgmatic.logger import configure_logging, should_do_markup
+from borgmatic.hooks import checksum, command, dispatch, dump, manifest, monitor
+from borgmatic.logger import (
+    configure_logging,
+    set_log_config_filename,
+    set_log_prefix,
+    should_do_markup,
+)
 from borgmatic.signals import configure_signals
 from borgmatic.verbosity import verbosity_to_log_level
 
@@ -59,14 +69,13 @@ def run_configuration(config_filename, config, arguments):
     remote_path = location.get('remote_path')
     retries = storage.get('retries', 0)
     retry_wait = storage.get('retry_wait', 0)
-    borg_environment.initialize(storage)
     encountered_error = None
     error_repository = ''
     using_primary_action = {'prune', 'compact', 'create', 'check'}.intersection(arguments)
     monitoring_log_level = verbosity_to_log_level(global_arguments.monitoring_verbosity)
 
     try:
-        local_borg_version = borg_version.local_borg_version(local_path)
+        local_borg_version = borg_version.local_borg_version(storage, local_path)
     except (OSError, CalledProcessError, ValueError) as error:
         yield from log_error_records(
             '{}: Error getting local Borg version'.format(config_filename), error
@@ -75,24 +84,24 @@ def run_configuration(config_filename, config, arguments):
 
     try:
         if using_primary_action:
-            dispatch.call_hooks(
-                'initialize_monitor',
-                hooks,
-                config_filename,
-                monitor.MONITOR_HOOK_NAMES,
-                monitoring_log_level,
-                global_arguments.dry_run,
-            )
-        if using_primary_action:
-            dispatch.call_hooks(
-                'ping_monitor',
-                hooks,
-                config_filename,
-                monitor.MONITOR_HOOK_NAMES,
-                monitor.State.START,
-                monitoring_log_level,
-                global_arguments.dry_run,
-            )
+            with timing.span(config_filename, None, 'monitor start ping'):
+                dispatch.call_hooks(
+                    'initialize_monitor',
+                    hooks,
+                    config_filename,
+                    monitor.MONITOR_HOOK_NAMES,
+                    monitoring_log_level,
+                    global_arguments.dry_run,
+                )
+                dispatch.call_hooks(
+                    'ping_monitor',
+                    hooks,
+                    config_filename,
+                    monitor.MONITOR_HOOK_NAMES,
+                    monitor.State.START,
+                    monitoring_log_level,
+                    global_arguments.dry_run,
+                )
     except (OSError, CalledProcessError) as error:
         if command.considered_soft_failure(config_filename, error):
             return
@@ -100,7 +109,47 @@ def run_configuration(config_filename, config, arguments):
         encountered_error = error
         yield from log_error_records('{}: Error pinging monitor'.format(config_filename), error)
 
-    if not encountered_error:
+    repository_concurrency = global_arguments.repository_jobs or storage.get(
+        'repository_concurrency', 1
+    )
+
+    soft_failure = False
+
+    if not encountered_error and repository_concurrency > 1 and len(location['repositories']) > 1:
+        for repository_path, (results, error) in run_repositories_concurrently(
+            location['repositories'],
+            repository_concurrency,
+            retries,
+            retry_wait,
+            arguments=arguments,
+            config_filename=config_filename,
+            location=location,
+            storage=storage,
+            retention=retention,
+            consistency=consistency,
+            hooks=hooks,
+            local_path=local_path,
+            remote_path=remote_path,
+            local_borg_version=local_borg_version,
+        ):
+            # This repository got skipped due to a soft failure of another repository.
+            if results is None:
+                continue
+
+            if error and command.considered_soft_failure(config_filename, error):
+                soft_failure = True
+                continue
+
+            metrics.record_repository_result(config_filename, repository_path, not error)
+            yield from results
+
+            if error:
+                yield from log_error_records(
+                    '{}: Error running actions for repository'.format(repository_path), error
+                )
+                encountered_error = error
+                error_repository = repository_path
+    elif not encountered_error:
         repo_queue = Queue()
         for repo in location['repositories']:
             repo_queue.put((repo, 0),)
@@ -112,19 +161,21 @@ def run_configuration(config_filename, config, arguments):
                 logger.warning(f'{config_filename}: Sleeping {timeout}s before next retry')
                 time.sleep(timeout)
             try:
-                yield from run_actions(
-                    arguments=arguments,
-                    config_filename=config_filename,
-                    location=location,
-                    storage=storage,
-                    retention=retention,
-                    consistency=consistency,
-                    hooks=hooks,
-                    local_path=local_path,
-                    remote_path=remote_path,
-                    local_borg_version=local_borg_version,
-                    repository_path=repository_path,
-                )
+                with trace.event(repository_path, 'repository', config_filename=config_filename):
+                    yield from run_actions(
+                        arguments=arguments,
+                        config_filename=config_filename,
+                        location=location,
+                        storage=storage,
+                        retention=retention,
+                        consistency=consistency,
+                        hooks=hooks,
+                        local_path=local_path,
+                        remote_path=remote_path,
+                        local_borg_version=local_borg_version,
+                        repository_path=repository_path,
+                    )
+                metrics.record_repository_result(config_filename, repository_path, True)
             except (OSError, CalledProcessError, ValueError) as error:
                 if retry_num < retries:
                     repo_queue.put((repository_path, retry_num + 1),)
@@ -142,23 +193,90 @@ def run_configuration(config_filename, config, arguments):
                     continue
 
                 if command.considered_soft_failure(config_filename, error):
-                    return
+                    soft_failure = True
+                    break
 
+                metrics.record_repository_result(config_filename, repository_path, False)
                 yield from log_error_records(
                     '{}: Error running actions for repository'.format(repository_path), error
                 )
                 encountered_error = error
                 error_repository = repository_path
 
+    try:
+        remove_spooled_database_dumps(config_filename, location, hooks, global_arguments.dry_run)
+    except (OSError, CalledProcessError) as error:
+        encountered_error = error
+        yield from log_error_records(
+            '{}: Error removing database dumps'.format(config_filename), error
+        )
+
+    if soft_failure:
+        return
+
+    if hooks.get('history_database') and 'create' in arguments and not global_arguments.dry_run:
+        for repository_path, message in history.record_run(
+            hooks['history_database'], config_filename, hooks.get('throughput_regression')
+        ):
+            if not hooks['throughput_regression'].get('fail', False):
+                logger.warning('{}: {}'.format(repository_path, message))
+                continue
+
+            encountered_error = ValueError(message)
+            error_repository = repository_path
+            yield from log_error_records(
+                '{}: Throughput regression'.format(repository_path), encountered_error
+            )
+
     if not encountered_error:
         try:
             if using_primary_action:
+                with timing.span(config_filename, None, 'monitor finish ping'):
+                    dispatch.call_hooks(
+                        'ping_monitor',
+                        hooks,
+                        config_filename,
+                        monitor.MONITOR_HOOK_NAMES,
+                        monitor.State.FINISH,
+                        monitoring_log_level,
+                        global_arguments.dry_run,
+                    )
+                    dispatch.call_hooks(
+                        'destroy_monitor',
+                        hooks,
+                        config_filename,
+                        monitor.MONITOR_HOOK_NAMES,
+                        monitoring_log_level,
+                        global_arguments.dry_run,
+                    )
+        except (OSError, CalledProcessError) as error:
+            if command.considered_soft_failure(config_filename, error):
+                return
+
+            encountered_error = error
+            yield from log_error_records('{}: Error pinging monitor'.format(config_filename), error)
+
+    if encountered_error and using_primary_action:
+        try:
+            with timing.span(config_filename, None, 'on-error hook'):
+                command.execute_hook(
+                    hooks.get('on_error'),
+                    hooks.get('umask'),
+                    config_filename,
+                    'on-error',
+                    global_arguments.dry_run,
+                    extra_environment=borg_environment.make_environment(storage),
+                    repository=error_repository,
+                    error=encountered_error,
+                    output=getattr(encountered_error, 'output', ''),
+                )
+            with timing.span(config_filename, None, 'monitor fail ping'):
                 dispatch.call_hooks(
                     'ping_monitor',
                     hooks,
                     config_filename,
                     monitor.MONITOR_HOOK_NAMES,
-                    monitor.State.FINISH,
+                    monitor.State.FAIL,
                     monitoring_log_level,
                     global_arguments.dry_run,
                 )
@@ -174,45 +292,270 @@ def run_configuration(config_filename, config, arguments):
             if command.considered_soft_failure(config_filename, error):
                 return
 
-            encountered_error = error
-            yield from log_error_records('{}: Error pinging monitor'.format(config_filename), error)
-
-    if encountered_error and using_primary_action:
-        try:
-            command.execute_hook(
-                hooks.get('on_error'),
-                hooks.get('umask'),
-                config_filename,
-                'on-error',
-                global_arguments.dry_run,
-                repository=error_repository,
-                error=encountered_error,
-                output=getattr(encountered_error, 'output', ''),
+            yield from log_error_records(
+                '{}: Error running on-error hook'.format(config_filename), error
             )
+
+
+def remove_spooled_database_dumps(config_filename, location, hooks, dry_run):
+    '''
+    Given a configuration filename, its location and hooks configuration dicts, and whether this is
+    a dry run, remove any database dumps spooled for backing up to each of the configuration file's
+    repositories (with the "dump_once_per_run" option), now that they've all been backed up.
+
+    Raise OSError or CalledProcessError if the dumps cannot be removed.
+    '''
+    with dump.database_dump_lock(hooks):
+        dump.wait_for_spooled_dumps_readers(hooks)
+
+        if dump.SPOOLED_DUMPS_CONFIG_FILENAME != config_filename:
+            return
+
+        with timing.span(config_filename, None, 'remove database dumps'):
             dispatch.call_hooks(
-                'ping_monitor',
+                'remove_database_dumps',
                 hooks,
                 config_filename,
-                monitor.MONITOR_HOOK_NAMES,
-                monitor.State.FAIL,
-                monitoring_log_level,
-                global_arguments.dry_run,
+                dump.DATABASE_HOOK_NAMES,
+                location,
+                dry_run,
             )
-            dispatch.call_hooks(
-                'destroy_monitor',
-                hooks,
-                config_filename,
-                monitor.MONITOR_HOOK_NAMES,
-                monitoring_log_level,
-                global_arguments.dry_run,
+            manifest.remove_manifest(location, config_filename, dry_run)
+
+        dump.SPOOLED_DUMPS_CONFIG_FILENAME = None
+
+
+def add_separately_dumped_databases(databases, restore_names, configured_names):
+    '''
+    Given a sequence of database configuration dicts for a database hook, the names of databases to
+    restore, and the names of the databases configured for all database hooks, return the database
+    configuration dicts plus one for each name to restore that isn't configured but that got
+    dumped on its own as part of an "all" database with "separate_dumps". Each added dict is a copy
+    of the "all" database's configuration with the name to restore.
+    '''
+    unconfigured_names = [name for name in restore_names if name not in configured_names]
+
+    return list(databases) + [
+        dict(database, name=name)
+        for database in databases
+        if database['name'] == 'all' and database.get('separate_dumps')
+        for name in unconfigured_names
+    ]
+
+
+def call_database_hooks_concurrently(
+    function_name, hook_databases, repository, location, dry_run, jobs, *args
+):
+    '''
+    Given a database hook function name, a sequence of (database hook name, database configuration
+    dict) tuples, a repository path, a location configuration dict, whether this is a dry run, the
+    maximum number of databases to call the function for at once, and any further arguments for the
+    function, call it for each database.
+
+    Raise the first error of any failed call, once the other calls have finished. (A call in
+    progress doesn't get interrupted, so as not to leave its database half restored.)
+    '''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(
+                dispatch.call_hooks,
+                function_name,
+                {hook_name: [database]},
+                repository,
+                dump.DATABASE_HOOK_NAMES,
+                location,
+                dry_run,
+                *args,
             )
-        except (OSError, CalledProcessError) as error:
-            if command.considered_soft_failure(config_filename, error):
-                return
+            for (hook_name, database) in hook_databases
+        ]
 
-            yield from log_error_records(
-                '{}: Error running on-error hook'.format(config_filename), error
+    for future in futures:
+        future.result()
+
+
+def restore_database_dumps_concurrently(restores, repository, location, dry_run, jobs):
+    '''
+    Given a sequence of (database hook name, database configuration dict) tuples for database dumps
+    that have already been extracted to disk, a repository path, a location configuration dict,
+    whether this is a dry run, and the maximum number of databases to restore at once, restore the
+    databases from their dumps on disk.
+
+    For databases that get analyzed after restoring, defer analyzing until all the restores have
+    finished, so that it doesn't compete with them. Then analyze up to the same number at once.
+
+    Raise the first error of any failed restore, once the other restores have finished.
+    '''
+    analyzes = [
+        (hook_name, database)
+        for (hook_name, database) in restores
+        if hook_name in dump.ANALYZE_HOOK_NAMES and database.get('analyze', True)
+    ]
+
+    call_database_hooks_concurrently(
+        'restore_database_dump',
+        [
+            (hook_name, dict(database, analyze=False))
+            if hook_name in dump.ANALYZE_HOOK_NAMES
+            else (hook_name, database)
+            for (hook_name, database) in restores
+        ],
+        repository,
+        location,
+        dry_run,
+        jobs,
+        None,
+    )
+    call_database_hooks_concurrently(
+        'analyze_database', analyzes, repository, location, dry_run, jobs
+    )
+
+
+def record_dump_checksums(
+    repository, create_json_output, dump_checksums, storage, local_path, remote_path
+):
+    '''
+    Given a repository path, the JSON output of "borg create" (or None), a dict of checksums for the
+    database dumps that streamed into the created archive (as returned by
+    checksum.finish_checksummed_dumps()), a storage configuration dict, and local and remote Borg
+    paths, record the checksums for that archive. Without JSON output to get the archive name from,
+    ask Borg for the name of the latest archive instead.
+    '''
+    archive_name = (
+        json.loads(create_json_output)['archive']['name']
+        if create_json_output
+        else borg_list.resolve_archive_name(repository, 'latest', storage, local_path, remote_path)
+    )
+
+    checksum.record_checksums(
+        repository, archive_name, checksum.make_dump_entries(dump_checksums), repository
+    )
+
+
+def report_create_progress(config_filename, hooks, dry_run, create_progress):
+    '''
+    Given a configuration filename, a hooks configuration dict, whether this is a dry run, and a
+    borgmatic.borg.progress.Progress instance for an archive being created, report the progress to
+    any monitoring hooks that support it.
+    '''
+    dispatch.call_hooks(
+        'report_progress',
+        hooks,
+        config_filename,
+        monitor.PROGRESS_MONITOR_HOOK_NAMES,
+        borg_progress.format_progress(create_progress),
+        dry_run,
+    )
+
+
+def run_repository_with_retries(
+    *, repository_path, retries, retry_wait, soft_failure_event=None, **run_actions_arguments
+):
+    '''
+    Given a repository path, a number of retries, a retry wait in seconds, an optional
+    threading.Event shared with other repositories, and keyword arguments to pass through to
+    run_actions(), run all actions for the repository, retrying on error with an increasing wait
+    between attempts. Tag any command output logged from the current thread with the repository
+    path.
+
+    Return the results as a tuple of (a list of JSON output strings from the final attempt, the
+    exception from the final attempt or None if it succeeded).
+
+    If the actions for this repository end in a soft failure (as per
+    command.considered_soft_failure()), then set the event. And if the event is already set before
+    an attempt, then skip running any actions for this repository and return (None, None).
+    '''
+    config_filename = run_actions_arguments['config_filename']
+    set_log_prefix(repository_path)
+    set_log_config_filename(config_filename)
+
+    try:
+        for retry_num in range(retries + 1):
+            timeout = retry_num * retry_wait
+            if timeout:
+                logger.warning(f'{repository_path}: Sleeping {timeout}s before next retry')
+                time.sleep(timeout)
+
+            results = []
+
+            if soft_failure_event and soft_failure_event.is_set():
+                return (None, None)
+
+            try:
+                with trace.event(repository_path, 'repository', config_filename=config_filename):
+                    for result in run_actions(
+                        repository_path=repository_path, **run_actions_arguments
+                    ):
+                        results.append(result)
+            except (OSError, CalledProcessError, ValueError) as error:
+                if retry_num < retries:
+                    tuple(  # Consume the generator so as to trigger logging.
+                        log_error_records(
+                            '{}: Error running actions for repository'.format(repository_path),
+                            error,
+                            levelno=logging.WARNING,
+                            log_command_error_output=True,
+                        )
+                    )
+                    logger.warning(
+                        f'{config_filename}: Retrying {repository_path}... attempt {retry_num + 1}/{retries}'
+                    )
+                    continue
+
+                if (
+                    soft_failure_event
+                    and getattr(error, 'returncode', None) == command.SOFT_FAIL_EXIT_CODE
+                ):
+                    soft_failure_event.set()
+
+                return (results, error)
+
+            return (results, None)
+    finally:
+        set_log_prefix(None)
+        set_log_config_filename(None)
+
+
+def run_repositories_concurrently(
+    repository_paths, concurrency, retries, retry_wait, **run_actions_arguments
+):
+    '''
+    Given a sequence of repository paths, the maximum number of repositories to run at once, a
+    number of retries, a retry wait in seconds, and keyword arguments to pass through to
+    run_actions(), run all actions for each repository in a pool of worker threads.
+
+    Return a list of (repository path, (results, error)) tuples in the order of the given repository
+    paths, where the results and error are as returned by run_repository_with_retries(). Errors are
+    returned rather than logged or raised, so that the caller can handle them in repository order.
+
+    Once the actions for any repository end in a soft failure, skip the repositories that haven't
+    started yet, as if they ran one at a time. Their results are None.
+    '''
+    logger.info(
+        '{}: Running actions for {} repositories, up to {} at a time'.format(
+            run_actions_arguments['config_filename'], len(repository_paths), concurrency
+        )
+    )
+
+    soft_failure_event = threading.Event()
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [
+            executor.submit(
+                run_repository_with_retries,
+                repository_path=repository_path,
+                retries=retries,
+                retry_wait=retry_wait,
+                soft_failure_event=soft_failure_event,
+                **run_actions_arguments,
             )
+            for repository_path in repository_paths
+        ]
+
+        return [
+            (repository_path, future.result())
+            for repository_path, future in zip(repository_paths, futures)
+        ]
 
 
 def run_actions(
@@ -249,6 +592,7 @@ def run_actions(
         # Deprecated: For backwards compatibility with borgmatic < 1.6.0.
         'repositories': ','.join(location['repositories']),
     }
+    hook_environment = borg_environment.make_environment(storage)
 
     if 'init' in arguments:
         logger.info('{}: Initializing repository'.format(repository))
@@ -262,93 +606,103 @@ def run_actions(
             remote_path=remote_path,
         )
     if 'prune' in arguments:
-        command.execute_hook(
-            hooks.get('before_prune'),
-            hooks.get('umask'),
-            config_filename,
-            'pre-prune',
-            global_arguments.dry_run,
-            **hook_context,
-        )
+        with timing.span(config_filename, repository_path, 'pre-prune hook'):
+            command.execute_hook(
+                hooks.get('before_prune'),
+                hooks.get('umask'),
+                config_filename,
+                'pre-prune',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+                **hook_context,
+            )
         logger.info('{}: Pruning archives{}'.format(repository, dry_run_label))
-        borg_prune.prune_archives(
-            global_arguments.dry_run,
-            repository,
-            storage,
-            retention,
-            local_path=local_path,
-            remote_path=remote_path,
-            stats=arguments['prune'].stats,
-            files=arguments['prune'].files,
-        )
-        command.execute_hook(
-            hooks.get('after_prune'),
-            hooks.get('umask'),
-            config_filename,
-            'post-prune',
-            global_arguments.dry_run,
-            **hook_context,
-        )
-    if 'compact' in arguments:
-        command.execute_hook(
-            hooks.get('before_compact'),
-            hooks.get('umask'),
-            config_filename,
-            'pre-compact',
-            global_arguments.dry_run,
-        )
-        if borg_feature.available(borg_feature.Feature.COMPACT, local_borg_version):
-            logger.info('{}: Compacting segments{}'.format(repository, dry_run_label))
-            borg_compact.compact_segments(
+        with timing.span(config_filename, repository_path, 'prune'):
+            borg_prune.prune_archives(
                 global_arguments.dry_run,
                 repository,
                 storage,
+                retention,
                 local_path=local_path,
                 remote_path=remote_path,
-                progress=arguments['compact'].progress,
-                cleanup_commits=arguments['compact'].cleanup_commits,
-                threshold=arguments['compact'].threshold,
+                stats=arguments['prune'].stats,
+                files=arguments['prune'].files,
+            )
+        with timing.span(config_filename, repository_path, 'post-prune hook'):
+            command.execute_hook(
+                hooks.get('after_prune'),
+                hooks.get('umask'),
+                config_filename,
+                'post-prune',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+                **hook_context,
             )
+    if 'compact' in arguments:
+        with timing.span(config_filename, repository_path, 'pre-compact hook'):
+            command.execute_hook(
+                hooks.get('before_compact'),
+                hooks.get('umask'),
+                config_filename,
+                'pre-compact',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+            )
+        if borg_feature.available(borg_feature.Feature.COMPACT, local_borg_version):
+            logger.info('{}: Compacting segments{}'.format(repository, dry_run_label))
+            with timing.span(config_filename, repository_path, 'compact'):
+                borg_compact.compact_segments(
+                    global_arguments.dry_run,
+                    repository,
+                    storage,
+                    local_path=local_path,
+                    remote_path=remote_path,
+                    progress=arguments['compact'].progress,
+                    cleanup_commits=arguments['compact'].cleanup_commits,
+                    threshold=arguments['compact'].threshold,
+                )
         else:  # pragma: nocover
             logger.info(
                 '{}: Skipping compact (only available/needed in Borg 1.2+)'.format(repository)
             )
-        command.execute_hook(
-            hooks.get('after_compact'),
-            hooks.get('umask'),
-            config_filename,
-            'post-compact',
-            global_arguments.dry_run,
-        )
+        with timing.span(config_filename, repository_path, 'post-compact hook'):
+            command.execute_hook(
+                hooks.get('after_compact'),
+                hooks.get('umask'),
+                config_filename,
+                'post-compact',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+            )
     if 'create' in arguments:
-        command.execute_hook(
-            hooks.get('before_backup'),
-            hooks.get('umask'),
-            config_filename,
-            'pre-backup',
-            global_arguments.dry_run,
-            **hook_context,
-        )
+        with timing.span(config_filename, repository_path, 'pre-backup hook'):
+            command.execute_hook(
+                hooks.get('before_backup'),
+                hooks.get('umask'),
+                config_filename,
+                'pre-backup',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+                **hook_context,
+            )
         logger.info('{}: Creating archive{}'.format(repository, dry_run_label))
-        dispatch.call_hooks(
-            'remove_database_dumps',
-            hooks,
-            repository,
-            dump.DATABASE_HOOK_NAMES,
-            location,
-            global_arguments.dry_run,
-        )
-        active_dumps = dispatch.call_hooks(
-            'dump_databases',
-            hooks,
-            repository,
-            dump.DATABASE_HOOK_NAMES,
-            location,
-            global_arguments.dry_run,
+        # Borg's JSON output includes archive stats for metrics, history, and dump checksums. Borg
+        # doesn't show its --stats and --progress output alongside JSON though, so only request JSON
+        # stats when that output isn't wanted.
+        create_json_stats = bool(
+            (
+                hooks.get('metrics_textfile')
+                or hooks.get('history_database')
+                or hooks.get('checksum_dumps')
+            )
+            and not global_arguments.dry_run
+            and not arguments['create'].json
+            and not arguments['create'].stats
+            and not arguments['create'].progress
         )
-        stream_processes = [process for processes in active_dumps.values() for process in processes]
-
-        json_output = borg_create.create_archive(
+        dump_once_per_run = bool(hooks.get('dump_once_per_run'))
+        create_archive = functools.partial(
+            borg_create.create_archive,
             global_arguments.dry_run,
             repository,
             location,
@@ -360,56 +714,178 @@ def run_actions(
             stats=arguments['create'].stats,
             json=arguments['create'].json,
             files=arguments['create'].files,
-            stream_processes=stream_processes,
+            json_stats=create_json_stats,
+        )
+        progress_callback = functools.partial(
+            report_create_progress, config_filename, hooks, global_arguments.dry_run
         )
+        reading_spooled_dumps = False
+
+        with dump.database_dump_lock(hooks):
+            # Waiting releases the lock, so only check for spooled dumps to use afterwards.
+            if not (dump_once_per_run and dump.SPOOLED_DUMPS_CONFIG_FILENAME == config_filename):
+                dump.wait_for_spooled_dumps_readers(hooks)
+
+            if dump_once_per_run and dump.SPOOLED_DUMPS_CONFIG_FILENAME == config_filename:
+                logger.info(
+                    '{}: Using database dumps from earlier in this run{}'.format(
+                        repository, dry_run_label
+                    )
+                )
+                active_dumps = {}
+            else:
+                with timing.span(config_filename, repository_path, 'remove database dumps'):
+                    dispatch.call_hooks(
+                        'remove_database_dumps',
+                        hooks,
+                        repository,
+                        dump.DATABASE_HOOK_NAMES,
+                        location,
+                        global_arguments.dry_run,
+                    )
+                    manifest.remove_manifest(location, repository, global_arguments.dry_run)
+                dump.SPOOLED_DUMPS_CONFIG_FILENAME = None
+
+                with timing.span(config_filename, repository_path, 'dump databases'):
+                    active_dumps = dispatch.call_hooks(
+                        'dump_databases',
+                        hooks,
+                        repository,
+                        dump.DATABASE_HOOK_NAMES,
+                        location,
+                        global_arguments.dry_run,
+                        spool=dump_once_per_run,
+                        concurrency=hooks.get('dump_concurrency'),
+                        checksum_dumps=bool(hooks.get('checksum_dumps')),
+                    )
+
+                    if active_dumps:
+                        manifest.write_manifest(
+                            location, hooks, repository, global_arguments.dry_run
+                        )
+
+                # Spooled dumps get written to regular files rather than streamed to Borg, so
+                # they've already finished by now.
+                if dump_once_per_run:
+                    metrics.record_database_dump_durations(
+                        config_filename, repository_path, active_dumps
+                    )
+                    active_dumps = {}
+
+                    if not global_arguments.dry_run:
+                        dump.SPOOLED_DUMPS_CONFIG_FILENAME = config_filename
+
+            # Backing up spooled dumps only reads them, so release the lock while doing that, and
+            # let backups to the configuration file's other repositories run at the same time.
+            # Streamed dumps share named pipes though, so those backups have to hold the lock.
+            if dump.SPOOLED_DUMPS_CONFIG_FILENAME == config_filename and dump_once_per_run:
+                reading_spooled_dumps = dump.start_reading_spooled_dumps(hooks)
+
+            if not reading_spooled_dumps:
+                # Dumps that have already run to completion (like directory format dumps) don't
+                # need to run alongside Borg.
+                stream_processes = [
+                    process
+                    for processes in active_dumps.values()
+                    for process in processes
+                    if process.returncode is None
+                ]
+
+                with timing.span(config_filename, repository_path, 'create'):
+                    try:
+                        json_output = create_archive(
+                            stream_processes=stream_processes, progress_callback=progress_callback
+                        )
+                    finally:
+                        # Only streamed dumps get checksummed, and those only happen while holding
+                        # the database dump lock.
+                        dump_checksums = (
+                            checksum.finish_checksummed_dumps()
+                            if active_dumps and hooks.get('checksum_dumps')
+                            else {}
+                        )
+
+                if dump_checksums and not global_arguments.dry_run:
+                    record_dump_checksums(
+                        repository, json_output, dump_checksums, storage, local_path, remote_path
+                    )
+
+                # Spooled dumps stick around for the configuration file's other repositories, and
+                # get removed at the end of the run instead.
+                if not dump_once_per_run:
+                    metrics.record_database_dump_durations(
+                        config_filename, repository_path, active_dumps
+                    )
+                    with timing.span(config_filename, repository_path, 'remove database dumps'):
+                        dispatch.call_hooks(
+                            'remove_database_dumps',
+                            hooks,
+                            config_filename,
+                            dump.DATABASE_HOOK_NAMES,
+                            location,
+                            global_arguments.dry_run,
+                        )
+                        manifest.remove_manifest(location, repository, global_arguments.dry_run)
+
+        if reading_spooled_dumps:
+            try:
+                with timing.span(config_filename, repository_path, 'create'):
+                    json_output = create_archive(
+                        stream_processes=[], progress_callback=progress_callback
+                    )
+            finally:
+                dump.finish_reading_spooled_dumps()
+
         if json_output:  # pragma: nocover
-            yield json.loads(json_output)
+            metrics.record_archive_stats(config_filename, repository_path, json_output)
 
-        dispatch.call_hooks(
-            'remove_database_dumps',
-            hooks,
-            config_filename,
-            dump.DATABASE_HOOK_NAMES,
-            location,
-            global_arguments.dry_run,
-        )
-        command.execute_hook(
-            hooks.get('after_backup'),
-            hooks.get('umask'),
-            config_filename,
-            'post-backup',
-            global_arguments.dry_run,
-            **hook_context,
-        )
+            if arguments['create'].json:
+                yield json.loads(json_output)
+
+        with timing.span(config_filename, repository_path, 'post-backup hook'):
+            command.execute_hook(
+                hooks.get('after_backup'),
+                hooks.get('umask'),
+                config_filename,
+                'post-backup',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+                **hook_context,
+            )
 
     if 'check' in arguments and checks.repository_enabled_for_checks(repository, consistency):
-        command.execute_hook(
-            hooks.get('before_check'),
-            hooks.get('umask'),
-            config_filename,
-            'pre-check',
-            global_arguments.dry_run,
-            **hook_context,
-        )
+        with timing.span(config_filename, repository_path, 'pre-check hook'):
+            command.execute_hook(
+                hooks.get('before_check'),
+                hooks.get('umask'),
+                config_filename,
+                'pre-check',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+                **hook_context,
+            )
         logger.info('{}: Running consistency checks'.format(repository))
-        borg_check.check_archives(
-            repository,
-            storage,
-            consistency,
-            local_path=local_path,
-            remote_path=remote_path,
-            progress=arguments['check'].progress,
-            repair=arguments['check'].repair,
-            only_checks=arguments['check'].only,
-        )
-        command.execute_hook(
-            hooks.get('after_check'),
-            hooks.get('umask'),
-            config_filename,
-            'post-check',
-            global_arguments.dry_run,
-            **hook_context,
-        )
+        with timing.span(config_filename, repository_path, 'check'):
+            borg_check.check_archives(
+                repository,
+                storage,
+                consistency,
+                local_path=local_path,
+                remote_path=remote_path,
+                progress=arguments['check'].progress,
+                repair=arguments['check'].repair,
+                only_checks=arguments['check'].only,
+            )
+        with timing.span(config_filename, repository_path, 'post-check hook'):
+            command.execute_hook(
+                hooks.get('after_check'),
+                hooks.get('umask'),
+                config_filename,
+                'post-check',
+                global_arguments.dry_run,
+                extra_environment=hook_environment,
+                **hook_context,
+            )
     if 'extract' in arguments:
         command.execute_hook(
             hooks.get('before_extract'),
@@ -417,6 +893,7 @@ def run_actions(
             config_filename,
             'pre-extract',
             global_arguments.dry_run,
+            extra_environment=hook_environment,
             **hook_context,
         )
         if arguments['extract'].repository is None or validate.repositories_match(
@@ -447,6 +924,7 @@ def run_actions(
             config_filename,
             'post-extract',
             global_arguments.dry_run,
+            extra_environment=hook_environment,
             **hook_context,
         )
     if 'export-tar' in arguments:
@@ -506,79 +984,148 @@ def run_actions(
                     repository, arguments['restore'].archive
                 )
             )
-            dispatch.call_hooks(
-                'remove_database_dumps',
-                hooks,
-                repository,
-                dump.DATABASE_HOOK_NAMES,
-                location,
-                global_arguments.dry_run,
-            )
-
-            restore_names = arguments['restore'].databases or []
-            if 'all' in restore_names:
-                restore_names = []
-
-            archive_name = borg_list.resolve_archive_name(
-                repository, arguments['restore'].archive, storage, local_path, remote_path
-            )
-            found_names = set()
-
-            for hook_name, per_hook_restore_databases in hooks.items():
-                if hook_name not in dump.DATABASE_HOOK_NAMES:
-                    continue
+            with dump.database_dump_lock(hooks):
+                dump.wait_for_spooled_dumps_readers(hooks)
+                dispatch.call_hooks(
+                    'remove_database_dumps',
+                    hooks,
+                    repository,
+                    dump.DATABASE_HOOK_NAMES,
+                    location,
+                    global_arguments.dry_run,
+                )
+                dump.SPOOLED_DUMPS_CONFIG_FILENAME = None
 
-                for restore_database in per_hook_restore_databases:
-                    database_name = restore_database['name']
-                    if restore_names and database_name not in restore_names:
-                        continue
+                restore_names = arguments['restore'].databases or []
+                if 'all' in restore_names:
+                    restore_names = []
 
-                    found_names.add(database_name)
-                    dump_pattern = dispatch.call_hooks(
-                        'make_database_dump_pattern',
-                        hooks,
+                archive_name = borg_list.resolve_archive_name(
+                    repository, arguments['restore'].archive, storage, local_path, remote_path
+                )
+                # Find dumps by their exact paths in the archive's dump manifest when there is one,
+                # as that's much faster for Borg than matching every archive item against a glob.
+                archive_manifest = (
+                    None
+                    if global_arguments.dry_run
+                    else manifest.read_archive_manifest(
                         repository,
-                        dump.DATABASE_HOOK_NAMES,
+                        archive_name,
                         location,
-                        database_name,
-                    )[hook_name]
+                        storage,
+                        local_borg_version,
+                        local_path,
+                        remote_path,
+                    )
+                )
+                found_names = set()
+                single_pass_restores = []
+                configured_names = {
+                    database['name']
+                    for hook_name in dump.DATABASE_HOOK_NAMES
+                    for database in hooks.get(hook_name) or ()
+                }
+
+                for hook_name, per_hook_restore_databases in hooks.items():
+                    if hook_name not in dump.DATABASE_HOOK_NAMES:
+                        continue
 
-                    # Kick off a single database extract to stdout.
-                    extract_process = borg_extract.extract_archive(
+                    for restore_database in add_separately_dumped_databases(
+                        per_hook_restore_databases, restore_names, configured_names
+                    ):
+                        database_name = restore_database['name']
+                        if restore_names and database_name not in restore_names:
+                            continue
+
+                        found_names.add(database_name)
+                        dump_pattern = dispatch.call_hooks(
+                            'make_database_dump_pattern',
+                            hooks,
+                            repository,
+                            dump.DATABASE_HOOK_NAMES,
+                            location,
+                            database_name,
+                        )[hook_name]
+                        dump_patterns = manifest.make_dump_patterns(
+                            archive_manifest, hook_name, database_name
+                        ) or dump.convert_glob_patterns_to_borg_patterns([dump_pattern])
+
+                        if arguments['restore'].database_jobs:
+                            single_pass_restores.append(
+                                (hook_name, restore_database, dump_patterns)
+                            )
+                            continue
+
+                        # Kick off a single database extract to stdout.
+                        extract_process = borg_extract.extract_archive(
+                            dry_run=global_arguments.dry_run,
+                            repository=repository,
+                            archive=archive_name,
+                            paths=dump_patterns,
+                            location_config=location,
+                            storage_config=storage,
+                            local_borg_version=local_borg_version,
+                            local_path=local_path,
+                            remote_path=remote_path,
+                            destination_path='/',
+                            # A directory format dump isn't a single file, and therefore can't extract
+                            # to stdout. Neither can a dump that must be restored from a file. In
+                            # these cases, the extract_process return value is None.
+                            extract_to_stdout=bool(
+                                restore_database.get('format') != 'directory'
+                                and hook_name not in dump.FILE_DUMP_HOOK_NAMES
+                            ),
+                        )
+
+                        # Run a single database restore, consuming the extract stdout (if any).
+                        dispatch.call_hooks(
+                            'restore_database_dump',
+                            {hook_name: [restore_database]},
+                            repository,
+                            dump.DATABASE_HOOK_NAMES,
+                            location,
+                            global_arguments.dry_run,
+                            extract_process,
+                        )
+
+                if single_pass_restores:
+                    # Extract all of the database dumps to disk at once, so Borg only has to read
+                    # the archive's metadata once.
+                    borg_extract.extract_archive(
                         dry_run=global_arguments.dry_run,
                         repository=repository,
                         archive=archive_name,
-                        paths=dump.convert_glob_patterns_to_borg_patterns([dump_pattern]),
+                        paths=[
+                            pattern
+                            for (_, _, dump_patterns) in single_pass_restores
+                            for pattern in dump_patterns
+                        ],
                         location_config=location,
                         storage_config=storage,
                         local_borg_version=local_borg_version,
                         local_path=local_path,
                         remote_path=remote_path,
                         destination_path='/',
-                        # A directory format dump isn't a single file, and therefore can't extract
-                        # to stdout. In this case, the extract_process return value is None.
-                        extract_to_stdout=bool(restore_database.get('format') != 'directory'),
                     )
-
-                    # Run a single database restore, consuming the extract stdout (if any).
-                    dispatch.call_hooks(
-                        'restore_database_dump',
-                        {hook_name: [restore_database]},
+                    restore_database_dumps_concurrently(
+                        [
+                            (hook_name, restore_database)
+                            for (hook_name, restore_database, _) in single_pass_restores
+                        ],
                         repository,
-                        dump.DATABASE_HOOK_NAMES,
                         location,
                         global_arguments.dry_run,
-                        extract_process,
+                        arguments['restore'].database_jobs,
                     )
 
-            dispatch.call_hooks(
-                'remove_database_dumps',
-                hooks,
-                repository,
-                dump.DATABASE_HOOK_NAMES,
-                location,
-                global_arguments.dry_run,
-            )
+                dispatch.call_hooks(
+                    'remove_database_dumps',
+                    hooks,
+                    repository,
+                    dump.DATABASE_HOOK_NAMES,
+                    location,
+                    global_arguments.dry_run,
+                )
 
             if not restore_names and not found_names:
                 raise ValueError('No databases were found to restore')
@@ -591,6 +1138,46 @@ def run_actions(
                     )
                 )
 
+    if 'verify-dumps' in arguments:
+        if arguments['verify-dumps'].repository is None or validate.repositories_match(
+            repository, arguments['verify-dumps'].repository
+        ):
+            archive_name = borg_list.resolve_archive_name(
+                repository, arguments['verify-dumps'].archive, storage, local_path, remote_path
+            )
+            logger.info(
+                '{}: Verifying database dumps in archive {}'.format(repository, archive_name)
+            )
+            dumps_to_verify = checksum.find_dumps_to_verify(
+                repository,
+                archive_name,
+                manifest.read_archive_manifest(
+                    repository,
+                    archive_name,
+                    location,
+                    storage,
+                    local_borg_version,
+                    local_path=local_path,
+                    remote_path=remote_path,
+                ),
+                arguments['verify-dumps'].databases,
+            )
+
+            if not dumps_to_verify:
+                raise ValueError(
+                    'Cannot find any database dump checksums for archive {}'.format(archive_name)
+                )
+
+            checksum.verify_dumps(
+                repository,
+                archive_name,
+                dumps_to_verify,
+                location,
+                storage,
+                local_borg_version,
+                local_path=local_path,
+                remote_path=remote_path,
+            )
     if 'list' in arguments:
         if arguments['list'].repository is None or validate.repositories_match(
             repository, arguments['list'].repository
@@ -629,6 +1216,36 @@ def run_actions(
             )
             if json_output:  # pragma: nocover
                 yield json.loads(json_output)
+    if 'history' in arguments:
+        if arguments['history'].repository is None or validate.repositories_match(
+            repository, arguments['history'].repository
+        ):
+            runs = (
+                history.read_history(
+                    hooks['history_database'],
+                    config_filename,
+                    repository_path,
+                    arguments['history'].last,
+                )
+                if hooks.get('history_database')
+                else []
+            )
+
+            if arguments['history'].json:
+                yield {
+                    'config_filename': config_filename,
+                    'repository': repository_path,
+                    'runs': runs,
+                }
+            elif not hooks.get('history_database'):
+                logger.warning(
+                    '{}: No history_database configured in {}'.format(repository, config_filename)
+                )
+            else:
+                logger.warning('{}: Displaying run history'.format(repository))
+
+                for line in history.format_history(runs):
+                    logger.warning(line)
     if 'borg' in arguments:
         if arguments['borg'].repository is None or validate.repositories_match(
             repository, arguments['borg'].repository
@@ -748,6 +1365,58 @@ def log_error_records(
         pass
 
 
+def run_configuration_with_log_prefix(config_filename, config, arguments):
+    '''
+    Given a config filename, the corresponding parsed config dict, and command-line arguments as a
+    dict from subparser name to a namespace of parsed arguments, run the configuration file and
+    return its results as a list. Tag any command output logged from the current thread with the
+    configuration filename.
+    '''
+    set_log_prefix(config_filename)
+    set_log_config_filename(config_filename)
+
+    try:
+        return list(run_configuration(config_filename, config, arguments))
+    finally:
+        set_log_prefix(None)
+        set_log_config_filename(None)
+
+
+def run_configurations(configs, arguments):
+    '''
+    Given a dict of configuration filename to corresponding parsed configuration, and parsed
+    command-line arguments as a dict from subparser name to a parsed namespace of arguments, run
+    each configuration file and yield a (configuration filename, list of results) tuple for each one,
+    in the order of the given configuration files.
+
+    If the global "--jobs" option is greater than one, run up to that many configuration files at
+    once in a pool of worker threads. Otherwise, run them one at a time.
+    '''
+    jobs = arguments['global'].jobs
+
+    if jobs <= 1 or len(configs) <= 1:
+        for config_filename, config in configs.items():
+            yield (config_filename, list(run_configuration(config_filename, config, arguments)))
+
+        return
+
+    logger.info('Running {} configuration files, up to {} at a time'.format(len(configs), jobs))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            (
+                config_filename,
+                executor.submit(
+                    run_configuration_with_log_prefix, config_filename, config, arguments
+                ),
+            )
+            for config_filename, config in configs.items()
+        ]
+
+        for config_filename, future in futures:
+            yield (config_filename, future.result())
+
+
 def get_local_path(configs):
     '''
     Arbitrarily return the local path from the first configuration dict. Default to "borg" if not
@@ -764,7 +1433,8 @@ def collect_configuration_run_summary_logs(configs, arguments):
     information about each run.
 
     As a side effect of running through these configuration files, output their JSON results, if
-    any, to stdout.
+    any, to stdout. Also output how long each phase of the run took if requested via the --timings
+    or --timings-json flags, and write any requested metrics textfiles and trace file.
     '''
     # Run cross-file validation checks.
     if 'extract' in arguments:
@@ -795,21 +1465,24 @@ def collect_configuration_run_summary_logs(configs, arguments):
         try:
             for config_filename, config in configs.items():
                 hooks = config.get('hooks', {})
-                command.execute_hook(
-                    hooks.get('before_everything'),
-                    hooks.get('umask'),
-                    config_filename,
-                    'pre-everything',
-                    arguments['global'].dry_run,
-                )
+                with timing.span(config_filename, None, 'pre-everything hook'):
+                    command.execute_hook(
+                        hooks.get('before_everything'),
+                        hooks.get('umask'),
+                        config_filename,
+                        'pre-everything',
+                        arguments['global'].dry_run,
+                        extra_environment=borg_environment.make_environment(
+                            config.get('storage', {})
+                        ),
+                    )
         except (CalledProcessError, ValueError, OSError) as error:
             yield from log_error_records('Error running pre-everything hook', error)
             return
 
     # Execute the actions corresponding to each configuration file.
     json_results = []
-    for config_filename, config in configs.items():
-        results = list(run_configuration(config_filename, config, arguments))
+    for config_filename, results in run_configurations(configs, arguments):
         error_logs = tuple(result for result in results if isinstance(result, logging.LogRecord))
 
         if error_logs:
@@ -844,16 +1517,40 @@ def collect_configuration_run_summary_logs(configs, arguments):
         try:
             for config_filename, config in configs.items():
                 hooks = config.get('hooks', {})
-                command.execute_hook(
-                    hooks.get('after_everything'),
-                    hooks.get('umask'),
-                    config_filename,
-                    'post-everything',
-                    arguments['global'].dry_run,
-                )
+                with timing.span(config_filename, None, 'post-everything hook'):
+                    command.execute_hook(
+                        hooks.get('after_everything'),
+                        hooks.get('umask'),
+                        config_filename,
+                        'post-everything',
+                        arguments['global'].dry_run,
+                        extra_environment=borg_environment.make_environment(
+                            config.get('storage', {})
+                        ),
+                    )
         except (CalledProcessError, ValueError, OSError) as error:
             yield from log_error_records('Error running post-everything hook', error)
 
+    for summary in execute.summarize_process_usages():
+        yield logging.makeLogRecord(dict(levelno=logging.INFO, levelname='INFO', msg=summary))
+
+    try:
+        metrics.write_textfiles(configs)
+    except OSError as error:
+        yield from log_error_records('Error writing metrics textfile', error)
+
+    if arguments['global'].trace_file:
+        try:
+            trace.write_trace(arguments['global'].trace_file)
+        except OSError as error:
+            yield from log_error_records('Error writing trace file', error)
+
+    if arguments['global'].timings:
+        sys.stdout.write(timing.format_timings())
+
+    if arguments['global'].timings_json:
+        sys.stdout.write(timing.format_timings_json())
+
 
 def exit_with_help_link():  # pragma: no cover
     '''
@@ -1,13 +1,24 @@
+import asyncio
 import collections
+import functools
 import logging
 import os
 import select
 import subprocess
+import sys
+import threading
+import time
+import weakref
+
+from borgmatic import trace
+from borgmatic.logger import add_log_prefix
 
 logger = logging.getLogger(__name__)
 
 
 ERROR_OUTPUT_MAX_LINE_COUNT = 25
+READ_CHUNK_SIZE = 64 * 1024
+EXITING_PROCESS_POLL_SECONDS = 0.1
 BORG_ERROR_EXIT_CODE = 2
 
 
@@ -39,13 +50,258 @@ def command_for_process(process):
 def output_buffer_for_process(process, exclude_stdouts):
     '''
     Given a process as an instance of subprocess.Popen and a sequence of stdouts to exclude, return
-    either the process's stdout or stderr. The idea is that if stdout is excluded for a process, we
-    still have stderr to log.
+    either the process's stdout or stderr. The idea is that if stdout is excluded for a process (or
+    goes somewhere other than a pipe), we still have stderr to log.
+    '''
+    if process.stdout is None or process.stdout in exclude_stdouts:
+        return process.stderr
+
+    return process.stdout
+
+
+Process_usage = collections.namedtuple(
+    'Process_usage',
+    ('command_name', 'wall_seconds', 'user_seconds', 'system_seconds', 'max_rss_bytes'),
+)
+
+# Map from each process started by borgmatic to its time.monotonic() start time.
+PROCESS_START_TIMES = {}
+# The resource usage of each process that borgmatic has reaped, as Process_usage instances.
+PROCESS_USAGES = []
+# Map from each process that borgmatic has reaped to its Process_usage, while the process is in use.
+PROCESS_USAGES_BY_PROCESS = weakref.WeakKeyDictionary()
+PROCESS_USAGES_LOCK = threading.Lock()
+
+
+def start_process(command, **popen_arguments):
+    '''
+    Given a command and keyword arguments for subprocess.Popen(), start the command, remember when
+    it started, and return the process.
+    '''
+    process = subprocess.Popen(command, **popen_arguments)
+
+    with PROCESS_USAGES_LOCK:
+        PROCESS_START_TIMES[process] = time.monotonic()
+
+    return process
+
+
+def command_name_for_process(process):
+    '''
+    Given a process as an instance of subprocess.Popen, return the name of the program it runs,
+    e.g. "borg" or "pg_dump". For a shell command, that's the first word of the command.
+    '''
+    command = process.args.split(' ') if isinstance(process.args, str) else process.args
+
+    return os.path.basename(command[0])
+
+
+def exit_code_for_wait_status(status):
+    '''
+    Given a wait status as returned by os.wait4(), return the corresponding exit code in the same
+    form as subprocess.Popen.returncode: negative for a process killed by a signal.
+    '''
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+
+    return os.WEXITSTATUS(status)
+
+
+def format_process_usage(usage):
+    '''
+    Given a Process_usage instance, return a human-readable string describing it.
+    '''
+    return '{}{:.2f}s user CPU, {:.2f}s system CPU, {:.1f} MiB max RSS'.format(
+        '' if usage.wall_seconds is None else '{:.2f}s wall, '.format(usage.wall_seconds),
+        usage.user_seconds,
+        usage.system_seconds,
+        usage.max_rss_bytes / 1024 / 1024,
+    )
+
+
+def record_process_usage(process, resource_usage):
+    '''
+    Given a process as an instance of subprocess.Popen that has just been reaped and its resource
+    usage as returned by os.wait4(), remember the process' wall time, CPU time, and peak memory
+    usage for the end-of-run summary, and log them at debug level.
     '''
-    return process.stderr if process.stdout in exclude_stdouts else process.stdout
+    with PROCESS_USAGES_LOCK:
+        start_time = PROCESS_START_TIMES.pop(process, None)
+        usage = Process_usage(
+            command_name=command_name_for_process(process),
+            wall_seconds=None if start_time is None else time.monotonic() - start_time,
+            user_seconds=resource_usage.ru_utime,
+            system_seconds=resource_usage.ru_stime,
+            # Linux reports the maximum resident set size in kibibytes, macOS in bytes.
+            max_rss_bytes=resource_usage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024),
+        )
+        PROCESS_USAGES.append(usage)
+        PROCESS_USAGES_BY_PROCESS[process] = usage
+
+    if start_time is not None:
+        trace.record_event(
+            usage.command_name,
+            'process',
+            start_time,
+            start_time + usage.wall_seconds,
+            pid=process.pid,
+            thread_id=process.pid,
+            args={'command': command_for_process(process), 'exit_code': process.returncode},
+        )
+
+    logger.debug(
+        add_log_prefix(
+            '{} exited with code {}: {}'.format(
+                usage.command_name, process.returncode, format_process_usage(usage)
+            )
+        )
+    )
+
+
+def reap_process(process, block=True):
+    '''
+    Given a process as an instance of subprocess.Popen, wait for it to exit with os.wait4(), so that
+    its resource usage gets recorded, and return its exit code. If block is False, then return None
+    instead of waiting if the process is still running.
+    '''
+    if process.returncode is not None:
+        return process.returncode
+
+    try:
+        (pid, status, resource_usage) = os.wait4(process.pid, 0 if block else os.WNOHANG)
+    except ChildProcessError:
+        # Something else has already reaped the process, taking its resource usage with it.
+        with PROCESS_USAGES_LOCK:
+            PROCESS_START_TIMES.pop(process, None)
+
+        return process.wait() if block else process.poll()
+
+    if pid == 0:
+        return None
+
+    process.returncode = exit_code_for_wait_status(status)
+    record_process_usage(process, resource_usage)
+
+    return process.returncode
+
+
+def usage_for_process(process):
+    '''
+    Given a process as an instance of subprocess.Popen, return its Process_usage if it has been
+    reaped with its resource usage recorded, or None otherwise.
+    '''
+    with PROCESS_USAGES_LOCK:
+        return PROCESS_USAGES_BY_PROCESS.get(process)
+
+
+def summarize_process_usages():
+    '''
+    Return a list of human-readable strings summarizing the resource usage of the processes reaped
+    so far, one per command name, with the command taking the most wall time first.
+    '''
+    with PROCESS_USAGES_LOCK:
+        usages = list(PROCESS_USAGES)
+
+    usages_by_command_name = collections.defaultdict(list)
+    for usage in usages:
+        usages_by_command_name[usage.command_name].append(usage)
+
+    totals = [
+        (
+            len(command_usages),
+            Process_usage(
+                command_name=command_name,
+                wall_seconds=sum(usage.wall_seconds or 0 for usage in command_usages),
+                user_seconds=sum(usage.user_seconds for usage in command_usages),
+                system_seconds=sum(usage.system_seconds for usage in command_usages),
+                max_rss_bytes=max(usage.max_rss_bytes for usage in command_usages),
+            ),
+        )
+        for (command_name, command_usages) in usages_by_command_name.items()
+    ]
+
+    return [
+        'Resource usage for {}: {} process{}, {}'.format(
+            total.command_name,
+            process_count,
+            '' if process_count == 1 else 'es',
+            format_process_usage(total),
+        )
+        for (process_count, total) in sorted(
+            totals, key=lambda count_and_total: count_and_total[1].wall_seconds, reverse=True
+        )
+    ]
 
 
-def log_outputs(processes, exclude_stdouts, output_log_level, borg_local_path):
+def split_output_lines(partial_line, chunk):
+    '''
+    Given a bytearray of any partial line previously read from an output buffer and a newly read
+    chunk of bytes from that buffer (empty at the end of the output), split the accumulated output
+    into complete lines, leaving any trailing partial line in the bytearray for next time.
+
+    Return a tuple of (the complete lines as a list of decoded strings with trailing whitespace
+    stripped and blank lines omitted, whether the end of the output has been reached). At the end
+    of the output, the remaining partial line (if any) is returned as a line as well.
+    '''
+    if not chunk:
+        remaining = bytes(partial_line)
+        partial_line.clear()
+
+        return ([line for line in (remaining.decode().rstrip(),) if line], True)
+
+    partial_line.extend(chunk)
+    last_newline_index = partial_line.rfind(b'\n')
+
+    if last_newline_index == -1:
+        return ([], False)
+
+    complete_output = partial_line[:last_newline_index].decode()
+    del partial_line[: last_newline_index + 1]
+
+    return ([line.rstrip() for line in complete_output.split('\n') if line.strip()], False)
+
+
+def read_output_lines(output_buffer, partial_lines):
+    '''
+    Given a binary output buffer that's ready for reading (as reported by select()) and a dict from
+    output buffer to a bytearray of any partial line previously read from it, read one chunk of
+    output with a single os.read() call. Because the buffer is ready, this read doesn't block, even
+    if the output so far ends in the middle of a line.
+
+    Return the complete lines read so far and whether the end of the output has been reached, as
+    per split_output_lines().
+    '''
+    return split_output_lines(
+        partial_lines[output_buffer], os.read(output_buffer.fileno(), READ_CHUNK_SIZE)
+    )
+
+
+def log_lines(lines, output_log_level, last_lines, output_line_handler=None):
+    '''
+    Given a sequence of output lines, a log level, a deque of the most recent lines from the same
+    output buffer, and an optional output line handler, log each line at the given level and
+    remember it as one of the most recent lines.
+
+    If an output line handler is given, then it gets called with each line and returns the text to
+    log in its place (which may span multiple lines), or None to log nothing for that line.
+    '''
+    if output_line_handler:
+        lines = [
+            handled_line
+            for line in lines
+            for handled_line in (output_line_handler(line) or '').splitlines()
+            if handled_line.strip()
+        ]
+
+    last_lines.extend(lines)
+
+    for line in lines:
+        logger.log(output_log_level, add_log_prefix(line))
+
+
+def log_outputs(
+    processes, exclude_stdouts, output_log_level, borg_local_path, output_line_handlers=None
+):
     '''
     Given a sequence of subprocess.Popen() instances for multiple processes, log the output for each
     process with the requested log level. Additionally, raise a CalledProcessError if a process
@@ -56,54 +312,81 @@ def log_outputs(processes, exclude_stdouts, output_log_level, borg_local_path):
 
     Note that stdout for a process can be None if output is intentionally not captured. In which
     case it won't be logged.
+
+    Output is read in chunks directly from each buffer's file descriptor and split into lines
+    incrementally, so a process writing a partial line can't stall the logging of other processes.
+
+    If a dict from process to output line handler is given, then each line of a process' output
+    gets passed through its handler before logging, as per log_lines().
     '''
-    # Map from output buffer to sequence of last lines.
-    buffer_last_lines = collections.defaultdict(list)
+    output_line_handlers = output_line_handlers or {}
+    # Map from output buffer to the last few lines read from it, kept in case the process errors
+    # and we need the output for the exception below.
+    buffer_last_lines = collections.defaultdict(
+        lambda: collections.deque(maxlen=ERROR_OUTPUT_MAX_LINE_COUNT)
+    )
+    # Map from output buffer to any partial line read from it that's still awaiting a newline.
+    partial_lines = collections.defaultdict(bytearray)
     process_for_output_buffer = {
         output_buffer_for_process(process, exclude_stdouts): process
         for process in processes
         if process.stdout or process.stderr
     }
     output_buffers = list(process_for_output_buffer.keys())
+    finished_buffers = set()
 
     # Log output for each process until they all exit.
     while True:
+        # A process has exited, but it might be a pipe destination with other processes (pipe
+        # sources) waiting to be read from. So as a measure to prevent hangs, vent all processes
+        # when one exits.
+        if any(reap_process(process, block=False) is not None for process in processes):
+            for other_process in processes:
+                if (
+                    reap_process(other_process, block=False) is None
+                    and other_process.stdout
+                    and other_process.stdout not in output_buffers
+                    and other_process.stdout not in finished_buffers
+                ):
+                    # Add the process's output to output_buffers to ensure it'll get read.
+                    output_buffers.append(other_process.stdout)
+
         if output_buffers:
-            (ready_buffers, _, _) = select.select(output_buffers, [], [])
+            # A process whose output is exhausted is likely about to exit. So rather than blocking
+            # on the remaining buffers indefinitely, wake up periodically to check on it.
+            exiting = any(
+                process_for_output_buffer[finished_buffer].returncode is None
+                for finished_buffer in finished_buffers
+                if finished_buffer in process_for_output_buffer
+            )
+            (ready_buffers, _, _) = select.select(
+                output_buffers, [], [], EXITING_PROCESS_POLL_SECONDS if exiting else None
+            )
 
             for ready_buffer in ready_buffers:
                 ready_process = process_for_output_buffer.get(ready_buffer)
+                (lines, finished) = read_output_lines(ready_buffer, partial_lines)
 
-                # The "ready" process has exited, but it might be a pipe destination with other
-                # processes (pipe sources) waiting to be read from. So as a measure to prevent
-                # hangs, vent all processes when one exits.
-                if ready_process and ready_process.poll() is not None:
-                    for other_process in processes:
-                        if (
-                            other_process.poll() is None
-                            and other_process.stdout
-                            and other_process.stdout not in output_buffers
-                        ):
-                            # Add the process's output to output_buffers to ensure it'll get read.
-                            output_buffers.append(other_process.stdout)
-
-                line = ready_buffer.readline().rstrip().decode()
-                if not line or not ready_process:
-                    continue
+                # Stop selecting on a buffer once it's exhausted, as it would otherwise be reported
+                # ready forever.
+                if finished:
+                    output_buffers.remove(ready_buffer)
+                    finished_buffers.add(ready_buffer)
 
-                # Keep the last few lines of output in case the process errors, and we need the output for
-                # the exception below.
-                last_lines = buffer_last_lines[ready_buffer]
-                last_lines.append(line)
-                if len(last_lines) > ERROR_OUTPUT_MAX_LINE_COUNT:
-                    last_lines.pop(0)
+                if not lines or not ready_process:
+                    continue
 
-                logger.log(output_log_level, line)
+                log_lines(
+                    lines,
+                    output_log_level,
+                    buffer_last_lines[ready_buffer],
+                    output_line_handlers.get(ready_process),
+                )
 
         still_running = False
 
         for process in processes:
-            exit_code = process.poll() if output_buffers else process.wait()
+            exit_code = reap_process(process, block=not output_buffers)
 
             if exit_code is None:
                 still_running = True
@@ -114,16 +397,18 @@ def log_outputs(processes, exclude_stdouts, output_log_level, borg_local_path):
                 # inadvertently hide error output.
                 output_buffer = output_buffer_for_process(process, exclude_stdouts)
 
-                last_lines = buffer_last_lines[output_buffer] if output_buffer else []
+                last_lines = list(buffer_last_lines[output_buffer]) if output_buffer else []
                 if len(last_lines) == ERROR_OUTPUT_MAX_LINE_COUNT:
                     last_lines.insert(0, '...')
 
                 # Something has gone wrong. So vent each process' output buffer to prevent it from
-                # hanging. And then kill the process.
+                # hanging. And then kill the process, and reap it so its resource usage still gets
+                # recorded.
                 for other_process in processes:
-                    if other_process.poll() is None:
+                    if reap_process(other_process, block=False) is None:
                         other_process.stdout.read(0)
                         other_process.kill()
+                        reap_process(other_process)
 
                 raise subprocess.CalledProcessError(
                     exit_code, command_for_process(process), '\n'.join(last_lines)
@@ -136,17 +421,21 @@ def log_outputs(processes, exclude_stdouts, output_log_level, borg_local_path):
     for process in processes:
         output_buffer = output_buffer_for_process(process, exclude_stdouts)
 
-        if not output_buffer:
+        if not output_buffer or output_buffer in finished_buffers:
             continue
 
         while True:  # pragma: no cover
-            remaining_output = output_buffer.readline().rstrip().decode()
-
-            if not remaining_output:
+            (lines, finished) = read_output_lines(output_buffer, partial_lines)
+            log_lines(
+                lines,
+                output_log_level,
+                buffer_last_lines[output_buffer],
+                output_line_handlers.get(process),
+            )
+
+            if finished:
                 break
 
-            logger.log(output_log_level, remaining_output)
-
 
 def log_command(full_command, input_file, output_file):
     '''
@@ -176,6 +465,8 @@ def execute_command(
     working_directory=None,
     borg_local_path=None,
     run_to_completion=True,
+    output_line_handler=None,
+    umask=None,
 ):
     '''
     Execute the given command (a sequence of command/argument strings) and log its output at the
@@ -187,7 +478,9 @@ def execute_command(
     into the command. If a working directory is given, use that as the present working directory
     when running the command. If a Borg local path is given, and the command matches it (regardless
     of arguments), treat exit code 1 as a warning instead of an error. If run to completion is
-    False, then return the process for the command without executing it to completion.
+    False, then return the process for the command without executing it to completion. If an output
+    line handler is given, pass each line of output through it before logging, as per log_lines().
+    If a umask integer is given, then set it for the command.
 
     Raise subprocesses.CalledProcessError if an error occurs while running the command.
     '''
@@ -196,13 +489,31 @@ def execute_command(
     do_not_capture = bool(output_file is DO_NOT_CAPTURE)
     command = ' '.join(full_command) if shell else full_command
 
+    # Set the umask in the child process only, as changing borgmatic's own umask would affect
+    # anything else running at the same time in other threads.
+    umask_arguments = (
+        {'preexec_fn': functools.partial(os.umask, umask)} if umask is not None else {}
+    )
+
     if output_log_level is None:
-        output = subprocess.check_output(
-            command, shell=shell, env=environment, cwd=working_directory
+        process = start_process(
+            command,
+            stdout=subprocess.PIPE,
+            shell=shell,
+            env=environment,
+            cwd=working_directory,
+            **umask_arguments,
         )
-        return output.decode() if output is not None else None
+        with process.stdout:
+            output = process.stdout.read()
+
+        exit_code = reap_process(process)
+        if exit_code != 0:
+            raise subprocess.CalledProcessError(exit_code, process.args, output)
 
-    process = subprocess.Popen(
+        return output.decode()
+
+    process = start_process(
         command,
         stdin=input_file,
         stdout=None if do_not_capture else (output_file or subprocess.PIPE),
@@ -210,12 +521,17 @@ def execute_command(
         shell=shell,
         env=environment,
         cwd=working_directory,
+        **umask_arguments,
     )
     if not run_to_completion:
         return process
 
     log_outputs(
-        (process,), (input_file, output_file), output_log_level, borg_local_path=borg_local_path
+        (process,),
+        (input_file, output_file),
+        output_log_level,
+        borg_local_path=borg_local_path,
+        output_line_handlers={process: output_line_handler} if output_line_handler else None,
     )
 
 
@@ -229,6 +545,7 @@ def execute_command_with_processes(
     extra_environment=None,
     working_directory=None,
     borg_local_path=None,
+    output_line_handler=None,
 ):
     '''
     Execute the given command (a sequence of command/argument strings) and log its output at the
@@ -242,40 +559,336 @@ def execute_command_with_processes(
     given, then use it to augment the current environment, and pass the result into the command. If
     a working directory is given, use that as the present working directory when running the
     command. If a Borg local path is given, then for any matching command or process (regardless of
-    arguments), treat exit code 1 as a warning instead of an error.
+    arguments), treat exit code 1 as a warning instead of an error. If an output line handler is
+    given, pass each line of the command's output (but not the other processes') through it before
+    logging, as per log_lines().
+
+    If output log level is None, then instead of logging the command's output, capture and return
+    it as a string, while still logging the output of the other processes at the info level.
+
+    This runs execute_command_with_processes_async() in its own event loop.
 
     Raise subprocesses.CalledProcessError if an error occurs while running the command or in the
     upstream process.
     '''
-    log_command(full_command, input_file, output_file)
+    # Don't let asyncio's own debug logging clutter borgmatic's output.
+    logging.getLogger('asyncio').setLevel(logging.WARNING)
+
+    return asyncio.run(
+        execute_command_with_processes_async(
+            full_command,
+            processes,
+            output_log_level,
+            output_file,
+            input_file,
+            shell,
+            extra_environment,
+            working_directory,
+            borg_local_path,
+            output_line_handler,
+        )
+    )
+
+
+def start_command_process(
+    full_command,
+    output_file,
+    input_file,
+    shell,
+    extra_environment,
+    working_directory,
+    capture_output=False,
+):
+    '''
+    Given a command (a sequence of command/argument strings), an open output file object (or
+    DO_NOT_CAPTURE or None), an open input file object (or None), whether to execute the command
+    within a shell, an extra environment dict (or None), a working directory (or None), and whether
+    to capture the command's output rather than logging it, start the command and return its
+    process as an instance of subprocess.Popen.
+
+    Unless output isn't to be captured, the process' stdout is piped (or, with an output file, its
+    stderr), so that it can be logged. If capturing output, then only stdout is piped, and stderr
+    goes wherever borgmatic's own does, as per execute_command() without an output log level.
+    '''
     environment = {**os.environ, **extra_environment} if extra_environment else None
     do_not_capture = bool(output_file is DO_NOT_CAPTURE)
-    command = ' '.join(full_command) if shell else full_command
 
-    try:
-        command_process = subprocess.Popen(
-            command,
+    if capture_output:
+        return start_process(
+            ' '.join(full_command) if shell else full_command,
             stdin=input_file,
-            stdout=None if do_not_capture else (output_file or subprocess.PIPE),
-            stderr=None
-            if do_not_capture
-            else (subprocess.PIPE if output_file else subprocess.STDOUT),
+            stdout=subprocess.PIPE,
             shell=shell,
             env=environment,
             cwd=working_directory,
         )
-    except (subprocess.CalledProcessError, OSError):
-        # Something has gone wrong. So vent each process' output buffer to prevent it from hanging.
-        # And then kill the process.
-        for process in processes:
-            if process.poll() is None:
-                process.stdout.read(0)
+
+    return start_process(
+        ' '.join(full_command) if shell else full_command,
+        stdin=input_file,
+        stdout=None if do_not_capture else (output_file or subprocess.PIPE),
+        stderr=None if do_not_capture else (subprocess.PIPE if output_file else subprocess.STDOUT),
+        shell=shell,
+        env=environment,
+        cwd=working_directory,
+    )
+
+
+def kill_processes(processes):
+    '''
+    Given a sequence of processes as instances of subprocess.Popen, kill any of them that haven't
+    been reaped yet.
+    '''
+    for process in processes:
+        if process.returncode is None:
+            try:
                 process.kill()
+            except ProcessLookupError:  # pragma: no cover
+                pass
+
+
+async def wait_for_process_async(process):
+    '''
+    Given a process as an instance of subprocess.Popen, wait for it to exit and return its exit
+    code.
+
+    asyncio's own subprocess support reaps processes with os.waitpid(), discarding their resource
+    usage. So instead, reap the process with reap_process() in a worker thread, which blocks until
+    the process exits rather than polling it.
+    '''
+    return await asyncio.get_running_loop().run_in_executor(None, reap_process, process)
+
+
+async def open_pipe_reader(pipe):
+    '''
+    Given a binary pipe file object, return a tuple of (an asyncio.StreamReader for reading from it,
+    the corresponding transport to close once done reading).
+    '''
+    reader = asyncio.StreamReader()
+    (transport, _) = await asyncio.get_running_loop().connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), pipe
+    )
+
+    return (reader, transport)
+
+
+async def read_output_async(output_buffer):
+    '''
+    Given an output buffer as a binary pipe file object, read from it until it ends, and return
+    everything read as bytes.
+    '''
+    (reader, transport) = await open_pipe_reader(output_buffer)
+
+    try:
+        return await reader.read()
+    finally:
+        transport.close()
+
+
+async def log_output_async(output_buffer, output_log_level, last_lines, output_line_handler=None):
+    '''
+    Given an output buffer as a binary pipe file object, a log level, a deque in which to keep the
+    most recent lines, and an optional output line handler, read output from the buffer in chunks
+    until it ends, logging each complete line as it arrives (as per log_lines()).
+    '''
+    (reader, transport) = await open_pipe_reader(output_buffer)
+    partial_line = bytearray()
+
+    try:
+        while True:
+            (lines, finished) = split_output_lines(partial_line, await reader.read(READ_CHUNK_SIZE))
+            log_lines(lines, output_log_level, last_lines, output_line_handler)
+
+            if finished:
+                break
+    finally:
+        transport.close()
+
+
+async def run_process_async(
+    process, output_buffer, output_log_level, borg_local_path, output_line_handler=None
+):
+    '''
+    Given a process as an instance of subprocess.Popen, its output buffer to log (or None), a log
+    level, an optional Borg local path, and an optional output line handler (as per log_lines()),
+    log the process' output until it exits. Raise a
+    CalledProcessError if it exits with an error (or a warning for exit code 1, if the process
+    matches the Borg local path), including its last few lines of output.
+    '''
+    last_lines = collections.deque(maxlen=ERROR_OUTPUT_MAX_LINE_COUNT)
+
+    if output_buffer:
+        (_, exit_code) = await asyncio.gather(
+            log_output_async(output_buffer, output_log_level, last_lines, output_line_handler),
+            wait_for_process_async(process),
+        )
+    else:
+        exit_code = await wait_for_process_async(process)
+
+    if exit_code_indicates_error(process, exit_code, borg_local_path):
+        error_lines = list(last_lines)
+        if len(error_lines) == ERROR_OUTPUT_MAX_LINE_COUNT:
+            error_lines.insert(0, '...')
+
+        raise subprocess.CalledProcessError(
+            exit_code, command_for_process(process), '\n'.join(error_lines)
+        )
+
+
+async def log_outputs_async(
+    processes, exclude_stdouts, output_log_level, borg_local_path, output_line_handlers=None
+):
+    '''
+    Given a sequence of processes as instances of subprocess.Popen, log the output for each process
+    with the requested log level until they all exit. If stdouts are given to exclude, then for any
+    matching processes, log from their stderr instead. If a dict from process to output line
+    handler is given, pass each line of a process' output through its handler before logging, as
+    per log_lines().
+
+    As soon as any process exits with an error, kill the others and raise a CalledProcessError for
+    the failed process. That way, an upstream process can't hang forever writing to a consumer that
+    has gone away, nor can a consumer wait forever for input from a producer that has failed.
+    '''
+    tasks = [
+        asyncio.ensure_future(
+            run_process_async(
+                process,
+                output_buffer_for_process(process, exclude_stdouts),
+                output_log_level,
+                borg_local_path,
+                (output_line_handlers or {}).get(process),
+            )
+        )
+        for process in processes
+    ]
+
+    (done, pending) = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+    failed_tasks = [task for task in tasks if task in done and task.exception()]
+
+    if not failed_tasks:
+        return
+
+    kill_processes(processes)
+
+    for task in pending:
+        task.cancel()
+
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    raise failed_tasks[0].exception()
+
+
+async def execute_command_async(
+    full_command,
+    output_log_level=logging.INFO,
+    output_file=None,
+    input_file=None,
+    shell=False,
+    extra_environment=None,
+    working_directory=None,
+    borg_local_path=None,
+):
+    '''
+    Execute the given command (a sequence of command/argument strings) with asyncio and log its
+    output at the given log level. If output log level is None, instead capture and return the
+    output. The remaining arguments are as per execute_command().
+
+    Raise subprocesses.CalledProcessError if an error occurs while running the command.
+    '''
+    if output_log_level is not None:
+        return await execute_command_with_processes_async(
+            full_command,
+            (),
+            output_log_level,
+            output_file,
+            input_file,
+            shell,
+            extra_environment,
+            working_directory,
+            borg_local_path,
+        )
+
+    log_command(full_command, input_file, output_file)
+    process = start_process(
+        ' '.join(full_command) if shell else full_command,
+        stdin=input_file,
+        stdout=subprocess.PIPE,
+        shell=shell,
+        env={**os.environ, **extra_environment} if extra_environment else None,
+        cwd=working_directory,
+    )
+    output = await read_output_async(process.stdout)
+    exit_code = await wait_for_process_async(process)
+    if exit_code != 0:
+        raise subprocess.CalledProcessError(exit_code, process.args, output)
+
+    return output.decode()
+
+
+async def execute_command_with_processes_async(
+    full_command,
+    processes,
+    output_log_level=logging.INFO,
+    output_file=None,
+    input_file=None,
+    shell=False,
+    extra_environment=None,
+    working_directory=None,
+    borg_local_path=None,
+    output_line_handler=None,
+):
+    '''
+    Execute the given command (a sequence of command/argument strings) with asyncio and log its
+    output at the given log level, while also logging the output of one or more active processes
+    (instances of subprocess.Popen) until they all exit. This is useful, for instance, for
+    processes that are streaming output to a named pipe that the given command is consuming from.
+    The remaining arguments are as per execute_command_with_processes().
+
+    If output log level is None, then instead of logging the command's output, capture and return
+    it, while still logging the output of the other processes at the info level.
+
+    If the input file is the stdout pipe of one of the given processes, then that process is the
+    producer side of a pipeline feeding the command. Once the command has started, borgmatic closes
+    its own copy of that pipe, so the producer gets a broken pipe rather than hanging if the command
+    exits early.
+
+    Raise subprocesses.CalledProcessError if an error occurs while running the command or in any of
+    the given processes, after killing any that are still running.
+    '''
+    log_command(full_command, input_file, output_file)
+    capture_output = bool(output_log_level is None)
+
+    try:
+        command_process = start_command_process(
+            full_command,
+            output_file,
+            input_file,
+            shell,
+            extra_environment,
+            working_directory,
+            capture_output,
+        )
+    except (subprocess.CalledProcessError, OSError):
+        # Something has gone wrong. So kill the other processes rather than leaving them hanging.
+        kill_processes(processes)
         raise
 
-    log_outputs(
+    if input_file is not None and any(input_file is process.stdout for process in processes):
+        input_file.close()
+
+    log_outputs = log_outputs_async(
         tuple(processes) + (command_process,),
-        (input_file, output_file),
-        output_log_level,
-        borg_local_path=borg_local_path,
+        # When capturing the command's output, don't log it as well.
+        (input_file, output_file) + ((command_process.stdout,) if capture_output else ()),
+        logging.INFO if capture_output else output_log_level,
+        borg_local_path,
+        {command_process: output_line_handler} if output_line_handler else None,
     )
+
+    if not capture_output:
+        await log_outputs
+        return None
+
+    (output, _) = await asyncio.gather(read_output_async(command_process.stdout), log_outputs)
+
+    return output.decode()
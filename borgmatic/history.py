@@ -0,0 +1,283 @@
+import contextlib
+import datetime
+import logging
+import os
+import sqlite3
+import statistics
+import time
+
+from borgmatic import metrics, timing
+from borgmatic.borg.progress import format_size
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    config_filename TEXT NOT NULL,
+    repository TEXT NOT NULL,
+    success INTEGER NOT NULL,
+    duration_seconds REAL,
+    create_seconds REAL,
+    original_size INTEGER,
+    compressed_size INTEGER,
+    deduplicated_size INTEGER,
+    file_count INTEGER,
+    dump_seconds REAL
+);
+CREATE INDEX IF NOT EXISTS runs_by_repository ON runs (config_filename, repository, id);
+'''
+
+COLUMNS = (
+    'timestamp',
+    'config_filename',
+    'repository',
+    'success',
+    'duration_seconds',
+    'create_seconds',
+    'original_size',
+    'compressed_size',
+    'deduplicated_size',
+    'file_count',
+    'dump_seconds',
+)
+
+# Map from metric sample name to the history column that it gets recorded in.
+SAMPLE_COLUMNS = {
+    'borgmatic_repository_success': 'success',
+    'borgmatic_archive_duration_seconds': 'create_seconds',
+    'borgmatic_archive_original_size_bytes': 'original_size',
+    'borgmatic_archive_compressed_size_bytes': 'compressed_size',
+    'borgmatic_archive_deduplicated_size_bytes': 'deduplicated_size',
+    'borgmatic_archive_files': 'file_count',
+}
+
+# How long to wait for another borgmatic process to finish writing to the database.
+DATABASE_TIMEOUT_SECONDS = 30
+
+DEFAULT_REGRESSION_RUNS = 10
+# The fewest earlier runs that a throughput median gets computed from, so that the first few runs
+# in a new database don't trigger regressions.
+MINIMUM_REGRESSION_RUNS = 3
+
+
+@contextlib.contextmanager
+def open_database(path):
+    '''
+    Given the path of a history database, open it (creating it and its tables first if necessary)
+    and yield a connection to it, closing the connection afterwards. Commit any changes made within
+    this context, unless it raises.
+
+    Raise OSError or sqlite3.Error if the database can't be opened.
+    '''
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+
+    with contextlib.closing(sqlite3.connect(path, timeout=DATABASE_TIMEOUT_SECONDS)) as connection:
+        connection.row_factory = sqlite3.Row
+        connection.executescript(SCHEMA)
+
+        with connection:
+            yield connection
+
+
+def collect_results(config_filename, timestamp):
+    '''
+    Given a configuration filename and a Unix timestamp, collect the results of running actions for
+    each of the configuration file's repositories during this borgmatic run from the metrics samples
+    and timing spans recorded so far. Return them as a list of dicts from history column to value,
+    one per repository. Leave out repositories without a success or failure result.
+    '''
+    results = {}
+    dump_seconds = {}
+
+    for sample in metrics.get_samples((config_filename,)):
+        labels = dict(sample.labels)
+        result = results.setdefault(labels['repository'], {})
+
+        if sample.name == 'borgmatic_database_dump_duration_seconds':
+            # With retries, a hook's dumps can run more than once. Only count the last time.
+            dump_seconds.setdefault(labels['repository'], {})[labels['hook']] = sample.value
+        elif sample.name in SAMPLE_COLUMNS:
+            result[SAMPLE_COLUMNS[sample.name]] = sample.value
+
+    spans = timing.total_spans()
+
+    return [
+        dict(
+            {column: None for column in COLUMNS},
+            timestamp=timestamp,
+            config_filename=config_filename,
+            repository=repository,
+            duration_seconds=sum(spans.get((config_filename, repository), {}).values()) or None,
+            dump_seconds=sum(dump_seconds[repository].values())
+            if repository in dump_seconds
+            else None,
+            **result,
+        )
+        for repository, result in results.items()
+        if 'success' in result
+    ]
+
+
+def throughput(original_size, create_seconds):
+    '''
+    Given the original size of an archive in bytes and the number of seconds that Borg took to
+    create it, return the throughput in bytes per second, or None if either is missing.
+    '''
+    if not original_size or not create_seconds:
+        return None
+
+    return original_size / create_seconds
+
+
+def find_throughput_regression(connection, result, threshold_percent, runs):
+    '''
+    Given a history database connection, a dict of results for a repository as returned by
+    collect_results(), a percentage, and a number of runs, compare the throughput of the results
+    against the median throughput of that many earlier successful runs for the same repository.
+    Return a message describing the regression if the throughput is more than the given percentage
+    below the median, or None otherwise.
+    '''
+    current_throughput = throughput(result['original_size'], result['create_seconds'])
+
+    if not result['success'] or current_throughput is None:
+        return None
+
+    earlier_throughputs = [
+        throughput(row['original_size'], row['create_seconds'])
+        for row in connection.execute(
+            '''
+            SELECT original_size, create_seconds FROM runs
+            WHERE config_filename = ? AND repository = ? AND success
+                AND original_size > 0 AND create_seconds > 0
+            ORDER BY id DESC LIMIT ?
+            ''',
+            (result['config_filename'], result['repository'], runs),
+        )
+    ]
+
+    if len(earlier_throughputs) < MINIMUM_REGRESSION_RUNS:
+        return None
+
+    median_throughput = statistics.median(earlier_throughputs)
+    drop_percent = 100 * (1 - current_throughput / median_throughput)
+
+    if drop_percent <= threshold_percent:
+        return None
+
+    return 'Backup throughput of {}/s is {:.0f}% below the median of {}/s over the last {} runs'.format(
+        format_size(current_throughput),
+        drop_percent,
+        format_size(median_throughput),
+        len(earlier_throughputs),
+    )
+
+
+def record_run(path, config_filename, throughput_regression=None):
+    '''
+    Given the path of a history database, a configuration filename, and an optional throughput
+    regression configuration dict, record the results of this borgmatic run for each of the
+    configuration file's repositories in the database.
+
+    If a throughput regression configuration is given, then also check each repository's throughput
+    against earlier runs. Return a list of (repository path, message) tuples for any regressions.
+
+    Failing to open or write the database isn't an error, as it's only history.
+    '''
+    results = collect_results(config_filename, time.time())
+    regressions = []
+
+    if not results:
+        return regressions
+
+    try:
+        with open_database(path) as connection:
+            for result in results:
+                if throughput_regression:
+                    message = find_throughput_regression(
+                        connection,
+                        result,
+                        throughput_regression.get('percent', 0),
+                        throughput_regression.get('runs', DEFAULT_REGRESSION_RUNS),
+                    )
+
+                    if message:
+                        regressions.append((result['repository'], message))
+
+                connection.execute(
+                    'INSERT INTO runs ({}) VALUES ({})'.format(
+                        ', '.join(COLUMNS), ', '.join('?' for column in COLUMNS)
+                    ),
+                    tuple(result[column] for column in COLUMNS),
+                )
+    except (OSError, sqlite3.Error) as error:
+        logger.warning(
+            '{}: Cannot record run history in {}: {}'.format(config_filename, path, error)
+        )
+
+    return regressions
+
+
+def read_history(path, config_filename, repository, last=None):
+    '''
+    Given the path of a history database, a configuration filename, a repository path, and an
+    optional number of most recent runs to limit results to, return the recorded runs for that
+    repository as a list of dicts from column to value, oldest first. Return an empty list if the
+    database doesn't exist.
+
+    Raise sqlite3.Error if the database can't be read.
+    '''
+    if not os.path.exists(os.path.expanduser(path)):
+        return []
+
+    with open_database(path) as connection:
+        rows = connection.execute(
+            '''
+            SELECT {} FROM runs WHERE config_filename = ? AND repository = ?
+            ORDER BY id DESC LIMIT ?
+            '''.format(
+                ', '.join(COLUMNS)
+            ),
+            (config_filename, repository, -1 if last is None else last),
+        ).fetchall()
+
+    return [dict(row) for row in reversed(rows)]
+
+
+def format_optional(value, format_value):
+    '''
+    Given a value and a function to format it with, return the formatted value or "-" if the value
+    is None.
+    '''
+    return '-' if value is None else format_value(value)
+
+
+def format_history(runs):
+    '''
+    Given a sequence of recorded runs as returned by read_history(), return a list of lines of a
+    human-readable table of them.
+    '''
+    line_format = '{:<19}  {:<7}  {:>9}  {:>9}  {:>10}  {:>10}  {:>9}  {:>12}'
+
+    return [
+        line_format.format(
+            'Time', 'Result', 'Duration', 'Create', 'Original', 'Dedup', 'Files', 'Throughput'
+        )
+    ] + [
+        line_format.format(
+            datetime.datetime.fromtimestamp(run['timestamp']).strftime('%Y-%m-%d %H:%M:%S'),
+            'success' if run['success'] else 'failed',
+            format_optional(run['duration_seconds'], '{:.1f}s'.format),
+            format_optional(run['create_seconds'], '{:.1f}s'.format),
+            format_optional(run['original_size'], format_size),
+            format_optional(run['deduplicated_size'], format_size),
+            format_optional(run['file_count'], '{:.0f}'.format),
+            format_optional(
+                throughput(run['original_size'], run['create_seconds']),
+                lambda value: '{}/s'.format(format_size(value)),
+            ),
+        )
+        for run in runs
+    ]
@@ -0,0 +1,417 @@
+import concurrent.futures
+import errno
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+from borgmatic import execute
+from borgmatic.borg import extract as borg_extract
+from borgmatic.borg import source_snapshot
+from borgmatic.hooks import manifest
+
+logger = logging.getLogger(__name__)
+
+CHECKSUMS_FILENAME = 'database_dump_checksums.json'
+# How many archives' worth of dump checksums to keep per repository.
+MAX_RECORDED_ARCHIVES = 100
+# How long to wait between checks for Borg opening the named pipe of a checksummed dump.
+PIPE_OPEN_POLL_SECONDS = 0.1
+# How long to wait for checksummed dumps to finish copying once Borg is done.
+TEE_FINISH_TIMEOUT_SECONDS = 10
+
+# Map from the path of each checksummed dump that streamed to Borg to a dict with its "checksum"
+# and "size". Only read or change these while holding dump.DATABASE_DUMP_LOCK.
+STREAMED_CHECKSUMS = {}
+TEE_THREADS = []
+TEE_STOP = threading.Event()
+
+# Guards the checksums file when several repositories record checksums at once.
+CHECKSUMS_FILE_LOCK = threading.Lock()
+
+
+def checksum_stream(input_file, output_file=None):
+    '''
+    Given a binary file object to read from and an optional binary file object to write to, read the
+    input in chunks until it ends, copying each chunk to the output (if any). Return a tuple of (a
+    checksum of everything read as a string like "blake2b:<hex digest>", the number of bytes read).
+    '''
+    checksum = hashlib.new(manifest.CHECKSUM_ALGORITHM)
+    size = 0
+
+    for chunk in iter(lambda: input_file.read(manifest.CHECKSUM_CHUNK_BYTES), b''):
+        checksum.update(chunk)
+        size += len(chunk)
+
+        if output_file:
+            output_file.write(chunk)
+
+    return ('{}:{}'.format(manifest.CHECKSUM_ALGORITHM, checksum.hexdigest()), size)
+
+
+def open_pipe_for_writing(pipe_path, stop_event):
+    '''
+    Given the path of a named pipe and a threading.Event, open the named pipe for writing as soon as
+    a reader (Borg) opens it, and return it as a binary file object. Poll rather than blocking on
+    the open, so as to give up and return None if the stop event gets set first.
+    '''
+    while True:
+        try:
+            descriptor = os.open(pipe_path, os.O_WRONLY | os.O_NONBLOCK)
+        except OSError as error:
+            # There's no reader yet.
+            if error.errno != errno.ENXIO:
+                raise
+
+            if stop_event.wait(PIPE_OPEN_POLL_SECONDS):
+                return None
+
+            continue
+
+        os.set_blocking(descriptor, True)
+
+        return os.fdopen(descriptor, 'wb')
+
+
+def process_exited(process):
+    '''
+    Given a process as an instance of subprocess.Popen, return whether it has exited. Don't reap
+    it, so as to leave that (and recording its resource usage) to whatever is waiting for it.
+    '''
+    if process.returncode is not None:
+        return True
+
+    try:
+        return os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOHANG | os.WNOWAIT) is not None
+    except ChildProcessError:
+        return True
+
+
+def tee_dump(process, input_path, pipe_path, stop_event):
+    '''
+    Given a dump process as an instance of subprocess.Popen, the path of the private named pipe
+    that it writes the dump to, the path of the named pipe that Borg reads the dump from, and a
+    threading.Event to stop waiting for Borg, wait for Borg to open its named pipe, and only then
+    open the private named pipe, which lets the dump start. Copy the dump from one to the other and
+    record its checksum and size in STREAMED_CHECKSUMS. Afterwards, remove the private named pipe.
+
+    If Borg never opens its named pipe or goes away partway through, then stop copying. Closing the
+    private named pipe makes the dump fail with a broken pipe, and that error gets reported along
+    with the dump process.
+    '''
+    try:
+        try:
+            output_file = open_pipe_for_writing(pipe_path, stop_event)
+        except OSError as error:
+            logger.debug('Cannot stream database dump to {}: {}'.format(pipe_path, error))
+            output_file = None
+
+        # The dump's shell is waiting to open the private named pipe, so opening it doesn't block
+        # unless the dump has already been killed.
+        if process_exited(process):
+            if output_file:
+                output_file.close()
+            return
+
+        with open(input_path, 'rb') as input_file:
+            if not output_file:
+                return
+
+            with output_file:
+                (checksum, size) = checksum_stream(input_file, output_file)
+    except OSError as error:
+        logger.debug('Cannot stream database dump to {}: {}'.format(pipe_path, error))
+        return
+    finally:
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+
+    STREAMED_CHECKSUMS[pipe_path] = {'checksum': checksum, 'size': size}
+
+
+def start_checksummed_dump(command, extra_environment, dump_filename):
+    '''
+    Given a shell command (a sequence of strings) that dumps a database with shell redirection to
+    the named pipe at the given dump filename, and an extra environment dict for it (or None), start
+    the dump so that it writes to a private named pipe instead, along with a thread that copies the
+    dump from there to the named pipe, computing its checksum on the way through. Return the dump
+    process as an instance of subprocess.Popen.
+
+    As with a dump that writes to Borg's named pipe directly, the dump's shell waits to open the
+    private named pipe, so the dump itself doesn't start until Borg opens the named pipe.
+
+    Raise ValueError if the command doesn't end with redirection to the dump filename.
+    '''
+    if tuple(command[-2:]) != ('>', dump_filename):
+        raise ValueError('Cannot checksum a database dump that is not redirected to a named pipe')
+
+    # Keep the private named pipe out of the directories that Borg backs up, so Borg doesn't read
+    # it too.
+    input_path = os.path.join(tempfile.mkdtemp(prefix='borgmatic-'), 'dump')
+
+    try:
+        os.mkfifo(input_path, mode=0o600)
+        process = execute.execute_command(
+            tuple(command[:-2]) + ('>', input_path),
+            shell=True,
+            extra_environment=extra_environment,
+            run_to_completion=False,
+        )
+    except OSError:
+        shutil.rmtree(os.path.dirname(input_path), ignore_errors=True)
+        raise
+
+    thread = threading.Thread(
+        target=tee_dump, args=(process, input_path, dump_filename, TEE_STOP), daemon=True
+    )
+    thread.start()
+    TEE_THREADS.append(thread)
+
+    return process
+
+
+def finish_checksummed_dumps():
+    '''
+    Stop waiting for Borg to read any checksummed dumps it hasn't opened, wait briefly for the
+    others to finish, and return a dict from the path of each checksummed dump that streamed to Borg
+    in its entirety to a dict with its "checksum" and "size". Then reset for the next dumps.
+    '''
+    TEE_STOP.set()
+
+    for thread in TEE_THREADS:
+        thread.join(TEE_FINISH_TIMEOUT_SECONDS)
+
+    checksums = dict(STREAMED_CHECKSUMS)
+    STREAMED_CHECKSUMS.clear()
+    TEE_THREADS.clear()
+    TEE_STOP.clear()
+
+    return checksums
+
+
+def make_dump_entries(checksums):
+    '''
+    Given a dict from dump path to a dict with its "checksum" and "size", as returned by
+    finish_checksummed_dumps(), return a list of dump checksum entries, each one a dict with the
+    database "hook", database "name", and the dump's "path", "checksum", and "size".
+    '''
+    return [
+        dict(
+            hook=os.path.basename(os.path.dirname(os.path.dirname(path))),
+            name=os.path.basename(path),
+            path=path,
+            **checksums[path],
+        )
+        for path in sorted(checksums)
+    ]
+
+
+def make_checksums_path():
+    '''
+    Return the path of the file that records the checksums of streamed database dumps.
+    '''
+    return os.path.join(source_snapshot.get_state_directory(), CHECKSUMS_FILENAME)
+
+
+def read_checksums(checksums_path):
+    '''
+    Given the path of a checksums file, return its contents as a dict from repository to a dict
+    from archive name to a list of dump checksum entries. If the file is missing or invalid, then
+    return an empty dict.
+    '''
+    try:
+        with open(checksums_path) as checksums_file:
+            checksums = json.load(checksums_file)
+    except (OSError, ValueError):
+        return {}
+
+    return checksums if isinstance(checksums, dict) else {}
+
+
+def record_checksums(repository, archive_name, dump_entries, log_prefix):
+    '''
+    Given a repository path, the name of the archive that the dumps went into, a list of dump
+    checksum entries as returned by make_dump_entries(), and a prefix to use in log entries, record
+    the checksums in borgmatic's state directory for later verification. Only keep the most recent
+    archives for each repository.
+
+    Failing to record checksums isn't an error, as they're only needed to verify the dumps later.
+    '''
+    checksums_path = make_checksums_path()
+    logger.debug(
+        '{}: Recording checksums of {} database dumps in archive {} to {}'.format(
+            log_prefix, len(dump_entries), archive_name, checksums_path
+        )
+    )
+
+    with CHECKSUMS_FILE_LOCK:
+        checksums = read_checksums(checksums_path)
+        archives = checksums.setdefault(repository, {})
+        archives.pop(archive_name, None)
+        archives[archive_name] = dump_entries
+
+        for old_archive_name in list(archives)[:-MAX_RECORDED_ARCHIVES]:
+            del archives[old_archive_name]
+
+        temporary_filename = None
+
+        try:
+            os.makedirs(os.path.dirname(checksums_path), mode=0o700, exist_ok=True)
+
+            with tempfile.NamedTemporaryFile(
+                'w', dir=os.path.dirname(checksums_path), suffix='.tmp', delete=False
+            ) as temporary_file:
+                temporary_filename = temporary_file.name
+                json.dump(checksums, temporary_file, indent=2)
+
+            os.replace(temporary_filename, checksums_path)
+        except OSError as error:
+            logger.warning(
+                '{}: Cannot record database dump checksums to {}: {}'.format(
+                    log_prefix, checksums_path, error
+                )
+            )
+
+            if temporary_filename and os.path.exists(temporary_filename):
+                os.remove(temporary_filename)
+
+
+def find_dumps_to_verify(repository, archive_name, archive_manifest, database_names=None):
+    '''
+    Given a repository path, an archive name, the database dump manifest of that archive as returned
+    by manifest.read_archive_manifest() (or None), and an optional sequence of database names to
+    limit verification to, return a list of dump checksum entries to verify.
+
+    These include the recorded checksums of dumps that streamed to Borg, along with the checksums
+    of any single-file dumps listed in the archive's own manifest.
+    '''
+    dump_entries = {
+        dump_entry['path']: dump_entry
+        for dump_entry in (archive_manifest or {}).get('dumps', ())
+        if dump_entry.get('checksum')
+    }
+    dump_entries.update(
+        {
+            dump_entry['path']: dump_entry
+            for dump_entry in read_checksums(make_checksums_path())
+            .get(repository, {})
+            .get(archive_name, ())
+        }
+    )
+
+    return [
+        dump_entry
+        for (path, dump_entry) in sorted(dump_entries.items())
+        if not database_names or dump_entry['name'] in database_names
+    ]
+
+
+def checksum_archived_dump(
+    repository,
+    archive_name,
+    path,
+    location_config,
+    storage_config,
+    local_borg_version,
+    local_path='borg',
+    remote_path=None,
+):
+    '''
+    Given a repository path, an archive name, the path of a single-file database dump within the
+    archive, location/storage configuration dicts, the local Borg version, and optional local and
+    remote Borg paths, stream the dump out of the archive and return a tuple of (its checksum, its
+    size) as per checksum_stream(). Nothing gets written to disk.
+
+    Raise subprocess.CalledProcessError if the dump can't be extracted.
+    '''
+    extract_process = borg_extract.extract_archive(
+        dry_run=False,
+        repository=repository,
+        archive=archive_name,
+        paths=manifest.convert_paths_to_borg_patterns([path]),
+        location_config=location_config,
+        storage_config=storage_config,
+        local_borg_version=local_borg_version,
+        local_path=local_path,
+        remote_path=remote_path,
+        destination_path='/',
+        extract_to_stdout=True,
+    )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        checksum_future = executor.submit(checksum_stream, extract_process.stdout)
+
+        # Log Borg's stderr while checksumming its stdout. Don't give Borg local path, so as to
+        # error on warnings, as Borg only gives a warning if the dump doesn't exist in the archive.
+        execute.log_outputs(
+            (extract_process,), (extract_process.stdout,), logging.DEBUG, borg_local_path=None
+        )
+
+        return checksum_future.result()
+
+
+def verify_dumps(
+    repository,
+    archive_name,
+    dump_entries,
+    location_config,
+    storage_config,
+    local_borg_version,
+    local_path='borg',
+    remote_path=None,
+):
+    '''
+    Given a repository path, an archive name, a sequence of dump checksum entries to verify, as
+    returned by find_dumps_to_verify(), location/storage configuration dicts, the local Borg version,
+    and optional local and remote Borg paths, stream each dump out of the archive and compare its
+    checksum and size with the recorded ones.
+
+    Raise ValueError if any dump doesn't match.
+    '''
+    mismatched_names = []
+
+    for dump_entry in dump_entries:
+        logger.info(
+            '{}: Verifying {} database dump {}'.format(
+                repository, dump_entry['hook'], dump_entry['name']
+            )
+        )
+        (checksum, size) = checksum_archived_dump(
+            repository,
+            archive_name,
+            dump_entry['path'],
+            location_config,
+            storage_config,
+            local_borg_version,
+            local_path,
+            remote_path,
+        )
+
+        if checksum == dump_entry['checksum'] and size == dump_entry['size']:
+            logger.debug(
+                '{}: Database dump {} matches checksum {}'.format(
+                    repository, dump_entry['name'], checksum
+                )
+            )
+            continue
+
+        logger.error(
+            '{}: Database dump {} has checksum {} and size {}, but {} and {} were recorded'.format(
+                repository,
+                dump_entry['name'],
+                checksum,
+                size,
+                dump_entry['checksum'],
+                dump_entry['size'],
+            )
+        )
+        mismatched_names.append(dump_entry['name'])
+
+    if mismatched_names:
+        raise ValueError(
+            'Database dumps in archive {} do not match their checksums: {}'.format(
+                archive_name, ', '.join(mismatched_names)
+            )
+        )
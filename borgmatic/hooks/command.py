@@ -1,5 +1,4 @@
 import logging
-import os
 
 from borgmatic import execute
 
@@ -20,11 +19,14 @@ def interpolate_context(command, context):
     return command
 
 
-def execute_hook(commands, umask, config_filename, description, dry_run, **context):
+def execute_hook(
+    commands, umask, config_filename, description, dry_run, extra_environment=None, **context
+):
     '''
     Given a list of hook commands to execute, a umask to execute with (or None), a config filename,
     a hook description, and whether this is a dry run, run the given commands. Or, don't run them
-    if this is a dry run.
+    if this is a dry run. If an extra environment dict is given, then use it to augment the current
+    environment for the commands, so that they see the same Borg environment variables as Borg does.
 
     The context contains optional values interpolated by name into the hook commands. Currently,
     this only applies to the on_error hook.
@@ -55,23 +57,18 @@ def execute_hook(commands, umask, config_filename, description, dry_run, **conte
     if umask:
         parsed_umask = int(str(umask), 8)
         logger.debug('{}: Set hook umask to {}'.format(config_filename, oct(parsed_umask)))
-        original_umask = os.umask(parsed_umask)
     else:
-        original_umask = None
-
-    try:
-        for command in commands:
-            if not dry_run:
-                execute.execute_command(
-                    [command],
-                    output_log_level=logging.ERROR
-                    if description == 'on-error'
-                    else logging.WARNING,
-                    shell=True,
-                )
-    finally:
-        if original_umask:
-            os.umask(original_umask)
+        parsed_umask = None
+
+    for command in commands:
+        if not dry_run:
+            execute.execute_command(
+                [command],
+                output_log_level=logging.ERROR if description == 'on-error' else logging.WARNING,
+                shell=True,
+                extra_environment=extra_environment,
+                umask=parsed_umask,
+            )
 
 
 def considered_soft_failure(config_filename, error):
@@ -1,6 +1,16 @@
 import logging
 
-from borgmatic.hooks import cronhub, cronitor, healthchecks, mongodb, mysql, pagerduty, postgresql
+from borgmatic import trace
+from borgmatic.hooks import (
+    cronhub,
+    cronitor,
+    healthchecks,
+    mongodb,
+    mysql,
+    pagerduty,
+    postgresql,
+    sqlite,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -12,6 +22,7 @@ HOOK_NAME_TO_MODULE = {
     'postgresql_databases': postgresql,
     'mysql_databases': mysql,
     'mongodb_databases': mongodb,
+    'sqlite_databases': sqlite,
 }
 
 
@@ -39,7 +50,9 @@ def call_hook(function_name, hooks, log_prefix, hook_name, *args, **kwargs):
         raise ValueError('Unknown hook name: {}'.format(hook_name))
 
     logger.debug('{}: Calling {} hook function {}'.format(log_prefix, hook_name, function_name))
-    return getattr(module, function_name)(config, log_prefix, *args, **kwargs)
+
+    with trace.event('{} {}'.format(hook_name, function_name), 'hook', log_prefix=log_prefix):
+        return getattr(module, function_name)(config, log_prefix, *args, **kwargs)
 
 
 def call_hooks(function_name, hooks, log_prefix, hook_names, *args, **kwargs):
@@ -1,12 +1,123 @@
+import collections
+import concurrent.futures
+import contextlib
+import json
 import logging
 import os
 import shutil
+import tempfile
+import threading
 
+from borgmatic import execute
+from borgmatic.borg import source_snapshot
 from borgmatic.borg.create import DEFAULT_BORGMATIC_SOURCE_DIRECTORY
 
 logger = logging.getLogger(__name__)
 
-DATABASE_HOOK_NAMES = ('postgresql_databases', 'mysql_databases', 'mongodb_databases')
+DATABASE_HOOK_NAMES = (
+    'postgresql_databases',
+    'mysql_databases',
+    'mongodb_databases',
+    'sqlite_databases',
+)
+
+# Database hooks whose dumps are always regular files rather than streams, so they get extracted to
+# the filesystem before restoring rather than streamed from the archive.
+FILE_DUMP_HOOK_NAMES = ('sqlite_databases',)
+
+# Database hooks that update planner statistics after restoring a database, unless its "analyze"
+# option is false, and that have an "analyze_database" function to do that separately.
+ANALYZE_HOOK_NAMES = ('postgresql_databases',)
+
+# Database dumps for all repositories share the same dump paths (named pipes) within the borgmatic
+# source directory. So when actions run for multiple repositories concurrently, only one of them at a
+# time can be dumping, restoring, or removing database dumps.
+DATABASE_DUMP_LOCK = threading.Lock()
+
+# How many backups are reading database dumps spooled for the "dump_once_per_run" option, having
+# released DATABASE_DUMP_LOCK so that backups of the same dumps to other repositories can run at the
+# same time. Only read or change this while holding DATABASE_DUMP_LOCK. And before removing or
+# replacing any dumps, wait on the condition for there to be no readers left.
+SPOOLED_DUMPS_READERS = 0
+SPOOLED_DUMPS_CONDITION = threading.Condition(DATABASE_DUMP_LOCK)
+
+# The configuration filename whose database dumps are currently spooled to regular files in the
+# dump paths, so they can be backed up to each of its repositories without dumping again (the
+# "dump_once_per_run" option), or None if there aren't any spooled dumps. Only read or change this
+# while holding DATABASE_DUMP_LOCK.
+SPOOLED_DUMPS_CONFIG_FILENAME = None
+
+
+# Map from the path of each database dump that has run to completion to how many seconds it took,
+# for the dump manifest. Only read or change this while holding DATABASE_DUMP_LOCK.
+DUMP_DURATIONS = {}
+
+# A database dump to run to completion into a regular file (or directory), rather than streaming it
+# to Borg via a named pipe: a shell command (a sequence of strings), an extra environment dict for it (or None),
+# and the dump's destination path.
+Spooled_dump = collections.namedtuple(
+    'Spooled_dump', ('command', 'extra_environment', 'dump_filename')
+)
+
+
+def database_hooks_configured(hooks):
+    '''
+    Given a hooks configuration dict, return whether any database hooks are configured.
+    '''
+    return any(hooks.get(hook_name) for hook_name in DATABASE_HOOK_NAMES)
+
+
+def database_dump_lock(hooks):
+    '''
+    Given a hooks configuration dict, return a context manager that holds the database dump lock if
+    any database hooks are configured, and otherwise does nothing.
+    '''
+    if database_hooks_configured(hooks):
+        return DATABASE_DUMP_LOCK
+
+    return contextlib.nullcontext()
+
+
+def wait_for_spooled_dumps_readers(hooks):
+    '''
+    Given a hooks configuration dict, wait until no backups are reading spooled database dumps, so
+    that the dumps can get removed or replaced. The database dump lock must be held (as per
+    database_dump_lock()), and it gets released while waiting. If no database hooks are configured,
+    then the lock isn't held, so don't wait.
+    '''
+    if database_hooks_configured(hooks):
+        SPOOLED_DUMPS_CONDITION.wait_for(lambda: SPOOLED_DUMPS_READERS == 0)
+
+
+def start_reading_spooled_dumps(hooks):
+    '''
+    Given a hooks configuration dict, register a backup as reading the spooled database dumps, so
+    that they stay in place once the database dump lock is released. The lock must be held (as per
+    database_dump_lock()).
+
+    Return whether the backup got registered, which only happens if any database hooks are
+    configured. If so, call finish_reading_spooled_dumps() afterwards.
+    '''
+    global SPOOLED_DUMPS_READERS
+
+    if not database_hooks_configured(hooks):
+        return False
+
+    SPOOLED_DUMPS_READERS += 1
+
+    return True
+
+
+def finish_reading_spooled_dumps():
+    '''
+    Without holding the database dump lock, unregister a backup as reading the spooled database
+    dumps, and wake up anything waiting to remove or replace them.
+    '''
+    global SPOOLED_DUMPS_READERS
+
+    with SPOOLED_DUMPS_CONDITION:
+        SPOOLED_DUMPS_READERS -= 1
+        SPOOLED_DUMPS_CONDITION.notify_all()
 
 
 def make_database_dump_path(borgmatic_source_directory, database_hook_name):
@@ -48,6 +159,161 @@ def create_named_pipe_for_dump(dump_path):
     os.mkfifo(dump_path, mode=0o600)
 
 
+def make_dump_sizes_path():
+    '''
+    Return the path of the file recording the size of each spooled database dump, so the next run
+    can schedule the largest dumps first.
+    '''
+    return os.path.join(source_snapshot.get_state_directory(), 'database_dump_sizes.json')
+
+
+def read_dump_sizes(sizes_path):
+    '''
+    Given the path of a dump sizes file, return the dict from dump filename to size in bytes that it
+    contains, or an empty dict if the file doesn't exist or can't be read.
+    '''
+    try:
+        with open(sizes_path) as sizes_file:
+            sizes = json.load(sizes_file)
+    except (OSError, ValueError):
+        return {}
+
+    return sizes if isinstance(sizes, dict) else {}
+
+
+def write_dump_sizes(sizes_path, sizes):
+    '''
+    Given the path of a dump sizes file and a dict from dump filename to size in bytes, write the
+    sizes to the file atomically.
+
+    Failing to write the sizes isn't an error, as it only means that the next run schedules its
+    dumps in configuration order.
+    '''
+    temporary_filename = None
+
+    try:
+        os.makedirs(os.path.dirname(sizes_path), mode=0o700, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(sizes_path), suffix='.tmp', delete=False
+        ) as temporary_file:
+            temporary_filename = temporary_file.name
+            json.dump(sizes, temporary_file)
+
+        os.replace(temporary_filename, sizes_path)
+    except OSError as error:
+        logger.debug('Cannot write database dump sizes {}: {}'.format(sizes_path, error))
+
+        if temporary_filename and os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+
+
+def get_dump_size(dump_filename):
+    '''
+    Given the path of a dump file or directory, return its total size in bytes, or None if it
+    doesn't exist.
+    '''
+    if not os.path.isdir(dump_filename):
+        try:
+            return os.path.getsize(dump_filename)
+        except OSError:
+            return None
+
+    return sum(
+        os.path.getsize(os.path.join(directory, filename))
+        for (directory, _, filenames) in os.walk(dump_filename)
+        for filename in filenames
+    )
+
+
+def run_spooled_dump(spooled_dump, started_processes):
+    '''
+    Given a Spooled_dump and a list to append started processes to, run the dump's command to
+    completion, logging its output. Return its process as an instance of subprocess.Popen.
+
+    Raise subprocess.CalledProcessError if the dump fails.
+    '''
+    process = execute.execute_command(
+        spooled_dump.command,
+        shell=True,
+        extra_environment=spooled_dump.extra_environment,
+        run_to_completion=False,
+    )
+    started_processes.append(process)
+    execute.log_outputs(
+        (process,), exclude_stdouts=(), output_log_level=logging.INFO, borg_local_path=None
+    )
+
+    return process
+
+
+def run_spooled_dumps(spooled_dumps, log_prefix, concurrency=None):
+    '''
+    Given a sequence of Spooled_dump instances, a prefix to use in log entries, and the maximum
+    number of dumps to run at once (None for no limit), run the dumps to completion and return their
+    processes (instances of subprocess.Popen), which have been reaped.
+
+    Each dump holds a database connection until it finishes, so running only a few at a time keeps
+    the load on the database server down, and starting the dumps that were the largest last time
+    first keeps a big dump from starting last and running alone. Dumps without a known size start
+    first, in the order given. Afterwards, record the size of each dump for the next run, and how
+    long each took in DUMP_DURATIONS.
+
+    Raise subprocess.CalledProcessError if any dump fails, after killing the dumps that are still
+    running and skipping the ones that haven't started yet.
+    '''
+    if not spooled_dumps:
+        return []
+
+    sizes_path = make_dump_sizes_path()
+    sizes = read_dump_sizes(sizes_path)
+    ordered_dumps = sorted(
+        spooled_dumps,
+        key=lambda spooled_dump: -sizes.get(spooled_dump.dump_filename, float('inf')),
+    )
+    worker_count = min(concurrency or len(ordered_dumps), len(ordered_dumps))
+    started_processes = []
+
+    logger.debug(
+        '{}: Running {} database dumps, {} at a time'.format(
+            log_prefix, len(ordered_dumps), worker_count
+        )
+    )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=worker_count) as executor:
+        futures = [
+            executor.submit(run_spooled_dump, spooled_dump, started_processes)
+            for spooled_dump in ordered_dumps
+        ]
+        (done, not_done) = concurrent.futures.wait(
+            futures, return_when=concurrent.futures.FIRST_EXCEPTION
+        )
+        failed_futures = [future for future in futures if future in done and future.exception()]
+
+        if failed_futures:
+            for future in not_done:
+                future.cancel()
+
+            execute.kill_processes(started_processes)
+
+            raise failed_futures[0].exception()
+
+    for (spooled_dump, future) in zip(ordered_dumps, futures):
+        usage = execute.usage_for_process(future.result())
+
+        if usage and usage.wall_seconds is not None:
+            DUMP_DURATIONS[spooled_dump.dump_filename] = usage.wall_seconds
+
+        size = get_dump_size(spooled_dump.dump_filename)
+
+        if size is not None:
+            sizes[spooled_dump.dump_filename] = size
+
+    write_dump_sizes(sizes_path, sizes)
+
+    return [future.result() for future in futures]
+
+
 def remove_database_dumps(dump_path, database_type_name, log_prefix, dry_run):
     '''
     Remove all database dumps in the given dump directory path (including the directory itself). If
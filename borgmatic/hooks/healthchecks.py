@@ -3,6 +3,7 @@ import logging
 import requests
 
 from borgmatic.hooks import monitor
+from borgmatic.logger import get_log_config_filename
 
 logger = logging.getLogger(__name__)
 
@@ -19,12 +20,16 @@ PAYLOAD_LIMIT_BYTES = 100 * 1024 - len(PAYLOAD_TRUNCATION_INDICATOR)
 class Forgetful_buffering_handler(logging.Handler):
     '''
     A buffering log handler that stores log messages in memory, and throws away messages (oldest
-    first) once a particular capacity in bytes is reached.
+    first) once a particular capacity in bytes is reached. The handler is tagged with the
+    configuration filename that added it, so that multiple configuration files running at once
+    each get their own handler. And it skips log records emitted from threads running a different
+    configuration file, so each handler only collects the logs for its own configuration file.
     '''
 
-    def __init__(self, byte_capacity, log_level):
+    def __init__(self, byte_capacity, log_level, config_filename=None):
         super().__init__()
 
+        self.config_filename = config_filename
         self.byte_capacity = byte_capacity
         self.byte_count = 0
         self.buffer = []
@@ -32,6 +37,10 @@ class Forgetful_buffering_handler(logging.Handler):
         self.setLevel(log_level)
 
     def emit(self, record):
+        record_config_filename = get_log_config_filename()
+        if record_config_filename and record_config_filename != self.config_filename:
+            return
+
         message = record.getMessage() + '\n'
         self.byte_count += len(message)
         self.buffer.append(message)
@@ -42,16 +51,17 @@ class Forgetful_buffering_handler(logging.Handler):
             self.forgot = True
 
 
-def format_buffered_logs_for_payload():
+def format_buffered_logs_for_payload(config_filename=None):
     '''
-    Get the handler previously added to the root logger, and slurp buffered logs out of it to
-    send to Healthchecks.
+    Given a configuration filename, get the handler previously added to the root logger for it, and
+    slurp buffered logs out of it to send to Healthchecks.
     '''
     try:
         buffering_handler = next(
             handler
             for handler in logging.getLogger().handlers
             if isinstance(handler, Forgetful_buffering_handler)
+            and handler.config_filename == config_filename
         )
     except StopIteration:
         # No handler means no payload.
@@ -73,21 +83,28 @@ def initialize_monitor(
     way, we can send them all to Healthchecks upon a finish or failure state.
     '''
     logging.getLogger().addHandler(
-        Forgetful_buffering_handler(PAYLOAD_LIMIT_BYTES, monitoring_log_level)
+        Forgetful_buffering_handler(PAYLOAD_LIMIT_BYTES, monitoring_log_level, config_filename)
     )
 
 
-def ping_monitor(ping_url_or_uuid, config_filename, state, monitoring_log_level, dry_run):
+def make_ping_url(ping_url_or_uuid):
     '''
-    Ping the given Healthchecks URL or UUID, modified with the monitor.State. Use the given
-    configuration filename in any log entries, and log to Healthchecks with the giving log level.
-    If this is a dry run, then don't actually ping anything.
+    Given a Healthchecks URL or UUID, return the corresponding ping URL.
     '''
-    ping_url = (
+    return (
         ping_url_or_uuid
         if ping_url_or_uuid.startswith('http')
         else 'https://hc-ping.com/{}'.format(ping_url_or_uuid)
     )
+
+
+def ping_monitor(ping_url_or_uuid, config_filename, state, monitoring_log_level, dry_run):
+    '''
+    Ping the given Healthchecks URL or UUID, modified with the monitor.State. Use the given
+    configuration filename in any log entries, and log to Healthchecks with the giving log level.
+    If this is a dry run, then don't actually ping anything.
+    '''
+    ping_url = make_ping_url(ping_url_or_uuid)
     dry_run_label = ' (dry run; not actually pinging)' if dry_run else ''
 
     healthchecks_state = MONITOR_STATE_TO_HEALTHCHECKS.get(state)
@@ -100,7 +117,7 @@ def ping_monitor(ping_url_or_uuid, config_filename, state, monitoring_log_level,
     logger.debug('{}: Using Healthchecks ping URL {}'.format(config_filename, ping_url))
 
     if state in (monitor.State.FINISH, monitor.State.FAIL):
-        payload = format_buffered_logs_for_payload()
+        payload = format_buffered_logs_for_payload(config_filename)
     else:
         payload = ''
 
@@ -109,13 +126,36 @@ def ping_monitor(ping_url_or_uuid, config_filename, state, monitoring_log_level,
         requests.post(ping_url, data=payload.encode('utf-8'))
 
 
+def report_progress(ping_url_or_uuid, config_filename, message, dry_run):
+    '''
+    Send the given progress message to the given Healthchecks URL or UUID as a log entry, which
+    shows up in the check's events without changing its state. Use the given configuration filename
+    in any log entries. If this is a dry run, then don't actually send anything.
+    '''
+    ping_url = '{}/log'.format(make_ping_url(ping_url_or_uuid))
+    dry_run_label = ' (dry run; not actually pinging)' if dry_run else ''
+
+    logger.debug(
+        '{}: Reporting progress to Healthchecks{}: {}'.format(
+            config_filename, dry_run_label, message
+        )
+    )
+
+    if not dry_run:
+        logging.getLogger('urllib3').setLevel(logging.ERROR)
+        requests.post(ping_url, data=message.encode('utf-8'))
+
+
 def destroy_monitor(ping_url_or_uuid, config_filename, monitoring_log_level, dry_run):
     '''
-    Remove the monitor handler that was added to the root logger. This prevents the handler from
-    getting reused by other instances of this monitor.
+    Remove the monitor handler that was added to the root logger for the given configuration
+    filename. This prevents the handler from getting reused by other instances of this monitor.
     '''
     logger = logging.getLogger()
 
     for handler in tuple(logger.handlers):
-        if isinstance(handler, Forgetful_buffering_handler):
+        if (
+            isinstance(handler, Forgetful_buffering_handler)
+            and handler.config_filename == config_filename
+        ):
             logger.removeHandler(handler)
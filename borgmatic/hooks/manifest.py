@@ -0,0 +1,265 @@
+import concurrent.futures
+import hashlib
+import json
+import logging
+import os
+import stat
+import subprocess
+import tempfile
+
+from borgmatic import execute
+from borgmatic.borg import extract as borg_extract
+from borgmatic.borg.create import DEFAULT_BORGMATIC_SOURCE_DIRECTORY
+from borgmatic.hooks import dump
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = 'database_dump_manifest.json'
+MANIFEST_VERSION = 1
+CHECKSUM_ALGORITHM = 'blake2b'
+CHECKSUM_CHUNK_BYTES = 1024 * 1024
+
+
+def make_manifest_path(borgmatic_source_directory):
+    '''
+    Given a borgmatic source directory (or None), return the path of the database dump manifest
+    within it.
+    '''
+    return os.path.join(
+        os.path.expanduser(borgmatic_source_directory or DEFAULT_BORGMATIC_SOURCE_DIRECTORY),
+        MANIFEST_FILENAME,
+    )
+
+
+def checksum_file(path):
+    '''
+    Given the path of a regular file, return a checksum of its contents as a string like
+    "blake2b:<hex digest>".
+    '''
+    checksum = hashlib.new(CHECKSUM_ALGORITHM)
+
+    with open(path, 'rb') as checksummed_file:
+        for chunk in iter(lambda: checksummed_file.read(CHECKSUM_CHUNK_BYTES), b''):
+            checksum.update(chunk)
+
+    return '{}:{}'.format(CHECKSUM_ALGORITHM, checksum.hexdigest())
+
+
+def find_database_format(databases, name):
+    '''
+    Given a sequence of database configuration dicts for a database hook and a dumped database
+    name, return the configured dump format for that database, or None if it's not configured.
+    '''
+    for database in databases or ():
+        if database['name'] in (name, 'all'):
+            return database.get('format')
+
+    return None
+
+
+def collect_dumps(borgmatic_source_directory, hooks):
+    '''
+    Given a borgmatic source directory (or None) and a hooks configuration dict, find the database
+    dumps within the source directory, and return a list of manifest entries describing them, one
+    dict per dump.
+
+    The size, duration, and checksum of a dump are only known once it has run to completion, so
+    they're None for dumps that are still to stream to Borg via a named pipe.
+    '''
+    dumps = []
+
+    for hook_name in dump.DATABASE_HOOK_NAMES:
+        dump_path = os.path.expanduser(
+            dump.make_database_dump_path(borgmatic_source_directory, hook_name)
+        )
+        if not os.path.isdir(dump_path):
+            continue
+
+        for hostname in sorted(os.listdir(dump_path)):
+            for name in sorted(os.listdir(os.path.join(dump_path, hostname))):
+                path = os.path.join(dump_path, hostname, name)
+                mode = os.stat(path).st_mode
+                dump_type = (
+                    'stream'
+                    if stat.S_ISFIFO(mode)
+                    else ('directory' if stat.S_ISDIR(mode) else 'file')
+                )
+
+                dumps.append(
+                    {
+                        'hook': hook_name,
+                        'name': name,
+                        'hostname': hostname,
+                        'path': path,
+                        'format': find_database_format(hooks.get(hook_name), name),
+                        'type': dump_type,
+                        'size': None if dump_type == 'stream' else dump.get_dump_size(path),
+                        'duration_seconds': None
+                        if dump_type == 'stream'
+                        else dump.DUMP_DURATIONS.get(path),
+                        'checksum': checksum_file(path) if dump_type == 'file' else None,
+                    }
+                )
+
+    return dumps
+
+
+def write_manifest(location_config, hooks, log_prefix, dry_run):
+    '''
+    Given a location configuration dict, a hooks configuration dict, a prefix to use in log entries,
+    and whether this is a dry run, write a manifest of the current database dumps to the borgmatic
+    source directory atomically, so that it gets backed up along with them. If this is a dry run,
+    then don't actually write anything.
+
+    Failing to write the manifest isn't an error, as restores fall back to finding dumps by pattern.
+    '''
+    manifest_path = make_manifest_path(location_config.get('borgmatic_source_directory'))
+    dry_run_label = ' (dry run; not actually writing anything)' if dry_run else ''
+
+    logger.debug(
+        '{}: Writing database dump manifest to {}{}'.format(
+            log_prefix, manifest_path, dry_run_label
+        )
+    )
+    if dry_run:
+        return
+
+    temporary_filename = None
+
+    try:
+        manifest = {
+            'version': MANIFEST_VERSION,
+            'dumps': collect_dumps(location_config.get('borgmatic_source_directory'), hooks),
+        }
+
+        os.makedirs(os.path.dirname(manifest_path), mode=0o700, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(
+            'w', dir=os.path.dirname(manifest_path), suffix='.tmp', delete=False
+        ) as temporary_file:
+            temporary_filename = temporary_file.name
+            json.dump(manifest, temporary_file, indent=2)
+
+        os.replace(temporary_filename, manifest_path)
+    except OSError as error:
+        logger.warning(
+            '{}: Cannot write database dump manifest {}: {}'.format(
+                log_prefix, manifest_path, error
+            )
+        )
+
+        if temporary_filename and os.path.exists(temporary_filename):
+            os.remove(temporary_filename)
+
+
+def remove_manifest(location_config, log_prefix, dry_run):
+    '''
+    Given a location configuration dict, a prefix to use in log entries, and whether this is a dry
+    run, remove the database dump manifest along with the dump durations recorded for it. If this
+    is a dry run, then don't actually remove anything.
+    '''
+    manifest_path = make_manifest_path(location_config.get('borgmatic_source_directory'))
+
+    if dry_run:
+        return
+
+    dump.DUMP_DURATIONS.clear()
+
+    if os.path.exists(manifest_path):
+        logger.debug('{}: Removing database dump manifest {}'.format(log_prefix, manifest_path))
+        os.remove(manifest_path)
+
+
+def read_archive_manifest(
+    repository,
+    archive,
+    location_config,
+    storage_config,
+    local_borg_version,
+    local_path='borg',
+    remote_path=None,
+):
+    '''
+    Given a repository path, an archive name, location/storage configuration dicts, the local Borg
+    version, and optional local and remote Borg paths, extract the database dump manifest from the
+    archive by its exact path and return it as a dict. Return None if the archive doesn't have a
+    valid manifest, for instance because it was created by an older version of borgmatic.
+    '''
+    manifest_path = make_manifest_path(location_config.get('borgmatic_source_directory'))
+    extract_process = borg_extract.extract_archive(
+        dry_run=False,
+        repository=repository,
+        archive=archive,
+        paths=convert_paths_to_borg_patterns([manifest_path]),
+        location_config=location_config,
+        storage_config=storage_config,
+        local_borg_version=local_borg_version,
+        local_path=local_path,
+        remote_path=remote_path,
+        destination_path='/',
+        extract_to_stdout=True,
+    )
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        output_future = executor.submit(extract_process.stdout.read)
+
+        # Log Borg's stderr while reading its stdout, and reap Borg so its resource usage gets
+        # recorded. Don't give Borg local path, so as to error on warnings, as Borg only gives a
+        # warning if the manifest doesn't exist in the archive.
+        try:
+            execute.log_outputs(
+                (extract_process,), (extract_process.stdout,), logging.DEBUG, borg_local_path=None
+            )
+        except subprocess.CalledProcessError:
+            logger.debug(
+                '{}: No database dump manifest in archive {}; falling back to patterns'.format(
+                    repository, archive
+                )
+            )
+            return None
+
+        output = output_future.result()
+
+    try:
+        manifest = json.loads(output)
+    except ValueError:
+        return None
+
+    if not isinstance(manifest, dict) or manifest.get('version') != MANIFEST_VERSION:
+        return None
+
+    return manifest
+
+
+def convert_paths_to_borg_patterns(paths, directory=False):
+    '''
+    Convert a sequence of absolute paths like "/etc/foo" to the corresponding Borg archive patterns
+    that match exactly those paths, like "pf:etc/foo". Borg matches these by lookup rather than by
+    checking each archive item against a glob. If directory is True, then match everything within
+    the paths with path prefix patterns like "pp:etc/foo" instead.
+    '''
+    return ['{}:{}'.format('pp' if directory else 'pf', path.lstrip(os.path.sep)) for path in paths]
+
+
+def make_dump_patterns(manifest, hook_name, name):
+    '''
+    Given a manifest dict as returned by read_archive_manifest() (or None), a database hook name,
+    and a database name, return the Borg patterns matching exactly the dumps of that database in
+    the archive. Return None if there's no manifest or it doesn't list any such dumps.
+    '''
+    if not manifest:
+        return None
+
+    patterns = []
+
+    for dump_entry in manifest.get('dumps', ()):
+        if dump_entry.get('hook') != hook_name or dump_entry.get('name') != name:
+            continue
+
+        patterns.extend(
+            convert_paths_to_borg_patterns(
+                [dump_entry['path']], directory=bool(dump_entry.get('type') == 'directory')
+            )
+        )
+
+    return patterns or None
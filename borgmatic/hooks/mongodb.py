@@ -1,7 +1,7 @@
 import logging
 
 from borgmatic.execute import execute_command, execute_command_with_processes
-from borgmatic.hooks import dump
+from borgmatic.hooks import checksum, dump
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +15,15 @@ def make_dump_path(location_config):  # pragma: no cover
     )
 
 
-def dump_databases(databases, log_prefix, location_config, dry_run):
+def dump_databases(
+    databases,
+    log_prefix,
+    location_config,
+    dry_run,
+    spool=False,
+    concurrency=None,
+    checksum_dumps=False,
+):
     '''
     Dump the given MongoDB databases to a named pipe. The databases are supplied as a sequence of
     dicts, one dict describing each database as per the configuration schema. Use the given log
@@ -24,12 +32,20 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
 
     Return a sequence of subprocess.Popen instances for the dump processes ready to spew to a named
     pipe. But if this is a dry run, then don't actually dump anything and return an empty sequence.
+
+    If spool is True, then dump to regular files instead of named pipes, so that the dumps can get
+    backed up more than once. Spooled dumps run to completion before this returns, at most the
+    given concurrency at a time (as per dump.run_spooled_dumps()).
+
+    If checksum dumps is True, then compute a checksum of each "archive" format dump as it streams
+    to Borg (as per checksum.start_checksummed_dump()).
     '''
     dry_run_label = ' (dry run; not actually dumping anything)' if dry_run else ''
 
     logger.info('{}: Dumping MongoDB databases{}'.format(log_prefix, dry_run_label))
 
     processes = []
+    spooled_dumps = []
     for database in databases:
         name = database['name']
         dump_filename = dump.make_database_dump_filename(
@@ -45,15 +61,24 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
         if dry_run:
             continue
 
+        command = build_dump_command(database, dump_filename, dump_format)
+
+        if spool:
+            dump.create_parent_directory_for_dump(dump_filename)
+            spooled_dumps.append(dump.Spooled_dump(command, None, dump_filename))
+            continue
+
         if dump_format == 'directory':
             dump.create_parent_directory_for_dump(dump_filename)
         else:
             dump.create_named_pipe_for_dump(dump_filename)
 
-        command = build_dump_command(database, dump_filename, dump_format)
-        processes.append(execute_command(command, shell=True, run_to_completion=False))
+        if checksum_dumps and dump_format != 'directory':
+            processes.append(checksum.start_checksummed_dump(command, None, dump_filename))
+        else:
+            processes.append(execute_command(command, shell=True, run_to_completion=False))
 
-    return processes
+    return processes + dump.run_spooled_dumps(spooled_dumps, log_prefix, concurrency)
 
 
 def build_dump_command(database, dump_filename, dump_format):
@@ -76,6 +101,8 @@ def build_dump_command(database, dump_filename, dump_format):
         command.extend(('--authenticationDatabase', database['authentication_database']))
     if not all_databases:
         command.extend(('--db', database['name']))
+    if 'dump_parallel_collections' in database:
+        command.extend(('--numParallelCollections', str(database['dump_parallel_collections'])))
     if 'options' in database:
         command.extend(database['options'].split(' '))
     if dump_format != 'directory':
@@ -144,9 +171,8 @@ def build_restore_command(extract_process, database, dump_filename):
     '''
     Return the mongorestore command from a single database configuration.
     '''
-    command = ['mongorestore', '--archive']
-    if not extract_process:
-        command.append(dump_filename)
+    # The "--archive" flag takes an optional value, so a dump file has to be attached to it.
+    command = ['mongorestore', '--archive' if extract_process else '--archive=' + dump_filename]
     if database['name'] != 'all':
         command.extend(('--drop', '--db', database['name']))
     if 'hostname' in database:
@@ -159,4 +185,8 @@ def build_restore_command(extract_process, database, dump_filename):
         command.extend(('--password', database['password']))
     if 'authentication_database' in database:
         command.extend(('--authenticationDatabase', database['authentication_database']))
+    if 'restore_insertion_workers' in database:
+        command.extend(
+            ('--numInsertionWorkersPerCollection', str(database['restore_insertion_workers']))
+        )
     return command
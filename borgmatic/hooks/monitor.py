@@ -1,6 +1,8 @@
 from enum import Enum
 
 MONITOR_HOOK_NAMES = ('healthchecks', 'cronitor', 'cronhub', 'pagerduty')
+# Monitoring hooks that support reporting progress during a backup, via a report_progress() function.
+PROGRESS_MONITOR_HOOK_NAMES = ('healthchecks',)
 
 
 class State(Enum):
@@ -1,7 +1,8 @@
+import glob
 import logging
 
 from borgmatic.execute import execute_command, execute_command_with_processes
-from borgmatic.hooks import dump
+from borgmatic.hooks import checksum, dump
 
 logger = logging.getLogger(__name__)
 
@@ -53,7 +54,43 @@ def database_names_to_dump(database, extra_environment, log_prefix, dry_run_labe
     )
 
 
-def dump_databases(databases, log_prefix, location_config, dry_run):
+def make_dump_command(database, dump_database_names, dump_filename):
+    '''
+    Given a database configuration dict, a sequence of database names to dump, and a dump
+    destination path, return the mysqldump command (as a sequence of strings for running in a
+    shell) to dump those databases.
+    '''
+    return (
+        ('mysqldump',)
+        + (tuple(database['options'].split(' ')) if 'options' in database else ())
+        + ('--add-drop-database',)
+        # Dump a consistent snapshot of each separate database without locking its tables.
+        + (
+            ('--single-transaction',)
+            if database['name'] == 'all' and database.get('separate_dumps')
+            else ()
+        )
+        + (('--host', database['hostname']) if 'hostname' in database else ())
+        + (('--port', str(database['port'])) if 'port' in database else ())
+        + (('--protocol', 'tcp') if 'hostname' in database or 'port' in database else ())
+        + (('--user', database['username']) if 'username' in database else ())
+        + ('--databases',)
+        + tuple(dump_database_names)
+        # Use shell redirection rather than execute_command(output_file=open(...)) to prevent
+        # the open() call on a named pipe from hanging the main borgmatic process.
+        + ('>', dump_filename)
+    )
+
+
+def dump_databases(
+    databases,
+    log_prefix,
+    location_config,
+    dry_run,
+    spool=False,
+    concurrency=None,
+    checksum_dumps=False,
+):
     '''
     Dump the given MySQL/MariaDB databases to a named pipe. The databases are supplied as a sequence
     of dicts, one dict describing each database as per the configuration schema. Use the given log
@@ -62,17 +99,22 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
 
     Return a sequence of subprocess.Popen instances for the dump processes ready to spew to a named
     pipe. But if this is a dry run, then don't actually dump anything and return an empty sequence.
+
+    If spool is True, then dump to regular files instead of named pipes, so that the dumps can get
+    backed up more than once. Spooled dumps run to completion before this returns, at most the
+    given concurrency at a time (as per dump.run_spooled_dumps()).
+
+    If checksum dumps is True, then compute a checksum of each dump as it streams to Borg (as per
+    checksum.start_checksummed_dump()).
     '''
     dry_run_label = ' (dry run; not actually dumping anything)' if dry_run else ''
     processes = []
+    spooled_dumps = []
 
     logger.info('{}: Dumping MySQL databases{}'.format(log_prefix, dry_run_label))
 
     for database in databases:
         requested_name = database['name']
-        dump_filename = dump.make_database_dump_filename(
-            make_dump_path(location_config), requested_name, database.get('hostname')
-        )
         extra_environment = {'MYSQL_PWD': database['password']} if 'password' in database else None
         dump_database_names = database_names_to_dump(
             database, extra_environment, log_prefix, dry_run_label
@@ -80,41 +122,47 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
         if not dump_database_names:
             raise ValueError('Cannot find any MySQL databases to dump.')
 
-        dump_command = (
-            ('mysqldump',)
-            + (tuple(database['options'].split(' ')) if 'options' in database else ())
-            + ('--add-drop-database',)
-            + (('--host', database['hostname']) if 'hostname' in database else ())
-            + (('--port', str(database['port'])) if 'port' in database else ())
-            + (('--protocol', 'tcp') if 'hostname' in database or 'port' in database else ())
-            + (('--user', database['username']) if 'username' in database else ())
-            + ('--databases',)
-            + dump_database_names
-            # Use shell redirection rather than execute_command(output_file=open(...)) to prevent
-            # the open() call on a named pipe from hanging the main borgmatic process.
-            + ('>', dump_filename)
-        )
+        # With separate dumps, each database gets its own dump, so it can get restored on its own.
+        if requested_name == 'all' and database.get('separate_dumps'):
+            dumps = tuple((name, (name,)) for name in dump_database_names)
+        else:
+            dumps = ((requested_name, dump_database_names),)
 
-        logger.debug(
-            '{}: Dumping MySQL database {} to {}{}'.format(
-                log_prefix, requested_name, dump_filename, dry_run_label
+        for (dump_name, dump_names) in dumps:
+            dump_filename = dump.make_database_dump_filename(
+                make_dump_path(location_config), dump_name, database.get('hostname')
             )
-        )
-        if dry_run:
-            continue
+            dump_command = make_dump_command(database, dump_names, dump_filename)
 
-        dump.create_named_pipe_for_dump(dump_filename)
+            logger.debug(
+                '{}: Dumping MySQL database {} to {}{}'.format(
+                    log_prefix, dump_name, dump_filename, dry_run_label
+                )
+            )
+            if dry_run:
+                continue
 
-        processes.append(
-            execute_command(
-                dump_command,
-                shell=True,
-                extra_environment=extra_environment,
-                run_to_completion=False,
+            if spool:
+                dump.create_parent_directory_for_dump(dump_filename)
+                spooled_dumps.append(
+                    dump.Spooled_dump(dump_command, extra_environment, dump_filename)
+                )
+                continue
+
+            dump.create_named_pipe_for_dump(dump_filename)
+
+            processes.append(
+                checksum.start_checksummed_dump(dump_command, extra_environment, dump_filename)
+                if checksum_dumps
+                else execute_command(
+                    dump_command,
+                    shell=True,
+                    extra_environment=extra_environment,
+                    run_to_completion=False,
+                )
             )
-        )
 
-    return processes
+    return processes + dump.run_spooled_dumps(spooled_dumps, log_prefix, concurrency)
 
 
 def remove_database_dumps(databases, log_prefix, location_config, dry_run):  # pragma: no cover
@@ -126,14 +174,19 @@ def remove_database_dumps(databases, log_prefix, location_config, dry_run):  # p
     dump.remove_database_dumps(make_dump_path(location_config), 'MySQL', log_prefix, dry_run)
 
 
-def make_database_dump_pattern(
-    databases, log_prefix, location_config, name=None
-):  # pragma: no cover
+def make_database_dump_pattern(databases, log_prefix, location_config, name=None):
     '''
     Given a sequence of configurations dicts, a prefix to log with, a location configuration dict,
     and a database name to match, return the corresponding glob patterns to match the database dump
     in an archive.
+
+    If "all" databases got dumped separately, then match the dumps of all of them for "all".
     '''
+    if name == 'all' and any(
+        database['name'] == 'all' and database.get('separate_dumps') for database in databases
+    ):
+        name = '*'
+
     return dump.make_database_dump_filename(make_dump_path(location_config), name, hostname='*')
 
 
@@ -144,6 +197,12 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
     Use the given log prefix in any log entries. If this is a dry run, then don't actually restore
     anything. Trigger the given active extract process (an instance of subprocess.Popen) to produce
     output to consume.
+
+    If the extract process is None, then restore the dump from the filesystem rather than from an
+    extract stream. In that case, restore "all" databases that got dumped separately from each of
+    their dumps on disk in turn.
+
+    Raise ValueError if there are no separate dumps on disk to restore "all" databases from.
     '''
     dry_run_label = ' (dry run; not actually restoring anything)' if dry_run else ''
 
@@ -151,6 +210,9 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
         raise ValueError('The database configuration value is invalid')
 
     database = database_config[0]
+    dump_filename = dump.make_database_dump_filename(
+        make_dump_path(location_config), database['name'], database.get('hostname')
+    )
     restore_command = (
         ('mysql', '--batch')
         + (('--host', database['hostname']) if 'hostname' in database else ())
@@ -166,11 +228,36 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
     if dry_run:
         return
 
-    execute_command_with_processes(
-        restore_command,
-        [extract_process],
-        output_log_level=logging.DEBUG,
-        input_file=extract_process.stdout,
-        extra_environment=extra_environment,
-        borg_local_path=location_config.get('local_path', 'borg'),
-    )
+    if extract_process:
+        execute_command_with_processes(
+            restore_command,
+            [extract_process],
+            output_log_level=logging.DEBUG,
+            input_file=extract_process.stdout,
+            extra_environment=extra_environment,
+            borg_local_path=location_config.get('local_path', 'borg'),
+        )
+        return
+
+    if database['name'] == 'all' and database.get('separate_dumps'):
+        dump_filenames = sorted(
+            glob.glob(
+                dump.make_database_dump_filename(
+                    make_dump_path(location_config), '*', database.get('hostname')
+                )
+            )
+        )
+
+        if not dump_filenames:
+            raise ValueError('Cannot find any separate MySQL database dumps to restore')
+    else:
+        dump_filenames = [dump_filename]
+
+    for dump_filename in dump_filenames:
+        with open(dump_filename, 'rb') as dump_file:
+            execute_command(
+                restore_command,
+                output_log_level=logging.DEBUG,
+                input_file=dump_file,
+                extra_environment=extra_environment,
+            )
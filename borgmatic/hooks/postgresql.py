@@ -1,7 +1,7 @@
 import logging
 
 from borgmatic.execute import execute_command, execute_command_with_processes
-from borgmatic.hooks import dump
+from borgmatic.hooks import checksum, dump
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +34,15 @@ def make_extra_environment(database):
     return extra
 
 
-def dump_databases(databases, log_prefix, location_config, dry_run):
+def dump_databases(
+    databases,
+    log_prefix,
+    location_config,
+    dry_run,
+    spool=False,
+    concurrency=None,
+    checksum_dumps=False,
+):
     '''
     Dump the given PostgreSQL databases to a named pipe. The databases are supplied as a sequence of
     dicts, one dict describing each database as per the configuration schema. Use the given log
@@ -43,9 +51,18 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
 
     Return a sequence of subprocess.Popen instances for the dump processes ready to spew to a named
     pipe. But if this is a dry run, then don't actually dump anything and return an empty sequence.
+
+    If spool is True, then dump to regular files instead of named pipes, so that the dumps can get
+    backed up more than once. Spooled dumps, as well as "directory" format dumps (which can't go to
+    a named pipe), run to completion before this returns, at most the given concurrency at a time
+    (as per dump.run_spooled_dumps()).
+
+    If checksum dumps is True, then compute a checksum of each dump as it streams to Borg (as per
+    checksum.start_checksummed_dump()).
     '''
     dry_run_label = ' (dry run; not actually dumping anything)' if dry_run else ''
     processes = []
+    spooled_dumps = []
 
     logger.info('{}: Dumping PostgreSQL databases{}'.format(log_prefix, dry_run_label))
 
@@ -68,6 +85,11 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
             + (('--username', database['username']) if 'username' in database else ())
             + (() if all_databases else ('--format', dump_format))
             + (('--file', dump_filename) if dump_format == 'directory' else ())
+            + (
+                ('--jobs', str(database['jobs']))
+                if 'jobs' in database and dump_format == 'directory' and not all_databases
+                else ()
+            )
             + (tuple(database['options'].split(' ')) if 'options' in database else ())
             + (() if all_databases else (name,))
             # Use shell redirection rather than the --file flag to sidestep synchronization issues
@@ -85,18 +107,24 @@ def dump_databases(databases, log_prefix, location_config, dry_run):
         if dry_run:
             continue
 
-        if dump_format == 'directory':
+        # Borg can't read a directory format dump while it's still getting written, so finish the
+        # dump before backing it up, as if it were spooled.
+        if spool or dump_format == 'directory':
             dump.create_parent_directory_for_dump(dump_filename)
-        else:
-            dump.create_named_pipe_for_dump(dump_filename)
+            spooled_dumps.append(dump.Spooled_dump(command, extra_environment, dump_filename))
+            continue
+
+        dump.create_named_pipe_for_dump(dump_filename)
 
         processes.append(
-            execute_command(
+            checksum.start_checksummed_dump(command, extra_environment, dump_filename)
+            if checksum_dumps
+            else execute_command(
                 command, shell=True, extra_environment=extra_environment, run_to_completion=False
             )
         )
 
-    return processes
+    return processes + dump.run_spooled_dumps(spooled_dumps, log_prefix, concurrency)
 
 
 def remove_database_dumps(databases, log_prefix, location_config, dry_run):  # pragma: no cover
@@ -129,6 +157,9 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
 
     If the extract process is None, then restore the dump from the filesystem rather than from an
     extract stream.
+
+    Afterwards, update the database's planner statistics (as per make_analyze_command()), unless its
+    "analyze" option is false.
     '''
     dry_run_label = ' (dry run; not actually restoring anything)' if dry_run else ''
 
@@ -140,14 +171,6 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
     dump_filename = dump.make_database_dump_filename(
         make_dump_path(location_config), database['name'], database.get('hostname')
     )
-    analyze_command = (
-        ('psql', '--no-password', '--quiet')
-        + (('--host', database['hostname']) if 'hostname' in database else ())
-        + (('--port', str(database['port'])) if 'port' in database else ())
-        + (('--username', database['username']) if 'username' in database else ())
-        + (('--dbname', database['name']) if not all_databases else ())
-        + ('--command', 'ANALYZE')
-    )
     restore_command = (
         ('psql' if all_databases else 'pg_restore', '--no-password')
         + (
@@ -155,10 +178,21 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
             if not all_databases
             else ()
         )
+        # Parallel restore needs a dump file rather than stdin.
+        + (
+            ('--jobs', str(database['jobs']))
+            if 'jobs' in database and not all_databases and not extract_process
+            else ()
+        )
         + (('--host', database['hostname']) if 'hostname' in database else ())
         + (('--port', str(database['port'])) if 'port' in database else ())
         + (('--username', database['username']) if 'username' in database else ())
-        + (() if extract_process else (dump_filename,))
+        # psql takes a positional argument as a database name, so it needs the dump file as a flag.
+        + (
+            ()
+            if extract_process
+            else (('-f', dump_filename) if all_databases else (dump_filename,))
+        )
     )
     extra_environment = make_extra_environment(database)
 
@@ -176,4 +210,64 @@ def restore_database_dump(database_config, log_prefix, location_config, dry_run,
         extra_environment=extra_environment,
         borg_local_path=location_config.get('local_path', 'borg'),
     )
-    execute_command(analyze_command, extra_environment=extra_environment)
+
+    if database.get('analyze', True):
+        execute_command(make_analyze_command(database), extra_environment=extra_environment)
+
+
+def make_analyze_command(database):
+    '''
+    Given a database configuration dict, return the command (a sequence of strings) to update the
+    planner statistics of the database after restoring it. With "analyze_jobs", use vacuumdb to
+    analyze that many tables at once, in stages so that the database has minimal statistics to plan
+    queries with as soon as possible. Otherwise, run ANALYZE with psql, one table at a time.
+    '''
+    all_databases = bool(database['name'] == 'all')
+    connection_flags = (
+        (('--host', database['hostname']) if 'hostname' in database else ())
+        + (('--port', str(database['port'])) if 'port' in database else ())
+        + (('--username', database['username']) if 'username' in database else ())
+    )
+
+    if 'analyze_jobs' in database:
+        return (
+            ('vacuumdb', '--no-password', '--analyze-in-stages')
+            + ('--jobs', str(database['analyze_jobs']))
+            + connection_flags
+            + (('--all',) if all_databases else ('--dbname', database['name']))
+        )
+
+    return (
+        ('psql', '--no-password', '--quiet')
+        + connection_flags
+        + (('--dbname', database['name']) if not all_databases else ())
+        + ('--command', 'ANALYZE')
+    )
+
+
+def analyze_database(database_config, log_prefix, location_config, dry_run):
+    '''
+    Update the planner statistics of the given restored PostgreSQL database, as per
+    make_analyze_command(). The database is supplied as a one-element sequence containing a dict
+    describing the database, as per the configuration schema. Use the given log prefix in any log
+    entries. If this is a dry run, then don't actually analyze anything.
+
+    This is for analyzing a database restored with its "analyze" option set to false, for instance
+    to defer analyzing until several databases have been restored.
+    '''
+    dry_run_label = ' (dry run; not actually analyzing anything)' if dry_run else ''
+
+    if len(database_config) != 1:
+        raise ValueError('The database configuration value is invalid')
+
+    database = database_config[0]
+
+    logger.debug(
+        '{}: Analyzing PostgreSQL database {}{}'.format(log_prefix, database['name'], dry_run_label)
+    )
+    if dry_run:
+        return
+
+    execute_command(
+        make_analyze_command(database), extra_environment=make_extra_environment(database)
+    )
@@ -0,0 +1,158 @@
+import contextlib
+import logging
+import os
+import sqlite3
+import time
+
+from borgmatic.hooks import dump
+
+logger = logging.getLogger(__name__)
+
+# How many database pages to copy per backup step. Between steps, SQLite releases its lock on the
+# database being copied, so other connections can write to it.
+BACKUP_PAGES_PER_STEP = 1024
+# How long to sleep between backup steps, giving other connections a chance to use the database.
+BACKUP_STEP_SLEEP_SECONDS = 0.01
+
+
+def make_dump_path(location_config):  # pragma: no cover
+    '''
+    Make the dump path from the given location configuration and the name of this hook.
+    '''
+    return dump.make_database_dump_path(
+        location_config.get('borgmatic_source_directory'), 'sqlite_databases'
+    )
+
+
+def copy_database(source_path, destination_path):
+    '''
+    Given the path of an SQLite database to copy from and the path to copy it to, copy the database
+    with SQLite's online backup API, a batch of pages at a time, so that other connections to either
+    database are never locked out for the whole copy. The copy is consistent as of the end of the
+    backup, even if other connections write to the source database during it.
+
+    Raise sqlite3.Error if either database can't be opened or the copy fails.
+    '''
+    with contextlib.closing(sqlite3.connect(source_path)) as source_connection:
+        with contextlib.closing(sqlite3.connect(destination_path)) as destination_connection:
+            source_connection.backup(
+                destination_connection,
+                pages=BACKUP_PAGES_PER_STEP,
+                sleep=BACKUP_STEP_SLEEP_SECONDS,
+            )
+
+
+def dump_databases(
+    databases,
+    log_prefix,
+    location_config,
+    dry_run,
+    spool=False,
+    concurrency=None,
+    checksum_dumps=False,
+):
+    '''
+    Dump the given SQLite databases to regular files. The databases are supplied as a sequence of
+    dicts, one dict describing each database as per the configuration schema. Use the given log
+    prefix in any log entries. Use the given location configuration dict to construct the
+    destination path.
+
+    SQLite's backup API needs to write to a real database file rather than a named pipe, so each
+    dump finishes before this returns, and there are no dump processes to stream from. Return an
+    empty sequence. The spool, concurrency, and checksum dumps arguments are accepted for consistency
+    with the other database hooks, but dumps always go to regular files, one at a time. (The dump
+    manifest already includes the checksum of each regular file dump.)
+
+    Raise ValueError if a database to dump doesn't exist.
+    '''
+    dry_run_label = ' (dry run; not actually dumping anything)' if dry_run else ''
+
+    logger.info('{}: Dumping SQLite databases{}'.format(log_prefix, dry_run_label))
+
+    for database in databases:
+        database_path = os.path.expanduser(database['path'])
+        dump_filename = dump.make_database_dump_filename(
+            make_dump_path(location_config), database['name']
+        )
+
+        # Otherwise, sqlite3.connect() would create an empty database and happily back that up.
+        if not os.path.exists(database_path):
+            raise ValueError(
+                'Cannot find SQLite database {} at {}'.format(database['name'], database_path)
+            )
+
+        logger.debug(
+            '{}: Dumping SQLite database {} to {}{}'.format(
+                log_prefix, database['name'], dump_filename, dry_run_label
+            )
+        )
+        if dry_run:
+            continue
+
+        dump.create_parent_directory_for_dump(dump_filename)
+        start_time = time.monotonic()
+        copy_database(database_path, dump_filename)
+        dump.DUMP_DURATIONS[dump_filename] = time.monotonic() - start_time
+
+    return []
+
+
+def remove_database_dumps(databases, log_prefix, location_config, dry_run):  # pragma: no cover
+    '''
+    Remove all database dump files for this hook regardless of the given databases. Use the log
+    prefix in any log entries. Use the given location configuration dict to construct the
+    destination path. If this is a dry run, then don't actually remove anything.
+    '''
+    dump.remove_database_dumps(make_dump_path(location_config), 'SQLite', log_prefix, dry_run)
+
+
+def make_database_dump_pattern(
+    databases, log_prefix, location_config, name=None
+):  # pragma: no cover
+    '''
+    Given a sequence of configurations dicts, a prefix to log with, a location configuration dict,
+    and a database name to match, return the corresponding glob patterns to match the database dump
+    in an archive.
+    '''
+    return dump.make_database_dump_filename(make_dump_path(location_config), name, hostname='*')
+
+
+def restore_database_dump(database_config, log_prefix, location_config, dry_run, extract_process):
+    '''
+    Restore the given SQLite database from its dump on the filesystem. The database is supplied as
+    a one-element sequence containing a dict describing the database, as per the configuration
+    schema. Use the given log prefix in any log entries. If this is a dry run, then don't actually
+    restore anything.
+
+    SQLite dumps always get extracted to the filesystem before restoring, so the extract process
+    should be None.
+
+    Raise ValueError if the database configuration is invalid, there's an extract process, or the
+    dump doesn't exist.
+    '''
+    dry_run_label = ' (dry run; not actually restoring anything)' if dry_run else ''
+
+    if len(database_config) != 1:
+        raise ValueError('The database configuration value is invalid')
+
+    if extract_process:
+        raise ValueError('SQLite databases can only get restored from the filesystem')
+
+    database = database_config[0]
+    dump_filename = dump.make_database_dump_filename(
+        make_dump_path(location_config), database['name']
+    )
+
+    logger.debug(
+        '{}: Restoring SQLite database {}{}'.format(log_prefix, database['name'], dry_run_label)
+    )
+    if dry_run:
+        return
+
+    # Otherwise, restoring would replace the database with an empty one.
+    if not os.path.exists(dump_filename):
+        raise ValueError(
+            'Cannot find SQLite database dump {} at {}'.format(database['name'], dump_filename)
+        )
+
+    copy_database(dump_filename, os.path.expanduser(database['path']))
@@ -2,6 +2,7 @@ import logging
 import logging.handlers
 import os
 import sys
+import threading
 
 import colorama
 
@@ -49,6 +50,46 @@ def should_do_markup(no_color, configs):
     return interactive_console()
 
 
+LOG_PREFIX = threading.local()
+
+
+def set_log_prefix(prefix):
+    '''
+    Set a prefix (e.g. a repository path) for the current thread to tag logged command output with,
+    so that output from commands running concurrently in other threads can be told apart. Pass None
+    to clear the prefix.
+    '''
+    LOG_PREFIX.value = prefix
+
+
+def set_log_config_filename(config_filename):
+    '''
+    Set the configuration filename that the current thread is running, so that log records emitted
+    from configuration files running concurrently in other threads can be told apart. Pass None to
+    clear it.
+    '''
+    LOG_PREFIX.config_filename = config_filename
+
+
+def get_log_config_filename():
+    '''
+    Return the configuration filename that the current thread is running, or None if it's not set.
+    '''
+    return getattr(LOG_PREFIX, 'config_filename', None)
+
+
+def add_log_prefix(message):
+    '''
+    Given a log message, return it prefixed with the current thread's log prefix (if any).
+    '''
+    prefix = getattr(LOG_PREFIX, 'value', None)
+
+    if not prefix:
+        return message
+
+    return '{}: {}'.format(prefix, message)
+
+
 class Multi_stream_handler(logging.Handler):
     '''
     A logging handler that dispatches each log record to one of multiple stream handlers depending
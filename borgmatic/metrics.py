@@ -0,0 +1,223 @@
+import collections
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+from borgmatic import execute, timing
+
+logger = logging.getLogger(__name__)
+
+Sample = collections.namedtuple('Sample', ('name', 'labels', 'value'))
+
+# Map from metric name to its help text, in output order. All of these metrics are gauges.
+METRIC_HELP = {
+    'borgmatic_phase_duration_seconds': 'Seconds that each phase of the last run took',
+    'borgmatic_repository_success': 'Whether actions for the repository last succeeded',
+    'borgmatic_repository_last_run_timestamp_seconds': 'Unix time that actions last ran',
+    'borgmatic_database_dump_duration_seconds': 'Total seconds of database dumps per hook',
+    'borgmatic_archive_duration_seconds': 'Seconds that Borg took to create the archive',
+    'borgmatic_archive_original_size_bytes': 'Original size of the created archive',
+    'borgmatic_archive_compressed_size_bytes': 'Compressed size of the created archive',
+    'borgmatic_archive_deduplicated_size_bytes': 'Deduplicated size of the created archive',
+    'borgmatic_archive_files': 'Number of files in the created archive',
+}
+
+# Map from a borg create --json "archive" stats key to the corresponding metric name.
+ARCHIVE_STATS_METRIC_NAMES = {
+    'original_size': 'borgmatic_archive_original_size_bytes',
+    'compressed_size': 'borgmatic_archive_compressed_size_bytes',
+    'deduplicated_size': 'borgmatic_archive_deduplicated_size_bytes',
+    'nfiles': 'borgmatic_archive_files',
+}
+
+# The samples recorded so far during this borgmatic run, not counting phase durations (which come
+# from borgmatic.timing instead).
+SAMPLES = []
+SAMPLES_LOCK = threading.Lock()
+
+
+def record_sample(name, value, config_filename, repository, **labels):
+    '''
+    Given a metric name, its value, a configuration filename, a repository path, and any additional
+    labels as keyword arguments, record a metric sample for output to a metrics textfile.
+    '''
+    with SAMPLES_LOCK:
+        SAMPLES.append(
+            Sample(
+                name,
+                (('config', config_filename), ('repository', repository)) + tuple(labels.items()),
+                value,
+            )
+        )
+
+
+def record_repository_result(config_filename, repository, succeeded):
+    '''
+    Given a configuration filename, a repository path, and whether running actions for that
+    repository succeeded, record the corresponding metric samples.
+    '''
+    record_sample('borgmatic_repository_success', int(succeeded), config_filename, repository)
+    record_sample(
+        'borgmatic_repository_last_run_timestamp_seconds', time.time(), config_filename, repository
+    )
+
+
+def record_archive_stats(config_filename, repository, create_json_output):
+    '''
+    Given a configuration filename, a repository path, and the JSON output string from "borg create
+    --json", record metric samples for the created archive's duration, sizes, and file count.
+    Ignore any stats missing from the output.
+    '''
+    try:
+        archive = json.loads(create_json_output).get('archive', {})
+    except ValueError:
+        logger.warning('{}: Cannot parse Borg create JSON output for metrics'.format(repository))
+        return
+
+    if 'duration' in archive:
+        record_sample(
+            'borgmatic_archive_duration_seconds', archive['duration'], config_filename, repository
+        )
+
+    stats = archive.get('stats', {})
+
+    for stats_key, metric_name in ARCHIVE_STATS_METRIC_NAMES.items():
+        if stats_key in stats:
+            record_sample(metric_name, stats[stats_key], config_filename, repository)
+
+
+def record_database_dump_durations(config_filename, repository, active_dumps):
+    '''
+    Given a configuration filename, a repository path, and a dict from database hook name to a
+    sequence of dump processes that have since been reaped, record the total wall time of each
+    hook's dump processes.
+    '''
+    for hook_name, processes in active_dumps.items():
+        usages = [execute.usage_for_process(process) for process in processes]
+        wall_seconds = [
+            usage.wall_seconds for usage in usages if usage and usage.wall_seconds is not None
+        ]
+
+        if wall_seconds:
+            record_sample(
+                'borgmatic_database_dump_duration_seconds',
+                sum(wall_seconds),
+                config_filename,
+                repository,
+                hook=hook_name,
+            )
+
+
+def escape_label_value(value):
+    '''
+    Given a label value, return it escaped for the Prometheus text exposition format.
+    '''
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_sample(sample):
+    '''
+    Given a Sample, return it as a line in the Prometheus text exposition format.
+    '''
+    return '{}{{{}}} {}'.format(
+        sample.name,
+        ','.join(
+            '{}="{}"'.format(label_name, escape_label_value(label_value))
+            for label_name, label_value in sample.labels
+        ),
+        repr(float(sample.value)),
+    )
+
+
+def get_samples(config_filenames):
+    '''
+    Given a sequence of configuration filenames, return a list of the samples recorded so far for
+    those configuration files, in the order that they were recorded.
+    '''
+    with SAMPLES_LOCK:
+        return [sample for sample in SAMPLES if dict(sample.labels)['config'] in config_filenames]
+
+
+def format_textfile(config_filenames):
+    '''
+    Given a sequence of configuration filenames, return the metrics recorded so far for those
+    configuration files as a string in the Prometheus text exposition format, suitable for the
+    node_exporter textfile collector.
+    '''
+    samples = get_samples(config_filenames)
+
+    samples.extend(
+        Sample(
+            'borgmatic_phase_duration_seconds',
+            (('config', config_filename), ('repository', repository or ''), ('phase', phase)),
+            seconds,
+        )
+        for (config_filename, repository), phases in timing.total_spans().items()
+        if config_filename in config_filenames
+        for phase, seconds in phases.items()
+    )
+
+    lines = []
+
+    for name, help_text in METRIC_HELP.items():
+        metric_samples = [sample for sample in samples if sample.name == name]
+        if not metric_samples:
+            continue
+
+        lines.append('# HELP {} {}'.format(name, help_text))
+        lines.append('# TYPE {} gauge'.format(name))
+        lines.extend(format_sample(sample) for sample in metric_samples)
+
+    return ''.join('{}\n'.format(line) for line in lines)
+
+
+def write_textfile(path, contents):
+    '''
+    Given a metrics textfile path and its contents, write the contents to the file atomically, so
+    that the node_exporter textfile collector never reads a partially written file. Do this by
+    writing a temporary file in the same directory and then renaming it into place.
+
+    Raise OSError if the file cannot be written.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    temporary_file = tempfile.NamedTemporaryFile(
+        'w',
+        dir=directory,
+        prefix='.{}.'.format(os.path.basename(path)),
+        suffix='.tmp',
+        delete=False,
+    )
+
+    try:
+        with temporary_file:
+            temporary_file.write(contents)
+            os.fchmod(temporary_file.fileno(), 0o644)
+
+        os.replace(temporary_file.name, path)
+    except OSError:
+        os.remove(temporary_file.name)
+        raise
+
+
+def write_textfiles(configs):
+    '''
+    Given a dict of configuration filename to corresponding parsed configuration, write the metrics
+    recorded so far to the metrics textfile of each configuration file that has one. If several
+    configuration files share a textfile, write the metrics for all of them to that file.
+
+    Raise OSError if a file cannot be written.
+    '''
+    config_filenames_by_path = {}
+
+    for config_filename, config in configs.items():
+        path = config.get('hooks', {}).get('metrics_textfile')
+
+        if path:
+            config_filenames_by_path.setdefault(path, []).append(config_filename)
+
+    for path, config_filenames in config_filenames_by_path.items():
+        logger.debug('Writing metrics to {}'.format(path))
+        write_textfile(path, format_textfile(config_filenames))
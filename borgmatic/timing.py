@@ -0,0 +1,109 @@
+import collections
+import contextlib
+import json
+import threading
+import time
+
+from borgmatic import trace
+
+Span = collections.namedtuple('Span', ('config_filename', 'repository', 'phase', 'seconds'))
+
+# The spans timed so far during this borgmatic run, in the order that they finished.
+SPANS = []
+SPANS_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def span(config_filename, repository, phase):
+    '''
+    Given a configuration filename, a repository path (or None for a phase that isn't specific to a
+    repository), and the name of a phase of a borgmatic run (e.g. "create" or "pre-backup hook"),
+    time how long the code within this context takes to run and record it as a span, whether or not
+    that code raises. Also record it as a trace event.
+    '''
+    start_time = time.monotonic()
+
+    try:
+        yield
+    finally:
+        end_time = time.monotonic()
+
+        with SPANS_LOCK:
+            SPANS.append(Span(config_filename, repository, phase, end_time - start_time))
+
+        trace.record_event(
+            phase,
+            'action',
+            start_time,
+            end_time,
+            args={'config_filename': config_filename, 'repository': repository},
+        )
+
+
+def total_spans():
+    '''
+    Total up the spans recorded so far by configuration filename, repository, and phase, adding
+    together the durations of any phase that ran more than once (e.g. due to retries).
+
+    Return the result as a dict from (configuration filename, repository) to a dict from phase to
+    total seconds. Configuration files, repositories, and phases are in the order that they first
+    finished, except that each configuration file's spans without a repository come before its
+    repositories' spans.
+    '''
+    with SPANS_LOCK:
+        spans = list(SPANS)
+
+    totals = collections.OrderedDict()
+
+    for config_filename in dict.fromkeys(span.config_filename for span in spans):
+        config_spans = [span for span in spans if span.config_filename == config_filename]
+
+        for span in sorted(config_spans, key=lambda span: span.repository is not None):
+            phases = totals.setdefault((span.config_filename, span.repository), {})
+            phases[span.phase] = phases.get(span.phase, 0) + span.seconds
+
+    return totals
+
+
+def format_timings():
+    '''
+    Return a human-readable breakdown of the spans recorded so far, per configuration file and
+    repository, as a single string ending with a newline. Return an empty string if no spans have
+    been recorded.
+    '''
+    lines = []
+    previous_config_filename = None
+
+    for (config_filename, repository), phases in total_spans().items():
+        if config_filename != previous_config_filename:
+            lines.append('Timings for {}:'.format(config_filename))
+            previous_config_filename = config_filename
+
+        indent = '  '
+        if repository is not None:
+            lines.append('  {}:'.format(repository))
+            indent = '    '
+
+        lines.extend(
+            '{:<32}{:>9.2f}s'.format(indent + phase, seconds) for phase, seconds in phases.items()
+        )
+
+        if repository is not None:
+            lines.append('{:<32}{:>9.2f}s'.format(indent + 'total', sum(phases.values())))
+
+    return ''.join('{}\n'.format(line) for line in lines)
+
+
+def format_timings_json():
+    '''
+    Return a JSON string of the spans recorded so far as a list of objects, one per configuration
+    file and repository, each with "config_filename", "repository" (null for phases that aren't
+    specific to a repository), and "phases" keys. The "phases" value maps each phase name to its
+    total seconds.
+    '''
+    return json.dumps(
+        [
+            {'config_filename': config_filename, 'repository': repository, 'phases': phases}
+            for (config_filename, repository), phases in total_spans().items()
+        ]
+    )
@@ -0,0 +1,107 @@
+import collections
+import contextlib
+import json
+import os
+import threading
+import time
+
+Event = collections.namedtuple(
+    'Event', ('name', 'category', 'start_time', 'end_time', 'pid', 'thread_id', 'args')
+)
+
+# The trace events recorded so far during this borgmatic run, in the order that they finished.
+EVENTS = []
+EVENTS_LOCK = threading.Lock()
+
+
+def record_event(name, category, start_time, end_time, pid=None, thread_id=None, args=None):
+    '''
+    Given an event name, a category (e.g. "action", "hook", or "process"), start and end times as
+    time.monotonic() values, an optional process ID and thread ID (defaulting to borgmatic's own
+    process and the current thread), and an optional dict of extra event arguments, record a trace
+    event.
+    '''
+    with EVENTS_LOCK:
+        EVENTS.append(
+            Event(
+                name,
+                category,
+                start_time,
+                end_time,
+                os.getpid() if pid is None else pid,
+                threading.get_ident() if thread_id is None else thread_id,
+                args or {},
+            )
+        )
+
+
+@contextlib.contextmanager
+def event(name, category, **args):
+    '''
+    Given an event name, a category, and any extra event arguments as keyword arguments, record a
+    trace event covering the code run within this context, whether or not that code raises.
+    '''
+    start_time = time.monotonic()
+
+    try:
+        yield
+    finally:
+        record_event(name, category, start_time, time.monotonic(), args=args)
+
+
+def microseconds(seconds):
+    '''
+    Given a number of seconds, return it as a whole number of microseconds, the unit of trace event
+    timestamps.
+    '''
+    return int(seconds * 1000000)
+
+
+def format_trace():
+    '''
+    Return a JSON string of the events recorded so far in the Chrome trace event format, suitable
+    for loading into Perfetto or chrome://tracing. Each event becomes a "complete" event on a track
+    per process and thread, and each process' track gets named after its first event, so that
+    subprocesses show up as e.g. "pg_dump" or "borg" alongside borgmatic itself.
+    '''
+    with EVENTS_LOCK:
+        events = list(EVENTS)
+
+    borgmatic_pid = os.getpid()
+    process_names = {borgmatic_pid: 'borgmatic'}
+
+    for recorded_event in events:
+        process_names.setdefault(recorded_event.pid, recorded_event.name)
+
+    return json.dumps(
+        {
+            'traceEvents': [
+                {'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': process_name}}
+                for pid, process_name in process_names.items()
+            ]
+            + [
+                {
+                    'name': recorded_event.name,
+                    'cat': recorded_event.category,
+                    'ph': 'X',
+                    'ts': microseconds(recorded_event.start_time),
+                    'dur': microseconds(recorded_event.end_time - recorded_event.start_time),
+                    'pid': recorded_event.pid,
+                    'tid': recorded_event.thread_id,
+                    'args': recorded_event.args,
+                }
+                for recorded_event in sorted(events, key=lambda recorded: recorded.start_time)
+            ],
+            'displayTimeUnit': 'ms',
+        }
+    )
+
+
+def write_trace(path):
+    '''
+    Given a path, write the events recorded so far to it as a Chrome trace JSON file.
+
+    Raise OSError if the file cannot be written.
+    '''
+    with open(path, 'w') as trace_file:
+        trace_file.write(format_trace())
@@ -1,6 +1,6 @@
 from setuptools import find_packages, setup
 
-VERSION = '1.6.0'
+VERSION = '1.6.1.dev0'
 
 
 setup(
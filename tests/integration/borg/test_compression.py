@@ -0,0 +1,59 @@
+import os
+
+from flexmock import flexmock
+
+from borgmatic.borg import compression as module
+
+
+def write_file(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, 'wb') as written_file:
+        written_file.write(contents)
+
+
+def test_choose_compression_with_text_picks_budget_compression(tmp_path):
+    write_file(str(tmp_path / 'logs' / 'app.log'), b'GET /index.html 200\n' * 50000)
+
+    assert module.choose_compression((str(tmp_path),), 'high') == 'zstd,9'
+
+
+def test_choose_compression_with_random_data_picks_no_compression(tmp_path):
+    write_file(str(tmp_path / 'media' / 'video.mp4'), os.urandom(200000))
+
+    assert module.choose_compression((str(tmp_path),), 'high') == 'none'
+
+
+def test_choose_compression_with_mostly_random_data_by_size_picks_no_compression(tmp_path):
+    write_file(str(tmp_path / 'media' / 'video.mp4'), os.urandom(2000000))
+    write_file(str(tmp_path / 'logs' / 'app.log'), b'GET /index.html 200\n' * 1000)
+
+    assert module.choose_compression((str(tmp_path),), 'high') == 'none'
+
+
+def test_choose_compression_with_relative_source_file_samples_it(tmp_path):
+    write_file(str(tmp_path / 'app.log'), b'GET /index.html 200\n' * 50000)
+
+    assert module.choose_compression(('app.log',), 'low', str(tmp_path)) == 'lz4'
+
+
+def test_choose_compression_skips_non_regular_files(tmp_path):
+    os.mkfifo(str(tmp_path / 'pipe'))
+
+    assert module.choose_compression((str(tmp_path),)) is None
+
+
+def test_sample_source_stops_at_byte_budget(tmp_path):
+    for index in range(10):
+        write_file(str(tmp_path / str(index)), b'x' * module.SAMPLE_CHUNK_BYTES)
+
+    assert len(module.sample_source(str(tmp_path), 3 * module.SAMPLE_CHUNK_BYTES)) == 3
+
+
+def test_sample_source_stops_at_entry_limit(tmp_path):
+    flexmock(module, MAX_SAMPLED_ENTRIES_PER_SOURCE=2)
+
+    for index in range(10):
+        write_file(str(tmp_path / str(index)), b'x')
+
+    assert len(module.sample_source(str(tmp_path), module.SAMPLE_BYTES)) == 2
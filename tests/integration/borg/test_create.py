@@ -0,0 +1,99 @@
+import glob
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+from borgmatic.borg import create as module
+
+
+@pytest.fixture
+def source_tree(tmp_path):
+    for directory in ('srv/foo/data', 'srv/bar', 'srv/.hidden/data', 'other/data/nested'):
+        (tmp_path / directory).mkdir(parents=True)
+
+    for filename in ('srv/file', 'srv/bar/data', 'srv/foo/data/.dotfile'):
+        (tmp_path / filename).touch()
+
+    (tmp_path / 'srv' / 'link').symlink_to(tmp_path / 'srv' / 'foo')
+    (tmp_path / 'srv' / 'broken').symlink_to(tmp_path / 'nowhere')
+
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    'pattern',
+    (
+        '*',
+        '*/',
+        '*/*',
+        'srv/*/data',
+        'srv/*/data/',
+        'srv/*/data/*',
+        'srv/.*',
+        'srv/*/data/.*',
+        'srv/[fl]*',
+        'srv/?ar',
+        'srv/br*',
+        '*/*/data/*',
+        'missing/*',
+    ),
+)
+def test_scan_glob_matches_glob_glob(source_tree, pattern):
+    full_pattern = os.path.join(str(source_tree), pattern)
+
+    assert sorted(module.scan_glob(full_pattern)[1]) == sorted(glob.glob(full_pattern))
+
+
+def test_cached_glob_notices_directory_added_after_caching(tmp_path):
+    (tmp_path / 'foo' / 'data').mkdir(parents=True)
+    (tmp_path / 'bar').mkdir()
+
+    # Backdate the directories, so their expansion isn't considered too recent to cache.
+    for directory in (tmp_path, tmp_path / 'foo', tmp_path / 'bar'):
+        os.utime(str(directory), ns=(0, 0))
+
+    pattern = os.path.join(str(tmp_path), '*', 'data')
+    module.GLOB_CACHE.pop(pattern, None)
+
+    assert module.cached_glob(pattern) == [str(tmp_path / 'foo' / 'data')]
+    assert pattern in module.GLOB_CACHE
+
+    (tmp_path / 'bar' / 'data').mkdir()
+
+    assert sorted(module.cached_glob(pattern)) == [
+        str(tmp_path / 'bar' / 'data'),
+        str(tmp_path / 'foo' / 'data'),
+    ]
+
+
+def test_create_archive_with_json_and_stream_processes_returns_borg_json_output(tmp_path):
+    fake_borg_path = tmp_path / 'borg'
+    fake_borg_path.write_text('#!/bin/sh\necho \'{"archive": {"name": "archive"}}\'\n')
+    fake_borg_path.chmod(0o700)
+    (tmp_path / 'source').mkdir()
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; print("dumping", file=sys.stderr)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    json_output = module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': [str(tmp_path / 'source')],
+            'repositories': ['repo'],
+            'borgmatic_source_directory': str(tmp_path / '.borgmatic'),
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+        local_path=str(fake_borg_path),
+        json=True,
+        stream_processes=[producer],
+    )
+
+    assert json.loads(json_output) == {'archive': {'name': 'archive'}}
+    assert producer.returncode == 0
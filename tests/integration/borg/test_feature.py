@@ -15,3 +15,7 @@ def test_available_true_for_borg_stable_version_introducing_feature():
 
 def test_available_false_for_too_old_borg_version():
     assert not module.available(module.Feature.COMPACT, '1.1.5')
+
+
+def test_parse_borg_version_caches_parsed_version():
+    assert module.parse_borg_version('1.2.3') is module.parse_borg_version('1.2.3')
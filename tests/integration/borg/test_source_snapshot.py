@@ -0,0 +1,86 @@
+import os
+
+from borgmatic.borg import source_snapshot as module
+
+
+def make_source_tree(tmp_path):
+    source = tmp_path / 'source'
+    (source / 'sub').mkdir(parents=True)
+    (source / 'sub' / 'file').write_text('contents')
+    (source / 'cache').mkdir()
+    (source / 'cache' / 'junk').write_text('junk')
+
+    dumps = tmp_path / 'borgmatic' / 'postgresql_databases' / 'localhost'
+    dumps.mkdir(parents=True)
+    (dumps / 'users').write_text('dump')
+
+    return (str(source), str(tmp_path / 'borgmatic'))
+
+
+def test_take_snapshot_is_unchanged_for_untouched_sources(tmp_path):
+    (source, borgmatic_source) = make_source_tree(tmp_path)
+
+    snapshot = module.take_snapshot((source, borgmatic_source), (), [borgmatic_source])
+
+    assert snapshot[source]['paths'] == 5
+    assert snapshot[borgmatic_source]['checksum']
+    assert module.take_snapshot((source, borgmatic_source), (), [borgmatic_source]) == snapshot
+
+
+def test_take_snapshot_notices_modified_file(tmp_path):
+    (source, borgmatic_source) = make_source_tree(tmp_path)
+    os.utime(os.path.join(source, 'sub', 'file'), ns=(0, 0))
+    snapshot = module.take_snapshot((source,), (), [])
+
+    with open(os.path.join(source, 'sub', 'file'), 'a') as modified_file:
+        modified_file.write('more')
+
+    assert module.take_snapshot((source,), (), []) != snapshot
+
+
+def test_take_snapshot_notices_deleted_file(tmp_path):
+    (source, borgmatic_source) = make_source_tree(tmp_path)
+    snapshot = module.take_snapshot((source,), (), [])
+
+    os.remove(os.path.join(source, 'sub', 'file'))
+
+    assert module.take_snapshot((source,), (), []) != snapshot
+
+
+def test_take_snapshot_ignores_excluded_paths(tmp_path):
+    (source, borgmatic_source) = make_source_tree(tmp_path)
+    exclude_patterns = (os.path.join(source, 'cache'),)
+    snapshot = module.take_snapshot((source,), exclude_patterns, [])
+
+    os.remove(os.path.join(source, 'cache', 'junk'))
+
+    assert snapshot[source]['paths'] == 3
+    assert module.take_snapshot((source,), exclude_patterns, []) == snapshot
+
+
+def test_take_snapshot_compares_database_dumps_by_contents(tmp_path):
+    (source, borgmatic_source) = make_source_tree(tmp_path)
+    dump_path = os.path.join(borgmatic_source, 'postgresql_databases', 'localhost', 'users')
+    snapshot = module.take_snapshot((borgmatic_source,), (), [borgmatic_source])
+
+    # Dump the database again with the same contents, and then with different contents.
+    os.remove(dump_path)
+    with open(dump_path, 'w') as dump_file:
+        dump_file.write('dump')
+
+    assert module.take_snapshot((borgmatic_source,), (), [borgmatic_source]) == snapshot
+
+    with open(dump_path, 'w') as dump_file:
+        dump_file.write('new dump')
+
+    assert module.take_snapshot((borgmatic_source,), (), [borgmatic_source]) != snapshot
+
+
+def test_write_snapshot_then_read_snapshot_round_trips(tmp_path):
+    (source, borgmatic_source) = make_source_tree(tmp_path)
+    snapshot = module.take_snapshot((source, borgmatic_source, '/nonexistent'), (), [])
+    snapshot_path = str(tmp_path / 'state' / 'source_snapshots' / 'snapshot.json')
+
+    module.write_snapshot(snapshot_path, snapshot)
+
+    assert module.read_snapshot(snapshot_path) == snapshot
@@ -0,0 +1,38 @@
+import json
+
+from borgmatic.borg import version as module
+
+
+def test_write_version_cache_then_read_version_cache_round_trips(tmp_path):
+    cache_path = str(tmp_path / 'borgmatic' / 'borg_versions.json')
+
+    module.write_version_cache(cache_path, '/usr/bin/borg', {'inode': 1}, '1.2.3')
+    module.write_version_cache(cache_path, '/usr/bin/borg2', {'inode': 2}, '2.0.0')
+
+    assert module.read_version_cache(cache_path) == {
+        '/usr/bin/borg': {'inode': 1, 'version': '1.2.3'},
+        '/usr/bin/borg2': {'inode': 2, 'version': '2.0.0'},
+    }
+    assert [path.name for path in (tmp_path / 'borgmatic').iterdir()] == ['borg_versions.json']
+
+
+def test_write_version_cache_replaces_version_of_earlier_binary_at_same_path(tmp_path):
+    cache_path = tmp_path / 'borg_versions.json'
+    cache_path.write_text(json.dumps({'/usr/bin/borg': {'inode': 1, 'version': '1.1.0'}}))
+
+    module.write_version_cache(str(cache_path), '/usr/bin/borg', {'inode': 2}, '1.2.3')
+
+    assert module.read_version_cache(str(cache_path)) == {
+        '/usr/bin/borg': {'inode': 2, 'version': '1.2.3'}
+    }
+
+
+def test_read_version_cache_with_corrupt_file_returns_empty_dict(tmp_path):
+    cache_path = tmp_path / 'borg_versions.json'
+    cache_path.write_text('{not json')
+
+    assert module.read_version_cache(str(cache_path)) == {}
+
+
+def test_read_version_cache_with_missing_file_returns_empty_dict(tmp_path):
+    assert module.read_version_cache(str(tmp_path / 'borg_versions.json')) == {}
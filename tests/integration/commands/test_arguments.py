@@ -296,6 +296,66 @@ def test_parse_arguments_disallows_init_and_dry_run():
         )
 
 
+def test_parse_arguments_disallows_jobs_less_than_one():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    with pytest.raises(ValueError):
+        module.parse_arguments('--config', 'myconfig', '--jobs', '0')
+
+
+def test_parse_arguments_allows_jobs():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments('--config', 'myconfig', '--jobs', '2')
+
+    assert arguments['global'].jobs == 2
+
+
+def test_parse_arguments_disallows_repository_jobs_less_than_one():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    with pytest.raises(ValueError):
+        module.parse_arguments('--config', 'myconfig', '--repository-jobs', '0')
+
+
+def test_parse_arguments_allows_repository_jobs():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments('--config', 'myconfig', '--repository-jobs', '3')
+
+    assert arguments['global'].repository_jobs == 3
+
+
+def test_parse_arguments_disallows_timings_with_json():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    with pytest.raises(ValueError):
+        module.parse_arguments('--config', 'myconfig', '--timings', 'info', '--json')
+
+
+def test_parse_arguments_allows_timings_json():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments('--config', 'myconfig', '--timings-json', 'create')
+
+    assert arguments['global'].timings_json
+
+
+def test_parse_arguments_disallows_timings_json_with_json():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    with pytest.raises(ValueError):
+        module.parse_arguments('--config', 'myconfig', '--timings-json', 'create', '--json')
+
+
+def test_parse_arguments_allows_trace_file():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments('--config', 'myconfig', '--trace-file', 'trace.json')
+
+    assert arguments['global'].trace_file == 'trace.json'
+
+
 def test_parse_arguments_disallows_glob_archives_with_successful():
     flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
 
@@ -388,6 +448,44 @@ def test_parse_arguments_allows_archive_with_dashed_restore():
     module.parse_arguments('--config', 'myconfig', '--restore', '--archive', 'test')
 
 
+def test_parse_arguments_with_database_jobs_parses_count():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments(
+        '--config', 'myconfig', 'restore', '--archive', 'test', '--database-jobs', '4'
+    )
+
+    assert arguments['restore'].database_jobs == 4
+
+
+def test_parse_arguments_with_global_jobs_and_database_jobs_keeps_both():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments(
+        '--config',
+        'myconfig',
+        '--jobs',
+        '3',
+        'restore',
+        '--archive',
+        'test',
+        '--database-jobs',
+        '2',
+    )
+
+    assert arguments['global'].jobs == 3
+    assert arguments['restore'].database_jobs == 2
+
+
+def test_parse_arguments_disallows_database_jobs_less_than_one():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    with pytest.raises(ValueError):
+        module.parse_arguments(
+            '--config', 'myconfig', 'restore', '--archive', 'test', '--database-jobs', '0'
+        )
+
+
 def test_parse_arguments_allows_archive_with_list():
     flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
 
@@ -505,6 +603,24 @@ def test_parse_arguments_disallows_json_with_both_list_and_info():
         module.parse_arguments('list', 'info', '--json')
 
 
+def test_parse_arguments_history_parses_last_as_integer():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments('history', '--last', '5', '--json')
+
+    assert arguments['history'].last == 5
+    assert arguments['history'].json
+
+
+def test_parse_arguments_verify_dumps_defaults_to_latest_archive():
+    flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
+
+    arguments = module.parse_arguments('verify-dumps', '--database', 'foo', 'bar')
+
+    assert arguments['verify-dumps'].archive == 'latest'
+    assert arguments['verify-dumps'].databases == ['foo', 'bar']
+
+
 def test_parse_arguments_check_only_extract_does_not_raise_extract_subparser_error():
     flexmock(module.collect).should_receive('get_default_config_paths').and_return(['default'])
 
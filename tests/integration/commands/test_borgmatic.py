@@ -1,5 +1,7 @@
 import subprocess
+import sys
 
+import pytest
 from flexmock import flexmock
 
 from borgmatic.commands import borgmatic as module
@@ -12,3 +14,92 @@ def test_borgmatic_version_matches_news_version():
     news_version = open('NEWS').readline()
 
     assert borgmatic_version == news_version
+
+
+@pytest.fixture
+def fake_borg_path(tmp_path):
+    '''
+    Return the path of a fake Borg executable that prints the JSON output of "borg create".
+    '''
+    path = tmp_path / 'borg'
+    path.write_text('#!/bin/sh\necho \'{"archive": {"name": "archive", "stats": {}}}\'\n')
+    path.chmod(0o700)
+
+    return str(path)
+
+
+def run_create_with_streamed_dump(tmp_path, fake_borg_path, hooks):
+    '''
+    Run the create action with the given hooks configuration, streaming a real dump process to the
+    fake Borg executable at the given path. Return the results of run_actions() as a list.
+    '''
+    (tmp_path / 'source').mkdir()
+    dump_process = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; print("dumping", file=sys.stderr)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({})
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'dump_databases',
+        object,
+        'repo',
+        object,
+        object,
+        False,
+        spool=False,
+        concurrency=None,
+        checksum_dumps=bool,
+    ).and_return({'postgresql_databases': [dump_process]})
+    flexmock(module.manifest).should_receive('remove_manifest')
+    flexmock(module.manifest).should_receive('write_manifest')
+    flexmock(module.metrics).should_receive('record_database_dump_durations')
+    flexmock(module.command).should_receive('execute_hook')
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
+    }
+
+    return list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={
+                'source_directories': [str(tmp_path / 'source')],
+                'repositories': ['repo'],
+                'borgmatic_source_directory': str(tmp_path / '.borgmatic'),
+            },
+            storage={},
+            retention={},
+            consistency={},
+            hooks=dict(hooks, postgresql_databases=[{'name': 'foo'}]),
+            local_path=fake_borg_path,
+            remote_path=None,
+            local_borg_version='1.2.3',
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_with_checksum_dumps_and_streamed_dump_records_checksums_for_created_archive(
+    tmp_path, fake_borg_path
+):
+    dump_checksums = {'/dump/postgresql_databases/localhost/foo': {'checksum': 'abc', 'size': 3}}
+    flexmock(module.checksum).should_receive('finish_checksummed_dumps').and_return(dump_checksums)
+    flexmock(module.borg_list).should_receive('resolve_archive_name').never()
+    flexmock(module.checksum).should_receive('record_checksums').with_args(
+        'repo', 'archive', module.checksum.make_dump_entries(dump_checksums), 'repo'
+    ).once()
+    flexmock(module.metrics).should_receive('record_archive_stats')
+
+    run_create_with_streamed_dump(tmp_path, fake_borg_path, {'checksum_dumps': True})
+
+
+def test_run_actions_with_history_database_and_streamed_dump_records_archive_stats(
+    tmp_path, fake_borg_path
+):
+    flexmock(module.metrics).should_receive('record_archive_stats').with_args(
+        'test.yaml', 'repo', '{"archive": {"name": "archive", "stats": {}}}\n'
+    ).once()
+
+    run_create_with_streamed_dump(tmp_path, fake_borg_path, {'history_database': 'history.db'})
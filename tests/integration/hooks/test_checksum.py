@@ -0,0 +1,124 @@
+import hashlib
+import os
+import subprocess
+import time
+
+from flexmock import flexmock
+
+from borgmatic.hooks import checksum as module
+
+
+def test_start_checksummed_dump_streams_dump_to_named_pipe_and_records_checksum(tmp_path):
+    dump_filename = str(tmp_path / 'dump')
+    os.mkfifo(dump_filename)
+
+    process = module.start_checksummed_dump(
+        ('printf', 'hello', '>', dump_filename), None, dump_filename
+    )
+
+    with open(dump_filename, 'rb') as dump_file:
+        assert dump_file.read() == b'hello'
+
+    assert process.wait() == 0
+    assert module.finish_checksummed_dumps() == {
+        dump_filename: {'checksum': 'blake2b:' + hashlib.blake2b(b'hello').hexdigest(), 'size': 5}
+    }
+    assert module.STREAMED_CHECKSUMS == {}
+    assert module.TEE_THREADS == []
+
+
+def test_finish_checksummed_dumps_stops_waiting_for_unread_named_pipe(tmp_path):
+    dump_filename = str(tmp_path / 'dump')
+    os.mkfifo(dump_filename)
+    flexmock(module, PIPE_OPEN_POLL_SECONDS=0.01)
+
+    process = module.start_checksummed_dump(
+        ('printf', 'hello', '>', dump_filename), None, dump_filename
+    )
+
+    assert module.finish_checksummed_dumps() == {}
+    assert not module.TEE_STOP.is_set()
+    process.wait(timeout=5)
+
+
+def test_start_checksummed_dump_does_not_start_dump_until_named_pipe_gets_opened(tmp_path):
+    dump_filename = str(tmp_path / 'dump')
+    started_filename = str(tmp_path / 'started')
+    os.mkfifo(dump_filename)
+
+    process = module.start_checksummed_dump(
+        ('sh', '-c', "'touch {}; printf hello'".format(started_filename), '>', dump_filename),
+        None,
+        dump_filename,
+    )
+    time.sleep(0.2)
+
+    assert not os.path.exists(started_filename)
+
+    with open(dump_filename, 'rb') as dump_file:
+        assert dump_file.read() == b'hello'
+
+    assert process.wait() == 0
+    assert os.path.exists(started_filename)
+    assert module.finish_checksummed_dumps() == {
+        dump_filename: {'checksum': 'blake2b:' + hashlib.blake2b(b'hello').hexdigest(), 'size': 5}
+    }
+
+
+def test_start_checksummed_dump_with_killed_dump_removes_private_named_pipe(tmp_path):
+    dump_filename = str(tmp_path / 'dump')
+    os.mkfifo(dump_filename)
+    private_directory = tmp_path / 'private'
+    private_directory.mkdir()
+    flexmock(module.tempfile).should_receive('mkdtemp').and_return(str(private_directory))
+    flexmock(module, PIPE_OPEN_POLL_SECONDS=0.01)
+    process = module.start_checksummed_dump(
+        ('printf', 'hello', '>', dump_filename), None, dump_filename
+    )
+    (thread,) = module.TEE_THREADS
+
+    process.kill()
+    process.wait()
+
+    assert module.finish_checksummed_dumps() == {}
+    assert not thread.is_alive()
+    assert not private_directory.exists()
+
+
+def test_record_checksums_keeps_only_most_recent_archives(tmp_path):
+    checksums_path = str(tmp_path / 'state' / 'checksums.json')
+    flexmock(module).should_receive('make_checksums_path').and_return(checksums_path)
+    flexmock(module, MAX_RECORDED_ARCHIVES=2)
+
+    for archive_name in ('one', 'two', 'three'):
+        module.record_checksums('repo', archive_name, [{'name': archive_name}], 'repo')
+
+    module.record_checksums('other', 'one', [], 'other')
+
+    assert module.read_checksums(checksums_path) == {
+        'repo': {'two': [{'name': 'two'}], 'three': [{'name': 'three'}]},
+        'other': {'one': []},
+    }
+
+
+def test_read_checksums_with_invalid_file_returns_empty_dict(tmp_path):
+    checksums_path = tmp_path / 'checksums.json'
+    checksums_path.write_text('{')
+
+    assert module.read_checksums(str(checksums_path)) == {}
+    assert module.read_checksums(str(tmp_path / 'missing.json')) == {}
+
+
+def test_checksum_archived_dump_checksums_extracted_output():
+    extract_process = subprocess.Popen(
+        'printf hello; printf warning >&2',
+        shell=True,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    flexmock(module.borg_extract).should_receive('extract_archive').and_return(extract_process)
+
+    assert module.checksum_archived_dump('repo', 'archive', '/dump', {}, {}, '1.2.3') == (
+        'blake2b:' + hashlib.blake2b(b'hello').hexdigest(),
+        5,
+    )
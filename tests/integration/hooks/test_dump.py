@@ -0,0 +1,20 @@
+from borgmatic.hooks import dump as module
+
+
+def test_write_dump_sizes_and_read_them_back(tmp_path):
+    sizes_path = str(tmp_path / 'state' / 'database_dump_sizes.json')
+
+    module.write_dump_sizes(sizes_path, {'/dumps/localhost/foo': 1234})
+
+    assert module.read_dump_sizes(sizes_path) == {'/dumps/localhost/foo': 1234}
+
+
+def test_get_dump_size_sums_files_in_directory_dump(tmp_path):
+    (tmp_path / 'foo').mkdir()
+    (tmp_path / 'foo' / 'toc.dat').write_bytes(b'x' * 10)
+    (tmp_path / 'foo' / '1234.dat').write_bytes(b'x' * 5)
+    (tmp_path / 'bar').write_bytes(b'x' * 3)
+
+    assert module.get_dump_size(str(tmp_path / 'foo')) == 15
+    assert module.get_dump_size(str(tmp_path / 'bar')) == 3
+    assert module.get_dump_size(str(tmp_path / 'baz')) is None
@@ -8,13 +8,36 @@ from borgmatic.hooks import healthchecks as module
 def test_destroy_monitor_removes_healthchecks_handler():
     logger = logging.getLogger()
     original_handlers = list(logger.handlers)
-    logger.addHandler(module.Forgetful_buffering_handler(byte_capacity=100, log_level=1))
+    logger.addHandler(
+        module.Forgetful_buffering_handler(
+            byte_capacity=100, log_level=1, config_filename='test.yaml'
+        )
+    )
 
-    module.destroy_monitor(flexmock(), flexmock(), flexmock(), flexmock())
+    module.destroy_monitor(flexmock(), 'test.yaml', flexmock(), flexmock())
 
     assert logger.handlers == original_handlers
 
 
+def test_destroy_monitor_leaves_healthchecks_handler_for_other_configuration_file():
+    logger = logging.getLogger()
+    original_handlers = list(logger.handlers)
+    other_handler = module.Forgetful_buffering_handler(
+        byte_capacity=100, log_level=1, config_filename='other.yaml'
+    )
+    logger.addHandler(other_handler)
+    logger.addHandler(
+        module.Forgetful_buffering_handler(
+            byte_capacity=100, log_level=1, config_filename='test.yaml'
+        )
+    )
+
+    module.destroy_monitor(flexmock(), 'test.yaml', flexmock(), flexmock())
+
+    assert logger.handlers == original_handlers + [other_handler]
+    logger.removeHandler(other_handler)
+
+
 def test_destroy_monitor_without_healthchecks_handler_does_not_raise():
     logger = logging.getLogger()
     original_handlers = list(logger.handlers)
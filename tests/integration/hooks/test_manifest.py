@@ -0,0 +1,107 @@
+import hashlib
+import json
+import os
+import subprocess
+
+from flexmock import flexmock
+
+from borgmatic import execute
+from borgmatic.hooks import manifest as module
+
+
+def test_write_manifest_describes_file_directory_and_stream_dumps(tmp_path):
+    source_directory = str(tmp_path / 'borgmatic')
+    file_dump = tmp_path / 'borgmatic' / 'sqlite_databases' / 'localhost' / 'foo'
+    file_dump.parent.mkdir(parents=True)
+    file_dump.write_bytes(b'dump contents')
+    directory_dump = tmp_path / 'borgmatic' / 'postgresql_databases' / 'db.example' / 'bar'
+    directory_dump.mkdir(parents=True)
+    (directory_dump / 'toc.dat').write_bytes(b'12345')
+    stream_dump = tmp_path / 'borgmatic' / 'mysql_databases' / 'localhost' / 'baz'
+    stream_dump.parent.mkdir(parents=True)
+    os.mkfifo(str(stream_dump))
+    flexmock(module.dump, DUMP_DURATIONS={str(file_dump): 1.5})
+
+    module.write_manifest(
+        {'borgmatic_source_directory': source_directory},
+        {'postgresql_databases': [{'name': 'all', 'format': 'directory'}]},
+        'test.yaml',
+        dry_run=False,
+    )
+
+    with open(module.make_manifest_path(source_directory)) as manifest_file:
+        manifest = json.load(manifest_file)
+
+    assert manifest['version'] == module.MANIFEST_VERSION
+    assert sorted(manifest['dumps'], key=lambda dump_entry: dump_entry['hook']) == [
+        {
+            'hook': 'mysql_databases',
+            'name': 'baz',
+            'hostname': 'localhost',
+            'path': str(stream_dump),
+            'format': None,
+            'type': 'stream',
+            'size': None,
+            'duration_seconds': None,
+            'checksum': None,
+        },
+        {
+            'hook': 'postgresql_databases',
+            'name': 'bar',
+            'hostname': 'db.example',
+            'path': str(directory_dump),
+            'format': 'directory',
+            'type': 'directory',
+            'size': 5,
+            'duration_seconds': None,
+            'checksum': None,
+        },
+        {
+            'hook': 'sqlite_databases',
+            'name': 'foo',
+            'hostname': 'localhost',
+            'path': str(file_dump),
+            'format': None,
+            'type': 'file',
+            'size': 13,
+            'duration_seconds': 1.5,
+            'checksum': 'blake2b:' + hashlib.blake2b(b'dump contents').hexdigest(),
+        },
+    ]
+    assert not [name for name in os.listdir(source_directory) if name.endswith('.tmp')]
+
+
+def test_remove_manifest_removes_written_manifest(tmp_path):
+    source_directory = str(tmp_path / 'borgmatic')
+    flexmock(module.dump, DUMP_DURATIONS={})
+    location_config = {'borgmatic_source_directory': source_directory}
+
+    module.write_manifest(location_config, {}, 'test.yaml', dry_run=False)
+    assert os.path.exists(module.make_manifest_path(source_directory))
+
+    module.remove_manifest(location_config, 'test.yaml', dry_run=False)
+    assert not os.path.exists(module.make_manifest_path(source_directory))
+
+
+def test_checksum_file_reads_file_in_chunks(tmp_path):
+    path = tmp_path / 'dump'
+    path.write_bytes(b'x' * 10)
+    flexmock(module, CHECKSUM_CHUNK_BYTES=3)
+
+    assert module.checksum_file(str(path)) == 'blake2b:' + hashlib.blake2b(b'x' * 10).hexdigest()
+
+
+def test_read_archive_manifest_reaps_extract_process_and_records_its_usage():
+    extract_process = execute.execute_command(
+        ['echo', '{"version": 1, "dumps": []}'],
+        output_file=subprocess.PIPE,
+        run_to_completion=False,
+    )
+    flexmock(module.borg_extract).should_receive('extract_archive').and_return(extract_process)
+
+    assert module.read_archive_manifest('repo', 'archive', {}, {}, '1.2.3') == {
+        'version': 1,
+        'dumps': [],
+    }
+    assert extract_process not in execute.PROCESS_START_TIMES
+    assert execute.usage_for_process(extract_process)
@@ -0,0 +1,51 @@
+import sqlite3
+
+from flexmock import flexmock
+
+from borgmatic.hooks import sqlite as module
+
+
+def test_copy_database_copies_all_pages_in_batches(tmp_path):
+    source_path = str(tmp_path / 'source.db')
+    destination_path = str(tmp_path / 'destination.db')
+    flexmock(module, BACKUP_PAGES_PER_STEP=2, BACKUP_STEP_SLEEP_SECONDS=0)
+
+    connection = sqlite3.connect(source_path)
+    connection.execute('CREATE TABLE items (value TEXT)')
+    connection.executemany('INSERT INTO items VALUES (?)', [('x' * 1000,) for index in range(100)])
+    connection.commit()
+    connection.close()
+
+    module.copy_database(source_path, destination_path)
+
+    connection = sqlite3.connect(destination_path)
+    assert connection.execute('SELECT COUNT(*) FROM items').fetchone() == (100,)
+    connection.close()
+
+
+def test_dump_databases_and_restore_database_dump_round_trip(tmp_path):
+    database_path = str(tmp_path / 'users.db')
+    location_config = {'borgmatic_source_directory': str(tmp_path / 'borgmatic')}
+    databases = [{'name': 'users', 'path': database_path}]
+    flexmock(module.dump, DUMP_DURATIONS={})
+
+    connection = sqlite3.connect(database_path)
+    connection.execute('CREATE TABLE users (name TEXT)')
+    connection.execute("INSERT INTO users VALUES ('alice')")
+    connection.commit()
+    connection.close()
+
+    assert module.dump_databases(databases, 'test.yaml', location_config, dry_run=False) == []
+
+    connection = sqlite3.connect(database_path)
+    connection.execute('DELETE FROM users')
+    connection.commit()
+    connection.close()
+
+    module.restore_database_dump(
+        databases, 'test.yaml', location_config, dry_run=False, extract_process=None
+    )
+
+    connection = sqlite3.connect(database_path)
+    assert connection.execute('SELECT name FROM users').fetchall() == [('alice',)]
+    connection.close()
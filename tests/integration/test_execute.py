@@ -1,3 +1,4 @@
+import asyncio
 import logging
 import subprocess
 import sys
@@ -31,6 +32,23 @@ def test_log_outputs_logs_each_line_separately():
     )
 
 
+def test_log_outputs_passes_lines_through_output_line_handler_for_process():
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'HI').once()
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'there').once()
+    flexmock(module).should_receive('exit_code_indicates_error').and_return(False)
+
+    hi_process = subprocess.Popen(['echo', 'hi'], stdout=subprocess.PIPE)
+    there_process = subprocess.Popen(['echo', 'there'], stdout=subprocess.PIPE)
+
+    module.log_outputs(
+        (hi_process, there_process),
+        exclude_stdouts=(),
+        output_log_level=logging.INFO,
+        borg_local_path='borg',
+        output_line_handlers={hi_process: str.upper},
+    )
+
+
 def test_log_outputs_skips_logs_for_process_with_none_stdout():
     flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'hi').never()
     flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'there').once()
@@ -110,7 +128,7 @@ def test_log_outputs_kills_other_processes_when_one_errors():
     flexmock(module).should_receive('output_buffer_for_process').with_args(
         other_process, ()
     ).and_return(other_process.stdout)
-    flexmock(other_process).should_receive('kill').once()
+    flexmock(other_process).should_call('kill').once()
 
     with pytest.raises(subprocess.CalledProcessError) as error:
         module.log_outputs(
@@ -122,14 +140,16 @@ def test_log_outputs_kills_other_processes_when_one_errors():
 
     assert error.value.returncode == 2
     assert error.value.output
+    assert other_process.returncode is not None
+    assert other_process not in module.PROCESS_START_TIMES
 
 
 def test_log_outputs_vents_other_processes_when_one_exits():
     '''
-    Execute a command to generate a longish random string and pipe it into another command that
-    exits quickly. The test is basically to ensure we don't hang forever waiting for the exited
-    process to read the pipe, and that the string-generating process eventually gets vented and
-    exits.
+    Execute a command to generate a random string longer than a pipe buffer and pipe it into another
+    command that exits quickly. The test is basically to ensure we don't hang forever waiting for
+    the exited process to read the pipe, and that the string-generating process eventually gets
+    vented and exits.
     '''
     flexmock(module.logger).should_receive('log')
     flexmock(module).should_receive('command_for_process').and_return('grep')
@@ -138,7 +158,7 @@ def test_log_outputs_vents_other_processes_when_one_exits():
         [
             sys.executable,
             '-c',
-            "import random, string; print(''.join(random.choice(string.ascii_letters) for _ in range(40000)))",
+            "import random, string; print(''.join(random.choice(string.ascii_letters) for _ in range(400000)))",
         ],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
@@ -152,7 +172,15 @@ def test_log_outputs_vents_other_processes_when_one_exits():
     flexmock(module).should_receive('output_buffer_for_process').with_args(
         other_process, (process.stdout,)
     ).and_return(other_process.stdout)
-    flexmock(process.stdout).should_call('readline').at_least().once()
+    original_read = module.os.read
+    read_file_descriptors = []
+
+    def read(file_descriptor, length):
+        read_file_descriptors.append(file_descriptor)
+        return original_read(file_descriptor, length)
+
+    flexmock(module.os).should_receive('read').replace_with(read)
+    vented_file_descriptor = process.stdout.fileno()
 
     module.log_outputs(
         (process, other_process),
@@ -161,6 +189,8 @@ def test_log_outputs_vents_other_processes_when_one_exits():
         borg_local_path='borg',
     )
 
+    assert vented_file_descriptor in read_file_descriptors
+
 
 def test_log_outputs_does_not_error_when_one_process_exits():
     flexmock(module.logger).should_receive('log')
@@ -194,7 +224,7 @@ def test_log_outputs_does_not_error_when_one_process_exits():
 
 
 def test_log_outputs_truncates_long_error_output():
-    flexmock(module).ERROR_OUTPUT_MAX_LINE_COUNT = 0
+    flexmock(module, ERROR_OUTPUT_MAX_LINE_COUNT=0)
     flexmock(module.logger).should_receive('log')
     flexmock(module).should_receive('command_for_process').and_return('grep')
 
@@ -228,14 +258,217 @@ def test_log_outputs_with_no_output_logs_nothing():
     )
 
 
-def test_log_outputs_with_unfinished_process_re_polls():
+def test_log_outputs_with_no_output_waits_for_process_once_output_is_exhausted():
     flexmock(module.logger).should_receive('log').never()
     flexmock(module).should_receive('exit_code_indicates_error').and_return(False)
 
     process = subprocess.Popen(['true'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    flexmock(process).should_receive('poll').and_return(None).and_return(0).twice()
+    flexmock(module).should_receive('reap_process').with_args(process, block=False).and_return(None)
+    flexmock(module).should_receive('reap_process').with_args(process, block=True).and_return(
+        0
+    ).once()
+    flexmock(module).should_receive('output_buffer_for_process').and_return(process.stdout)
+
+    module.log_outputs(
+        (process,), exclude_stdouts=(), output_log_level=logging.INFO, borg_local_path='borg'
+    )
+
+
+def test_log_outputs_logs_partial_lines_once_completed():
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'hello there').once()
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'last').once()
+    flexmock(module).should_receive('exit_code_indicates_error').and_return(False)
+
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            '-c',
+            "import sys, time; sys.stdout.write('hello '); sys.stdout.flush(); time.sleep(0.1); "
+            + "sys.stdout.write('there\\n\\nlast')",
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
     flexmock(module).should_receive('output_buffer_for_process').and_return(process.stdout)
 
     module.log_outputs(
         (process,), exclude_stdouts=(), output_log_level=logging.INFO, borg_local_path='borg'
     )
+
+
+def test_log_outputs_keeps_only_most_recent_error_output_lines():
+    flexmock(module.logger).should_receive('log')
+    flexmock(module).should_receive('command_for_process').and_return('python')
+
+    process = subprocess.Popen(
+        [
+            sys.executable,
+            '-c',
+            'import sys; print("\\n".join(str(number) for number in range(1000))); sys.exit(2)',
+        ],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    )
+    flexmock(module).should_receive('output_buffer_for_process').and_return(process.stdout)
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        module.log_outputs(
+            (process,), exclude_stdouts=(), output_log_level=logging.INFO, borg_local_path='borg'
+        )
+
+    (truncation_indicator, *last_lines) = error.value.output.split('\n')
+    assert truncation_indicator == '...'
+    assert len(last_lines) == module.ERROR_OUTPUT_MAX_LINE_COUNT
+    assert [int(line) for line in last_lines] == list(
+        range(int(last_lines[0]), int(last_lines[0]) + module.ERROR_OUTPUT_MAX_LINE_COUNT)
+    )
+
+
+def test_execute_command_with_processes_async_logs_output_of_pipeline():
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'hi').once()
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'there').once()
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'print("hi"); print("there")'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    asyncio.run(
+        module.execute_command_with_processes_async(
+            ['cat'], [producer], output_log_level=logging.INFO, input_file=producer.stdout
+        )
+    )
+
+    assert producer.returncode == 0
+
+
+def test_execute_command_with_processes_async_passes_command_output_through_line_handler():
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'HI').once()
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'there').never()
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'print("hi"); print("there")'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    asyncio.run(
+        module.execute_command_with_processes_async(
+            ['cat'],
+            [producer],
+            output_log_level=logging.INFO,
+            input_file=producer.stdout,
+            output_line_handler=lambda line: line.upper() if line == 'hi' else None,
+        )
+    )
+
+
+def test_execute_command_with_processes_async_raises_for_failed_producer():
+    flexmock(module.logger).should_receive('log')
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; print("oops", file=sys.stderr); sys.exit(2)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        asyncio.run(
+            module.execute_command_with_processes_async(
+                ['cat'], [producer], output_log_level=logging.INFO, input_file=producer.stdout
+            )
+        )
+
+    assert error.value.returncode == 2
+    assert error.value.output == 'oops'
+
+
+def test_execute_command_with_processes_async_kills_producer_when_command_fails():
+    '''
+    Run a producer that would otherwise take a long time, feeding a command that fails right away.
+    The test is basically to ensure that the producer gets killed promptly rather than waited on.
+    '''
+    flexmock(module.logger).should_receive('log')
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'import time; time.sleep(30)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        asyncio.run(
+            module.execute_command_with_processes_async(
+                ['false'], [producer], output_log_level=logging.INFO, input_file=producer.stdout
+            )
+        )
+
+    assert error.value.returncode == 1
+    assert producer.wait(timeout=5) < 0
+
+
+def test_execute_command_with_processes_async_breaks_pipe_when_command_exits_early():
+    '''
+    Run a producer that writes more output than fits in a pipe, feeding a command that exits
+    without reading it. The producer should get a broken pipe rather than hanging forever.
+    '''
+    flexmock(module.logger).should_receive('log')
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; sys.stdout.write("x" * 10000000)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(
+            module.execute_command_with_processes_async(
+                ['true'], [producer], output_log_level=logging.INFO, input_file=producer.stdout
+            )
+        )
+
+    assert producer.wait(timeout=5) != 0
+
+
+def test_execute_command_with_processes_async_without_output_log_level_captures_command_output():
+    flexmock(module.logger).should_receive('log').with_args(logging.INFO, 'warning').once()
+    flexmock(module.logger).should_receive('log').with_args(None, object).never()
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'import sys; print("hi"); print("warning", file=sys.stderr)'],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+
+    output = asyncio.run(
+        module.execute_command_with_processes_async(
+            ['cat'], [producer], output_log_level=None, input_file=producer.stdout
+        )
+    )
+
+    assert output == 'hi\n'
+    assert producer.returncode == 0
+
+
+def test_execute_command_with_processes_async_without_output_log_level_raises_on_error():
+    flexmock(module.logger).should_receive('log')
+
+    producer = subprocess.Popen(
+        [sys.executable, '-c', 'print("hi")'], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        asyncio.run(
+            module.execute_command_with_processes_async(
+                ['false'], [producer], output_log_level=None, input_file=producer.stdout
+            )
+        )
+
+    assert error.value.returncode == 1
+
+
+def test_execute_command_async_captures_output():
+    output = asyncio.run(module.execute_command_async(['echo', 'hi'], output_log_level=None))
+
+    assert output == 'hi\n'
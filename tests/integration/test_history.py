@@ -0,0 +1,70 @@
+from flexmock import flexmock
+
+from borgmatic import history as module
+
+
+def test_record_run_records_results_and_reads_them_back(tmp_path):
+    database_path = str(tmp_path / 'state' / 'history.db')
+    results = [
+        {
+            'timestamp': 1000 + index,
+            'config_filename': 'test.yaml',
+            'repository': 'repo',
+            'success': 1,
+            'duration_seconds': 12,
+            'create_seconds': 10,
+            'original_size': 1000 * (index + 1),
+            'compressed_size': 500,
+            'deduplicated_size': 100,
+            'file_count': 7,
+            'dump_seconds': None,
+        }
+        for index in range(3)
+    ]
+    flexmock(module).should_receive('collect_results').and_return([results[0]]).and_return(
+        [results[1]]
+    ).and_return([results[2]])
+
+    for result in results:
+        assert module.record_run(database_path, 'test.yaml') == []
+
+    assert module.read_history(database_path, 'test.yaml', 'repo') == results
+    assert module.read_history(database_path, 'test.yaml', 'repo', last=2) == results[1:]
+    assert module.read_history(database_path, 'other.yaml', 'repo') == []
+
+
+def test_record_run_with_throughput_regression_returns_it(tmp_path):
+    database_path = str(tmp_path / 'history.db')
+    flexmock(module.time).should_receive('time').and_return(1000)
+
+    for original_size in (1000, 1000, 1000, 100):
+        flexmock(module.metrics).should_receive('get_samples').and_return(
+            [
+                module.metrics.Sample(
+                    'borgmatic_repository_success',
+                    (('config', 'test.yaml'), ('repository', 'repo')),
+                    1,
+                ),
+                module.metrics.Sample(
+                    'borgmatic_archive_original_size_bytes',
+                    (('config', 'test.yaml'), ('repository', 'repo')),
+                    original_size,
+                ),
+                module.metrics.Sample(
+                    'borgmatic_archive_duration_seconds',
+                    (('config', 'test.yaml'), ('repository', 'repo')),
+                    1,
+                ),
+            ]
+        )
+        flexmock(module.timing).should_receive('total_spans').and_return({})
+
+        regressions = module.record_run(database_path, 'test.yaml', {'percent': 50})
+
+    assert [repository for repository, message in regressions] == ['repo']
+    assert len(module.read_history(database_path, 'test.yaml', 'repo')) == 4
+
+
+def test_read_history_without_database_returns_empty_list(tmp_path):
+    assert module.read_history(str(tmp_path / 'history.db'), 'test.yaml', 'repo') == []
+    assert not (tmp_path / 'history.db').exists()
@@ -0,0 +1,29 @@
+import os
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic import metrics as module
+
+
+def test_write_textfile_replaces_file_contents(tmp_path):
+    path = tmp_path / 'borgmatic.prom'
+    path.write_text('old')
+
+    module.write_textfile(str(path), 'new\n')
+
+    assert path.read_text() == 'new\n'
+    assert os.listdir(str(tmp_path)) == ['borgmatic.prom']
+    assert oct(path.stat().st_mode & 0o777) == oct(0o644)
+
+
+def test_write_textfile_with_error_leaves_existing_file_and_removes_temporary_file(tmp_path):
+    path = tmp_path / 'borgmatic.prom'
+    path.write_text('old')
+    flexmock(module.os).should_receive('replace').and_raise(OSError)
+
+    with pytest.raises(OSError):
+        module.write_textfile(str(path), 'new\n')
+
+    assert path.read_text() == 'old'
+    assert os.listdir(str(tmp_path)) == ['borgmatic.prom']
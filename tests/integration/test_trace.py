@@ -0,0 +1,18 @@
+import json
+
+from flexmock import flexmock
+
+from borgmatic import trace as module
+
+
+def test_write_trace_writes_trace_json(tmp_path):
+    flexmock(module, EVENTS=[module.Event('create', 'action', 1.0, 2.0, 100, 200, {})])
+    path = tmp_path / 'trace.json'
+
+    module.write_trace(str(path))
+
+    assert [event['name'] for event in json.loads(path.read_text())['traceEvents']] == [
+        'process_name',
+        'process_name',
+        'create',
+    ]
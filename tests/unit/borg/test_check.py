@@ -9,7 +9,9 @@ from ..test_verbosity import insert_logging_mock
 
 
 def insert_execute_command_mock(command):
-    flexmock(module).should_receive('execute_command').with_args(command).once()
+    flexmock(module).should_receive('execute_command').with_args(
+        command, extra_environment=None
+    ).once()
 
 
 def insert_execute_command_never():
@@ -157,13 +159,16 @@ def test_make_check_flags_with_default_checks_and_prefix_includes_prefix_flag():
 
 
 def test_check_archives_with_progress_calls_borg_with_progress_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     consistency_config = {'check_last': None}
     flexmock(module).should_receive('_parse_checks').and_return(checks)
     flexmock(module).should_receive('_make_check_flags').and_return(())
     flexmock(module).should_receive('execute_command').never()
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'check', '--progress', 'repo'), output_file=module.DO_NOT_CAPTURE
+        ('borg', 'check', '--progress', 'repo'),
+        output_file=module.DO_NOT_CAPTURE,
+        extra_environment=None,
     ).once()
 
     module.check_archives(
@@ -172,13 +177,16 @@ def test_check_archives_with_progress_calls_borg_with_progress_parameter():
 
 
 def test_check_archives_with_repair_calls_borg_with_repair_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     consistency_config = {'check_last': None}
     flexmock(module).should_receive('_parse_checks').and_return(checks)
     flexmock(module).should_receive('_make_check_flags').and_return(())
     flexmock(module).should_receive('execute_command').never()
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'check', '--repair', 'repo'), output_file=module.DO_NOT_CAPTURE
+        ('borg', 'check', '--repair', 'repo'),
+        output_file=module.DO_NOT_CAPTURE,
+        extra_environment=None,
     ).once()
 
     module.check_archives(
@@ -196,6 +204,7 @@ def test_check_archives_with_repair_calls_borg_with_repair_parameter():
     ),
 )
 def test_check_archives_calls_borg_with_parameters(checks):
+    flexmock(module.environment).should_receive('make_environment')
     check_last = flexmock()
     consistency_config = {'check_last': check_last}
     flexmock(module).should_receive('_parse_checks').and_return(checks)
@@ -210,6 +219,7 @@ def test_check_archives_calls_borg_with_parameters(checks):
 
 
 def test_check_archives_with_extract_check_calls_extract_only():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('extract',)
     check_last = flexmock()
     consistency_config = {'check_last': check_last}
@@ -224,6 +234,7 @@ def test_check_archives_with_extract_check_calls_extract_only():
 
 
 def test_check_archives_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     consistency_config = {'check_last': None}
     flexmock(module).should_receive('_parse_checks').and_return(checks)
@@ -237,6 +248,7 @@ def test_check_archives_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_check_archives_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     consistency_config = {'check_last': None}
     flexmock(module).should_receive('_parse_checks').and_return(checks)
@@ -250,6 +262,7 @@ def test_check_archives_with_log_debug_calls_borg_with_debug_parameter():
 
 
 def test_check_archives_without_any_checks_bails():
+    flexmock(module.environment).should_receive('make_environment')
     consistency_config = {'check_last': None}
     flexmock(module).should_receive('_parse_checks').and_return(())
     insert_execute_command_never()
@@ -260,6 +273,7 @@ def test_check_archives_without_any_checks_bails():
 
 
 def test_check_archives_with_local_path_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     check_last = flexmock()
     consistency_config = {'check_last': check_last}
@@ -278,6 +292,7 @@ def test_check_archives_with_local_path_calls_borg_via_local_path():
 
 
 def test_check_archives_with_remote_path_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     check_last = flexmock()
     consistency_config = {'check_last': check_last}
@@ -296,6 +311,7 @@ def test_check_archives_with_remote_path_calls_borg_with_remote_path_parameters(
 
 
 def test_check_archives_with_lock_wait_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     check_last = flexmock()
     consistency_config = {'check_last': check_last}
@@ -311,6 +327,7 @@ def test_check_archives_with_lock_wait_calls_borg_with_lock_wait_parameters():
 
 
 def test_check_archives_with_retention_prefix():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     check_last = flexmock()
     prefix = 'foo-'
@@ -327,6 +344,7 @@ def test_check_archives_with_retention_prefix():
 
 
 def test_check_archives_with_extra_borg_options_calls_borg_with_extra_options():
+    flexmock(module.environment).should_receive('make_environment')
     checks = ('repository',)
     consistency_config = {'check_last': None}
     flexmock(module).should_receive('_parse_checks').and_return(checks)
@@ -9,7 +9,10 @@ from ..test_verbosity import insert_logging_mock
 
 def insert_execute_command_mock(compact_command, output_log_level):
     flexmock(module).should_receive('execute_command').with_args(
-        compact_command, output_log_level=output_log_level, borg_local_path=compact_command[0]
+        compact_command,
+        output_log_level=output_log_level,
+        borg_local_path=compact_command[0],
+        extra_environment=None,
     ).once()
 
 
@@ -17,12 +20,14 @@ COMPACT_COMMAND = ('borg', 'compact')
 
 
 def test_compact_segments_calls_borg_with_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('repo',), logging.INFO)
 
     module.compact_segments(dry_run=False, repository='repo', storage_config={})
 
 
 def test_compact_segments_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--info', 'repo'), logging.INFO)
     insert_logging_mock(logging.INFO)
 
@@ -30,6 +35,7 @@ def test_compact_segments_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_compact_segments_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--debug', '--show-rc', 'repo'), logging.INFO)
     insert_logging_mock(logging.DEBUG)
 
@@ -37,12 +43,14 @@ def test_compact_segments_with_log_debug_calls_borg_with_debug_parameter():
 
 
 def test_compact_segments_with_dry_run_skips_borg_call():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').never()
 
     module.compact_segments(repository='repo', storage_config={}, dry_run=True)
 
 
 def test_compact_segments_with_local_path_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg1',) + COMPACT_COMMAND[1:] + ('repo',), logging.INFO)
 
     module.compact_segments(
@@ -51,6 +59,7 @@ def test_compact_segments_with_local_path_calls_borg_via_local_path():
 
 
 def test_compact_segments_with_remote_path_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--remote-path', 'borg1', 'repo'), logging.INFO)
 
     module.compact_segments(
@@ -59,6 +68,7 @@ def test_compact_segments_with_remote_path_calls_borg_with_remote_path_parameter
 
 
 def test_compact_segments_with_progress_calls_borg_with_progress_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--progress', 'repo'), logging.INFO)
 
     module.compact_segments(
@@ -67,6 +77,7 @@ def test_compact_segments_with_progress_calls_borg_with_progress_parameter():
 
 
 def test_compact_segments_with_cleanup_commits_calls_borg_with_cleanup_commits_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--cleanup-commits', 'repo'), logging.INFO)
 
     module.compact_segments(
@@ -75,6 +86,7 @@ def test_compact_segments_with_cleanup_commits_calls_borg_with_cleanup_commits_p
 
 
 def test_compact_segments_with_threshold_calls_borg_with_threshold_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--threshold', '20', 'repo'), logging.INFO)
 
     module.compact_segments(
@@ -83,6 +95,7 @@ def test_compact_segments_with_threshold_calls_borg_with_threshold_parameter():
 
 
 def test_compact_segments_with_umask_calls_borg_with_umask_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {'umask': '077'}
     insert_execute_command_mock(COMPACT_COMMAND + ('--umask', '077', 'repo'), logging.INFO)
 
@@ -92,6 +105,7 @@ def test_compact_segments_with_umask_calls_borg_with_umask_parameters():
 
 
 def test_compact_segments_with_lock_wait_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {'lock_wait': 5}
     insert_execute_command_mock(COMPACT_COMMAND + ('--lock-wait', '5', 'repo'), logging.INFO)
 
@@ -101,6 +115,7 @@ def test_compact_segments_with_lock_wait_calls_borg_with_lock_wait_parameters():
 
 
 def test_compact_segments_with_extra_borg_options_calls_borg_with_extra_options():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(COMPACT_COMMAND + ('--extra', '--options', 'repo'), logging.INFO)
 
     module.compact_segments(
@@ -0,0 +1,114 @@
+import sys
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic.borg import compression as module
+
+
+def test_sample_file_with_unreadable_file_returns_none():
+    flexmock(sys.modules['builtins']).should_receive('open').with_args('foo', 'rb').and_raise(
+        OSError
+    )
+
+    assert module.sample_file('foo', 100) is None
+
+
+def test_estimate_compression_ratio_without_sources_returns_none():
+    assert module.estimate_compression_ratio(()) is None
+
+
+def test_estimate_compression_ratio_splits_sample_bytes_across_sources():
+    flexmock(module).should_receive('sample_source').with_args(
+        'foo', module.SAMPLE_BYTES // 2
+    ).and_return([module.Sample(100, 10, 5)]).once()
+    flexmock(module).should_receive('sample_source').with_args(
+        'bar', module.SAMPLE_BYTES // 2
+    ).and_return([]).once()
+
+    assert module.estimate_compression_ratio(('foo', 'bar')) == 0.5
+
+
+def test_estimate_compression_ratio_weights_samples_by_file_size():
+    flexmock(module).should_receive('sample_source').and_return(
+        [module.Sample(900, 10, 10), module.Sample(100, 10, 1)]
+    )
+
+    assert module.estimate_compression_ratio(('foo',)) == pytest.approx(0.91)
+
+
+def test_estimate_compression_ratio_joins_sources_to_working_directory():
+    flexmock(module).should_receive('sample_source').with_args('/working/foo', object).and_return(
+        [module.Sample(100, 10, 5)]
+    ).once()
+
+    assert module.estimate_compression_ratio(('foo',), working_directory='/working') == 0.5
+
+
+def test_estimate_compression_ratio_without_samples_returns_none():
+    flexmock(module).should_receive('sample_source').and_return([])
+
+    assert module.estimate_compression_ratio(('foo',)) is None
+
+
+@pytest.mark.parametrize(
+    'ratio,cpu_budget,expected_compression',
+    (
+        (0.99, 'high', 'none'),
+        (0.9, 'high', 'lz4'),
+        (0.5, 'low', 'lz4'),
+        (0.5, None, 'zstd,3'),
+        (0.5, 'medium', 'zstd,3'),
+        (0.5, 'high', 'zstd,9'),
+    ),
+)
+def test_choose_compression_picks_compression_for_ratio_and_cpu_budget(
+    ratio, cpu_budget, expected_compression
+):
+    flexmock(module).should_receive('estimate_compression_ratio').and_return(ratio)
+
+    assert module.choose_compression(('foo',), cpu_budget) == expected_compression
+
+
+def test_choose_compression_without_samples_returns_none():
+    flexmock(module).should_receive('estimate_compression_ratio').and_return(None)
+
+    assert module.choose_compression(('foo',)) is None
+
+
+def test_choose_compression_with_unknown_cpu_budget_raises():
+    flexmock(module).should_receive('estimate_compression_ratio').never()
+
+    with pytest.raises(ValueError):
+        module.choose_compression(('foo',), 'extreme')
+
+
+def test_choose_compression_once_chooses_compression_and_remembers_it():
+    flexmock(module, CHOSEN_COMPRESSIONS={})
+    flexmock(module).should_receive('choose_compression').with_args(
+        ['foo'], 'low', None, 'repo'
+    ).and_return('lz4').once()
+
+    assert module.choose_compression_once(['foo'], 'low', None, 'repo') == 'lz4'
+    assert module.CHOSEN_COMPRESSIONS == {(('foo',), 'low', None): 'lz4'}
+
+
+def test_choose_compression_once_reuses_compression_chosen_earlier_for_same_sources():
+    flexmock(module, CHOSEN_COMPRESSIONS={(('foo',), 'low', None): 'lz4'})
+    flexmock(module).should_receive('choose_compression').never()
+
+    assert module.choose_compression_once(['foo'], 'low', None, 'other_repo') == 'lz4'
+
+
+def test_choose_compression_once_reuses_default_compression_chosen_earlier():
+    flexmock(module, CHOSEN_COMPRESSIONS={(('foo',), None, None): None})
+    flexmock(module).should_receive('choose_compression').never()
+
+    assert module.choose_compression_once(['foo']) is None
+
+
+def test_choose_compression_once_with_other_sources_chooses_compression_again():
+    flexmock(module, CHOSEN_COMPRESSIONS={(('foo',), 'low', None): 'lz4'})
+    flexmock(module).should_receive('choose_compression').and_return('none').once()
+
+    assert module.choose_compression_once(['bar'], 'low', None, 'repo') == 'none'
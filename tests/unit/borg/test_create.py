@@ -1,5 +1,8 @@
+import contextlib
+import io
 import logging
 import sys
+import threading
 
 import pytest
 from flexmock import flexmock
@@ -9,9 +12,160 @@ from borgmatic.borg import create as module
 from ..test_verbosity import insert_logging_mock
 
 
+def test_directory_modification_time_returns_modification_time_in_nanoseconds():
+    flexmock(module.os).should_receive('stat').with_args('/foo').and_return(
+        flexmock(st_mtime_ns=123)
+    )
+
+    assert module.directory_modification_time('/foo') == 123
+
+
+def test_directory_modification_time_with_missing_directory_returns_none():
+    flexmock(module.os).should_receive('stat').with_args('/foo').and_raise(FileNotFoundError)
+
+    assert module.directory_modification_time('/foo') is None
+
+
+def test_read_directory_returns_entry_names():
+    entries = [flexmock(name='foo'), flexmock(name='bar')]
+    flexmock(module.os).should_receive('scandir').with_args('/dir').and_return(
+        contextlib.nullcontext(entries)
+    )
+
+    assert module.read_directory('/dir') == ['foo', 'bar']
+
+
+def test_read_directory_with_directories_only_skips_other_entries():
+    entries = [
+        flexmock(name='foo', is_dir=lambda: True),
+        flexmock(name='bar', is_dir=lambda: False),
+    ]
+    flexmock(module.os).should_receive('scandir').with_args('/dir').and_return(
+        contextlib.nullcontext(entries)
+    )
+
+    assert module.read_directory('/dir', directories_only=True) == ['foo']
+
+
+def test_read_directory_with_unreadable_directory_returns_empty_list():
+    flexmock(module.os).should_receive('scandir').and_raise(PermissionError)
+
+    assert module.read_directory('/dir') == []
+
+
+def test_scan_glob_matches_names_in_directory_and_records_its_modification_time():
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv').and_return(5)
+    flexmock(module).should_receive('read_directory').with_args('/srv', False).and_return(
+        ['foo', 'bar', '.hidden', 'other']
+    )
+
+    assert module.scan_glob('/srv/[fb]*') == ({'/srv': 5}, ['/srv/foo', '/srv/bar'])
+
+
+def test_scan_glob_with_dot_pattern_matches_hidden_names():
+    flexmock(module).should_receive('directory_modification_time').and_return(5)
+    flexmock(module).should_receive('read_directory').and_return(['foo', '.hidden'])
+
+    assert module.scan_glob('/srv/.h*') == ({'/srv': 5}, ['/srv/.hidden'])
+
+
+def test_scan_glob_with_relative_pattern_reads_current_directory():
+    flexmock(module).should_receive('directory_modification_time').with_args('.').and_return(5)
+    flexmock(module).should_receive('read_directory').with_args('.', False).and_return(['foo'])
+
+    assert module.scan_glob('f*') == ({'.': 5}, ['foo'])
+
+
+def test_scan_glob_with_glob_in_parent_expands_parent_to_directories_and_checks_each_child():
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv').and_return(5)
+    flexmock(module).should_receive('read_directory').with_args('/srv', True).and_return(
+        ['foo', 'bar']
+    )
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv/foo').and_return(
+        6
+    )
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv/bar').and_return(
+        7
+    )
+    flexmock(module.os.path).should_receive('lexists').with_args('/srv/foo/data').and_return(True)
+    flexmock(module.os.path).should_receive('lexists').with_args('/srv/bar/data').and_return(False)
+
+    assert module.scan_glob('/srv/*/data') == (
+        {'/srv': 5, '/srv/foo': 6, '/srv/bar': 7},
+        ['/srv/foo/data'],
+    )
+
+
+def test_scan_glob_with_trailing_slash_only_matches_directories():
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv').and_return(5)
+    flexmock(module).should_receive('read_directory').with_args('/srv', True).and_return(['foo'])
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv/foo').and_return(
+        6
+    )
+    flexmock(module.os.path).should_receive('isdir').with_args('/srv/foo').and_return(True)
+
+    assert module.scan_glob('/srv/*/') == ({'/srv': 5, '/srv/foo': 6}, ['/srv/foo/'])
+
+
+def test_cached_glob_scans_and_caches_expansion():
+    glob_cache = {}
+    flexmock(module, GLOB_CACHE=glob_cache)
+    flexmock(module.time).should_receive('time_ns').and_return(10 * 1000000000)
+    flexmock(module).should_receive('scan_glob').with_args('/srv/*').and_return(
+        ({'/srv': 5 * 1000000000}, ['/srv/foo'])
+    ).once()
+
+    assert module.cached_glob('/srv/*') == ['/srv/foo']
+    assert glob_cache == {'/srv/*': ({'/srv': 5 * 1000000000}, ('/srv/foo',))}
+
+
+def test_cached_glob_with_recently_modified_directory_does_not_cache_expansion():
+    glob_cache = {}
+    flexmock(module, GLOB_CACHE=glob_cache)
+    flexmock(module.time).should_receive('time_ns').and_return(10 * 1000000000)
+    flexmock(module).should_receive('scan_glob').and_return(
+        ({'/srv': 9 * 1000000000}, ['/srv/foo'])
+    )
+
+    assert module.cached_glob('/srv/*') == ['/srv/foo']
+    assert glob_cache == {}
+
+
+def test_cached_glob_with_unchanged_directories_reuses_cached_expansion():
+    flexmock(module, GLOB_CACHE={'/srv/*': ({'/srv': 5, '/missing': None}, ('/srv/foo',))})
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv').and_return(5)
+    flexmock(module).should_receive('directory_modification_time').with_args('/missing').and_return(
+        None
+    )
+    flexmock(module).should_receive('scan_glob').never()
+
+    assert module.cached_glob('/srv/*') == ['/srv/foo']
+
+
+def test_cached_glob_with_changed_directory_rescans():
+    flexmock(module, GLOB_CACHE={'/srv/*': ({'/srv': 5}, ('/srv/foo',))})
+    flexmock(module).should_receive('directory_modification_time').with_args('/srv').and_return(6)
+    flexmock(module.time).should_receive('time_ns').and_return(10 * 1000000000)
+    flexmock(module).should_receive('scan_glob').with_args('/srv/*').and_return(
+        ({'/srv': 6}, ['/srv/foo', '/srv/bar'])
+    ).once()
+
+    assert module.cached_glob('/srv/*') == ['/srv/foo', '/srv/bar']
+
+
+def test_map_concurrently_with_concurrency_of_one_calls_function_in_current_thread():
+    thread_ids = module.map_concurrently(lambda item: threading.get_ident(), (1, 2, 3), 1)
+
+    assert thread_ids == [threading.get_ident()] * 3
+
+
+def test_map_concurrently_with_concurrency_returns_results_in_item_order():
+    assert module.map_concurrently(lambda item: item * 2, (1, 2, 3), 2) == [2, 4, 6]
+
+
 def test_expand_directory_with_basic_path_passes_it_through():
     flexmock(module.os.path).should_receive('expanduser').and_return('foo')
-    flexmock(module.glob).should_receive('glob').and_return([])
+    flexmock(module).should_receive('cached_glob').never()
 
     paths = module.expand_directory('foo')
 
@@ -20,13 +174,22 @@ def test_expand_directory_with_basic_path_passes_it_through():
 
 def test_expand_directory_with_glob_expands():
     flexmock(module.os.path).should_receive('expanduser').and_return('foo*')
-    flexmock(module.glob).should_receive('glob').and_return(['foo', 'food'])
+    flexmock(module).should_receive('cached_glob').with_args('foo*').and_return(['foo', 'food'])
 
     paths = module.expand_directory('foo*')
 
     assert paths == ['foo', 'food']
 
 
+def test_expand_directory_with_glob_matching_nothing_passes_it_through():
+    flexmock(module.os.path).should_receive('expanduser').and_return('foo*')
+    flexmock(module).should_receive('cached_glob').and_return([])
+
+    paths = module.expand_directory('foo*')
+
+    assert paths == ['foo*']
+
+
 def test_expand_directories_flattens_expanded_directories():
     flexmock(module).should_receive('expand_directory').with_args('~/foo').and_return(['/root/foo'])
     flexmock(module).should_receive('expand_directory').with_args('bar*').and_return(
@@ -38,6 +201,20 @@ def test_expand_directories_flattens_expanded_directories():
     assert paths == ('/root/foo', 'bar', 'barf')
 
 
+def test_expand_directories_with_concurrency_expands_directories_concurrently():
+    flexmock(module).should_receive('expand_directory').with_args('~/foo').and_return(['/root/foo'])
+    flexmock(module).should_receive('expand_directory').with_args('bar*').and_return(
+        ['bar', 'barf']
+    )
+    flexmock(module).should_call('map_concurrently').with_args(
+        module.expand_directory, ('~/foo', 'bar*'), 4
+    ).once()
+
+    paths = module.expand_directories(['~/foo', 'bar*'], concurrency=4)
+
+    assert paths == ('/root/foo', 'bar', 'barf')
+
+
 def test_expand_directories_considers_none_as_no_directories():
     paths = module.expand_directories(None)
 
@@ -71,6 +248,21 @@ def test_map_directories_to_devices_gives_device_id_per_path():
     }
 
 
+def test_map_directories_to_devices_with_concurrency_stats_paths_concurrently():
+    flexmock(module.os).should_receive('stat').with_args('/foo').and_return(flexmock(st_dev=55))
+    flexmock(module.os).should_receive('stat').with_args('/bar').and_return(flexmock(st_dev=66))
+    flexmock(module).should_call('map_concurrently').with_args(
+        module.get_device, ('/foo', '/bar'), 4
+    ).once()
+
+    device_map = module.map_directories_to_devices(['/foo', '/bar'], concurrency=4)
+
+    assert device_map == {
+        '/foo': 55,
+        '/bar': 66,
+    }
+
+
 def test_map_directories_to_devices_with_missing_path_does_not_error():
     flexmock(module.os).should_receive('stat').with_args('/foo').and_return(flexmock(st_dev=55))
     flexmock(module.os).should_receive('stat').with_args('/bar').and_raise(FileNotFoundError)
@@ -101,6 +293,11 @@ def test_map_directories_to_devices_with_missing_path_does_not_error():
         ({'/dup': 1, '/dup': 1}, ('/dup',)),
         ({'/foo': 1, '/bar': 1}, ('/bar', '/foo')),
         ({'/foo': 1, '/bar': 2}, ('/bar', '/foo')),
+        ({'/root': 1, '/root/foo': 2, '/root/foo/bar': 1}, ('/root', '/root/foo')),
+        ({'/root': 1, '/root/foo': 2, '/root/foo/bar': 2}, ('/root', '/root/foo')),
+        ({'/root': None, '/root/foo': 1}, ('/root', '/root/foo')),
+        ({'root': 1, 'root/foo': 1, 'other': 1}, ('other', 'root')),
+        ({'.': 1, '/': 1, 'foo': 1}, ('.', '/')),
     ),
 )
 def test_deduplicate_directories_removes_child_paths_on_the_same_filesystem(
@@ -279,6 +476,84 @@ ARCHIVE_WITH_PATHS = ('repo::{}'.format(DEFAULT_ARCHIVE_NAME), 'foo', 'bar')
 
 
 def test_create_archive_calls_borg_with_parameters():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module).should_receive('execute_command').with_args(
+        ('borg', 'create') + ARCHIVE_WITH_PATHS,
+        output_log_level=logging.INFO,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    )
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+    )
+
+
+def test_create_archive_with_source_directories_concurrency_expands_and_stats_concurrently():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('expand_directories').with_args(['foo', 'bar'], 8).and_return(
+        ('foo', 'bar')
+    )
+    flexmock(module).should_receive('map_directories_to_devices').with_args(
+        ('foo', 'bar'), 8
+    ).and_return({})
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module).should_receive('execute_command').with_args(
+        ('borg', 'create') + ARCHIVE_WITH_PATHS,
+        output_log_level=logging.INFO,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    )
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+            'source_directories_concurrency': 8,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+    )
+
+
+def test_create_archive_with_skip_create_if_unchanged_and_unchanged_sources_skips_borg():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -290,14 +565,123 @@ def test_create_archive_calls_borg_with_parameters():
     flexmock(module).should_receive('ensure_files_readable')
     flexmock(module).should_receive('make_pattern_flags').and_return(())
     flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module.source_snapshot).should_receive('make_snapshot_path').and_return('snapshot')
+    flexmock(module.source_snapshot).should_receive('take_snapshot').and_return({'foo': {}})
+    flexmock(module.source_snapshot).should_receive('read_snapshot').with_args(
+        'snapshot'
+    ).and_return({'foo': {}})
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.source_snapshot).should_receive('write_snapshot').never()
+
+    assert (
+        module.create_archive(
+            dry_run=False,
+            repository='repo',
+            location_config={
+                'source_directories': ['foo', 'bar'],
+                'repositories': ['repo'],
+                'exclude_patterns': None,
+                'skip_create_if_unchanged': True,
+            },
+            storage_config={},
+            local_borg_version='1.2.3',
+        )
+        is None
+    )
+
+
+def test_create_archive_with_skip_create_if_unchanged_and_changed_sources_calls_borg_and_writes_snapshot():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module.source_snapshot).should_receive('make_snapshot_path').and_return('snapshot')
+    flexmock(module.source_snapshot).should_receive('take_snapshot').and_return({'foo': {}})
+    flexmock(module.source_snapshot).should_receive('read_snapshot').and_return(None)
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'create') + ARCHIVE_WITH_PATHS,
         output_log_level=logging.INFO,
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    ).once()
+    flexmock(module.source_snapshot).should_receive('write_snapshot').with_args(
+        'snapshot', {'foo': {}}
+    ).once()
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+            'skip_create_if_unchanged': True,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+    )
+
+
+def test_create_archive_with_skip_create_if_unchanged_and_dry_run_does_not_write_snapshot():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module.source_snapshot).should_receive('make_snapshot_path').and_return('snapshot')
+    flexmock(module.source_snapshot).should_receive('take_snapshot').and_return({'foo': {}})
+    flexmock(module.source_snapshot).should_receive('read_snapshot').and_return(None)
+    flexmock(module).should_receive('execute_command').once()
+    flexmock(module.source_snapshot).should_receive('write_snapshot').never()
+
+    module.create_archive(
+        dry_run=True,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+            'skip_create_if_unchanged': True,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
     )
 
+
+def test_create_archive_with_skip_create_if_unchanged_and_stream_processes_does_not_snapshot():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module.source_snapshot).should_receive('take_snapshot').never()
+    flexmock(module).should_receive('execute_command_with_processes').once()
+
     module.create_archive(
         dry_run=False,
         repository='repo',
@@ -305,13 +689,16 @@ def test_create_archive_calls_borg_with_parameters():
             'source_directories': ['foo', 'bar'],
             'repositories': ['repo'],
             'exclude_patterns': None,
+            'skip_create_if_unchanged': True,
         },
         storage_config={},
         local_borg_version='1.2.3',
+        stream_processes=[flexmock()],
     )
 
 
 def test_create_archive_with_patterns_calls_borg_with_patterns():
+    flexmock(module.environment).should_receive('make_environment')
     pattern_flags = ('--patterns-from', 'patterns')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
@@ -332,6 +719,8 @@ def test_create_archive_with_patterns_calls_borg_with_patterns():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -348,6 +737,7 @@ def test_create_archive_with_patterns_calls_borg_with_patterns():
 
 
 def test_create_archive_with_exclude_patterns_calls_borg_with_excludes():
+    flexmock(module.environment).should_receive('make_environment')
     exclude_flags = ('--exclude-from', 'excludes')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
@@ -368,6 +758,8 @@ def test_create_archive_with_exclude_patterns_calls_borg_with_excludes():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -384,6 +776,7 @@ def test_create_archive_with_exclude_patterns_calls_borg_with_excludes():
 
 
 def test_create_archive_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -401,6 +794,8 @@ def test_create_archive_with_log_info_calls_borg_with_info_parameter():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -418,6 +813,7 @@ def test_create_archive_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_create_archive_with_log_info_and_json_suppresses_most_borg_output():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -435,6 +831,8 @@ def test_create_archive_with_log_info_and_json_suppresses_most_borg_output():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -452,7 +850,52 @@ def test_create_archive_with_log_info_and_json_suppresses_most_borg_output():
     )
 
 
+def test_create_archive_with_log_info_files_and_json_stats_logs_borg_output_and_returns_json():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    json_stats_file = io.BytesIO(b'{"archive": {}}')
+    flexmock(module.tempfile).should_receive('TemporaryFile').and_return(json_stats_file)
+    flexmock(module).should_receive('execute_command').with_args(
+        ('borg', 'create', '--list', '--filter', 'AME-', '--info', '--json') + ARCHIVE_WITH_PATHS,
+        output_log_level=logging.INFO,
+        output_file=json_stats_file,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    ).once()
+    insert_logging_mock(logging.INFO)
+
+    json_output = module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+        files=True,
+        json_stats=True,
+    )
+
+    assert json_output == '{"archive": {}}'
+    assert json_stats_file.closed
+
+
 def test_create_archive_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -470,6 +913,8 @@ def test_create_archive_with_log_debug_calls_borg_with_debug_parameter():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.DEBUG)
 
@@ -487,6 +932,7 @@ def test_create_archive_with_log_debug_calls_borg_with_debug_parameter():
 
 
 def test_create_archive_with_log_debug_and_json_suppresses_most_borg_output():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -504,6 +950,8 @@ def test_create_archive_with_log_debug_and_json_suppresses_most_borg_output():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.DEBUG)
 
@@ -522,6 +970,7 @@ def test_create_archive_with_log_debug_and_json_suppresses_most_borg_output():
 
 
 def test_create_archive_with_dry_run_calls_borg_with_dry_run_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -539,6 +988,8 @@ def test_create_archive_with_dry_run_calls_borg_with_dry_run_parameter():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -555,6 +1006,7 @@ def test_create_archive_with_dry_run_calls_borg_with_dry_run_parameter():
 
 
 def test_create_archive_with_stats_and_dry_run_calls_borg_without_stats_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     # --dry-run and --stats are mutually exclusive, see:
     # https://borgbackup.readthedocs.io/en/stable/usage/create.html#description
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
@@ -574,6 +1026,8 @@ def test_create_archive_with_stats_and_dry_run_calls_borg_without_stats_paramete
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -592,6 +1046,7 @@ def test_create_archive_with_stats_and_dry_run_calls_borg_without_stats_paramete
 
 
 def test_create_archive_with_checkpoint_interval_calls_borg_with_checkpoint_interval_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -609,6 +1064,8 @@ def test_create_archive_with_checkpoint_interval_calls_borg_with_checkpoint_inte
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -625,6 +1082,7 @@ def test_create_archive_with_checkpoint_interval_calls_borg_with_checkpoint_inte
 
 
 def test_create_archive_with_chunker_params_calls_borg_with_chunker_params_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -642,6 +1100,8 @@ def test_create_archive_with_chunker_params_calls_borg_with_chunker_params_param
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -658,6 +1118,7 @@ def test_create_archive_with_chunker_params_calls_borg_with_chunker_params_param
 
 
 def test_create_archive_with_compression_calls_borg_with_compression_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -675,6 +1136,8 @@ def test_create_archive_with_compression_calls_borg_with_compression_parameters(
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -690,12 +1153,89 @@ def test_create_archive_with_compression_calls_borg_with_compression_parameters(
     )
 
 
+def test_create_archive_with_auto_compression_calls_borg_with_chosen_compression():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module.borg_compression).should_receive('choose_compression_once').with_args(
+        ('foo', 'bar'), 'low', None, 'repo'
+    ).and_return('lz4')
+    flexmock(module).should_receive('execute_command').with_args(
+        ('borg', 'create', '--compression', 'lz4') + ARCHIVE_WITH_PATHS,
+        output_log_level=logging.INFO,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    )
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={'compression': 'auto', 'compression_cpu_budget': 'low'},
+        local_borg_version='1.2.3',
+    )
+
+
+def test_create_archive_with_auto_compression_and_nothing_sampled_calls_borg_without_compression():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module.borg_compression).should_receive('choose_compression_once').and_return(None)
+    flexmock(module).should_receive('execute_command').with_args(
+        ('borg', 'create') + ARCHIVE_WITH_PATHS,
+        output_log_level=logging.INFO,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    )
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={'compression': 'auto'},
+        local_borg_version='1.2.3',
+    )
+
+
 @pytest.mark.parametrize(
     'feature_available,option_flag', ((True, '--upload-ratelimit'), (False, '--remote-ratelimit')),
 )
 def test_create_archive_with_remote_rate_limit_calls_borg_with_upload_ratelimit_parameters(
     feature_available, option_flag
 ):
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -713,6 +1253,8 @@ def test_create_archive_with_remote_rate_limit_calls_borg_with_upload_ratelimit_
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -729,6 +1271,7 @@ def test_create_archive_with_remote_rate_limit_calls_borg_with_upload_ratelimit_
 
 
 def test_create_archive_with_working_directory_calls_borg_with_working_directory():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -748,6 +1291,8 @@ def test_create_archive_with_working_directory_calls_borg_with_working_directory
         output_file=None,
         borg_local_path='borg',
         working_directory='/working/dir',
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -765,6 +1310,7 @@ def test_create_archive_with_working_directory_calls_borg_with_working_directory
 
 
 def test_create_archive_with_one_file_system_calls_borg_with_one_file_system_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -782,6 +1328,8 @@ def test_create_archive_with_one_file_system_calls_borg_with_one_file_system_par
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -804,6 +1352,7 @@ def test_create_archive_with_one_file_system_calls_borg_with_one_file_system_par
 def test_create_archive_with_numeric_owner_calls_borg_with_numeric_ids_parameter(
     feature_available, option_flag
 ):
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -821,6 +1370,8 @@ def test_create_archive_with_numeric_owner_calls_borg_with_numeric_ids_parameter
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -838,6 +1389,7 @@ def test_create_archive_with_numeric_owner_calls_borg_with_numeric_ids_parameter
 
 
 def test_create_archive_with_read_special_calls_borg_with_read_special_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -855,6 +1407,8 @@ def test_create_archive_with_read_special_calls_borg_with_read_special_parameter
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -878,6 +1432,7 @@ def test_create_archive_with_read_special_calls_borg_with_read_special_parameter
 def test_create_archive_with_basic_option_calls_borg_with_corresponding_parameter(
     option_name, option_value
 ):
+    flexmock(module.environment).should_receive('make_environment')
     option_flag = '--no' + option_name.replace('', '') if option_value is False else None
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
@@ -896,6 +1451,8 @@ def test_create_archive_with_basic_option_calls_borg_with_corresponding_paramete
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -924,6 +1481,7 @@ def test_create_archive_with_basic_option_calls_borg_with_corresponding_paramete
 def test_create_archive_with_atime_option_calls_borg_with_corresponding_parameter(
     option_value, feature_available, option_flag
 ):
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -941,6 +1499,8 @@ def test_create_archive_with_atime_option_calls_borg_with_corresponding_paramete
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -969,6 +1529,7 @@ def test_create_archive_with_atime_option_calls_borg_with_corresponding_paramete
 def test_create_archive_with_bsd_flags_option_calls_borg_with_corresponding_parameter(
     option_value, feature_available, option_flag
 ):
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -986,6 +1547,8 @@ def test_create_archive_with_bsd_flags_option_calls_borg_with_corresponding_para
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1003,6 +1566,7 @@ def test_create_archive_with_bsd_flags_option_calls_borg_with_corresponding_para
 
 
 def test_create_archive_with_files_cache_calls_borg_with_files_cache_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1020,6 +1584,8 @@ def test_create_archive_with_files_cache_calls_borg_with_files_cache_parameters(
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1037,6 +1603,7 @@ def test_create_archive_with_files_cache_calls_borg_with_files_cache_parameters(
 
 
 def test_create_archive_with_local_path_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1054,6 +1621,8 @@ def test_create_archive_with_local_path_calls_borg_via_local_path():
         output_file=None,
         borg_local_path='borg1',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1071,6 +1640,7 @@ def test_create_archive_with_local_path_calls_borg_via_local_path():
 
 
 def test_create_archive_with_remote_path_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1088,6 +1658,8 @@ def test_create_archive_with_remote_path_calls_borg_with_remote_path_parameters(
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1105,6 +1677,7 @@ def test_create_archive_with_remote_path_calls_borg_with_remote_path_parameters(
 
 
 def test_create_archive_with_umask_calls_borg_with_umask_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1122,6 +1695,8 @@ def test_create_archive_with_umask_calls_borg_with_umask_parameters():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1138,6 +1713,7 @@ def test_create_archive_with_umask_calls_borg_with_umask_parameters():
 
 
 def test_create_archive_with_lock_wait_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1155,6 +1731,8 @@ def test_create_archive_with_lock_wait_calls_borg_with_lock_wait_parameters():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1171,6 +1749,7 @@ def test_create_archive_with_lock_wait_calls_borg_with_lock_wait_parameters():
 
 
 def test_create_archive_with_stats_calls_borg_with_stats_parameter_and_warning_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1188,6 +1767,8 @@ def test_create_archive_with_stats_calls_borg_with_stats_parameter_and_warning_o
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1205,6 +1786,7 @@ def test_create_archive_with_stats_calls_borg_with_stats_parameter_and_warning_o
 
 
 def test_create_archive_with_stats_and_log_info_calls_borg_with_stats_parameter_and_info_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1222,6 +1804,8 @@ def test_create_archive_with_stats_and_log_info_calls_borg_with_stats_parameter_
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -1240,6 +1824,7 @@ def test_create_archive_with_stats_and_log_info_calls_borg_with_stats_parameter_
 
 
 def test_create_archive_with_files_calls_borg_with_list_parameter_and_warning_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1257,6 +1842,8 @@ def test_create_archive_with_files_calls_borg_with_list_parameter_and_warning_ou
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1274,6 +1861,7 @@ def test_create_archive_with_files_calls_borg_with_list_parameter_and_warning_ou
 
 
 def test_create_archive_with_files_and_log_info_calls_borg_with_list_parameter_and_info_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1291,6 +1879,8 @@ def test_create_archive_with_files_and_log_info_calls_borg_with_list_parameter_a
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -1309,6 +1899,8 @@ def test_create_archive_with_files_and_log_info_calls_borg_with_list_parameter_a
 
 
 def test_create_archive_with_progress_and_log_info_calls_borg_with_progress_parameter_and_no_list():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module.sys.stderr).should_receive('isatty').and_return(True)
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1326,6 +1918,8 @@ def test_create_archive_with_progress_and_log_info_calls_borg_with_progress_para
         output_file=module.DO_NOT_CAPTURE,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -1344,6 +1938,8 @@ def test_create_archive_with_progress_and_log_info_calls_borg_with_progress_para
 
 
 def test_create_archive_with_progress_calls_borg_with_progress_parameter():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module.sys.stderr).should_receive('isatty').and_return(True)
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1361,6 +1957,8 @@ def test_create_archive_with_progress_calls_borg_with_progress_parameter():
         output_file=module.DO_NOT_CAPTURE,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1378,6 +1976,8 @@ def test_create_archive_with_progress_calls_borg_with_progress_parameter():
 
 
 def test_create_archive_with_progress_and_stream_processes_calls_borg_with_progress_parameter():
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module.sys.stderr).should_receive('isatty').and_return(True)
     processes = flexmock()
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
@@ -1398,7 +1998,105 @@ def test_create_archive_with_progress_and_stream_processes_calls_borg_with_progr
         output_file=module.DO_NOT_CAPTURE,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    )
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+        progress=True,
+        stream_processes=processes,
+    )
+
+
+def test_create_archive_with_progress_outside_terminal_calls_borg_with_log_json_and_tracks_progress():
+    flexmock(module.sys.stderr).should_receive('isatty').and_return(False)
+    progress_callback = flexmock()
+    tracker = flexmock(handle_line=flexmock(), finished=True, totals=lambda: {'original_size': 5})
+    flexmock(module.borg_progress).should_receive('make_totals_path').and_return('totals.json')
+    flexmock(module.borg_progress).should_receive('read_totals').and_return(None)
+    flexmock(module.borg_progress).should_receive('Progress_tracker').with_args(
+        'repo', None, progress_callback
+    ).and_return(tracker)
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module).should_receive('execute_command').with_args(
+        ('borg', 'create', '--progress', '--log-json') + ARCHIVE_WITH_PATHS,
+        output_log_level=logging.INFO,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=tracker.handle_line,
     )
+    flexmock(module.borg_progress).should_receive('write_totals').with_args(
+        'totals.json', {'original_size': 5}
+    ).once()
+
+    module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+        progress=True,
+        progress_callback=progress_callback,
+    )
+
+
+def test_create_archive_with_progress_outside_terminal_and_stream_processes_tracks_progress():
+    flexmock(module.sys.stderr).should_receive('isatty').and_return(False)
+    processes = flexmock()
+    tracker = flexmock(handle_line=flexmock(), finished=False)
+    flexmock(module.borg_progress).should_receive('make_totals_path').and_return('totals.json')
+    flexmock(module.borg_progress).should_receive('read_totals').and_return(None)
+    flexmock(module.borg_progress).should_receive('Progress_tracker').and_return(tracker)
+    flexmock(module.environment).should_receive('make_environment')
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module).should_receive('execute_command_with_processes').with_args(
+        ('borg', 'create', '--one-file-system', '--read-special', '--progress', '--log-json')
+        + ARCHIVE_WITH_PATHS,
+        processes=processes,
+        output_log_level=logging.INFO,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=tracker.handle_line,
+    )
+    flexmock(module.borg_progress).should_receive('write_totals').never()
 
     module.create_archive(
         dry_run=False,
@@ -1416,6 +2114,7 @@ def test_create_archive_with_progress_and_stream_processes_calls_borg_with_progr
 
 
 def test_create_archive_with_json_calls_borg_with_json_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1433,6 +2132,8 @@ def test_create_archive_with_json_calls_borg_with_json_parameter():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     ).and_return('[]')
 
     json_output = module.create_archive(
@@ -1452,6 +2153,7 @@ def test_create_archive_with_json_calls_borg_with_json_parameter():
 
 
 def test_create_archive_with_stats_and_json_calls_borg_without_stats_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1469,6 +2171,8 @@ def test_create_archive_with_stats_and_json_calls_borg_without_stats_parameter()
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     ).and_return('[]')
 
     json_output = module.create_archive(
@@ -1489,6 +2193,7 @@ def test_create_archive_with_stats_and_json_calls_borg_without_stats_parameter()
 
 
 def test_create_archive_with_source_directories_glob_expands():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'food'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1506,6 +2211,8 @@ def test_create_archive_with_source_directories_glob_expands():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     flexmock(module.glob).should_receive('glob').with_args('foo*').and_return(['foo', 'food'])
 
@@ -1523,6 +2230,7 @@ def test_create_archive_with_source_directories_glob_expands():
 
 
 def test_create_archive_with_non_matching_source_directories_glob_passes_through():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo*',))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1540,6 +2248,8 @@ def test_create_archive_with_non_matching_source_directories_glob_passes_through
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
     flexmock(module.glob).should_receive('glob').with_args('foo*').and_return([])
 
@@ -1557,6 +2267,7 @@ def test_create_archive_with_non_matching_source_directories_glob_passes_through
 
 
 def test_create_archive_with_glob_calls_borg_with_expanded_directories():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'food'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1574,6 +2285,8 @@ def test_create_archive_with_glob_calls_borg_with_expanded_directories():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1590,6 +2303,7 @@ def test_create_archive_with_glob_calls_borg_with_expanded_directories():
 
 
 def test_create_archive_with_archive_name_format_calls_borg_with_archive_name():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1607,6 +2321,8 @@ def test_create_archive_with_archive_name_format_calls_borg_with_archive_name():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1623,6 +2339,7 @@ def test_create_archive_with_archive_name_format_calls_borg_with_archive_name():
 
 
 def test_create_archive_with_archive_name_format_accepts_borg_placeholders():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1640,6 +2357,8 @@ def test_create_archive_with_archive_name_format_accepts_borg_placeholders():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1656,6 +2375,7 @@ def test_create_archive_with_archive_name_format_accepts_borg_placeholders():
 
 
 def test_create_archive_with_repository_accepts_borg_placeholders():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1673,6 +2393,8 @@ def test_create_archive_with_repository_accepts_borg_placeholders():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1689,6 +2411,7 @@ def test_create_archive_with_repository_accepts_borg_placeholders():
 
 
 def test_create_archive_with_extra_borg_options_calls_borg_with_extra_options():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
     flexmock(module).should_receive('map_directories_to_devices').and_return({})
@@ -1706,6 +2429,8 @@ def test_create_archive_with_extra_borg_options_calls_borg_with_extra_options():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -1721,7 +2446,50 @@ def test_create_archive_with_extra_borg_options_calls_borg_with_extra_options():
     )
 
 
+def test_create_archive_with_json_and_stream_processes_captures_and_returns_output():
+    flexmock(module.environment).should_receive('make_environment')
+    processes = flexmock()
+    flexmock(module).should_receive('borgmatic_source_directories').and_return([])
+    flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
+    flexmock(module).should_receive('map_directories_to_devices').and_return({})
+    flexmock(module).should_receive('expand_directories').and_return(())
+    flexmock(module.os.path).should_receive('expanduser').and_raise(TypeError)
+    flexmock(module).should_receive('expand_home_directories').and_return(())
+    flexmock(module).should_receive('write_pattern_file').and_return(None)
+    flexmock(module.feature).should_receive('available').and_return(True)
+    flexmock(module).should_receive('ensure_files_readable')
+    flexmock(module).should_receive('make_pattern_flags').and_return(())
+    flexmock(module).should_receive('make_exclude_flags').and_return(())
+    flexmock(module).should_receive('execute_command_with_processes').with_args(
+        ('borg', 'create', '--one-file-system', '--read-special', '--json') + ARCHIVE_WITH_PATHS,
+        processes=processes,
+        output_log_level=None,
+        output_file=None,
+        borg_local_path='borg',
+        working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
+    ).and_return('[]')
+
+    json_output = module.create_archive(
+        dry_run=False,
+        repository='repo',
+        location_config={
+            'source_directories': ['foo', 'bar'],
+            'repositories': ['repo'],
+            'exclude_patterns': None,
+        },
+        storage_config={},
+        local_borg_version='1.2.3',
+        json=True,
+        stream_processes=processes,
+    )
+
+    assert json_output == '[]'
+
+
 def test_create_archive_with_stream_processes_calls_borg_with_processes():
+    flexmock(module.environment).should_receive('make_environment')
     processes = flexmock()
     flexmock(module).should_receive('borgmatic_source_directories').and_return([])
     flexmock(module).should_receive('deduplicate_directories').and_return(('foo', 'bar'))
@@ -1741,6 +2509,8 @@ def test_create_archive_with_stream_processes_calls_borg_with_processes():
         output_file=None,
         borg_local_path='borg',
         working_directory=None,
+        extra_environment=None,
+        output_line_handler=None,
     )
 
     module.create_archive(
@@ -15,10 +15,12 @@ def insert_execute_command_mock(
         output_file=None if capture else module.DO_NOT_CAPTURE,
         output_log_level=output_log_level,
         borg_local_path=borg_local_path,
+        extra_environment=None,
     ).once()
 
 
 def test_export_tar_archive_calls_borg_with_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', 'repo::archive', 'test.tar', 'path1', 'path2')
@@ -35,6 +37,7 @@ def test_export_tar_archive_calls_borg_with_path_parameters():
 
 
 def test_export_tar_archive_calls_borg_with_local_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg1', 'export-tar', 'repo::archive', 'test.tar'), borg_local_path='borg1'
@@ -52,6 +55,7 @@ def test_export_tar_archive_calls_borg_with_local_path_parameters():
 
 
 def test_export_tar_archive_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--remote-path', 'borg1', 'repo::archive', 'test.tar')
@@ -69,6 +73,7 @@ def test_export_tar_archive_calls_borg_with_remote_path_parameters():
 
 
 def test_export_tar_archive_calls_borg_with_umask_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--umask', '0770', 'repo::archive', 'test.tar')
@@ -85,6 +90,7 @@ def test_export_tar_archive_calls_borg_with_umask_parameters():
 
 
 def test_export_tar_archive_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--lock-wait', '5', 'repo::archive', 'test.tar')
@@ -101,6 +107,7 @@ def test_export_tar_archive_calls_borg_with_lock_wait_parameters():
 
 
 def test_export_tar_archive_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'export-tar', '--info', 'repo::archive', 'test.tar'))
     insert_logging_mock(logging.INFO)
@@ -116,6 +123,7 @@ def test_export_tar_archive_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_export_tar_archive_with_log_debug_calls_borg_with_debug_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--debug', '--show-rc', 'repo::archive', 'test.tar')
@@ -133,6 +141,7 @@ def test_export_tar_archive_with_log_debug_calls_borg_with_debug_parameters():
 
 
 def test_export_tar_archive_calls_borg_with_dry_run_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     flexmock(module).should_receive('execute_command').never()
 
@@ -147,6 +156,7 @@ def test_export_tar_archive_calls_borg_with_dry_run_parameter():
 
 
 def test_export_tar_archive_calls_borg_with_tar_filter_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--tar-filter', 'bzip2', 'repo::archive', 'test.tar')
@@ -164,6 +174,7 @@ def test_export_tar_archive_calls_borg_with_tar_filter_parameters():
 
 
 def test_export_tar_archive_calls_borg_with_list_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--list', 'repo::archive', 'test.tar'),
@@ -182,6 +193,7 @@ def test_export_tar_archive_calls_borg_with_list_parameter():
 
 
 def test_export_tar_archive_calls_borg_with_strip_components_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'export-tar', '--strip-components', '5', 'repo::archive', 'test.tar')
@@ -199,6 +211,7 @@ def test_export_tar_archive_calls_borg_with_strip_components_parameter():
 
 
 def test_export_tar_archive_skips_abspath_for_remote_repository_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').never()
     insert_execute_command_mock(('borg', 'export-tar', 'server:repo::archive', 'test.tar'))
 
@@ -213,6 +226,7 @@ def test_export_tar_archive_skips_abspath_for_remote_repository_parameter():
 
 
 def test_export_tar_archive_calls_borg_with_stdout_destination_path():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'export-tar', 'repo::archive', '-'), capture=False)
 
@@ -10,34 +10,37 @@ from ..test_verbosity import insert_logging_mock
 
 def insert_execute_command_mock(command, working_directory=None):
     flexmock(module).should_receive('execute_command').with_args(
-        command, working_directory=working_directory
+        command, working_directory=working_directory, extra_environment=None
     ).once()
 
 
 def insert_execute_command_output_mock(command, result):
     flexmock(module).should_receive('execute_command').with_args(
-        command, output_log_level=None, borg_local_path=command[0]
+        command, output_log_level=None, borg_local_path=command[0], extra_environment=None
     ).and_return(result).once()
 
 
 def test_extract_last_archive_dry_run_calls_borg_with_last_archive():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(
         ('borg', 'list', '--short', 'repo'), result='archive1\narchive2\n'
     )
     insert_execute_command_mock(('borg', 'extract', '--dry-run', 'repo::archive2'))
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=None)
+    module.extract_last_archive_dry_run(storage_config={}, repository='repo', lock_wait=None)
 
 
 def test_extract_last_archive_dry_run_without_any_archives_should_not_raise():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(('borg', 'list', '--short', 'repo'), result='\n')
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=None)
+    module.extract_last_archive_dry_run(storage_config={}, repository='repo', lock_wait=None)
 
 
 def test_extract_last_archive_dry_run_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(
         ('borg', 'list', '--short', '--info', 'repo'), result='archive1\narchive2\n'
     )
@@ -45,10 +48,11 @@ def test_extract_last_archive_dry_run_with_log_info_calls_borg_with_info_paramet
     insert_logging_mock(logging.INFO)
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=None)
+    module.extract_last_archive_dry_run(storage_config={}, repository='repo', lock_wait=None)
 
 
 def test_extract_last_archive_dry_run_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(
         ('borg', 'list', '--short', '--debug', '--show-rc', 'repo'), result='archive1\narchive2\n'
     )
@@ -58,20 +62,24 @@ def test_extract_last_archive_dry_run_with_log_debug_calls_borg_with_debug_param
     insert_logging_mock(logging.DEBUG)
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=None)
+    module.extract_last_archive_dry_run(storage_config={}, repository='repo', lock_wait=None)
 
 
 def test_extract_last_archive_dry_run_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(
         ('borg1', 'list', '--short', 'repo'), result='archive1\narchive2\n'
     )
     insert_execute_command_mock(('borg1', 'extract', '--dry-run', 'repo::archive2'))
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=None, local_path='borg1')
+    module.extract_last_archive_dry_run(
+        storage_config={}, repository='repo', lock_wait=None, local_path='borg1'
+    )
 
 
 def test_extract_last_archive_dry_run_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(
         ('borg', 'list', '--short', '--remote-path', 'borg1', 'repo'), result='archive1\narchive2\n'
     )
@@ -80,10 +88,13 @@ def test_extract_last_archive_dry_run_calls_borg_with_remote_path_parameters():
     )
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=None, remote_path='borg1')
+    module.extract_last_archive_dry_run(
+        storage_config={}, repository='repo', lock_wait=None, remote_path='borg1'
+    )
 
 
 def test_extract_last_archive_dry_run_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_output_mock(
         ('borg', 'list', '--short', '--lock-wait', '5', 'repo'), result='archive1\narchive2\n'
     )
@@ -92,10 +103,11 @@ def test_extract_last_archive_dry_run_calls_borg_with_lock_wait_parameters():
     )
     flexmock(module.feature).should_receive('available').and_return(True)
 
-    module.extract_last_archive_dry_run(repository='repo', lock_wait=5)
+    module.extract_last_archive_dry_run(storage_config={}, repository='repo', lock_wait=5)
 
 
 def test_extract_archive_calls_borg_with_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', 'repo::archive', 'path1', 'path2'))
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -112,6 +124,7 @@ def test_extract_archive_calls_borg_with_path_parameters():
 
 
 def test_extract_archive_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', '--remote-path', 'borg1', 'repo::archive'))
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -132,6 +145,7 @@ def test_extract_archive_calls_borg_with_remote_path_parameters():
     'feature_available,option_flag', ((True, '--numeric-ids'), (False, '--numeric-owner'),),
 )
 def test_extract_archive_calls_borg_with_numeric_ids_parameter(feature_available, option_flag):
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', option_flag, 'repo::archive'))
     flexmock(module.feature).should_receive('available').and_return(feature_available)
@@ -148,6 +162,7 @@ def test_extract_archive_calls_borg_with_numeric_ids_parameter(feature_available
 
 
 def test_extract_archive_calls_borg_with_umask_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', '--umask', '0770', 'repo::archive'))
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -164,6 +179,7 @@ def test_extract_archive_calls_borg_with_umask_parameters():
 
 
 def test_extract_archive_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', '--lock-wait', '5', 'repo::archive'))
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -180,6 +196,7 @@ def test_extract_archive_calls_borg_with_lock_wait_parameters():
 
 
 def test_extract_archive_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', '--info', 'repo::archive'))
     insert_logging_mock(logging.INFO)
@@ -197,6 +214,7 @@ def test_extract_archive_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_extract_archive_with_log_debug_calls_borg_with_debug_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(
         ('borg', 'extract', '--debug', '--list', '--show-rc', 'repo::archive')
@@ -216,6 +234,7 @@ def test_extract_archive_with_log_debug_calls_borg_with_debug_parameters():
 
 
 def test_extract_archive_calls_borg_with_dry_run_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', '--dry-run', 'repo::archive'))
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -232,6 +251,7 @@ def test_extract_archive_calls_borg_with_dry_run_parameter():
 
 
 def test_extract_archive_calls_borg_with_destination_path():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', 'repo::archive'), working_directory='/dest')
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -249,6 +269,7 @@ def test_extract_archive_calls_borg_with_destination_path():
 
 
 def test_extract_archive_calls_borg_with_strip_components():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     insert_execute_command_mock(('borg', 'extract', '--strip-components', '5', 'repo::archive'))
     flexmock(module.feature).should_receive('available').and_return(True)
@@ -266,11 +287,13 @@ def test_extract_archive_calls_borg_with_strip_components():
 
 
 def test_extract_archive_calls_borg_with_progress_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'extract', '--progress', 'repo::archive'),
         output_file=module.DO_NOT_CAPTURE,
         working_directory=None,
+        extra_environment=None,
     ).once()
     flexmock(module.feature).should_receive('available').and_return(True)
 
@@ -287,6 +310,7 @@ def test_extract_archive_calls_borg_with_progress_parameter():
 
 
 def test_extract_archive_with_progress_and_extract_to_stdout_raises():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').never()
 
     with pytest.raises(ValueError):
@@ -304,6 +328,7 @@ def test_extract_archive_with_progress_and_extract_to_stdout_raises():
 
 
 def test_extract_archive_calls_borg_with_stdout_parameter_and_returns_process():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').and_return('repo')
     process = flexmock()
     flexmock(module).should_receive('execute_command').with_args(
@@ -311,6 +336,7 @@ def test_extract_archive_calls_borg_with_stdout_parameter_and_returns_process():
         output_file=module.subprocess.PIPE,
         working_directory=None,
         run_to_completion=False,
+        extra_environment=None,
     ).and_return(process).once()
     flexmock(module.feature).should_receive('available').and_return(True)
 
@@ -330,9 +356,10 @@ def test_extract_archive_calls_borg_with_stdout_parameter_and_returns_process():
 
 
 def test_extract_archive_skips_abspath_for_remote_repository():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module.os.path).should_receive('abspath').never()
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'extract', 'server:repo::archive'), working_directory=None
+        ('borg', 'extract', 'server:repo::archive'), working_directory=None, extra_environment=None
     ).once()
     flexmock(module.feature).should_receive('available').and_return(True)
 
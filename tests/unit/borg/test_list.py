@@ -24,20 +24,26 @@ def test_resolve_archive_name_passes_through_non_latest_archive_name():
 
 
 def test_resolve_archive_name_calls_borg_with_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     expected_archive = 'archive-name'
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list') + BORG_LIST_LATEST_ARGUMENTS, output_log_level=None, borg_local_path='borg'
+        ('borg', 'list') + BORG_LIST_LATEST_ARGUMENTS,
+        output_log_level=None,
+        borg_local_path='borg',
+        extra_environment=None,
     ).and_return(expected_archive + '\n')
 
     assert module.resolve_archive_name('repo', 'latest', storage_config={}) == expected_archive
 
 
 def test_resolve_archive_name_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     expected_archive = 'archive-name'
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--info') + BORG_LIST_LATEST_ARGUMENTS,
         output_log_level=None,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return(expected_archive + '\n')
     insert_logging_mock(logging.INFO)
 
@@ -45,11 +51,13 @@ def test_resolve_archive_name_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_resolve_archive_name_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     expected_archive = 'archive-name'
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--debug', '--show-rc') + BORG_LIST_LATEST_ARGUMENTS,
         output_log_level=None,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return(expected_archive + '\n')
     insert_logging_mock(logging.DEBUG)
 
@@ -57,11 +65,13 @@ def test_resolve_archive_name_with_log_debug_calls_borg_with_debug_parameter():
 
 
 def test_resolve_archive_name_with_local_path_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     expected_archive = 'archive-name'
     flexmock(module).should_receive('execute_command').with_args(
         ('borg1', 'list') + BORG_LIST_LATEST_ARGUMENTS,
         output_log_level=None,
         borg_local_path='borg1',
+        extra_environment=None,
     ).and_return(expected_archive + '\n')
 
     assert (
@@ -71,11 +81,13 @@ def test_resolve_archive_name_with_local_path_calls_borg_via_local_path():
 
 
 def test_resolve_archive_name_with_remote_path_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     expected_archive = 'archive-name'
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--remote-path', 'borg1') + BORG_LIST_LATEST_ARGUMENTS,
         output_log_level=None,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return(expected_archive + '\n')
 
     assert (
@@ -85,8 +97,12 @@ def test_resolve_archive_name_with_remote_path_calls_borg_with_remote_path_param
 
 
 def test_resolve_archive_name_without_archives_raises():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list') + BORG_LIST_LATEST_ARGUMENTS, output_log_level=None, borg_local_path='borg'
+        ('borg', 'list') + BORG_LIST_LATEST_ARGUMENTS,
+        output_log_level=None,
+        borg_local_path='borg',
+        extra_environment=None,
     ).and_return('')
 
     with pytest.raises(ValueError):
@@ -94,12 +110,14 @@ def test_resolve_archive_name_without_archives_raises():
 
 
 def test_resolve_archive_name_with_lock_wait_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     expected_archive = 'archive-name'
 
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--lock-wait', 'okay') + BORG_LIST_LATEST_ARGUMENTS,
         output_log_level=None,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return(expected_archive + '\n')
 
     assert (
@@ -109,8 +127,12 @@ def test_resolve_archive_name_with_lock_wait_calls_borg_with_lock_wait_parameter
 
 
 def test_list_archives_calls_borg_with_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list', 'repo'), output_log_level=logging.WARNING, borg_local_path='borg'
+        ('borg', 'list', 'repo'),
+        output_log_level=logging.WARNING,
+        borg_local_path='borg',
+        extra_environment=None,
     )
 
     module.list_archives(
@@ -121,8 +143,12 @@ def test_list_archives_calls_borg_with_parameters():
 
 
 def test_list_archives_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list', '--info', 'repo'), output_log_level=logging.WARNING, borg_local_path='borg'
+        ('borg', 'list', '--info', 'repo'),
+        output_log_level=logging.WARNING,
+        borg_local_path='borg',
+        extra_environment=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -134,8 +160,12 @@ def test_list_archives_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_list_archives_with_log_info_and_json_suppresses_most_borg_output():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list', '--json', 'repo'), output_log_level=None, borg_local_path='borg'
+        ('borg', 'list', '--json', 'repo'),
+        output_log_level=None,
+        borg_local_path='borg',
+        extra_environment=None,
     )
     insert_logging_mock(logging.INFO)
 
@@ -147,10 +177,12 @@ def test_list_archives_with_log_info_and_json_suppresses_most_borg_output():
 
 
 def test_list_archives_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--debug', '--show-rc', 'repo'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     )
     insert_logging_mock(logging.DEBUG)
 
@@ -162,8 +194,12 @@ def test_list_archives_with_log_debug_calls_borg_with_debug_parameter():
 
 
 def test_list_archives_with_log_debug_and_json_suppresses_most_borg_output():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list', '--json', 'repo'), output_log_level=None, borg_local_path='borg'
+        ('borg', 'list', '--json', 'repo'),
+        output_log_level=None,
+        borg_local_path='borg',
+        extra_environment=None,
     )
     insert_logging_mock(logging.DEBUG)
 
@@ -175,11 +211,13 @@ def test_list_archives_with_log_debug_and_json_suppresses_most_borg_output():
 
 
 def test_list_archives_with_lock_wait_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {'lock_wait': 5}
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--lock-wait', '5', 'repo'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     )
 
     module.list_archives(
@@ -190,9 +228,13 @@ def test_list_archives_with_lock_wait_calls_borg_with_lock_wait_parameters():
 
 
 def test_list_archives_with_archive_calls_borg_with_archive_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {}
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list', 'repo::archive'), output_log_level=logging.WARNING, borg_local_path='borg'
+        ('borg', 'list', 'repo::archive'),
+        output_log_level=logging.WARNING,
+        borg_local_path='borg',
+        extra_environment=None,
     )
 
     module.list_archives(
@@ -203,11 +245,13 @@ def test_list_archives_with_archive_calls_borg_with_archive_parameter():
 
 
 def test_list_archives_with_path_calls_borg_with_path_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {}
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', 'repo::archive', 'var/lib'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     )
 
     module.list_archives(
@@ -218,8 +262,12 @@ def test_list_archives_with_path_calls_borg_with_path_parameter():
 
 
 def test_list_archives_with_local_path_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg1', 'list', 'repo'), output_log_level=logging.WARNING, borg_local_path='borg1'
+        ('borg1', 'list', 'repo'),
+        output_log_level=logging.WARNING,
+        borg_local_path='borg1',
+        extra_environment=None,
     )
 
     module.list_archives(
@@ -231,10 +279,12 @@ def test_list_archives_with_local_path_calls_borg_via_local_path():
 
 
 def test_list_archives_with_remote_path_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--remote-path', 'borg1', 'repo'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     )
 
     module.list_archives(
@@ -246,10 +296,12 @@ def test_list_archives_with_remote_path_calls_borg_with_remote_path_parameters()
 
 
 def test_list_archives_with_short_calls_borg_with_short_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--short', 'repo'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return('[]')
 
     module.list_archives(
@@ -274,10 +326,12 @@ def test_list_archives_with_short_calls_borg_with_short_parameter():
     ),
 )
 def test_list_archives_passes_through_arguments_to_borg(argument_name):
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--' + argument_name.replace('_', '-'), 'value', 'repo'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return('[]')
 
     module.list_archives(
@@ -290,10 +344,12 @@ def test_list_archives_passes_through_arguments_to_borg(argument_name):
 
 
 def test_list_archives_with_successful_calls_borg_to_exclude_checkpoints():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'list', '--glob-archives', module.BORG_EXCLUDE_CHECKPOINTS_GLOB, 'repo'),
         output_log_level=logging.WARNING,
         borg_local_path='borg',
+        extra_environment=None,
     ).and_return('[]')
 
     module.list_archives(
@@ -304,8 +360,12 @@ def test_list_archives_with_successful_calls_borg_to_exclude_checkpoints():
 
 
 def test_list_archives_with_json_calls_borg_with_json_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
-        ('borg', 'list', '--json', 'repo'), output_log_level=None, borg_local_path='borg'
+        ('borg', 'list', '--json', 'repo'),
+        output_log_level=None,
+        borg_local_path='borg',
+        extra_environment=None,
     ).and_return('[]')
 
     json_output = module.list_archives(
@@ -9,11 +9,12 @@ from ..test_verbosity import insert_logging_mock
 
 def insert_execute_command_mock(command):
     flexmock(module).should_receive('execute_command').with_args(
-        command, borg_local_path='borg'
+        command, borg_local_path='borg', extra_environment=None
     ).once()
 
 
 def test_mount_archive_calls_borg_with_required_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', 'repo::archive', '/mnt'))
 
     module.mount_archive(
@@ -28,6 +29,7 @@ def test_mount_archive_calls_borg_with_required_parameters():
 
 
 def test_mount_archive_calls_borg_with_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', 'repo::archive', '/mnt', 'path1', 'path2'))
 
     module.mount_archive(
@@ -42,6 +44,7 @@ def test_mount_archive_calls_borg_with_path_parameters():
 
 
 def test_mount_archive_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(
         ('borg', 'mount', '--remote-path', 'borg1', 'repo::archive', '/mnt')
     )
@@ -59,6 +62,7 @@ def test_mount_archive_calls_borg_with_remote_path_parameters():
 
 
 def test_mount_archive_calls_borg_with_umask_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', '--umask', '0770', 'repo::archive', '/mnt'))
 
     module.mount_archive(
@@ -73,6 +77,7 @@ def test_mount_archive_calls_borg_with_umask_parameters():
 
 
 def test_mount_archive_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', '--lock-wait', '5', 'repo::archive', '/mnt'))
 
     module.mount_archive(
@@ -87,6 +92,7 @@ def test_mount_archive_calls_borg_with_lock_wait_parameters():
 
 
 def test_mount_archive_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', '--info', 'repo::archive', '/mnt'))
     insert_logging_mock(logging.INFO)
 
@@ -102,6 +108,7 @@ def test_mount_archive_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_mount_archive_with_log_debug_calls_borg_with_debug_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', '--debug', '--show-rc', 'repo::archive', '/mnt'))
     insert_logging_mock(logging.DEBUG)
 
@@ -117,10 +124,12 @@ def test_mount_archive_with_log_debug_calls_borg_with_debug_parameters():
 
 
 def test_mount_archive_calls_borg_with_foreground_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     flexmock(module).should_receive('execute_command').with_args(
         ('borg', 'mount', '--foreground', 'repo::archive', '/mnt'),
         output_file=module.DO_NOT_CAPTURE,
         borg_local_path='borg',
+        extra_environment=None,
     ).once()
 
     module.mount_archive(
@@ -135,6 +144,7 @@ def test_mount_archive_calls_borg_with_foreground_parameter():
 
 
 def test_mount_archive_calls_borg_with_options_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', 'mount', '-o', 'super_mount', 'repo::archive', '/mnt'))
 
     module.mount_archive(
@@ -0,0 +1,165 @@
+import json
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic.borg import progress as module
+
+
+def progress_event(time, original_size=0, nfiles=0, path='/foo'):
+    return json.dumps(
+        {
+            'type': 'archive_progress',
+            'original_size': original_size,
+            'compressed_size': original_size // 2,
+            'deduplicated_size': original_size // 4,
+            'nfiles': nfiles,
+            'path': path,
+            'time': time,
+            'finished': False,
+        }
+    )
+
+
+def test_make_totals_path_differs_by_source_directories():
+    flexmock(module.source_snapshot).should_receive('get_state_directory').and_return('/state')
+
+    path = module.make_totals_path('repo', ['/foo'])
+
+    assert path.startswith('/state/create_totals/')
+    assert path != module.make_totals_path('repo', ['/bar'])
+
+
+@pytest.mark.parametrize(
+    'byte_count,expected_size',
+    ((0, '0 B'), (1023, '1023 B'), (1536, '1.5 KiB'), (3 * 1024 ** 3, '3.0 GiB')),
+)
+def test_format_size_uses_binary_units(byte_count, expected_size):
+    assert module.format_size(byte_count) == expected_size
+
+
+def test_format_progress_includes_rates_eta_and_path():
+    assert (
+        module.format_progress(
+            module.Progress(
+                original_size=2048,
+                compressed_size=1024,
+                deduplicated_size=512,
+                file_count=3,
+                path='/foo/bar',
+                elapsed_seconds=2,
+                bytes_per_second=1024,
+                files_per_second=1.5,
+                eta_seconds=61,
+            )
+        )
+        == 'Progress: 2.0 KiB in 3 files at 1.0 KiB/s, 1.5 files/s, ETA 0:01:01: /foo/bar'
+    )
+
+
+def test_format_progress_without_eta_says_unknown():
+    assert 'ETA unknown' in module.format_progress(
+        module.Progress(0, 0, 0, 0, None, 0, 0, 0, eta_seconds=None)
+    )
+
+
+@pytest.mark.parametrize(
+    'original_size,bytes_per_second,previous_totals,expected_eta',
+    (
+        (100, 10, {'original_size': 300}, 20),
+        (100, 10, None, None),
+        (100, 0, {'original_size': 300}, None),
+        (400, 10, {'original_size': 300}, None),
+    ),
+)
+def test_estimate_eta_seconds(original_size, bytes_per_second, previous_totals, expected_eta):
+    assert (
+        module.estimate_eta_seconds(original_size, bytes_per_second, previous_totals)
+        == expected_eta
+    )
+
+
+def test_handle_line_consumes_progress_events():
+    tracker = module.Progress_tracker('repo', {'original_size': 3000}, start_time=100)
+    flexmock(module.logger).should_receive('info').once()
+
+    assert tracker.handle_line(progress_event(110, original_size=1000, nfiles=20)) is None
+
+    assert tracker.latest == module.Progress(
+        original_size=1000,
+        compressed_size=500,
+        deduplicated_size=250,
+        file_count=20,
+        path='/foo',
+        elapsed_seconds=10,
+        bytes_per_second=100,
+        files_per_second=2,
+        eta_seconds=20,
+    )
+
+
+def test_handle_line_translates_log_messages_and_file_statuses():
+    tracker = module.Progress_tracker('repo')
+
+    assert (
+        tracker.handle_line(
+            json.dumps({'type': 'log_message', 'message': 'hi', 'levelname': 'INFO'})
+        )
+        == 'hi'
+    )
+    assert (
+        tracker.handle_line(json.dumps({'type': 'file_status', 'status': 'A', 'path': '/foo'}))
+        == 'A /foo'
+    )
+
+
+def test_handle_line_drops_other_progress_output():
+    tracker = module.Progress_tracker('repo')
+
+    assert tracker.handle_line(json.dumps({'type': 'progress_message', 'message': 'hi'})) is None
+    assert tracker.handle_line(json.dumps({'type': 'progress_percent', 'current': 1})) is None
+
+
+@pytest.mark.parametrize('line', ('terminating with success status, rc 0', '[1, 2]', '{"a": 1}'))
+def test_handle_line_passes_through_other_output(line):
+    assert module.Progress_tracker('repo').handle_line(line) == line
+
+
+def test_handle_line_throttles_logging_and_callback():
+    callbacks = []
+    tracker = module.Progress_tracker(
+        'repo', progress_callback=lambda progress: callbacks.append(progress), start_time=100
+    )
+    flexmock(module.logger).should_receive('info').times(3)
+
+    for event_time in (101, 105, 111, 115, 401):
+        tracker.handle_line(progress_event(event_time))
+
+    assert [progress.elapsed_seconds for progress in callbacks] == [1, 301]
+
+
+def test_handle_line_with_failing_callback_warns():
+    def fail(progress):
+        raise OSError()
+
+    tracker = module.Progress_tracker('repo', progress_callback=fail, start_time=100)
+    flexmock(module.logger).should_receive('info')
+    flexmock(module.logger).should_receive('warning').once()
+
+    tracker.handle_line(progress_event(101))
+
+
+def test_handle_line_with_finished_event_logs_final_progress_and_records_totals():
+    tracker = module.Progress_tracker('repo', start_time=100)
+    flexmock(module.logger).should_receive('info').twice()
+
+    tracker.handle_line(progress_event(101, original_size=10, nfiles=2))
+    tracker.handle_line(progress_event(102, original_size=20, nfiles=3))
+    tracker.handle_line(json.dumps({'type': 'archive_progress', 'finished': True, 'time': 103}))
+
+    assert tracker.finished
+    assert tracker.totals() == {'original_size': 20, 'file_count': 3}
+
+
+def test_totals_without_progress_returns_none():
+    assert module.Progress_tracker('repo').totals() is None
@@ -10,7 +10,10 @@ from ..test_verbosity import insert_logging_mock
 
 def insert_execute_command_mock(prune_command, output_log_level):
     flexmock(module).should_receive('execute_command').with_args(
-        prune_command, output_log_level=output_log_level, borg_local_path=prune_command[0]
+        prune_command,
+        output_log_level=output_log_level,
+        borg_local_path=prune_command[0],
+        extra_environment=None,
     ).once()
 
 
@@ -59,6 +62,7 @@ PRUNE_COMMAND = ('borg', 'prune', '--keep-daily', '1', '--keep-weekly', '2', '--
 
 
 def test_prune_archives_calls_borg_with_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -71,6 +75,7 @@ def test_prune_archives_calls_borg_with_parameters():
 
 
 def test_prune_archives_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -84,6 +89,7 @@ def test_prune_archives_with_log_info_calls_borg_with_info_parameter():
 
 
 def test_prune_archives_with_log_debug_calls_borg_with_debug_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -97,6 +103,7 @@ def test_prune_archives_with_log_debug_calls_borg_with_debug_parameter():
 
 
 def test_prune_archives_with_dry_run_calls_borg_with_dry_run_parameter():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -109,6 +116,7 @@ def test_prune_archives_with_dry_run_calls_borg_with_dry_run_parameter():
 
 
 def test_prune_archives_with_local_path_calls_borg_via_local_path():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -125,6 +133,7 @@ def test_prune_archives_with_local_path_calls_borg_via_local_path():
 
 
 def test_prune_archives_with_remote_path_calls_borg_with_remote_path_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -141,6 +150,7 @@ def test_prune_archives_with_remote_path_calls_borg_with_remote_path_parameters(
 
 
 def test_prune_archives_with_stats_calls_borg_with_stats_parameter_and_warning_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -157,6 +167,7 @@ def test_prune_archives_with_stats_calls_borg_with_stats_parameter_and_warning_o
 
 
 def test_prune_archives_with_stats_and_log_info_calls_borg_with_stats_parameter_and_info_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -174,6 +185,7 @@ def test_prune_archives_with_stats_and_log_info_calls_borg_with_stats_parameter_
 
 
 def test_prune_archives_with_files_calls_borg_with_list_parameter_and_warning_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -190,6 +202,7 @@ def test_prune_archives_with_files_calls_borg_with_list_parameter_and_warning_ou
 
 
 def test_prune_archives_with_files_and_log_info_calls_borg_with_list_parameter_and_info_output_log_level():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -207,6 +220,7 @@ def test_prune_archives_with_files_and_log_info_calls_borg_with_list_parameter_a
 
 
 def test_prune_archives_with_umask_calls_borg_with_umask_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {'umask': '077'}
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
@@ -223,6 +237,7 @@ def test_prune_archives_with_umask_calls_borg_with_umask_parameters():
 
 
 def test_prune_archives_with_lock_wait_calls_borg_with_lock_wait_parameters():
+    flexmock(module.environment).should_receive('make_environment')
     storage_config = {'lock_wait': 5}
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
@@ -239,6 +254,7 @@ def test_prune_archives_with_lock_wait_calls_borg_with_lock_wait_parameters():
 
 
 def test_prune_archives_with_extra_borg_options_calls_borg_with_extra_options():
+    flexmock(module.environment).should_receive('make_environment')
     retention_config = flexmock()
     flexmock(module).should_receive('_make_prune_flags').with_args(retention_config).and_return(
         BASE_PRUNE_FLAGS
@@ -0,0 +1,96 @@
+import sys
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic.borg import source_snapshot as module
+
+
+def test_get_state_directory_uses_xdg_state_home():
+    flexmock(module.os).should_receive('getenv').with_args('XDG_STATE_HOME').and_return('/state')
+
+    assert module.get_state_directory() == '/state/borgmatic'
+
+
+def test_get_state_directory_without_xdg_state_home_defaults_to_local_state_in_home():
+    flexmock(module.os).should_receive('getenv').with_args('XDG_STATE_HOME').and_return(None)
+    flexmock(module.os.path).should_receive('expanduser').with_args('~').and_return('/root')
+
+    assert module.get_state_directory() == '/root/.local/state/borgmatic'
+
+
+def test_make_snapshot_path_differs_per_repository_and_configuration():
+    flexmock(module).should_receive('get_state_directory').and_return('/state')
+
+    path = module.make_snapshot_path('repo', {'source_directories': ['/foo']}, {})
+
+    assert path.startswith('/state/source_snapshots/')
+    assert path.endswith('.json')
+    assert module.make_snapshot_path('repo', {'source_directories': ['/foo']}, {}) == path
+    assert module.make_snapshot_path('other', {'source_directories': ['/foo']}, {}) != path
+    assert (
+        module.make_snapshot_path('repo', {'source_directories': ['/foo']}, {'compression': 'lz4'})
+        != path
+    )
+
+
+@pytest.mark.parametrize(
+    'path,exclude_patterns,expected_result',
+    (
+        ('/foo/bar', (), False),
+        ('/foo/bar', ('/foo/bar',), True),
+        ('/foo/bar', ('foo/bar',), True),
+        ('/foo/bar', ('fm:/foo/*',), True),
+        ('/foo/bar/baz', ('*/bar',), False),
+        ('/foo/bar', ('*.pyc',), False),
+        ('/foo/bar.pyc', ('*.pyc',), True),
+        ('/foo/bar', ('pp:/foo',), True),
+        ('/foo/bar', ('pp:/foo/',), True),
+        ('/foobar', ('pp:/foo',), False),
+        ('/foo/bar', ('re:^/foo',), False),
+        ('/foo/bar', ('sh:/foo/**',), False),
+    ),
+)
+def test_excluded_matches_fnmatch_and_path_prefix_patterns(path, exclude_patterns, expected_result):
+    assert module.excluded(path, exclude_patterns) is expected_result
+
+
+def test_checksum_file_with_unreadable_file_returns_none():
+    builtins = flexmock(sys.modules['builtins'])
+    builtins.should_receive('open').with_args('/foo', 'rb').and_raise(PermissionError)
+
+    assert module.checksum_file('/foo') is None
+
+
+def test_snapshot_source_with_missing_source_returns_none():
+    flexmock(module.os).should_receive('lstat').and_raise(FileNotFoundError)
+
+    assert module.snapshot_source('/foo', (), set(), set()) is None
+
+
+def test_take_snapshot_snapshots_each_source_relative_to_working_directory():
+    flexmock(module).should_receive('get_state_directory').and_return('/state')
+    flexmock(module).should_receive('snapshot_source').with_args(
+        '/working/foo', ('*.pyc',), {'/root/.borgmatic'}, {'/state'}
+    ).and_return({'paths': 1})
+    flexmock(module).should_receive('snapshot_source').with_args(
+        '/bar', ('*.pyc',), {'/root/.borgmatic'}, {'/state'}
+    ).and_return(None)
+
+    assert module.take_snapshot(
+        ('foo', '/bar'), ('*.pyc',), ['/root/.borgmatic'], working_directory='/working'
+    ) == {'foo': {'paths': 1}, '/bar': None}
+
+
+def test_read_snapshot_with_missing_file_returns_none():
+    builtins = flexmock(sys.modules['builtins'])
+    builtins.should_receive('open').with_args('/state/snapshot.json').and_raise(FileNotFoundError)
+
+    assert module.read_snapshot('/state/snapshot.json') is None
+
+
+def test_write_snapshot_with_unwritable_directory_warns():
+    flexmock(module.os).should_receive('makedirs').and_raise(PermissionError)
+    flexmock(module.logger).should_receive('warning').once()
+
+    module.write_snapshot('/state/source_snapshots/snapshot.json', {})
@@ -12,38 +12,165 @@ VERSION = '1.2.3'
 
 def insert_execute_command_mock(command, borg_local_path='borg', version_output=f'borg {VERSION}'):
     flexmock(module).should_receive('execute_command').with_args(
-        command, output_log_level=None, borg_local_path=borg_local_path
+        command, output_log_level=None, borg_local_path=borg_local_path, extra_environment=None
     ).once().and_return(version_output)
 
 
 def test_local_borg_version_calls_borg_with_required_parameters():
+    flexmock(module).should_receive('cached_borg_version').and_return((None, None, None))
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', '--version'))
 
-    assert module.local_borg_version() == VERSION
+    assert module.local_borg_version({}) == VERSION
 
 
 def test_local_borg_version_with_log_info_calls_borg_with_info_parameter():
+    flexmock(module).should_receive('cached_borg_version').and_return((None, None, None))
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', '--version', '--info'))
     insert_logging_mock(logging.INFO)
 
-    assert module.local_borg_version() == VERSION
+    assert module.local_borg_version({}) == VERSION
 
 
 def test_local_borg_version_with_log_debug_calls_borg_with_debug_parameters():
+    flexmock(module).should_receive('cached_borg_version').and_return((None, None, None))
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', '--version', '--debug', '--show-rc'))
     insert_logging_mock(logging.DEBUG)
 
-    assert module.local_borg_version() == VERSION
+    assert module.local_borg_version({}) == VERSION
 
 
 def test_local_borg_version_with_local_borg_path_calls_borg_with_it():
+    flexmock(module).should_receive('cached_borg_version').and_return((None, None, None))
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg1', '--version'), borg_local_path='borg1')
 
-    assert module.local_borg_version('borg1') == VERSION
+    assert module.local_borg_version({}, 'borg1') == VERSION
 
 
 def test_local_borg_version_with_invalid_version_raises():
+    flexmock(module).should_receive('cached_borg_version').and_return((None, None, None))
+    flexmock(module.environment).should_receive('make_environment')
     insert_execute_command_mock(('borg', '--version'), version_output='wtf')
 
     with pytest.raises(ValueError):
-        module.local_borg_version()
+        module.local_borg_version({})
+
+
+def test_local_borg_version_with_cached_version_does_not_call_borg():
+    flexmock(module).should_receive('cached_borg_version').and_return(
+        ('/usr/bin/borg', {'inode': 1}, VERSION)
+    )
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module).should_receive('write_version_cache').never()
+
+    assert module.local_borg_version({}) == VERSION
+
+
+def test_local_borg_version_without_cached_version_caches_version():
+    identity = {'inode': 1, 'size': 2, 'mtime_ns': 3}
+    flexmock(module).should_receive('cached_borg_version').and_return(
+        ('/usr/bin/borg', identity, None)
+    )
+    flexmock(module.environment).should_receive('make_environment')
+    insert_execute_command_mock(('borg', '--version'))
+    flexmock(module).should_receive('get_version_cache_path').and_return('/cache.json')
+    flexmock(module).should_receive('write_version_cache').with_args(
+        '/cache.json', '/usr/bin/borg', identity, VERSION
+    ).once()
+    cached_versions = {}
+    flexmock(module, CACHED_VERSIONS=cached_versions)
+
+    assert module.local_borg_version({}) == VERSION
+    assert cached_versions == {'/usr/bin/borg': dict(identity, version=VERSION)}
+
+
+def test_get_version_cache_path_uses_xdg_cache_home():
+    flexmock(module.os).should_receive('getenv').with_args('XDG_CACHE_HOME').and_return('/cache')
+
+    assert module.get_version_cache_path() == '/cache/borgmatic/borg_versions.json'
+
+
+def test_get_version_cache_path_without_xdg_cache_home_uses_home_directory():
+    flexmock(module.os).should_receive('getenv').with_args('XDG_CACHE_HOME').and_return(None)
+    flexmock(module.os.path).should_receive('expanduser').with_args('~').and_return('/home/user')
+
+    assert module.get_version_cache_path() == '/home/user/.cache/borgmatic/borg_versions.json'
+
+
+def test_binary_identity_returns_resolved_path_and_stat_fields():
+    flexmock(module.shutil).should_receive('which').with_args('borg').and_return('/usr/bin/borg')
+    flexmock(module.os.path).should_receive('realpath').and_return('/opt/borg/borg')
+    flexmock(module.os).should_receive('stat').with_args('/opt/borg/borg').and_return(
+        flexmock(st_ino=1, st_size=2, st_mtime_ns=3)
+    )
+
+    assert module.binary_identity('borg') == (
+        '/opt/borg/borg',
+        {'inode': 1, 'size': 2, 'mtime_ns': 3},
+    )
+
+
+def test_binary_identity_with_missing_binary_returns_none():
+    flexmock(module.shutil).should_receive('which').and_return(None)
+
+    assert module.binary_identity('borg') == (None, None)
+
+
+@pytest.mark.parametrize(
+    'cached,expected_result',
+    (
+        ({'inode': 1, 'size': 2, 'mtime_ns': 3, 'version': VERSION}, True),
+        ({'inode': 1, 'size': 2, 'mtime_ns': 4, 'version': VERSION}, False),
+        ({'version': VERSION}, False),
+        (None, False),
+        ('junk', False),
+    ),
+)
+def test_cached_identity_matches_compares_identity(cached, expected_result):
+    assert (
+        module.cached_identity_matches(cached, {'inode': 1, 'size': 2, 'mtime_ns': 3})
+        == expected_result
+    )
+
+
+def test_cached_borg_version_with_version_cached_in_memory_does_not_read_cache_file():
+    identity = {'inode': 1}
+    flexmock(module).should_receive('binary_identity').and_return(('/usr/bin/borg', identity))
+    flexmock(module, CACHED_VERSIONS={'/usr/bin/borg': {'inode': 1, 'version': VERSION}})
+    flexmock(module).should_receive('read_version_cache').never()
+
+    assert module.cached_borg_version('borg') == ('/usr/bin/borg', identity, VERSION)
+
+
+def test_cached_borg_version_with_version_cached_on_disk_remembers_it():
+    identity = {'inode': 1}
+    cached_versions = {}
+    flexmock(module).should_receive('binary_identity').and_return(('/usr/bin/borg', identity))
+    flexmock(module, CACHED_VERSIONS=cached_versions)
+    flexmock(module).should_receive('read_version_cache').and_return(
+        {'/usr/bin/borg': {'inode': 1, 'version': VERSION}}
+    )
+
+    assert module.cached_borg_version('borg') == ('/usr/bin/borg', identity, VERSION)
+    assert cached_versions == {'/usr/bin/borg': {'inode': 1, 'version': VERSION}}
+
+
+def test_cached_borg_version_with_changed_binary_returns_no_version():
+    identity = {'inode': 2}
+    flexmock(module).should_receive('binary_identity').and_return(('/usr/bin/borg', identity))
+    flexmock(module, CACHED_VERSIONS={'/usr/bin/borg': {'inode': 1, 'version': VERSION}})
+    flexmock(module).should_receive('read_version_cache').and_return(
+        {'/usr/bin/borg': {'inode': 1, 'version': VERSION}}
+    )
+
+    assert module.cached_borg_version('borg') == ('/usr/bin/borg', identity, None)
+
+
+def test_cached_borg_version_with_missing_binary_returns_nothing():
+    flexmock(module).should_receive('binary_identity').and_return((None, None))
+    flexmock(module).should_receive('read_version_cache').never()
+
+    assert module.cached_borg_version('borg') == (None, None, None)
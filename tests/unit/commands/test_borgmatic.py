@@ -2,6 +2,7 @@ import logging
 import subprocess
 import time
 
+import pytest
 from flexmock import flexmock
 
 import borgmatic.hooks.command
@@ -9,14 +10,19 @@ from borgmatic.commands import borgmatic as module
 
 
 def test_run_configuration_runs_actions_for_each_repository():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     expected_results = [flexmock(), flexmock()]
     flexmock(module).should_receive('run_actions').and_return(expected_results[:1]).and_return(
         expected_results[1:]
     )
+    flexmock(module.metrics).should_receive('record_repository_result').with_args(
+        'test.yaml', 'foo', True
+    ).once()
+    flexmock(module.metrics).should_receive('record_repository_result').with_args(
+        'test.yaml', 'bar', True
+    ).once()
     config = {'location': {'repositories': ['foo', 'bar']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1)}
+    arguments = {'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False)}
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -24,19 +30,20 @@ def test_run_configuration_runs_actions_for_each_repository():
 
 
 def test_run_configuration_with_invalid_borg_version_errors():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_raise(ValueError)
     flexmock(module.command).should_receive('execute_hook').never()
     flexmock(module.dispatch).should_receive('call_hooks').never()
     flexmock(module).should_receive('run_actions').never()
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'prune': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'prune': flexmock(),
+    }
 
     list(module.run_configuration('test.yaml', config, arguments))
 
 
 def test_run_configuration_logs_monitor_start_error():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.dispatch).should_receive('call_hooks').and_raise(OSError).and_return(
         None
@@ -45,7 +52,10 @@ def test_run_configuration_logs_monitor_start_error():
     flexmock(module).should_receive('log_error_records').and_return(expected_results)
     flexmock(module).should_receive('run_actions').never()
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -53,14 +63,16 @@ def test_run_configuration_logs_monitor_start_error():
 
 
 def test_run_configuration_bails_for_monitor_start_soft_failure():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
     flexmock(module.dispatch).should_receive('call_hooks').and_raise(error)
     flexmock(module).should_receive('log_error_records').never()
     flexmock(module).should_receive('run_actions').never()
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -68,23 +80,109 @@ def test_run_configuration_bails_for_monitor_start_soft_failure():
 
 
 def test_run_configuration_logs_actions_error():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module.dispatch).should_receive('call_hooks')
     expected_results = [flexmock()]
     flexmock(module).should_receive('log_error_records').and_return(expected_results)
     flexmock(module).should_receive('run_actions').and_raise(OSError)
+    flexmock(module.metrics).should_receive('record_repository_result').with_args(
+        'test.yaml', 'foo', False
+    ).once()
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False)}
+    arguments = {'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False)}
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
     assert results == expected_results
 
 
+def test_run_configuration_with_history_database_records_run():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    flexmock(module).should_receive('run_actions').and_return([])
+    flexmock(module.history).should_receive('record_run').with_args(
+        'history.db', 'test.yaml', None
+    ).and_return([]).once()
+    flexmock(module.command).should_receive('execute_hook').never()
+    config = {'location': {'repositories': ['foo']}, 'hooks': {'history_database': 'history.db'}}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    assert list(module.run_configuration('test.yaml', config, arguments)) == []
+
+
+def test_run_configuration_with_history_database_and_dry_run_does_not_record_run():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    flexmock(module).should_receive('run_actions').and_return([])
+    flexmock(module.history).should_receive('record_run').never()
+    config = {'location': {'repositories': ['foo']}, 'hooks': {'history_database': 'history.db'}}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=True),
+        'create': flexmock(),
+    }
+
+    assert list(module.run_configuration('test.yaml', config, arguments)) == []
+
+
+def test_run_configuration_with_throughput_regression_logs_warning():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    flexmock(module).should_receive('run_actions').and_return([])
+    flexmock(module.history).should_receive('record_run').and_return([('foo', 'Slow')])
+    flexmock(module.logger).should_receive('warning').with_args('foo: Slow').once()
+    flexmock(module).should_receive('log_error_records').never()
+    config = {
+        'location': {'repositories': ['foo']},
+        'hooks': {'history_database': 'history.db', 'throughput_regression': {'percent': 50}},
+    }
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    assert list(module.run_configuration('test.yaml', config, arguments)) == []
+
+
+def test_run_configuration_with_failing_throughput_regression_logs_error_and_runs_error_hooks():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    flexmock(module).should_receive('run_actions').and_return([])
+    flexmock(module.history).should_receive('record_run').and_return([('foo', 'Slow')])
+    expected_results = [flexmock()]
+    flexmock(module).should_receive('log_error_records').with_args(
+        'foo: Throughput regression', ValueError
+    ).and_return(expected_results)
+    flexmock(module.command).should_receive('execute_hook').with_args(
+        None,
+        None,
+        'test.yaml',
+        'on-error',
+        False,
+        extra_environment=dict,
+        repository='foo',
+        error=ValueError,
+        output='',
+    ).once()
+    config = {
+        'location': {'repositories': ['foo']},
+        'hooks': {
+            'history_database': 'history.db',
+            'throughput_regression': {'percent': 50, 'fail': True},
+        },
+    }
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    assert list(module.run_configuration('test.yaml', config, arguments)) == expected_results
+
+
 def test_run_configuration_bails_for_actions_soft_failure():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.dispatch).should_receive('call_hooks')
     error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
@@ -92,15 +190,56 @@ def test_run_configuration_bails_for_actions_soft_failure():
     flexmock(module).should_receive('log_error_records').never()
     flexmock(module.command).should_receive('considered_soft_failure').and_return(True)
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == []
+
+
+def test_run_configuration_removes_spooled_database_dumps_after_soft_failure():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
+    flexmock(module).should_receive('run_actions').and_raise(error)
+    flexmock(module.command).should_receive('considered_soft_failure').and_return(True)
+    flexmock(module).should_receive('remove_spooled_database_dumps').with_args(
+        'test.yaml', {'repositories': ['foo']}, {}, False
+    ).once()
+    config = {'location': {'repositories': ['foo']}}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
     assert results == []
 
 
+def test_run_configuration_logs_remove_spooled_database_dumps_error():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    flexmock(module).should_receive('run_actions').and_return([])
+    flexmock(module).should_receive('remove_spooled_database_dumps').and_raise(OSError)
+    expected_results = [flexmock()]
+    flexmock(module).should_receive('log_error_records').and_return(expected_results)
+    flexmock(module.command).should_receive('execute_hook')
+    config = {'location': {'repositories': ['foo']}}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == expected_results
+
+
 def test_run_configuration_logs_monitor_finish_error():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.dispatch).should_receive('call_hooks').and_return(None).and_return(
         None
@@ -109,7 +248,10 @@ def test_run_configuration_logs_monitor_finish_error():
     flexmock(module).should_receive('log_error_records').and_return(expected_results)
     flexmock(module).should_receive('run_actions').and_return([])
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -117,7 +259,6 @@ def test_run_configuration_logs_monitor_finish_error():
 
 
 def test_run_configuration_bails_for_monitor_finish_soft_failure():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
     flexmock(module.dispatch).should_receive('call_hooks').and_return(None).and_return(
@@ -127,7 +268,10 @@ def test_run_configuration_bails_for_monitor_finish_soft_failure():
     flexmock(module).should_receive('run_actions').and_return([])
     flexmock(module.command).should_receive('considered_soft_failure').and_return(True)
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -135,7 +279,6 @@ def test_run_configuration_bails_for_monitor_finish_soft_failure():
 
 
 def test_run_configuration_logs_on_error_hook_error():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook').and_raise(OSError)
     expected_results = [flexmock(), flexmock()]
@@ -144,7 +287,10 @@ def test_run_configuration_logs_on_error_hook_error():
     ).and_return(expected_results[1:])
     flexmock(module).should_receive('run_actions').and_raise(OSError)
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -152,7 +298,6 @@ def test_run_configuration_logs_on_error_hook_error():
 
 
 def test_run_configuration_bails_for_on_error_hook_soft_failure():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
     flexmock(module.command).should_receive('execute_hook').and_raise(error)
@@ -160,7 +305,10 @@ def test_run_configuration_bails_for_on_error_hook_soft_failure():
     flexmock(module).should_receive('log_error_records').and_return(expected_results)
     flexmock(module).should_receive('run_actions').and_raise(OSError)
     config = {'location': {'repositories': ['foo']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
 
     results = list(module.run_configuration('test.yaml', config, arguments))
 
@@ -169,20 +317,21 @@ def test_run_configuration_bails_for_on_error_hook_soft_failure():
 
 def test_run_configuration_retries_soft_error():
     # Run action first fails, second passes
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).and_return([])
     flexmock(module).should_receive('log_error_records').and_return([flexmock()]).once()
     config = {'location': {'repositories': ['foo']}, 'storage': {'retries': 1}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
     results = list(module.run_configuration('test.yaml', config, arguments))
     assert results == []
 
 
 def test_run_configuration_retries_hard_error():
     # Run action fails twice
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).times(2)
@@ -197,13 +346,15 @@ def test_run_configuration_retries_hard_error():
         'foo: Error running actions for repository', OSError,
     ).and_return(error_logs)
     config = {'location': {'repositories': ['foo']}, 'storage': {'retries': 1}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
     results = list(module.run_configuration('test.yaml', config, arguments))
     assert results == error_logs
 
 
 def test_run_repos_ordered():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).times(2)
@@ -215,13 +366,15 @@ def test_run_repos_ordered():
         'bar: Error running actions for repository', OSError
     ).and_return(expected_results[1:]).ordered()
     config = {'location': {'repositories': ['foo', 'bar']}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
     results = list(module.run_configuration('test.yaml', config, arguments))
     assert results == expected_results
 
 
 def test_run_configuration_retries_round_robbin():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).times(4)
@@ -246,13 +399,15 @@ def test_run_configuration_retries_round_robbin():
         'bar: Error running actions for repository', OSError
     ).and_return(bar_error_logs).ordered()
     config = {'location': {'repositories': ['foo', 'bar']}, 'storage': {'retries': 1}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
     results = list(module.run_configuration('test.yaml', config, arguments))
     assert results == foo_error_logs + bar_error_logs
 
 
 def test_run_configuration_retries_one_passes():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).and_raise(OSError).and_return(
@@ -275,13 +430,15 @@ def test_run_configuration_retries_one_passes():
         'bar: Error running actions for repository', OSError
     ).and_return(error_logs).ordered()
     config = {'location': {'repositories': ['foo', 'bar']}, 'storage': {'retries': 1}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
     results = list(module.run_configuration('test.yaml', config, arguments))
     assert results == error_logs
 
 
 def test_run_configuration_retry_wait():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).times(4)
@@ -314,13 +471,15 @@ def test_run_configuration_retry_wait():
         'foo: Error running actions for repository', OSError
     ).and_return(error_logs).ordered()
     config = {'location': {'repositories': ['foo']}, 'storage': {'retries': 3, 'retry_wait': 10}}
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
     results = list(module.run_configuration('test.yaml', config, arguments))
     assert results == error_logs
 
 
 def test_run_configuration_retries_timeout_multiple_repos():
-    flexmock(module.borg_environment).should_receive('initialize')
     flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
     flexmock(module.command).should_receive('execute_hook')
     flexmock(module).should_receive('run_actions').and_raise(OSError).and_raise(OSError).and_return(
@@ -339,31 +498,802 @@ def test_run_configuration_retries_timeout_multiple_repos():
         log_command_error_output=True,
     ).and_return([flexmock()]).ordered()
 
-    # Sleep before retrying foo (and passing)
-    flexmock(time).should_receive('sleep').with_args(10).and_return().ordered()
+    # Sleep before retrying foo (and passing)
+    flexmock(time).should_receive('sleep').with_args(10).and_return().ordered()
+
+    # Sleep before retrying bar (and failing)
+    flexmock(time).should_receive('sleep').with_args(10).and_return().ordered()
+    error_logs = [flexmock()]
+    flexmock(module).should_receive('log_error_records').with_args(
+        'bar: Error running actions for repository', OSError
+    ).and_return(error_logs).ordered()
+    config = {
+        'location': {'repositories': ['foo', 'bar']},
+        'storage': {'retries': 1, 'retry_wait': 10},
+    }
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+    results = list(module.run_configuration('test.yaml', config, arguments))
+    assert results == error_logs
+
+
+def test_run_configuration_with_repository_concurrency_runs_repositories_concurrently():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    expected_results = [flexmock(), flexmock()]
+    flexmock(module).should_receive('run_repositories_concurrently').replace_with(
+        lambda *args, **kwargs: [
+            ('foo', (expected_results[:1], None)),
+            ('bar', (expected_results[1:], None)),
+        ]
+    )
+    flexmock(module).should_receive('run_actions').never()
+    flexmock(module.metrics).should_receive('record_repository_result').twice()
+    config = {
+        'location': {'repositories': ['foo', 'bar']},
+        'storage': {'repository_concurrency': 2},
+    }
+    arguments = {'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False)}
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == expected_results
+
+
+def test_run_configuration_with_repository_jobs_overrides_repository_concurrency():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module).should_receive('run_repositories_concurrently').replace_with(
+        lambda repository_paths, concurrency, *args, **kwargs: [
+            (repository_path, ([concurrency], None)) for repository_path in repository_paths
+        ]
+    )
+    flexmock(module).should_receive('run_actions').never()
+    config = {
+        'location': {'repositories': ['foo', 'bar']},
+        'storage': {'repository_concurrency': 2},
+    }
+    arguments = {'global': flexmock(monitoring_verbosity=1, repository_jobs=3, dry_run=False)}
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == [3, 3]
+
+
+def test_run_configuration_with_repository_concurrency_and_single_repository_runs_sequentially():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module).should_receive('run_repositories_concurrently').never()
+    expected_results = [flexmock()]
+    flexmock(module).should_receive('run_actions').and_return(expected_results)
+    config = {'location': {'repositories': ['foo']}, 'storage': {'repository_concurrency': 2}}
+    arguments = {'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False)}
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == expected_results
+
+
+def test_run_configuration_with_repository_concurrency_logs_repository_errors_in_order():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.command).should_receive('execute_hook')
+    flexmock(module.dispatch).should_receive('call_hooks')
+    flexmock(module).should_receive('run_repositories_concurrently').and_return(
+        [('foo', ([], OSError())), ('bar', ([], OSError()))]
+    )
+    foo_error_logs = [flexmock()]
+    flexmock(module).should_receive('log_error_records').with_args(
+        'foo: Error running actions for repository', OSError
+    ).and_return(foo_error_logs).ordered()
+    bar_error_logs = [flexmock()]
+    flexmock(module).should_receive('log_error_records').with_args(
+        'bar: Error running actions for repository', OSError
+    ).and_return(bar_error_logs).ordered()
+    config = {
+        'location': {'repositories': ['foo', 'bar']},
+        'storage': {'repository_concurrency': 2},
+    }
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == foo_error_logs + bar_error_logs
+
+
+def test_run_configuration_with_repository_concurrency_bails_for_soft_failure():
+    flexmock(module.borg_version).should_receive('local_borg_version').and_return(flexmock())
+    flexmock(module.dispatch).should_receive('call_hooks')
+    error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
+    expected_results = [flexmock()]
+    flexmock(module).should_receive('run_repositories_concurrently').and_return(
+        [('foo', ([], error)), ('bar', (expected_results, None)), ('baz', (None, None))]
+    )
+    flexmock(module).should_receive('log_error_records').never()
+    config = {
+        'location': {'repositories': ['foo', 'bar', 'baz']},
+        'storage': {'repository_concurrency': 2},
+    }
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, repository_jobs=None, dry_run=False),
+        'create': flexmock(),
+    }
+
+    results = list(module.run_configuration('test.yaml', config, arguments))
+
+    assert results == expected_results
+
+
+def test_run_repository_with_retries_returns_results():
+    expected_results = [flexmock()]
+    flexmock(module).should_receive('run_actions').and_return(expected_results)
+    flexmock(module).should_receive('set_log_prefix').with_args('foo').once()
+    flexmock(module).should_receive('set_log_prefix').with_args(None).once()
+    flexmock(module).should_receive('set_log_config_filename').with_args('test.yaml').once()
+    flexmock(module).should_receive('set_log_config_filename').with_args(None).once()
+
+    assert module.run_repository_with_retries(
+        repository_path='foo', retries=0, retry_wait=0, config_filename='test.yaml'
+    ) == (expected_results, None)
+
+
+def test_run_repository_with_retries_with_soft_failure_event_set_skips_actions():
+    flexmock(module).should_receive('run_actions').never()
+    soft_failure_event = flexmock(is_set=lambda: True)
+
+    assert module.run_repository_with_retries(
+        repository_path='foo',
+        retries=0,
+        retry_wait=0,
+        soft_failure_event=soft_failure_event,
+        config_filename='test.yaml',
+    ) == (None, None)
+
+
+def test_run_repository_with_retries_with_soft_failure_sets_soft_failure_event():
+    error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
+    flexmock(module).should_receive('run_actions').and_raise(error)
+    flexmock(module).should_receive('set_log_prefix')
+    soft_failure_event = flexmock(is_set=lambda: False)
+    soft_failure_event.should_receive('set').once()
+
+    assert module.run_repository_with_retries(
+        repository_path='foo',
+        retries=0,
+        retry_wait=0,
+        soft_failure_event=soft_failure_event,
+        config_filename='test.yaml',
+    ) == ([], error)
+
+
+def test_run_repository_with_retries_with_other_error_does_not_set_soft_failure_event():
+    error = OSError()
+    flexmock(module).should_receive('run_actions').and_raise(error)
+    flexmock(module).should_receive('log_error_records').and_return([flexmock()])
+    flexmock(module).should_receive('set_log_prefix')
+    soft_failure_event = flexmock(is_set=lambda: False)
+    soft_failure_event.should_receive('set').never()
+
+    assert module.run_repository_with_retries(
+        repository_path='foo',
+        retries=0,
+        retry_wait=0,
+        soft_failure_event=soft_failure_event,
+        config_filename='test.yaml',
+    ) == ([], error)
+
+
+def test_run_repository_with_retries_retries_error_with_wait():
+    expected_results = [flexmock()]
+    flexmock(module).should_receive('run_actions').and_raise(OSError).and_return(expected_results)
+    flexmock(module).should_receive('log_error_records').with_args(
+        'foo: Error running actions for repository',
+        OSError,
+        levelno=logging.WARNING,
+        log_command_error_output=True,
+    ).and_return([flexmock()]).once()
+    flexmock(time).should_receive('sleep').with_args(10).once()
+
+    assert module.run_repository_with_retries(
+        repository_path='foo', retries=1, retry_wait=10, config_filename='test.yaml'
+    ) == (expected_results, None)
+
+
+def test_run_repository_with_retries_returns_error_after_final_retry():
+    error = OSError()
+    flexmock(module).should_receive('run_actions').and_raise(error).times(2)
+    flexmock(module).should_receive('log_error_records').and_return([flexmock()]).once()
+    flexmock(module).should_receive('set_log_prefix')
+
+    assert module.run_repository_with_retries(
+        repository_path='foo', retries=1, retry_wait=0, config_filename='test.yaml'
+    ) == ([], error)
+
+
+def test_run_repositories_concurrently_returns_results_in_repository_order():
+    flexmock(module).should_receive('run_repository_with_retries').replace_with(
+        lambda repository_path, **kwargs: ([repository_path], None)
+    )
+
+    assert module.run_repositories_concurrently(
+        ['foo', 'bar', 'baz'], 2, 0, 0, config_filename='test.yaml'
+    ) == [('foo', (['foo'], None)), ('bar', (['bar'], None)), ('baz', (['baz'], None))]
+
+
+def test_run_repositories_concurrently_with_soft_failure_skips_repositories_not_yet_started():
+    error = subprocess.CalledProcessError(borgmatic.hooks.command.SOFT_FAIL_EXIT_CODE, 'try again')
+    flexmock(module).should_receive('run_actions').and_raise(error).once()
+    flexmock(module).should_receive('set_log_prefix')
+
+    assert module.run_repositories_concurrently(
+        ['foo', 'bar', 'baz'], 1, 0, 0, config_filename='test.yaml'
+    ) == [('foo', ([], error)), ('bar', (None, None)), ('baz', (None, None))]
+
+
+def test_run_configuration_with_log_prefix_sets_and_clears_log_prefix():
+    flexmock(module).should_receive('set_log_prefix').with_args('test.yaml').once()
+    flexmock(module).should_receive('set_log_prefix').with_args(None).once()
+    flexmock(module).should_receive('set_log_config_filename').with_args('test.yaml').once()
+    flexmock(module).should_receive('set_log_config_filename').with_args(None).once()
+    flexmock(module).should_receive('run_configuration').and_return(iter(['result']))
+
+    assert module.run_configuration_with_log_prefix('test.yaml', {}, {}) == ['result']
+
+
+def test_remove_spooled_database_dumps_removes_dumps_spooled_for_config_file():
+    flexmock(module.dump, SPOOLED_DUMPS_CONFIG_FILENAME='test.yaml')
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'remove_database_dumps',
+        {'postgresql_databases': [{'name': 'foo'}]},
+        'test.yaml',
+        module.dump.DATABASE_HOOK_NAMES,
+        {},
+        False,
+    ).once()
+    flexmock(module.manifest).should_receive('remove_manifest').with_args(
+        {}, 'test.yaml', False
+    ).once()
+
+    module.remove_spooled_database_dumps(
+        'test.yaml', {}, {'postgresql_databases': [{'name': 'foo'}]}, dry_run=False
+    )
+
+    assert module.dump.SPOOLED_DUMPS_CONFIG_FILENAME is None
+
+
+def test_remove_spooled_database_dumps_leaves_dumps_spooled_for_other_config_file():
+    flexmock(module.dump, SPOOLED_DUMPS_CONFIG_FILENAME='other.yaml')
+    flexmock(module.dispatch).should_receive('call_hooks').never()
+
+    module.remove_spooled_database_dumps(
+        'test.yaml', {}, {'postgresql_databases': [{'name': 'foo'}]}, dry_run=False
+    )
+
+    assert module.dump.SPOOLED_DUMPS_CONFIG_FILENAME == 'other.yaml'
+
+
+def test_add_separately_dumped_databases_adds_unconfigured_names_for_separate_all_database():
+    databases = [{'name': 'all', 'separate_dumps': True, 'hostname': 'db'}, {'name': 'foo'}]
+
+    assert module.add_separately_dumped_databases(
+        databases, ['foo', 'bar', 'baz'], {'all', 'foo', 'baz'}
+    ) == databases + [{'name': 'bar', 'separate_dumps': True, 'hostname': 'db'}]
+
+
+def test_add_separately_dumped_databases_without_separate_dumps_adds_nothing():
+    databases = [{'name': 'all'}]
+
+    assert module.add_separately_dumped_databases(databases, ['bar'], {'all'}) == databases
+
+
+def test_restore_database_dumps_concurrently_restores_each_database_from_disk_and_then_analyzes():
+    calls = []
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'restore_database_dump',
+        {'postgresql_databases': [{'name': 'foo', 'analyze': False}]},
+        'repo',
+        module.dump.DATABASE_HOOK_NAMES,
+        {},
+        False,
+        None,
+    ).replace_with(lambda *args: calls.append('restore')).once()
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'analyze_database',
+        {'postgresql_databases': [{'name': 'foo'}]},
+        'repo',
+        module.dump.DATABASE_HOOK_NAMES,
+        {},
+        False,
+    ).replace_with(lambda *args: calls.append('analyze')).once()
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'restore_database_dump',
+        {'mysql_databases': [{'name': 'bar'}]},
+        'repo',
+        module.dump.DATABASE_HOOK_NAMES,
+        {},
+        False,
+        None,
+    ).once()
+
+    module.restore_database_dumps_concurrently(
+        [('postgresql_databases', {'name': 'foo'}), ('mysql_databases', {'name': 'bar'})],
+        'repo',
+        {},
+        False,
+        jobs=2,
+    )
+
+    assert calls == ['restore', 'analyze']
+
+
+def test_restore_database_dumps_concurrently_finishes_other_restores_before_raising_error():
+    restored = []
+
+    def restore(function_name, hooks, *args):
+        if 'postgresql_databases' in hooks:
+            raise ValueError()
+
+        restored.append(hooks)
+
+    flexmock(module.dispatch).should_receive('call_hooks').replace_with(restore)
+
+    with pytest.raises(ValueError):
+        module.restore_database_dumps_concurrently(
+            [('postgresql_databases', {'name': 'foo'}), ('mysql_databases', {'name': 'bar'})],
+            'repo',
+            {},
+            False,
+            jobs=1,
+        )
+
+    assert restored == [{'mysql_databases': [{'name': 'bar'}]}]
+
+
+def test_restore_database_dumps_concurrently_skips_analyze_for_database_with_analyze_off():
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'restore_database_dump',
+        {'postgresql_databases': [{'name': 'foo', 'analyze': False}]},
+        'repo',
+        module.dump.DATABASE_HOOK_NAMES,
+        {},
+        False,
+        None,
+    ).once()
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'analyze_database', object, object, object, object, object
+    ).never()
+
+    module.restore_database_dumps_concurrently(
+        [('postgresql_databases', {'name': 'foo', 'analyze': False})], 'repo', {}, False, jobs=2
+    )
+
+
+def test_report_create_progress_calls_progress_monitor_hooks_with_formatted_progress():
+    create_progress = flexmock()
+    flexmock(module.borg_progress).should_receive('format_progress').with_args(
+        create_progress
+    ).and_return('Progress: ...')
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'report_progress',
+        {'healthchecks': 'https://example.com'},
+        'test.yaml',
+        module.monitor.PROGRESS_MONITOR_HOOK_NAMES,
+        'Progress: ...',
+        False,
+    ).once()
+
+    module.report_create_progress(
+        'test.yaml', {'healthchecks': 'https://example.com'}, False, create_progress
+    )
+
+
+def test_run_configurations_without_jobs_runs_configurations_sequentially():
+    flexmock(module).should_receive('run_configuration_with_log_prefix').never()
+    flexmock(module).should_receive('run_configuration').replace_with(
+        lambda config_filename, config, arguments: iter([config_filename])
+    )
+    configs = {'foo.yaml': {}, 'bar.yaml': {}}
+    arguments = {'global': flexmock(jobs=1)}
+
+    assert list(module.run_configurations(configs, arguments)) == [
+        ('foo.yaml', ['foo.yaml']),
+        ('bar.yaml', ['bar.yaml']),
+    ]
+
+
+def test_run_configurations_with_jobs_returns_results_in_configuration_order():
+    flexmock(module).should_receive('run_configuration_with_log_prefix').replace_with(
+        lambda config_filename, config, arguments: [config_filename]
+    )
+    configs = {'foo.yaml': {}, 'bar.yaml': {}, 'baz.yaml': {}}
+    arguments = {'global': flexmock(jobs=2)}
+
+    assert list(module.run_configurations(configs, arguments)) == [
+        ('foo.yaml', ['foo.yaml']),
+        ('bar.yaml', ['bar.yaml']),
+        ('baz.yaml', ['baz.yaml']),
+    ]
+
+
+def test_run_actions_does_not_raise_for_init_action():
+    flexmock(module.borg_init).should_receive('initialize_repository')
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'init': flexmock(
+            encryption_mode=flexmock(), append_only=flexmock(), storage_quota=flexmock()
+        ),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_calls_hooks_for_prune_action():
+    flexmock(module.borg_prune).should_receive('prune_archives')
+    flexmock(module.command).should_receive('execute_hook').twice()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'prune': flexmock(stats=flexmock(), files=flexmock()),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_passes_borg_environment_to_hooks():
+    flexmock(module.borg_prune).should_receive('prune_archives')
+    flexmock(module.borg_environment).should_receive('make_environment').with_args(
+        {'encryption_passphrase': 'secret'}
+    ).and_return({'BORG_PASSPHRASE': 'secret'})
+    flexmock(module.command).should_receive('execute_hook').with_args(
+        None,
+        None,
+        'test.yaml',
+        str,
+        False,
+        extra_environment={'BORG_PASSPHRASE': 'secret'},
+        repository='repo',
+        repositories='repo',
+    ).twice()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'prune': flexmock(stats=flexmock(), files=flexmock()),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={'encryption_passphrase': 'secret'},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_calls_hooks_for_compact_action():
+    flexmock(module.borg_feature).should_receive('available').and_return(True)
+    flexmock(module.borg_compact).should_receive('compact_segments')
+    flexmock(module.command).should_receive('execute_hook').twice()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'compact': flexmock(progress=flexmock(), cleanup_commits=flexmock(), threshold=flexmock()),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_executes_and_calls_hooks_for_create_action():
+    flexmock(module.borg_create).should_receive('create_archive')
+    flexmock(module.command).should_receive('execute_hook').twice()
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({}).times(3)
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(
+            progress=flexmock(), stats=flexmock(), json=flexmock(), files=flexmock()
+        ),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_with_dump_once_per_run_spools_dumps_and_keeps_them():
+    flexmock(module.dump, SPOOLED_DUMPS_CONFIG_FILENAME=None)
+    process = flexmock()
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'remove_database_dumps', object, 'repo', object, object, False
+    ).once()
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'dump_databases',
+        object,
+        'repo',
+        object,
+        object,
+        False,
+        spool=True,
+        concurrency=2,
+        checksum_dumps=False,
+    ).and_return({'postgresql_databases': [process]}).once()
+    flexmock(module.manifest).should_receive('remove_manifest').once()
+    flexmock(module.manifest).should_receive('write_manifest').with_args(
+        {'repositories': ['repo']}, object, 'repo', False
+    ).once()
+    flexmock(module.metrics).should_receive('record_database_dump_durations').with_args(
+        'test.yaml', 'repo', {'postgresql_databases': [process]}
+    ).once()
+    create_archive_calls = []
+    flexmock(module.borg_create).should_receive('create_archive').replace_with(
+        lambda *args, **kwargs: create_archive_calls.append(kwargs)
+    )
+    flexmock(module.command).should_receive('execute_hook').twice()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={
+                'postgresql_databases': [{'name': 'foo'}],
+                'dump_once_per_run': True,
+                'dump_concurrency': 2,
+            },
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+    assert create_archive_calls[0]['stream_processes'] == []
+    assert module.dump.SPOOLED_DUMPS_CONFIG_FILENAME == 'test.yaml'
+
+
+def test_run_actions_streams_only_dumps_that_are_still_running():
+    running_process = flexmock(returncode=None)
+    finished_process = flexmock(returncode=0)
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({})
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'dump_databases',
+        object,
+        'repo',
+        object,
+        object,
+        False,
+        spool=False,
+        concurrency=None,
+        checksum_dumps=False,
+    ).and_return({'postgresql_databases': [running_process, finished_process]})
+    flexmock(module.manifest).should_receive('remove_manifest').twice()
+    flexmock(module.manifest).should_receive('write_manifest').once()
+    flexmock(module.metrics).should_receive('record_database_dump_durations')
+    create_archive_calls = []
+    flexmock(module.borg_create).should_receive('create_archive').replace_with(
+        lambda *args, **kwargs: create_archive_calls.append(kwargs)
+    )
+    flexmock(module.command).should_receive('execute_hook').twice()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={'postgresql_databases': [{'name': 'foo'}]},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+    assert create_archive_calls[0]['stream_processes'] == [running_process]
+
+
+def test_run_actions_with_checksum_dumps_records_checksums_of_streamed_dumps():
+    running_process = flexmock(returncode=None)
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({})
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'dump_databases',
+        object,
+        'repo',
+        object,
+        object,
+        False,
+        spool=False,
+        concurrency=None,
+        checksum_dumps=True,
+    ).and_return({'postgresql_databases': [running_process]})
+    flexmock(module.manifest).should_receive('remove_manifest')
+    flexmock(module.manifest).should_receive('write_manifest')
+    flexmock(module.metrics).should_receive('record_database_dump_durations')
+    flexmock(module.metrics).should_receive('record_archive_stats')
+    flexmock(module.borg_create).should_receive('create_archive').with_args(
+        False,
+        'repo',
+        object,
+        object,
+        object,
+        local_path=None,
+        remote_path=None,
+        json=False,
+        **{
+            'progress': False,
+            'stats': False,
+            'files': False,
+            'json_stats': True,
+            'stream_processes': [running_process],
+            'progress_callback': object,
+        }
+    ).and_return('{"archive": {"name": "archive"}}')
+    dump_checksums = {'/dump': {'checksum': 'blake2b:abc', 'size': 3}}
+    flexmock(module.checksum).should_receive('finish_checksummed_dumps').and_return(
+        dump_checksums
+    ).once()
+    flexmock(module).should_receive('record_dump_checksums').with_args(
+        'repo', '{"archive": {"name": "archive"}}', dump_checksums, {}, None, None
+    ).once()
+    flexmock(module.command).should_receive('execute_hook').twice()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={'postgresql_databases': [{'name': 'foo'}], 'checksum_dumps': True},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_with_checksum_dumps_finishes_checksummed_dumps_when_create_fails():
+    flexmock(module.dispatch).should_receive('call_hooks').and_return(
+        {'postgresql_databases': [flexmock(returncode=None)]}
+    )
+    flexmock(module.manifest).should_receive('remove_manifest')
+    flexmock(module.manifest).should_receive('write_manifest')
+    flexmock(module.borg_create).should_receive('create_archive').and_raise(OSError)
+    flexmock(module.checksum).should_receive('finish_checksummed_dumps').and_return({}).once()
+    flexmock(module).should_receive('record_dump_checksums').never()
+    flexmock(module.command).should_receive('execute_hook')
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
+    }
+
+    with pytest.raises(OSError):
+        list(
+            module.run_actions(
+                arguments=arguments,
+                config_filename='test.yaml',
+                location={'repositories': ['repo']},
+                storage={},
+                retention={},
+                consistency={},
+                hooks={'postgresql_databases': [{'name': 'foo'}], 'checksum_dumps': True},
+                local_path=None,
+                remote_path=None,
+                local_borg_version=None,
+                repository_path='repo',
+            )
+        )
+
+
+def test_record_dump_checksums_gets_archive_name_from_create_json_output():
+    flexmock(module.borg_list).should_receive('resolve_archive_name').never()
+    flexmock(module.checksum).should_receive('make_dump_entries').and_return([{'name': 'foo'}])
+    flexmock(module.checksum).should_receive('record_checksums').with_args(
+        'repo', 'archive', [{'name': 'foo'}], 'repo'
+    ).once()
+
+    module.record_dump_checksums(
+        'repo', '{"archive": {"name": "archive"}}', {'/dump': {}}, {}, 'borg', None
+    )
+
 
-    # Sleep before retrying bar (and failing)
-    flexmock(time).should_receive('sleep').with_args(10).and_return().ordered()
-    error_logs = [flexmock()]
-    flexmock(module).should_receive('log_error_records').with_args(
-        'bar: Error running actions for repository', OSError
-    ).and_return(error_logs).ordered()
-    config = {
-        'location': {'repositories': ['foo', 'bar']},
-        'storage': {'retries': 1, 'retry_wait': 10},
-    }
-    arguments = {'global': flexmock(monitoring_verbosity=1, dry_run=False), 'create': flexmock()}
-    results = list(module.run_configuration('test.yaml', config, arguments))
-    assert results == error_logs
+def test_record_dump_checksums_without_create_json_output_uses_latest_archive_name():
+    flexmock(module.borg_list).should_receive('resolve_archive_name').with_args(
+        'repo', 'latest', {}, 'borg', None
+    ).and_return('archive')
+    flexmock(module.checksum).should_receive('make_dump_entries').and_return([{'name': 'foo'}])
+    flexmock(module.checksum).should_receive('record_checksums').with_args(
+        'repo', 'archive', [{'name': 'foo'}], 'repo'
+    ).once()
 
+    module.record_dump_checksums('repo', None, {'/dump': {}}, {}, 'borg', None)
 
-def test_run_actions_does_not_raise_for_init_action():
-    flexmock(module.borg_init).should_receive('initialize_repository')
+
+def test_run_actions_with_dump_once_per_run_reuses_dumps_spooled_earlier_in_run():
+    flexmock(module.dump, SPOOLED_DUMPS_CONFIG_FILENAME='test.yaml')
+    flexmock(module.dispatch).should_receive('call_hooks').never()
+    flexmock(module.borg_create).should_receive('create_archive').once()
+    flexmock(module.command).should_receive('execute_hook').twice()
     arguments = {
         'global': flexmock(monitoring_verbosity=1, dry_run=False),
-        'init': flexmock(
-            encryption_mode=flexmock(), append_only=flexmock(), storage_quota=flexmock()
-        ),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
     }
 
     list(
@@ -374,7 +1304,7 @@ def test_run_actions_does_not_raise_for_init_action():
             storage={},
             retention={},
             consistency={},
-            hooks={},
+            hooks={'postgresql_databases': [{'name': 'foo'}], 'dump_once_per_run': True},
             local_path=None,
             remote_path=None,
             local_borg_version=None,
@@ -382,13 +1312,24 @@ def test_run_actions_does_not_raise_for_init_action():
         )
     )
 
+    assert module.dump.SPOOLED_DUMPS_CONFIG_FILENAME == 'test.yaml'
 
-def test_run_actions_calls_hooks_for_prune_action():
-    flexmock(module.borg_prune).should_receive('prune_archives')
+
+def test_run_actions_with_dump_once_per_run_backs_up_spooled_dumps_without_holding_lock():
+    flexmock(module.dump, SPOOLED_DUMPS_CONFIG_FILENAME='test.yaml', SPOOLED_DUMPS_READERS=0)
+    flexmock(module.dispatch).should_receive('call_hooks').never()
+
+    def create_archive(*args, **kwargs):
+        assert not module.dump.DATABASE_DUMP_LOCK.locked()
+        assert module.dump.SPOOLED_DUMPS_READERS == 1
+
+    flexmock(module.borg_create).should_receive('create_archive').replace_with(
+        create_archive
+    ).once()
     flexmock(module.command).should_receive('execute_hook').twice()
     arguments = {
         'global': flexmock(monitoring_verbosity=1, dry_run=False),
-        'prune': flexmock(stats=flexmock(), files=flexmock()),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
     }
 
     list(
@@ -399,7 +1340,7 @@ def test_run_actions_calls_hooks_for_prune_action():
             storage={},
             retention={},
             consistency={},
-            hooks={},
+            hooks={'postgresql_databases': [{'name': 'foo'}], 'dump_once_per_run': True},
             local_path=None,
             remote_path=None,
             local_borg_version=None,
@@ -407,14 +1348,30 @@ def test_run_actions_calls_hooks_for_prune_action():
         )
     )
 
-
-def test_run_actions_calls_hooks_for_compact_action():
-    flexmock(module.borg_feature).should_receive('available').and_return(True)
-    flexmock(module.borg_compact).should_receive('compact_segments')
+    assert module.dump.SPOOLED_DUMPS_READERS == 0
+
+
+def test_run_actions_with_dump_once_per_run_replaces_dumps_spooled_for_other_config_file():
+    flexmock(module.dump, SPOOLED_DUMPS_CONFIG_FILENAME='other.yaml')
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'remove_database_dumps', object, 'repo', object, object, False
+    ).once()
+    flexmock(module.dispatch).should_receive('call_hooks').with_args(
+        'dump_databases',
+        object,
+        'repo',
+        object,
+        object,
+        False,
+        spool=True,
+        concurrency=None,
+        checksum_dumps=False,
+    ).and_return({}).once()
+    flexmock(module.borg_create).should_receive('create_archive').once()
     flexmock(module.command).should_receive('execute_hook').twice()
     arguments = {
         'global': flexmock(monitoring_verbosity=1, dry_run=False),
-        'compact': flexmock(progress=flexmock(), cleanup_commits=flexmock(), threshold=flexmock()),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
     }
 
     list(
@@ -425,7 +1382,7 @@ def test_run_actions_calls_hooks_for_compact_action():
             storage={},
             retention={},
             consistency={},
-            hooks={},
+            hooks={'postgresql_databases': [{'name': 'foo'}], 'dump_once_per_run': True},
             local_path=None,
             remote_path=None,
             local_borg_version=None,
@@ -433,16 +1390,57 @@ def test_run_actions_calls_hooks_for_compact_action():
         )
     )
 
+    assert module.dump.SPOOLED_DUMPS_CONFIG_FILENAME == 'test.yaml'
 
-def test_run_actions_executes_and_calls_hooks_for_create_action():
-    flexmock(module.borg_create).should_receive('create_archive')
-    flexmock(module.command).should_receive('execute_hook').twice()
-    flexmock(module.dispatch).should_receive('call_hooks').and_return({}).times(3)
+
+def test_run_actions_with_metrics_textfile_records_archive_stats_without_yielding_json():
+    flexmock(module.borg_create).should_receive('create_archive').replace_with(
+        lambda *args, **kwargs: '{"archive": {}}'
+        if kwargs['json_stats'] is True and kwargs['json'] is False
+        else None
+    )
+    flexmock(module.command).should_receive('execute_hook')
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({})
+    flexmock(module.metrics).should_receive('record_database_dump_durations').once()
+    flexmock(module.metrics).should_receive('record_archive_stats').with_args(
+        'test.yaml', 'repo', '{"archive": {}}'
+    ).once()
     arguments = {
         'global': flexmock(monitoring_verbosity=1, dry_run=False),
-        'create': flexmock(
-            progress=flexmock(), stats=flexmock(), json=flexmock(), files=flexmock()
-        ),
+        'create': flexmock(progress=False, stats=False, json=False, files=False),
+    }
+
+    results = list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={'metrics_textfile': '/tmp/borgmatic.prom'},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+    assert results == []
+
+
+def test_run_actions_with_metrics_textfile_and_stats_does_not_request_json():
+    flexmock(module.borg_create).should_receive('create_archive').replace_with(
+        lambda *args, **kwargs: None
+        if kwargs['json'] is False and kwargs['json_stats'] is False
+        else 'unexpected'
+    )
+    flexmock(module.command).should_receive('execute_hook')
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({})
+    flexmock(module.metrics).should_receive('record_archive_stats').never()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=True, json=False, files=False),
     }
 
     list(
@@ -453,7 +1451,41 @@ def test_run_actions_executes_and_calls_hooks_for_create_action():
             storage={},
             retention={},
             consistency={},
-            hooks={},
+            hooks={'metrics_textfile': '/tmp/borgmatic.prom'},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_with_metrics_textfile_and_files_requests_json_stats():
+    flexmock(module.borg_create).should_receive('create_archive').replace_with(
+        lambda *args, **kwargs: '{"archive": {}}'
+        if kwargs['json_stats'] is True and kwargs['files'] is True
+        else None
+    )
+    flexmock(module.command).should_receive('execute_hook')
+    flexmock(module.dispatch).should_receive('call_hooks').and_return({})
+    flexmock(module.metrics).should_receive('record_database_dump_durations')
+    flexmock(module.metrics).should_receive('record_archive_stats').with_args(
+        'test.yaml', 'repo', '{"archive": {}}'
+    ).once()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'create': flexmock(progress=False, stats=False, json=False, files=True),
+    }
+
+    results = list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={'metrics_textfile': '/tmp/borgmatic.prom'},
             local_path=None,
             remote_path=None,
             local_borg_version=None,
@@ -461,6 +1493,8 @@ def test_run_actions_executes_and_calls_hooks_for_create_action():
         )
     )
 
+    assert results == []
+
 
 def test_run_actions_calls_hooks_for_check_action():
     flexmock(module.checks).should_receive('repository_enabled_for_checks').and_return(True)
@@ -638,6 +1672,156 @@ def test_run_actions_does_not_raise_for_info_action():
     )
 
 
+def test_run_actions_with_verify_dumps_action_verifies_dumps():
+    flexmock(module.validate).should_receive('repositories_match').and_return(True)
+    flexmock(module.borg_list).should_receive('resolve_archive_name').and_return('archive')
+    flexmock(module.manifest).should_receive('read_archive_manifest').and_return(None)
+    flexmock(module.checksum).should_receive('find_dumps_to_verify').with_args(
+        'repo', 'archive', None, ['foo']
+    ).and_return([{'name': 'foo'}])
+    flexmock(module.checksum).should_receive('verify_dumps').with_args(
+        'repo',
+        'archive',
+        [{'name': 'foo'}],
+        {'repositories': ['repo']},
+        {},
+        None,
+        local_path=None,
+        remote_path=None,
+    ).once()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'verify-dumps': flexmock(repository=None, archive='latest', databases=['foo']),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
+def test_run_actions_with_verify_dumps_action_without_checksums_raises():
+    flexmock(module.validate).should_receive('repositories_match').and_return(True)
+    flexmock(module.borg_list).should_receive('resolve_archive_name').and_return('archive')
+    flexmock(module.manifest).should_receive('read_archive_manifest').and_return(None)
+    flexmock(module.checksum).should_receive('find_dumps_to_verify').and_return([])
+    flexmock(module.checksum).should_receive('verify_dumps').never()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'verify-dumps': flexmock(repository='repo', archive='archive', databases=None),
+    }
+
+    with pytest.raises(ValueError):
+        list(
+            module.run_actions(
+                arguments=arguments,
+                config_filename='test.yaml',
+                location={'repositories': ['repo']},
+                storage={},
+                retention={},
+                consistency={},
+                hooks={},
+                local_path=None,
+                remote_path=None,
+                local_borg_version=None,
+                repository_path='repo',
+            )
+        )
+
+
+def test_run_actions_with_history_action_logs_history():
+    flexmock(module.validate).should_receive('repositories_match').and_return(True)
+    flexmock(module.history).should_receive('read_history').with_args(
+        'history.db', 'test.yaml', 'repo', 5
+    ).and_return([{'success': 1}])
+    flexmock(module.history).should_receive('format_history').and_return(['header', 'row'])
+    flexmock(module.logger).should_receive('warning').times(3)
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'history': flexmock(repository=None, last=5, json=False),
+    }
+
+    assert (
+        list(
+            module.run_actions(
+                arguments=arguments,
+                config_filename='test.yaml',
+                location={'repositories': ['repo']},
+                storage={},
+                retention={},
+                consistency={},
+                hooks={'history_database': 'history.db'},
+                local_path=None,
+                remote_path=None,
+                local_borg_version=None,
+                repository_path='repo',
+            )
+        )
+        == []
+    )
+
+
+def test_run_actions_with_history_action_and_json_yields_runs():
+    flexmock(module.validate).should_receive('repositories_match').and_return(True)
+    flexmock(module.history).should_receive('read_history').and_return([{'success': 1}])
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'history': flexmock(repository='repo', last=None, json=True),
+    }
+
+    assert list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={'history_database': 'history.db'},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    ) == [{'config_filename': 'test.yaml', 'repository': 'repo', 'runs': [{'success': 1}]}]
+
+
+def test_run_actions_with_history_action_without_history_database_warns():
+    flexmock(module.history).should_receive('read_history').never()
+    flexmock(module.logger).should_receive('warning').once()
+    arguments = {
+        'global': flexmock(monitoring_verbosity=1, dry_run=False),
+        'history': flexmock(repository=None, last=None, json=False),
+    }
+
+    list(
+        module.run_actions(
+            arguments=arguments,
+            config_filename='test.yaml',
+            location={'repositories': ['repo']},
+            storage={},
+            retention={},
+            consistency={},
+            hooks={},
+            local_path=None,
+            remote_path=None,
+            local_borg_version=None,
+            repository_path='repo',
+        )
+    )
+
+
 def test_run_actions_does_not_raise_for_borg_action():
     flexmock(module.validate).should_receive('repositories_match').and_return(True)
     flexmock(module.borg_list).should_receive('resolve_archive_name').and_return(flexmock())
@@ -762,7 +1946,7 @@ def test_get_local_path_without_local_path_defaults_to_borg():
 def test_collect_configuration_run_summary_logs_info_for_success():
     flexmock(module.command).should_receive('execute_hook').never()
     flexmock(module).should_receive('run_configuration').and_return([])
-    arguments = {}
+    arguments = {'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None)}
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -773,7 +1957,17 @@ def test_collect_configuration_run_summary_logs_info_for_success():
 
 def test_collect_configuration_run_summary_executes_hooks_for_create():
     flexmock(module).should_receive('run_configuration').and_return([])
-    arguments = {'create': flexmock(), 'global': flexmock(monitoring_verbosity=1, dry_run=False)}
+    arguments = {
+        'create': flexmock(),
+        'global': flexmock(
+            jobs=1,
+            timings=False,
+            timings_json=False,
+            trace_file=None,
+            monitoring_verbosity=1,
+            dry_run=False,
+        ),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -785,7 +1979,10 @@ def test_collect_configuration_run_summary_executes_hooks_for_create():
 def test_collect_configuration_run_summary_logs_info_for_success_with_extract():
     flexmock(module.validate).should_receive('guard_configuration_contains_repository')
     flexmock(module).should_receive('run_configuration').and_return([])
-    arguments = {'extract': flexmock(repository='repo')}
+    arguments = {
+        'extract': flexmock(repository='repo'),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -800,7 +1997,10 @@ def test_collect_configuration_run_summary_logs_extract_with_repository_error():
     )
     expected_logs = (flexmock(),)
     flexmock(module).should_receive('log_error_records').and_return(expected_logs)
-    arguments = {'extract': flexmock(repository='repo')}
+    arguments = {
+        'extract': flexmock(repository='repo'),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -812,7 +2012,10 @@ def test_collect_configuration_run_summary_logs_extract_with_repository_error():
 def test_collect_configuration_run_summary_logs_info_for_success_with_mount():
     flexmock(module.validate).should_receive('guard_configuration_contains_repository')
     flexmock(module).should_receive('run_configuration').and_return([])
-    arguments = {'mount': flexmock(repository='repo')}
+    arguments = {
+        'mount': flexmock(repository='repo'),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -827,7 +2030,10 @@ def test_collect_configuration_run_summary_logs_mount_with_repository_error():
     )
     expected_logs = (flexmock(),)
     flexmock(module).should_receive('log_error_records').and_return(expected_logs)
-    arguments = {'mount': flexmock(repository='repo')}
+    arguments = {
+        'mount': flexmock(repository='repo'),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -850,7 +2056,17 @@ def test_collect_configuration_run_summary_logs_pre_hook_error():
     flexmock(module.command).should_receive('execute_hook').and_raise(ValueError)
     expected_logs = (flexmock(),)
     flexmock(module).should_receive('log_error_records').and_return(expected_logs)
-    arguments = {'create': flexmock(), 'global': flexmock(monitoring_verbosity=1, dry_run=False)}
+    arguments = {
+        'create': flexmock(),
+        'global': flexmock(
+            jobs=1,
+            timings=False,
+            timings_json=False,
+            trace_file=None,
+            monitoring_verbosity=1,
+            dry_run=False,
+        ),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -864,7 +2080,17 @@ def test_collect_configuration_run_summary_logs_post_hook_error():
     flexmock(module).should_receive('run_configuration').and_return([])
     expected_logs = (flexmock(),)
     flexmock(module).should_receive('log_error_records').and_return(expected_logs)
-    arguments = {'create': flexmock(), 'global': flexmock(monitoring_verbosity=1, dry_run=False)}
+    arguments = {
+        'create': flexmock(),
+        'global': flexmock(
+            jobs=1,
+            timings=False,
+            timings_json=False,
+            trace_file=None,
+            monitoring_verbosity=1,
+            dry_run=False,
+        ),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -879,7 +2105,10 @@ def test_collect_configuration_run_summary_logs_for_list_with_archive_and_reposi
     )
     expected_logs = (flexmock(),)
     flexmock(module).should_receive('log_error_records').and_return(expected_logs)
-    arguments = {'list': flexmock(repository='repo', archive='test')}
+    arguments = {
+        'list': flexmock(repository='repo', archive='test'),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -890,7 +2119,10 @@ def test_collect_configuration_run_summary_logs_for_list_with_archive_and_reposi
 
 def test_collect_configuration_run_summary_logs_info_for_success_with_list():
     flexmock(module).should_receive('run_configuration').and_return([])
-    arguments = {'list': flexmock(repository='repo', archive=None)}
+    arguments = {
+        'list': flexmock(repository='repo', archive=None),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -905,7 +2137,8 @@ def test_collect_configuration_run_summary_logs_run_configuration_error():
         [logging.makeLogRecord(dict(levelno=logging.CRITICAL, levelname='CRITICAL', msg='Error'))]
     )
     flexmock(module).should_receive('log_error_records').and_return([])
-    arguments = {}
+    flexmock(module.execute).should_receive('summarize_process_usages').and_return([])
+    arguments = {'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None)}
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -914,6 +2147,22 @@ def test_collect_configuration_run_summary_logs_run_configuration_error():
     assert {log.levelno for log in logs} == {logging.CRITICAL}
 
 
+def test_collect_configuration_run_summary_logs_info_for_process_resource_usage():
+    flexmock(module.validate).should_receive('guard_configuration_contains_repository')
+    flexmock(module).should_receive('run_configuration').and_return([])
+    flexmock(module.execute).should_receive('summarize_process_usages').and_return(
+        ['Resource usage for borg: 1 process, 1.00s wall']
+    )
+    arguments = {'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None)}
+
+    logs = tuple(
+        module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
+    )
+
+    assert logs[-1].levelno == logging.INFO
+    assert logs[-1].getMessage() == 'Resource usage for borg: 1 process, 1.00s wall'
+
+
 def test_collect_configuration_run_summary_logs_run_umount_error():
     flexmock(module.validate).should_receive('guard_configuration_contains_repository')
     flexmock(module).should_receive('run_configuration').and_return([])
@@ -921,7 +2170,10 @@ def test_collect_configuration_run_summary_logs_run_umount_error():
     flexmock(module).should_receive('log_error_records').and_return(
         [logging.makeLogRecord(dict(levelno=logging.CRITICAL, levelname='CRITICAL', msg='Error'))]
     )
-    arguments = {'umount': flexmock(mount_point='/mnt')}
+    arguments = {
+        'umount': flexmock(mount_point='/mnt'),
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None),
+    }
 
     logs = tuple(
         module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
@@ -937,10 +2189,80 @@ def test_collect_configuration_run_summary_logs_outputs_merged_json_results():
     stdout = flexmock()
     stdout.should_receive('write').with_args('["foo", "bar", "baz"]').once()
     flexmock(module.sys).stdout = stdout
-    arguments = {}
+    arguments = {'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None)}
 
     tuple(
         module.collect_configuration_run_summary_logs(
             {'test.yaml': {}, 'test2.yaml': {}}, arguments=arguments
         )
     )
+
+
+def test_collect_configuration_run_summary_logs_outputs_timings():
+    flexmock(module).should_receive('run_configuration').and_return([])
+    flexmock(module.timing).should_receive('format_timings').and_return('Timings\n')
+    flexmock(module.timing).should_receive('format_timings_json').never()
+    stdout = flexmock()
+    stdout.should_receive('write').with_args('Timings\n').once()
+    flexmock(module.sys).stdout = stdout
+    arguments = {'global': flexmock(jobs=1, timings=True, timings_json=False, trace_file=None)}
+
+    tuple(module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments))
+
+
+def test_collect_configuration_run_summary_logs_outputs_timings_json():
+    flexmock(module).should_receive('run_configuration').and_return([])
+    flexmock(module.timing).should_receive('format_timings').never()
+    flexmock(module.timing).should_receive('format_timings_json').and_return('[]')
+    stdout = flexmock()
+    stdout.should_receive('write').with_args('[]').once()
+    flexmock(module.sys).stdout = stdout
+    arguments = {'global': flexmock(jobs=1, timings=False, timings_json=True, trace_file=None)}
+
+    tuple(module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments))
+
+
+def test_collect_configuration_run_summary_logs_metrics_textfile_error():
+    flexmock(module).should_receive('run_configuration').and_return([])
+    flexmock(module.metrics).should_receive('write_textfiles').and_raise(OSError)
+    flexmock(module).should_receive('log_error_records').and_return(
+        [logging.makeLogRecord(dict(levelno=logging.CRITICAL, levelname='CRITICAL', msg='Error'))]
+    )
+    arguments = {'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file=None)}
+
+    logs = tuple(
+        module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
+    )
+
+    assert {log.levelno for log in logs} == {logging.INFO, logging.CRITICAL}
+
+
+def test_collect_configuration_run_summary_logs_writes_trace_file():
+    flexmock(module).should_receive('run_configuration').and_return([])
+    flexmock(module.trace).should_receive('write_trace').with_args('trace.json').once()
+    arguments = {
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file='trace.json')
+    }
+
+    logs = tuple(
+        module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
+    )
+
+    assert {log.levelno for log in logs} == {logging.INFO}
+
+
+def test_collect_configuration_run_summary_logs_trace_file_error():
+    flexmock(module).should_receive('run_configuration').and_return([])
+    flexmock(module.trace).should_receive('write_trace').and_raise(OSError)
+    flexmock(module).should_receive('log_error_records').and_return(
+        [logging.makeLogRecord(dict(levelno=logging.CRITICAL, levelname='CRITICAL', msg='Error'))]
+    )
+    arguments = {
+        'global': flexmock(jobs=1, timings=False, timings_json=False, trace_file='trace.json')
+    }
+
+    logs = tuple(
+        module.collect_configuration_run_summary_logs({'test.yaml': {}}, arguments=arguments)
+    )
+
+    assert {log.levelno for log in logs} == {logging.INFO, logging.CRITICAL}
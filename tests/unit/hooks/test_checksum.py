@@ -0,0 +1,175 @@
+import io
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic.hooks import checksum as module
+
+
+def test_checksum_stream_copies_input_to_output_and_returns_checksum_and_size():
+    output_file = io.BytesIO()
+    flexmock(module.manifest, CHECKSUM_CHUNK_BYTES=2)
+
+    (checksum, size) = module.checksum_stream(io.BytesIO(b'hello'), output_file)
+
+    assert checksum == module.checksum_stream(io.BytesIO(b'hello'))[0]
+    assert checksum.startswith('blake2b:')
+    assert size == 5
+    assert output_file.getvalue() == b'hello'
+
+
+def test_start_checksummed_dump_without_redirect_to_dump_filename_raises():
+    flexmock(module.execute).should_receive('execute_command').never()
+
+    with pytest.raises(ValueError):
+        module.start_checksummed_dump(('pg_dump', 'foo', '>', 'other'), None, 'dump')
+
+
+def test_make_dump_entries_gets_hook_and_name_from_dump_path():
+    assert module.make_dump_entries(
+        {'/root/.borgmatic/postgresql_databases/localhost/foo': {'checksum': 'abc', 'size': 3}}
+    ) == [
+        {
+            'hook': 'postgresql_databases',
+            'name': 'foo',
+            'path': '/root/.borgmatic/postgresql_databases/localhost/foo',
+            'checksum': 'abc',
+            'size': 3,
+        }
+    ]
+
+
+def test_record_checksums_with_os_error_warns_instead_of_raising():
+    flexmock(module).should_receive('make_checksums_path').and_return('/state/checksums.json')
+    flexmock(module).should_receive('read_checksums').and_return({})
+    flexmock(module.os).should_receive('makedirs').and_raise(OSError)
+    flexmock(module.logger).should_receive('warning').once()
+
+    module.record_checksums('repo', 'archive', [], 'repo')
+
+
+def test_find_dumps_to_verify_combines_recorded_and_manifest_checksums():
+    flexmock(module).should_receive('make_checksums_path').and_return('/state/checksums.json')
+    flexmock(module).should_receive('read_checksums').and_return(
+        {
+            'repo': {
+                'archive': [{'name': 'foo', 'path': '/dumps/foo', 'checksum': 'a', 'size': 1}],
+                'other': [{'name': 'bar', 'path': '/dumps/bar', 'checksum': 'b', 'size': 2}],
+            }
+        }
+    )
+    archive_manifest = {
+        'version': 1,
+        'dumps': [
+            {'name': 'baz', 'path': '/dumps/baz', 'checksum': 'c', 'size': 3},
+            {'name': 'quux', 'path': '/dumps/quux', 'checksum': None, 'size': None},
+        ],
+    }
+
+    assert module.find_dumps_to_verify('repo', 'archive', archive_manifest) == [
+        {'name': 'baz', 'path': '/dumps/baz', 'checksum': 'c', 'size': 3},
+        {'name': 'foo', 'path': '/dumps/foo', 'checksum': 'a', 'size': 1},
+    ]
+
+
+def test_find_dumps_to_verify_with_database_names_only_includes_those_databases():
+    flexmock(module).should_receive('make_checksums_path').and_return('/state/checksums.json')
+    flexmock(module).should_receive('read_checksums').and_return(
+        {
+            'repo': {
+                'archive': [
+                    {'name': 'foo', 'path': '/dumps/foo', 'checksum': 'a', 'size': 1},
+                    {'name': 'bar', 'path': '/dumps/bar', 'checksum': 'b', 'size': 2},
+                ]
+            }
+        }
+    )
+
+    assert module.find_dumps_to_verify('repo', 'archive', None, ['bar']) == [
+        {'name': 'bar', 'path': '/dumps/bar', 'checksum': 'b', 'size': 2}
+    ]
+
+
+def test_find_dumps_to_verify_without_checksums_returns_empty_list():
+    flexmock(module).should_receive('make_checksums_path').and_return('/state/checksums.json')
+    flexmock(module).should_receive('read_checksums').and_return({})
+
+    assert module.find_dumps_to_verify('repo', 'archive', None) == []
+
+
+def test_verify_dumps_with_matching_checksums_does_not_raise():
+    flexmock(module).should_receive('checksum_archived_dump').and_return(('a', 1)).and_return(
+        ('b', 2)
+    )
+
+    module.verify_dumps(
+        'repo',
+        'archive',
+        [
+            {
+                'hook': 'postgresql_databases',
+                'name': 'foo',
+                'path': '/foo',
+                'checksum': 'a',
+                'size': 1,
+            },
+            {'hook': 'mysql_databases', 'name': 'bar', 'path': '/bar', 'checksum': 'b', 'size': 2},
+        ],
+        {},
+        {},
+        '1.2.3',
+    )
+
+
+def test_verify_dumps_with_mismatched_checksum_verifies_remaining_dumps_and_raises():
+    flexmock(module).should_receive('checksum_archived_dump').and_return(('x', 1)).and_return(
+        ('b', 2)
+    ).twice()
+    flexmock(module.logger).should_receive('error').once()
+
+    with pytest.raises(ValueError, match='foo'):
+        module.verify_dumps(
+            'repo',
+            'archive',
+            [
+                {
+                    'hook': 'postgresql_databases',
+                    'name': 'foo',
+                    'path': '/foo',
+                    'checksum': 'a',
+                    'size': 1,
+                },
+                {
+                    'hook': 'mysql_databases',
+                    'name': 'bar',
+                    'path': '/bar',
+                    'checksum': 'b',
+                    'size': 2,
+                },
+            ],
+            {},
+            {},
+            '1.2.3',
+        )
+
+
+def test_verify_dumps_with_mismatched_size_raises():
+    flexmock(module).should_receive('checksum_archived_dump').and_return(('a', 5))
+
+    with pytest.raises(ValueError):
+        module.verify_dumps(
+            'repo',
+            'archive',
+            [
+                {
+                    'hook': 'sqlite_databases',
+                    'name': 'foo',
+                    'path': '/foo',
+                    'checksum': 'a',
+                    'size': 1,
+                }
+            ],
+            {},
+            {},
+            '1.2.3',
+        )
@@ -27,6 +27,18 @@ def test_call_hook_invokes_module_function_with_arguments_and_returns_value():
     assert return_value == expected_return_value
 
 
+def test_call_hook_records_trace_event():
+    hooks = {'super_hook': flexmock()}
+    test_module = sys.modules[__name__]
+    flexmock(module).HOOK_NAME_TO_MODULE = {'super_hook': test_module}
+    flexmock(test_module).should_receive('hook_function')
+    flexmock(module.trace).should_receive('event').with_args(
+        'super_hook hook_function', 'hook', log_prefix='prefix'
+    ).and_return(flexmock(__enter__=lambda: None, __exit__=lambda *args: None)).once()
+
+    module.call_hook('hook_function', hooks, 'prefix', 'super_hook', 55, value=66)
+
+
 def test_call_hook_without_hook_config_skips_call():
     hooks = {'other_hook': flexmock()}
     test_module = sys.modules[__name__]
@@ -1,3 +1,7 @@
+import logging
+import subprocess
+import sys
+
 import pytest
 from flexmock import flexmock
 
@@ -12,6 +16,55 @@ def test_make_database_dump_path_defaults_without_source_directory():
     assert module.make_database_dump_path(None, 'super_databases') == '~/.borgmatic/super_databases'
 
 
+def test_database_dump_lock_with_database_hooks_returns_lock():
+    assert (
+        module.database_dump_lock({'postgresql_databases': [{'name': 'foo'}]})
+        is module.DATABASE_DUMP_LOCK
+    )
+
+
+def test_database_dump_lock_without_database_hooks_returns_other_context_manager():
+    with module.database_dump_lock({'before_backup': ['echo']}) as lock:
+        assert lock is None
+
+
+def test_wait_for_spooled_dumps_readers_without_readers_does_not_block():
+    flexmock(module, SPOOLED_DUMPS_READERS=0)
+
+    with module.DATABASE_DUMP_LOCK:
+        module.wait_for_spooled_dumps_readers({'postgresql_databases': [{'name': 'foo'}]})
+
+
+def test_wait_for_spooled_dumps_readers_without_database_hooks_does_not_wait():
+    flexmock(module, SPOOLED_DUMPS_READERS=1)
+    flexmock(module.SPOOLED_DUMPS_CONDITION).should_receive('wait_for').never()
+
+    module.wait_for_spooled_dumps_readers({'before_backup': ['echo']})
+
+
+def test_start_reading_spooled_dumps_registers_reader():
+    flexmock(module, SPOOLED_DUMPS_READERS=0)
+
+    assert module.start_reading_spooled_dumps({'postgresql_databases': [{'name': 'foo'}]})
+    assert module.SPOOLED_DUMPS_READERS == 1
+
+
+def test_start_reading_spooled_dumps_without_database_hooks_skips_registering_reader():
+    flexmock(module, SPOOLED_DUMPS_READERS=0)
+
+    assert not module.start_reading_spooled_dumps({'before_backup': ['echo']})
+    assert module.SPOOLED_DUMPS_READERS == 0
+
+
+def test_finish_reading_spooled_dumps_unregisters_reader_and_wakes_waiters():
+    flexmock(module, SPOOLED_DUMPS_READERS=1)
+    flexmock(module.SPOOLED_DUMPS_CONDITION).should_receive('notify_all').once()
+
+    module.finish_reading_spooled_dumps()
+
+    assert module.SPOOLED_DUMPS_READERS == 0
+
+
 def test_make_database_dump_filename_uses_name_and_hostname():
     flexmock(module.os.path).should_receive('expanduser').and_return('databases')
 
@@ -47,6 +100,99 @@ def test_create_named_pipe_for_dump_does_not_raise():
     module.create_named_pipe_for_dump('/path/to/pipe')
 
 
+def test_read_dump_sizes_with_invalid_file_returns_empty_dict():
+    flexmock(module.json).should_receive('load').and_return([1, 2])
+    flexmock(sys.modules['builtins']).should_receive('open').and_return(
+        flexmock(__enter__=lambda: None, __exit__=lambda *args: None)
+    )
+
+    assert module.read_dump_sizes('sizes.json') == {}
+
+
+def test_read_dump_sizes_without_file_returns_empty_dict():
+    flexmock(sys.modules['builtins']).should_receive('open').and_raise(FileNotFoundError)
+
+    assert module.read_dump_sizes('sizes.json') == {}
+
+
+def test_run_spooled_dumps_without_dumps_skips_sizes():
+    flexmock(module).should_receive('read_dump_sizes').never()
+    flexmock(module).should_receive('write_dump_sizes').never()
+
+    assert module.run_spooled_dumps([], 'test.yaml') == []
+
+
+def test_run_spooled_dumps_starts_largest_dumps_first_and_records_sizes():
+    spooled_dumps = [
+        module.Spooled_dump(('dump', 'small'), None, 'small'),
+        module.Spooled_dump(('dump', 'new'), None, 'new'),
+        module.Spooled_dump(('dump', 'large'), None, 'large'),
+    ]
+    started_names = []
+    flexmock(module).should_receive('make_dump_sizes_path').and_return('sizes.json')
+    flexmock(module).should_receive('read_dump_sizes').and_return(
+        {'small': 10, 'large': 1000, 'gone': 5}
+    )
+    flexmock(module).should_receive('run_spooled_dump').replace_with(
+        lambda spooled_dump, started_processes: started_names.append(spooled_dump.dump_filename)
+        or spooled_dump.dump_filename
+    )
+    flexmock(module.execute).should_receive('usage_for_process').and_return(None)
+    flexmock(module).should_receive('get_dump_size').with_args('small').and_return(20)
+    flexmock(module).should_receive('get_dump_size').with_args('new').and_return(500)
+    flexmock(module).should_receive('get_dump_size').with_args('large').and_return(None)
+    flexmock(module).should_receive('write_dump_sizes').with_args(
+        'sizes.json', {'small': 20, 'new': 500, 'large': 1000, 'gone': 5}
+    ).once()
+
+    assert module.run_spooled_dumps(spooled_dumps, 'test.yaml', concurrency=1) == [
+        'new',
+        'large',
+        'small',
+    ]
+    assert started_names == ['new', 'large', 'small']
+
+
+def test_run_spooled_dumps_runs_dumps_with_command_and_environment():
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_sizes_path').and_return('sizes.json')
+    flexmock(module).should_receive('read_dump_sizes').and_return({})
+    flexmock(module.execute).should_receive('execute_command').with_args(
+        ('dump', 'foo'), shell=True, extra_environment={'PASSWORD': 'pw'}, run_to_completion=False
+    ).and_return(process).once()
+    flexmock(module.execute).should_receive('log_outputs').with_args(
+        (process,), exclude_stdouts=(), output_log_level=logging.INFO, borg_local_path=None
+    ).once()
+    flexmock(module.execute).should_receive('usage_for_process').with_args(process).and_return(
+        flexmock(wall_seconds=3)
+    )
+    flexmock(module).should_receive('get_dump_size').and_return(5)
+    flexmock(module).should_receive('write_dump_sizes').once()
+    flexmock(module, DUMP_DURATIONS={})
+
+    assert module.run_spooled_dumps(
+        [module.Spooled_dump(('dump', 'foo'), {'PASSWORD': 'pw'}, 'foo')], 'test.yaml'
+    ) == [process]
+    assert module.DUMP_DURATIONS == {'foo': 3}
+
+
+def test_run_spooled_dumps_with_failing_dump_kills_others_and_raises():
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_sizes_path').and_return('sizes.json')
+    flexmock(module).should_receive('read_dump_sizes').and_return({})
+    flexmock(module.execute).should_receive('execute_command').and_return(process)
+    flexmock(module.execute).should_receive('log_outputs').and_raise(
+        subprocess.CalledProcessError(1, 'dump')
+    )
+    flexmock(module.execute).should_receive('kill_processes').with_args([process]).once()
+    flexmock(module).should_receive('write_dump_sizes').never()
+
+    with pytest.raises(subprocess.CalledProcessError):
+        module.run_spooled_dumps(
+            [module.Spooled_dump(('dump', 'foo'), None, 'foo')], 'test.yaml', concurrency=1
+        )
+
+
 def test_remove_database_dumps_removes_dump_path():
     flexmock(module.os.path).should_receive('expanduser').and_return('databases/localhost')
     flexmock(module.os.path).should_receive('exists').and_return(True)
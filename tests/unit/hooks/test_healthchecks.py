@@ -25,6 +25,28 @@ def test_forgetful_buffering_handler_emit_forgets_log_records_when_capacity_reac
     assert handler.forgot
 
 
+def test_forgetful_buffering_handler_emit_collects_log_records_for_its_configuration_file():
+    handler = module.Forgetful_buffering_handler(
+        byte_capacity=100, log_level=1, config_filename='test.yaml'
+    )
+    flexmock(module).should_receive('get_log_config_filename').and_return('test.yaml')
+
+    handler.emit(flexmock(getMessage=lambda: 'foo'))
+
+    assert handler.buffer == ['foo\n']
+
+
+def test_forgetful_buffering_handler_emit_skips_log_records_for_other_configuration_file():
+    handler = module.Forgetful_buffering_handler(
+        byte_capacity=100, log_level=1, config_filename='test.yaml'
+    )
+    flexmock(module).should_receive('get_log_config_filename').and_return('other.yaml')
+
+    handler.emit(flexmock(getMessage=lambda: 'foo'))
+
+    assert handler.buffer == []
+
+
 def test_format_buffered_logs_for_payload_flattens_log_buffer():
     handler = module.Forgetful_buffering_handler(byte_capacity=100, log_level=1)
     handler.buffer = ['foo\n', 'bar\n']
@@ -50,6 +72,23 @@ def test_format_buffered_logs_for_payload_inserts_truncation_indicator_when_logs
     assert payload == '...\nfoo\nbar\n'
 
 
+def test_format_buffered_logs_for_payload_uses_handler_for_given_configuration_file():
+    other_handler = module.Forgetful_buffering_handler(
+        byte_capacity=100, log_level=1, config_filename='other.yaml'
+    )
+    other_handler.buffer = ['other\n']
+    handler = module.Forgetful_buffering_handler(
+        byte_capacity=100, log_level=1, config_filename='test.yaml'
+    )
+    handler.buffer = ['foo\n', 'bar\n']
+    logger = flexmock(handlers=[other_handler, handler])
+    flexmock(module.logging).should_receive('getLogger').and_return(logger)
+
+    payload = module.format_buffered_logs_for_payload('test.yaml')
+
+    assert payload == 'foo\nbar\n'
+
+
 def test_format_buffered_logs_for_payload_without_handler_produces_empty_payload():
     logger = flexmock(handlers=[module.logging.Handler()])
     logger.should_receive('removeHandler')
@@ -139,3 +178,25 @@ def test_ping_monitor_dry_run_does_not_hit_ping_url():
         monitoring_log_level=1,
         dry_run=True,
     )
+
+
+def test_report_progress_posts_message_to_log_url():
+    flexmock(module.requests).should_receive('post').with_args(
+        'https://example.com/log', data='Progress: ...'.encode('utf-8')
+    ).once()
+
+    module.report_progress('https://example.com', 'config.yaml', 'Progress: ...', dry_run=False)
+
+
+def test_report_progress_with_uuid_posts_to_log_url_for_uuid():
+    flexmock(module.requests).should_receive('post').with_args(
+        'https://hc-ping.com/abcd-efgh/log', data='Progress: ...'.encode('utf-8')
+    ).once()
+
+    module.report_progress('abcd-efgh', 'config.yaml', 'Progress: ...', dry_run=False)
+
+
+def test_report_progress_with_dry_run_does_not_post():
+    flexmock(module.requests).should_receive('post').never()
+
+    module.report_progress('https://example.com', 'config.yaml', 'Progress: ...', dry_run=True)
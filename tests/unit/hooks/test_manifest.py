@@ -0,0 +1,166 @@
+import logging
+import subprocess
+
+from flexmock import flexmock
+
+from borgmatic.hooks import manifest as module
+
+
+def test_make_manifest_path_joins_source_directory_and_manifest_filename():
+    assert module.make_manifest_path('/borgmatic') == '/borgmatic/database_dump_manifest.json'
+
+
+def test_make_manifest_path_without_source_directory_uses_default():
+    flexmock(module.os.path).should_receive('expanduser').and_return('/root/.borgmatic')
+
+    assert module.make_manifest_path(None) == '/root/.borgmatic/database_dump_manifest.json'
+
+
+def test_find_database_format_returns_format_of_matching_database():
+    assert (
+        module.find_database_format(
+            [{'name': 'foo', 'format': 'custom'}, {'name': 'bar', 'format': 'directory'}], 'bar'
+        )
+        == 'directory'
+    )
+
+
+def test_find_database_format_with_all_database_returns_its_format():
+    assert module.find_database_format([{'name': 'all', 'format': 'tar'}], 'bar') == 'tar'
+
+
+def test_find_database_format_without_matching_database_returns_none():
+    assert module.find_database_format([{'name': 'foo', 'format': 'tar'}], 'bar') is None
+    assert module.find_database_format(None, 'bar') is None
+
+
+def test_write_manifest_with_dry_run_skips_write():
+    flexmock(module).should_receive('collect_dumps').never()
+    flexmock(module.os).should_receive('replace').never()
+
+    module.write_manifest({}, {}, 'test.yaml', dry_run=True)
+
+
+def test_write_manifest_with_os_error_warns_instead_of_raising():
+    flexmock(module).should_receive('collect_dumps').and_return([])
+    flexmock(module.os).should_receive('makedirs').and_raise(OSError)
+    flexmock(module.logger).should_receive('warning').once()
+
+    module.write_manifest({}, {}, 'test.yaml', dry_run=False)
+
+
+def test_remove_manifest_removes_manifest_and_clears_dump_durations():
+    flexmock(module.dump, DUMP_DURATIONS={'/dump': 1.0})
+    flexmock(module).should_receive('make_manifest_path').and_return('/borgmatic/manifest.json')
+    flexmock(module.os.path).should_receive('exists').and_return(True)
+    flexmock(module.os).should_receive('remove').with_args('/borgmatic/manifest.json').once()
+
+    module.remove_manifest({}, 'test.yaml', dry_run=False)
+
+    assert module.dump.DUMP_DURATIONS == {}
+
+
+def test_remove_manifest_with_dry_run_skips_removal():
+    flexmock(module.dump, DUMP_DURATIONS={'/dump': 1.0})
+    flexmock(module).should_receive('make_manifest_path').and_return('/borgmatic/manifest.json')
+    flexmock(module.os).should_receive('remove').never()
+
+    module.remove_manifest({}, 'test.yaml', dry_run=True)
+
+    assert module.dump.DUMP_DURATIONS == {'/dump': 1.0}
+
+
+def test_read_archive_manifest_extracts_manifest_by_exact_path():
+    extract_process = flexmock(stdout=flexmock(read=lambda: b'{"version": 1, "dumps": []}'))
+    flexmock(module.execute).should_receive('log_outputs').with_args(
+        (extract_process,), (extract_process.stdout,), logging.DEBUG, borg_local_path=None
+    ).once()
+    flexmock(module.borg_extract).should_receive('extract_archive').with_args(
+        dry_run=False,
+        repository='repo',
+        archive='archive',
+        paths=['pf:borgmatic/database_dump_manifest.json'],
+        location_config={'borgmatic_source_directory': '/borgmatic'},
+        storage_config={},
+        local_borg_version='1.2.3',
+        local_path='borg',
+        remote_path=None,
+        destination_path='/',
+        extract_to_stdout=True,
+    ).and_return(extract_process).once()
+
+    assert module.read_archive_manifest(
+        'repo', 'archive', {'borgmatic_source_directory': '/borgmatic'}, {}, '1.2.3'
+    ) == {'version': 1, 'dumps': []}
+
+
+def test_read_archive_manifest_with_extract_error_returns_none():
+    extract_process = flexmock(stdout=flexmock(read=lambda: b''))
+    flexmock(module.execute).should_receive('log_outputs').and_raise(
+        subprocess.CalledProcessError(1, 'borg extract')
+    )
+    flexmock(module.borg_extract).should_receive('extract_archive').and_return(extract_process)
+
+    assert module.read_archive_manifest('repo', 'archive', {}, {}, '1.2.3') is None
+
+
+def test_read_archive_manifest_with_invalid_json_returns_none():
+    extract_process = flexmock(stdout=flexmock(read=lambda: b'{'))
+    flexmock(module.execute).should_receive('log_outputs')
+    flexmock(module.borg_extract).should_receive('extract_archive').and_return(extract_process)
+
+    assert module.read_archive_manifest('repo', 'archive', {}, {}, '1.2.3') is None
+
+
+def test_read_archive_manifest_with_unknown_version_returns_none():
+    extract_process = flexmock(stdout=flexmock(read=lambda: b'{"version": 99}'))
+    flexmock(module.execute).should_receive('log_outputs')
+    flexmock(module.borg_extract).should_receive('extract_archive').and_return(extract_process)
+
+    assert module.read_archive_manifest('repo', 'archive', {}, {}, '1.2.3') is None
+
+
+def test_convert_paths_to_borg_patterns_makes_path_full_patterns():
+    assert module.convert_paths_to_borg_patterns(['/etc/foo', '/var/bar']) == [
+        'pf:etc/foo',
+        'pf:var/bar',
+    ]
+
+
+def test_convert_paths_to_borg_patterns_with_directory_makes_path_prefix_patterns():
+    assert module.convert_paths_to_borg_patterns(['/etc/foo'], directory=True) == ['pp:etc/foo']
+
+
+def test_make_dump_patterns_returns_patterns_for_matching_dumps():
+    manifest = {
+        'version': 1,
+        'dumps': [
+            {'hook': 'postgresql_databases', 'name': 'foo', 'path': '/dumps/a/foo', 'type': 'file'},
+            {
+                'hook': 'postgresql_databases',
+                'name': 'foo',
+                'path': '/dumps/b/foo',
+                'type': 'directory',
+            },
+            {'hook': 'postgresql_databases', 'name': 'bar', 'path': '/dumps/a/bar', 'type': 'file'},
+            {'hook': 'mysql_databases', 'name': 'foo', 'path': '/dumps/c/foo', 'type': 'stream'},
+        ],
+    }
+
+    assert module.make_dump_patterns(manifest, 'postgresql_databases', 'foo') == [
+        'pf:dumps/a/foo',
+        'pp:dumps/b/foo',
+    ]
+
+
+def test_make_dump_patterns_without_matching_dumps_returns_none():
+    manifest = {
+        'version': 1,
+        'dumps': [{'hook': 'mysql_databases', 'name': 'foo', 'path': '/foo', 'type': 'file'}],
+    }
+
+    assert module.make_dump_patterns(manifest, 'postgresql_databases', 'foo') is None
+
+
+def test_make_dump_patterns_without_manifest_returns_none():
+    assert module.make_dump_patterns(None, 'postgresql_databases', 'foo') is None
@@ -25,6 +25,54 @@ def test_dump_databases_runs_mongodump_for_each_database():
     assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == processes
 
 
+def test_dump_databases_with_checksum_dumps_starts_checksummed_dumps():
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump')
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.checksum).should_receive('start_checksummed_dump').with_args(
+        ['mongodump', '--archive', '--db', 'foo', '>', 'databases/localhost/foo'],
+        None,
+        'databases/localhost/foo',
+    ).and_return(process).once()
+
+    assert module.dump_databases(
+        [{'name': 'foo'}], 'test.yaml', {}, dry_run=False, checksum_dumps=True
+    ) == [process]
+
+
+def test_dump_databases_with_spool_runs_dumps_to_regular_files():
+    databases = [{'name': 'foo'}]
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump').never()
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump').with_args(
+        'databases/localhost/foo'
+    ).once()
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.dump).should_receive('run_spooled_dumps').with_args(
+        [
+            module.dump.Spooled_dump(
+                ['mongodump', '--archive', '--db', 'foo', '>', 'databases/localhost/foo'],
+                None,
+                'databases/localhost/foo',
+            )
+        ],
+        'test.yaml',
+        3,
+    ).and_return([process]).once()
+
+    assert module.dump_databases(
+        databases, 'test.yaml', {}, dry_run=False, spool=True, concurrency=3
+    ) == [process]
+
+
 def test_dump_databases_with_dry_run_skips_mongodump():
     databases = [{'name': 'foo'}, {'name': 'bar'}]
     flexmock(module).should_receive('make_dump_path').and_return('')
@@ -123,6 +171,25 @@ def test_dump_databases_runs_mongodump_with_directory_format():
     assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == [process]
 
 
+def test_dump_databases_with_checksum_dumps_and_directory_format_skips_checksum():
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump')
+    flexmock(module.checksum).should_receive('start_checksummed_dump').never()
+    flexmock(module).should_receive('execute_command').and_return(process).once()
+
+    assert module.dump_databases(
+        [{'name': 'foo', 'format': 'directory'}],
+        'test.yaml',
+        {},
+        dry_run=False,
+        checksum_dumps=True,
+    ) == [process]
+
+
 def test_dump_databases_runs_mongodump_with_options():
     databases = [{'name': 'foo', 'options': '--stuff=such'}]
     process = flexmock()
@@ -141,6 +208,21 @@ def test_dump_databases_runs_mongodump_with_options():
     assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == [process]
 
 
+def test_build_dump_command_with_dump_parallel_collections_passes_them():
+    assert module.build_dump_command(
+        {'name': 'foo', 'dump_parallel_collections': 8}, 'databases/localhost/foo', 'archive'
+    ) == [
+        'mongodump',
+        '--archive',
+        '--db',
+        'foo',
+        '--numParallelCollections',
+        '8',
+        '>',
+        'databases/localhost/foo',
+    ]
+
+
 def test_dump_databases_runs_mongodumpall_for_all_databases():
     databases = [{'name': 'all'}]
     process = flexmock()
@@ -296,7 +378,7 @@ def test_restore_database_dump_without_extract_process_restores_from_disk():
     flexmock(module).should_receive('make_dump_path')
     flexmock(module.dump).should_receive('make_database_dump_filename').and_return('/dump/path')
     flexmock(module).should_receive('execute_command_with_processes').with_args(
-        ['mongorestore', '--archive', '/dump/path', '--drop', '--db', 'foo'],
+        ['mongorestore', '--archive=/dump/path', '--drop', '--db', 'foo'],
         processes=[],
         output_log_level=logging.DEBUG,
         input_file=None,
@@ -306,3 +388,24 @@ def test_restore_database_dump_without_extract_process_restores_from_disk():
     module.restore_database_dump(
         database_config, 'test.yaml', {}, dry_run=False, extract_process=None
     )
+
+
+def test_build_restore_command_without_extract_process_attaches_dump_file_to_archive_flag():
+    assert module.build_restore_command(None, {'name': 'all'}, 'databases/localhost/all') == [
+        'mongorestore',
+        '--archive=databases/localhost/all',
+    ]
+
+
+def test_build_restore_command_with_restore_insertion_workers_passes_them():
+    assert module.build_restore_command(
+        flexmock(), {'name': 'foo', 'restore_insertion_workers': 8}, 'databases/localhost/foo'
+    ) == [
+        'mongorestore',
+        '--archive',
+        '--drop',
+        '--db',
+        'foo',
+        '--numInsertionWorkersPerCollection',
+        '8',
+    ]
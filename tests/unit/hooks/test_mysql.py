@@ -1,4 +1,6 @@
+import contextlib
 import logging
+import sys
 
 import pytest
 from flexmock import flexmock
@@ -65,6 +67,63 @@ def test_dump_databases_runs_mysqldump_for_each_database():
     assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == processes
 
 
+def test_dump_databases_with_checksum_dumps_starts_checksummed_dumps():
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module).should_receive('database_names_to_dump').and_return(('foo',))
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump')
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.checksum).should_receive('start_checksummed_dump').with_args(
+        ('mysqldump', '--add-drop-database', '--databases', 'foo', '>', 'databases/localhost/foo',),
+        None,
+        'databases/localhost/foo',
+    ).and_return(process).once()
+
+    assert module.dump_databases(
+        [{'name': 'foo'}], 'test.yaml', {}, dry_run=False, checksum_dumps=True
+    ) == [process]
+
+
+def test_dump_databases_with_spool_runs_dumps_to_regular_files():
+    databases = [{'name': 'foo'}]
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module).should_receive('database_names_to_dump').and_return(('foo',))
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump').never()
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump').with_args(
+        'databases/localhost/foo'
+    ).once()
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.dump).should_receive('run_spooled_dumps').with_args(
+        [
+            module.dump.Spooled_dump(
+                (
+                    'mysqldump',
+                    '--add-drop-database',
+                    '--databases',
+                    'foo',
+                    '>',
+                    'databases/localhost/foo',
+                ),
+                None,
+                'databases/localhost/foo',
+            )
+        ],
+        'test.yaml',
+        3,
+    ).and_return([process]).once()
+
+    assert module.dump_databases(
+        databases, 'test.yaml', {}, dry_run=False, spool=True, concurrency=3
+    ) == [process]
+
+
 def test_dump_databases_with_dry_run_skips_mysqldump():
     databases = [{'name': 'foo'}, {'name': 'bar'}]
     flexmock(module).should_receive('make_dump_path').and_return('')
@@ -216,6 +275,64 @@ def test_database_names_to_dump_runs_mysql_with_list_options():
     assert module.database_names_to_dump(database, None, 'test.yaml', '') == ('foo', 'bar')
 
 
+def test_dump_databases_with_separate_dumps_runs_mysqldump_for_each_of_all_databases():
+    databases = [{'name': 'all', 'separate_dumps': True}]
+    processes = [flexmock(), flexmock()]
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').with_args(
+        '', 'foo', None
+    ).and_return('databases/localhost/foo')
+    flexmock(module.dump).should_receive('make_database_dump_filename').with_args(
+        '', 'bar', None
+    ).and_return('databases/localhost/bar')
+    flexmock(module).should_receive('database_names_to_dump').and_return(('foo', 'bar'))
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump').twice()
+
+    for name, process in zip(('foo', 'bar'), processes):
+        flexmock(module).should_receive('execute_command').with_args(
+            (
+                'mysqldump',
+                '--add-drop-database',
+                '--single-transaction',
+                '--databases',
+                name,
+                '>',
+                'databases/localhost/{}'.format(name),
+            ),
+            shell=True,
+            extra_environment=None,
+            run_to_completion=False,
+        ).and_return(process).once()
+
+    assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == processes
+
+
+def test_make_database_dump_pattern_with_separate_all_databases_matches_each_dump_for_all():
+    flexmock(module).should_receive('make_dump_path').and_return('databases')
+    flexmock(module.dump).should_receive('make_database_dump_filename').with_args(
+        'databases', '*', hostname='*'
+    ).and_return('databases/*/*').once()
+
+    assert (
+        module.make_database_dump_pattern(
+            [{'name': 'all', 'separate_dumps': True}], 'test.yaml', {}, name='all'
+        )
+        == 'databases/*/*'
+    )
+
+
+def test_make_database_dump_pattern_matches_dump_for_name():
+    flexmock(module).should_receive('make_dump_path').and_return('databases')
+    flexmock(module.dump).should_receive('make_database_dump_filename').with_args(
+        'databases', 'all', hostname='*'
+    ).and_return('databases/*/all').once()
+
+    assert (
+        module.make_database_dump_pattern([{'name': 'all'}], 'test.yaml', {}, name='all')
+        == 'databases/*/all'
+    )
+
+
 def test_dump_databases_errors_for_missing_all_databases():
     databases = [{'name': 'all'}]
     process = flexmock()
@@ -247,6 +364,78 @@ def test_restore_database_dump_runs_mysql_to_restore():
     )
 
 
+def test_restore_database_dump_without_extract_process_restores_from_disk():
+    database_config = [{'name': 'foo'}]
+    dump_file = flexmock()
+    flexmock(module).should_receive('make_dump_path')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return('/dump/path')
+    flexmock(sys.modules['builtins']).should_receive('open').with_args(
+        '/dump/path', 'rb'
+    ).and_return(contextlib.nullcontext(dump_file))
+    flexmock(module).should_receive('execute_command_with_processes').never()
+    flexmock(module).should_receive('execute_command').with_args(
+        ('mysql', '--batch'),
+        output_log_level=logging.DEBUG,
+        input_file=dump_file,
+        extra_environment=None,
+    ).once()
+
+    module.restore_database_dump(
+        database_config, 'test.yaml', {}, dry_run=False, extract_process=None
+    )
+
+
+def test_restore_database_dump_without_extract_process_restores_each_separate_dump_for_all():
+    database_config = [{'name': 'all', 'separate_dumps': True}]
+    flexmock(module).should_receive('make_dump_path').and_return('/dumps')
+    flexmock(module.dump).should_receive('make_database_dump_filename').with_args(
+        '/dumps', 'all', None
+    ).and_return('/dumps/localhost/all')
+    flexmock(module.dump).should_receive('make_database_dump_filename').with_args(
+        '/dumps', '*', None
+    ).and_return('/dumps/localhost/*')
+    flexmock(module.glob).should_receive('glob').with_args('/dumps/localhost/*').and_return(
+        ['/dumps/localhost/foo', '/dumps/localhost/bar']
+    )
+    bar_file = flexmock()
+    foo_file = flexmock()
+    flexmock(sys.modules['builtins']).should_receive('open').with_args(
+        '/dumps/localhost/bar', 'rb'
+    ).and_return(contextlib.nullcontext(bar_file)).ordered()
+    flexmock(sys.modules['builtins']).should_receive('open').with_args(
+        '/dumps/localhost/foo', 'rb'
+    ).and_return(contextlib.nullcontext(foo_file)).ordered()
+    flexmock(module).should_receive('execute_command').with_args(
+        ('mysql', '--batch'),
+        output_log_level=logging.DEBUG,
+        input_file=bar_file,
+        extra_environment=None,
+    ).once()
+    flexmock(module).should_receive('execute_command').with_args(
+        ('mysql', '--batch'),
+        output_log_level=logging.DEBUG,
+        input_file=foo_file,
+        extra_environment=None,
+    ).once()
+
+    module.restore_database_dump(
+        database_config, 'test.yaml', {}, dry_run=False, extract_process=None
+    )
+
+
+def test_restore_database_dump_without_extract_process_or_separate_dumps_for_all_raises():
+    database_config = [{'name': 'all', 'separate_dumps': True}]
+    flexmock(module).should_receive('make_dump_path').and_return('/dumps')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return('/dumps/x')
+    flexmock(module.glob).should_receive('glob').and_return([])
+    flexmock(module).should_receive('execute_command').never()
+
+    with pytest.raises(ValueError):
+        module.restore_database_dump(
+            database_config, 'test.yaml', {}, dry_run=False, extract_process=None
+        )
+
+
 def test_restore_database_dump_errors_on_multiple_database_config():
     database_config = [{'name': 'foo'}, {'name': 'bar'}]
 
@@ -37,6 +37,76 @@ def test_dump_databases_runs_pg_dump_for_each_database():
     assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == processes
 
 
+def test_dump_databases_with_checksum_dumps_starts_checksummed_dumps():
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump')
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.checksum).should_receive('start_checksummed_dump').with_args(
+        (
+            'pg_dump',
+            '--no-password',
+            '--clean',
+            '--if-exists',
+            '--format',
+            'custom',
+            'foo',
+            '>',
+            'databases/localhost/foo',
+        ),
+        {'PGSSLMODE': 'disable'},
+        'databases/localhost/foo',
+    ).and_return(process).once()
+
+    assert module.dump_databases(
+        [{'name': 'foo'}], 'test.yaml', {}, dry_run=False, checksum_dumps=True
+    ) == [process]
+
+
+def test_dump_databases_with_spool_runs_dumps_to_regular_files():
+    databases = [{'name': 'foo'}]
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump').never()
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump').with_args(
+        'databases/localhost/foo'
+    ).once()
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.dump).should_receive('run_spooled_dumps').with_args(
+        [
+            module.dump.Spooled_dump(
+                (
+                    'pg_dump',
+                    '--no-password',
+                    '--clean',
+                    '--if-exists',
+                    '--format',
+                    'custom',
+                    'foo',
+                    '>',
+                    'databases/localhost/foo',
+                ),
+                {'PGSSLMODE': 'disable'},
+                'databases/localhost/foo',
+            )
+        ],
+        'test.yaml',
+        3,
+    ).and_return([process]).once()
+
+    assert module.dump_databases(
+        databases, 'test.yaml', {}, dry_run=False, spool=True, concurrency=3
+    ) == [process]
+
+
 def test_dump_databases_with_dry_run_skips_pg_dump():
     databases = [{'name': 'foo'}, {'name': 'bar'}]
     flexmock(module).should_receive('make_dump_path').and_return('')
@@ -141,7 +211,7 @@ def test_make_extra_environment_maps_options_to_environment():
     assert extra_env == expected
 
 
-def test_dump_databases_runs_pg_dump_with_directory_format():
+def test_dump_databases_runs_pg_dump_with_directory_format_to_completion():
     databases = [{'name': 'foo', 'format': 'directory'}]
     process = flexmock()
     flexmock(module).should_receive('make_dump_path').and_return('')
@@ -151,7 +221,77 @@ def test_dump_databases_runs_pg_dump_with_directory_format():
     flexmock(module.dump).should_receive('create_parent_directory_for_dump')
     flexmock(module.dump).should_receive('create_named_pipe_for_dump').never()
     flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('execute_command').never()
+    flexmock(module.dump).should_receive('run_spooled_dumps').with_args(
+        [
+            module.dump.Spooled_dump(
+                (
+                    'pg_dump',
+                    '--no-password',
+                    '--clean',
+                    '--if-exists',
+                    '--format',
+                    'directory',
+                    '--file',
+                    'databases/localhost/foo',
+                    'foo',
+                ),
+                {'PGSSLMODE': 'disable'},
+                'databases/localhost/foo',
+            )
+        ],
+        'test.yaml',
+        None,
+    ).and_return([process]).once()
+
+    assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == [process]
+
 
+def test_dump_databases_runs_pg_dump_with_directory_format_and_jobs():
+    databases = [{'name': 'foo', 'format': 'directory', 'jobs': 8}]
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump')
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module.dump).should_receive('run_spooled_dumps').with_args(
+        [
+            module.dump.Spooled_dump(
+                (
+                    'pg_dump',
+                    '--no-password',
+                    '--clean',
+                    '--if-exists',
+                    '--format',
+                    'directory',
+                    '--file',
+                    'databases/localhost/foo',
+                    '--jobs',
+                    '8',
+                    'foo',
+                ),
+                {'PGSSLMODE': 'disable'},
+                'databases/localhost/foo',
+            )
+        ],
+        'test.yaml',
+        None,
+    ).and_return([process]).once()
+
+    assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == [process]
+
+
+def test_dump_databases_ignores_jobs_for_custom_format():
+    databases = [{'name': 'foo', 'jobs': 8}]
+    process = flexmock()
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.dump).should_receive('create_named_pipe_for_dump')
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
     flexmock(module).should_receive('execute_command').with_args(
         (
             'pg_dump',
@@ -159,10 +299,10 @@ def test_dump_databases_runs_pg_dump_with_directory_format():
             '--clean',
             '--if-exists',
             '--format',
-            'directory',
-            '--file',
-            'databases/localhost/foo',
+            'custom',
             'foo',
+            '>',
+            'databases/localhost/foo',
         ),
         shell=True,
         extra_environment={'PGSSLMODE': 'disable'},
@@ -436,3 +576,151 @@ def test_restore_database_dump_without_extract_process_restores_from_disk():
     module.restore_database_dump(
         database_config, 'test.yaml', {}, dry_run=False, extract_process=None
     )
+
+
+def test_restore_database_dump_without_extract_process_runs_psql_with_file_for_all_database_dump():
+    database_config = [{'name': 'all'}]
+
+    flexmock(module).should_receive('make_dump_path')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return('/dump/path')
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('execute_command_with_processes').with_args(
+        ('psql', '--no-password', '-f', '/dump/path'),
+        processes=[],
+        output_log_level=logging.DEBUG,
+        input_file=None,
+        extra_environment={'PGSSLMODE': 'disable'},
+        borg_local_path='borg',
+    ).once()
+    flexmock(module).should_receive('execute_command').with_args(
+        ('psql', '--no-password', '--quiet', '--command', 'ANALYZE'),
+        extra_environment={'PGSSLMODE': 'disable'},
+    ).once()
+
+    module.restore_database_dump(
+        database_config, 'test.yaml', {}, dry_run=False, extract_process=None
+    )
+
+
+def test_restore_database_dump_with_jobs_and_without_extract_process_restores_in_parallel():
+    database_config = [{'name': 'foo', 'format': 'directory', 'jobs': 8}]
+
+    flexmock(module).should_receive('make_dump_path')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return('/dump/path')
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('execute_command_with_processes').with_args(
+        (
+            'pg_restore',
+            '--no-password',
+            '--if-exists',
+            '--exit-on-error',
+            '--clean',
+            '--dbname',
+            'foo',
+            '--jobs',
+            '8',
+            '/dump/path',
+        ),
+        processes=[],
+        output_log_level=logging.DEBUG,
+        input_file=None,
+        extra_environment={'PGSSLMODE': 'disable'},
+        borg_local_path='borg',
+    ).once()
+    flexmock(module).should_receive('execute_command').with_args(
+        ('psql', '--no-password', '--quiet', '--dbname', 'foo', '--command', 'ANALYZE'),
+        extra_environment={'PGSSLMODE': 'disable'},
+    ).once()
+
+    module.restore_database_dump(
+        database_config, 'test.yaml', {}, dry_run=False, extract_process=None
+    )
+
+
+def test_restore_database_dump_with_analyze_off_skips_analyze():
+    database_config = [{'name': 'foo', 'analyze': False}]
+    extract_process = flexmock(stdout=flexmock())
+
+    flexmock(module).should_receive('make_dump_path')
+    flexmock(module.dump).should_receive('make_database_dump_filename')
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('execute_command_with_processes').once()
+    flexmock(module).should_receive('execute_command').never()
+
+    module.restore_database_dump(
+        database_config, 'test.yaml', {}, dry_run=False, extract_process=extract_process
+    )
+
+
+def test_make_analyze_command_without_analyze_jobs_runs_psql_analyze():
+    assert module.make_analyze_command({'name': 'foo', 'hostname': 'db', 'port': 1234}) == (
+        'psql',
+        '--no-password',
+        '--quiet',
+        '--host',
+        'db',
+        '--port',
+        '1234',
+        '--dbname',
+        'foo',
+        '--command',
+        'ANALYZE',
+    )
+
+
+def test_make_analyze_command_for_all_databases_runs_psql_analyze_without_dbname():
+    assert module.make_analyze_command({'name': 'all'}) == (
+        'psql',
+        '--no-password',
+        '--quiet',
+        '--command',
+        'ANALYZE',
+    )
+
+
+def test_make_analyze_command_with_analyze_jobs_runs_vacuumdb_in_stages():
+    assert module.make_analyze_command({'name': 'foo', 'analyze_jobs': 4, 'username': 'bob'}) == (
+        'vacuumdb',
+        '--no-password',
+        '--analyze-in-stages',
+        '--jobs',
+        '4',
+        '--username',
+        'bob',
+        '--dbname',
+        'foo',
+    )
+
+
+def test_make_analyze_command_with_analyze_jobs_for_all_databases_runs_vacuumdb_for_all():
+    assert module.make_analyze_command({'name': 'all', 'analyze_jobs': 4}) == (
+        'vacuumdb',
+        '--no-password',
+        '--analyze-in-stages',
+        '--jobs',
+        '4',
+        '--all',
+    )
+
+
+def test_analyze_database_runs_analyze_command():
+    flexmock(module).should_receive('make_extra_environment').and_return({'PGSSLMODE': 'disable'})
+    flexmock(module).should_receive('make_analyze_command').and_return(('vacuumdb',))
+    flexmock(module).should_receive('execute_command').with_args(
+        ('vacuumdb',), extra_environment={'PGSSLMODE': 'disable'}
+    ).once()
+
+    module.analyze_database([{'name': 'foo'}], 'test.yaml', {}, dry_run=False)
+
+
+def test_analyze_database_with_dry_run_skips_analyze():
+    flexmock(module).should_receive('execute_command').never()
+
+    module.analyze_database([{'name': 'foo'}], 'test.yaml', {}, dry_run=True)
+
+
+def test_analyze_database_errors_on_multiple_database_config():
+    flexmock(module).should_receive('execute_command').never()
+
+    with pytest.raises(ValueError):
+        module.analyze_database([{'name': 'foo'}, {'name': 'bar'}], 'test.yaml', {}, dry_run=False)
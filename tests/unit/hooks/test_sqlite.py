@@ -0,0 +1,135 @@
+import pytest
+from flexmock import flexmock
+
+from borgmatic.hooks import sqlite as module
+
+
+def test_dump_databases_copies_each_database_to_dump_file():
+    databases = [{'name': 'foo', 'path': '/data/foo.db'}, {'name': 'bar', 'path': '/data/bar.db'}]
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    ).and_return('databases/localhost/bar')
+    flexmock(module.os.path).should_receive('exists').and_return(True)
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump')
+    flexmock(module).should_receive('copy_database').with_args(
+        '/data/foo.db', 'databases/localhost/foo'
+    ).once()
+    flexmock(module).should_receive('copy_database').with_args(
+        '/data/bar.db', 'databases/localhost/bar'
+    ).once()
+
+    flexmock(module.dump, DUMP_DURATIONS={})
+
+    assert module.dump_databases(databases, 'test.yaml', {}, dry_run=False) == []
+    assert set(module.dump.DUMP_DURATIONS) == {'databases/localhost/foo', 'databases/localhost/bar'}
+
+
+def test_dump_databases_with_dry_run_skips_copy():
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.os.path).should_receive('exists').and_return(True)
+    flexmock(module.dump).should_receive('create_parent_directory_for_dump').never()
+    flexmock(module).should_receive('copy_database').never()
+
+    assert (
+        module.dump_databases(
+            [{'name': 'foo', 'path': '/data/foo.db'}], 'test.yaml', {}, dry_run=True
+        )
+        == []
+    )
+
+
+def test_dump_databases_with_missing_database_raises():
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.os.path).should_receive('exists').and_return(False)
+    flexmock(module).should_receive('copy_database').never()
+
+    with pytest.raises(ValueError):
+        module.dump_databases(
+            [{'name': 'foo', 'path': '/data/foo.db'}], 'test.yaml', {}, dry_run=False
+        )
+
+
+def test_restore_database_dump_copies_dump_to_database():
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.os.path).should_receive('exists').and_return(True)
+    flexmock(module).should_receive('copy_database').with_args(
+        'databases/localhost/foo', '/data/foo.db'
+    ).once()
+
+    module.restore_database_dump(
+        [{'name': 'foo', 'path': '/data/foo.db'}],
+        'test.yaml',
+        {},
+        dry_run=False,
+        extract_process=None,
+    )
+
+
+def test_restore_database_dump_errors_on_multiple_database_config():
+    flexmock(module).should_receive('copy_database').never()
+
+    with pytest.raises(ValueError):
+        module.restore_database_dump(
+            [{'name': 'foo', 'path': '/foo.db'}, {'name': 'bar', 'path': '/bar.db'}],
+            'test.yaml',
+            {},
+            dry_run=False,
+            extract_process=None,
+        )
+
+
+def test_restore_database_dump_with_extract_process_raises():
+    flexmock(module).should_receive('copy_database').never()
+
+    with pytest.raises(ValueError):
+        module.restore_database_dump(
+            [{'name': 'foo', 'path': '/data/foo.db'}],
+            'test.yaml',
+            {},
+            dry_run=False,
+            extract_process=flexmock(),
+        )
+
+
+def test_restore_database_dump_with_missing_dump_raises():
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module.os.path).should_receive('exists').and_return(False)
+    flexmock(module).should_receive('copy_database').never()
+
+    with pytest.raises(ValueError):
+        module.restore_database_dump(
+            [{'name': 'foo', 'path': '/data/foo.db'}],
+            'test.yaml',
+            {},
+            dry_run=False,
+            extract_process=None,
+        )
+
+
+def test_restore_database_dump_with_dry_run_skips_copy():
+    flexmock(module).should_receive('make_dump_path').and_return('')
+    flexmock(module.dump).should_receive('make_database_dump_filename').and_return(
+        'databases/localhost/foo'
+    )
+    flexmock(module).should_receive('copy_database').never()
+
+    module.restore_database_dump(
+        [{'name': 'foo', 'path': '/data/foo.db'}],
+        'test.yaml',
+        {},
+        dry_run=True,
+        extract_process=None,
+    )
@@ -1,3 +1,6 @@
+import asyncio
+import io
+import logging
 import subprocess
 
 import pytest
@@ -55,6 +58,13 @@ def test_output_buffer_for_process_returns_stderr_when_stdout_excluded():
     assert module.output_buffer_for_process(process, exclude_stdouts=[flexmock(), stdout]) == stderr
 
 
+def test_output_buffer_for_process_returns_stderr_when_stdout_not_piped():
+    stderr = flexmock()
+    process = flexmock(stdout=None, stderr=stderr)
+
+    assert module.output_buffer_for_process(process, exclude_stdouts=[flexmock()]) == stderr
+
+
 def test_output_buffer_for_process_returns_stdout_when_not_excluded():
     stdout = flexmock()
     process = flexmock(stdout=stdout)
@@ -65,6 +75,249 @@ def test_output_buffer_for_process_returns_stdout_when_not_excluded():
     )
 
 
+def test_start_process_records_start_time():
+    process = flexmock()
+    flexmock(module.subprocess).should_receive('Popen').with_args(
+        ['foo', 'bar'], stdout=None
+    ).and_return(process)
+    flexmock(module.time).should_receive('monotonic').and_return(5.0)
+    start_times = {}
+    flexmock(module, PROCESS_START_TIMES=start_times)
+
+    assert module.start_process(['foo', 'bar'], stdout=None) == process
+    assert start_times == {process: 5.0}
+
+
+@pytest.mark.parametrize(
+    'args,expected_name',
+    (
+        (['/usr/bin/borg', 'create'], 'borg'),
+        (['pg_dump', 'foo'], 'pg_dump'),
+        ('pg_dumpall --no-password > /tmp/dump', 'pg_dumpall'),
+    ),
+)
+def test_command_name_for_process_returns_program_basename(args, expected_name):
+    assert module.command_name_for_process(flexmock(args=args)) == expected_name
+
+
+def test_exit_code_for_wait_status_returns_exit_status():
+    flexmock(module.os).should_receive('WIFSIGNALED').and_return(False)
+    flexmock(module.os).should_receive('WEXITSTATUS').and_return(3)
+
+    assert module.exit_code_for_wait_status(0x300) == 3
+
+
+def test_exit_code_for_wait_status_returns_negative_signal_for_killed_process():
+    flexmock(module.os).should_receive('WIFSIGNALED').and_return(True)
+    flexmock(module.os).should_receive('WTERMSIG').and_return(9)
+
+    assert module.exit_code_for_wait_status(9) == -9
+
+
+def test_record_process_usage_remembers_usage_and_forgets_start_time():
+    process = flexmock(args=['/usr/bin/borg', 'create'], returncode=0, pid=123)
+    start_times = {process: 5.0}
+    usages = []
+    usages_by_process = {}
+    flexmock(
+        module,
+        PROCESS_START_TIMES=start_times,
+        PROCESS_USAGES=usages,
+        PROCESS_USAGES_BY_PROCESS=usages_by_process,
+    )
+    flexmock(module.time).should_receive('monotonic').and_return(7.5)
+    flexmock(module.sys, platform='linux')
+    flexmock(module.logger).should_receive('debug').once()
+    flexmock(module.trace).should_receive('record_event').with_args(
+        'borg',
+        'process',
+        5.0,
+        7.5,
+        pid=123,
+        thread_id=123,
+        args={'command': '/usr/bin/borg create', 'exit_code': 0},
+    ).once()
+
+    module.record_process_usage(
+        process, flexmock(ru_utime=1.0, ru_stime=0.5, ru_maxrss=2048),
+    )
+
+    expected_usage = module.Process_usage(
+        command_name='borg',
+        wall_seconds=2.5,
+        user_seconds=1.0,
+        system_seconds=0.5,
+        max_rss_bytes=2048 * 1024,
+    )
+    assert start_times == {}
+    assert usages == [expected_usage]
+    assert usages_by_process == {process: expected_usage}
+
+
+def test_usage_for_process_returns_usage_of_reaped_process():
+    process = flexmock()
+    usage = flexmock()
+    flexmock(module, PROCESS_USAGES_BY_PROCESS={process: usage})
+
+    assert module.usage_for_process(process) == usage
+
+
+def test_usage_for_process_with_unreaped_process_returns_none():
+    flexmock(module, PROCESS_USAGES_BY_PROCESS={})
+
+    assert module.usage_for_process(flexmock()) is None
+
+
+def test_reap_process_with_exited_process_returns_existing_exit_code():
+    flexmock(module.os).should_receive('wait4').never()
+
+    assert module.reap_process(flexmock(returncode=1)) == 1
+
+
+def test_reap_process_waits_for_process_and_records_usage():
+    process = flexmock(pid=123, returncode=None)
+    resource_usage = flexmock()
+    flexmock(module.os).should_receive('wait4').with_args(123, 0).and_return(
+        (123, 0, resource_usage)
+    )
+    flexmock(module).should_receive('exit_code_for_wait_status').and_return(0)
+    flexmock(module).should_receive('record_process_usage').with_args(
+        process, resource_usage
+    ).once()
+
+    assert module.reap_process(process) == 0
+    assert process.returncode == 0
+
+
+def test_reap_process_without_block_and_running_process_returns_none():
+    process = flexmock(pid=123, returncode=None)
+    flexmock(module.os).should_receive('wait4').with_args(123, module.os.WNOHANG).and_return(
+        (0, 0, flexmock())
+    )
+    flexmock(module).should_receive('record_process_usage').never()
+
+    assert module.reap_process(process, block=False) is None
+    assert process.returncode is None
+
+
+def test_reap_process_with_already_reaped_process_falls_back_to_wait():
+    process = flexmock(pid=123, returncode=None)
+    start_times = {process: 5.0}
+    flexmock(module, PROCESS_START_TIMES=start_times)
+    flexmock(module.os).should_receive('wait4').and_raise(ChildProcessError)
+    process.should_receive('wait').and_return(2)
+    flexmock(module).should_receive('record_process_usage').never()
+
+    assert module.reap_process(process) == 2
+    assert start_times == {}
+
+
+def test_summarize_process_usages_totals_usages_per_command_by_descending_wall_time():
+    flexmock(
+        module,
+        PROCESS_USAGES=[
+            module.Process_usage('pg_dump', 1.0, 0.5, 0.25, 10 * 1024 * 1024),
+            module.Process_usage('borg', 10.0, 4.0, 1.0, 100 * 1024 * 1024),
+            module.Process_usage('pg_dump', 2.0, 1.0, 0.25, 20 * 1024 * 1024),
+        ],
+    )
+
+    assert module.summarize_process_usages() == [
+        'Resource usage for borg: 1 process, 10.00s wall, 4.00s user CPU, 1.00s system CPU, '
+        '100.0 MiB max RSS',
+        'Resource usage for pg_dump: 2 processes, 3.00s wall, 1.50s user CPU, 0.50s system CPU, '
+        '20.0 MiB max RSS',
+    ]
+
+
+def test_summarize_process_usages_without_usages_returns_empty_list():
+    flexmock(module, PROCESS_USAGES=[])
+
+    assert module.summarize_process_usages() == []
+
+
+def test_read_output_lines_returns_complete_lines_and_keeps_partial_line():
+    output_buffer = flexmock(fileno=lambda: 3)
+    partial_lines = {output_buffer: bytearray(b'hel')}
+    flexmock(module.os).should_receive('read').and_return(b'lo\n\nthere  \npart')
+
+    lines = module.read_output_lines(output_buffer, partial_lines)
+
+    assert lines == (['hello', 'there'], False)
+    assert partial_lines[output_buffer] == bytearray(b'part')
+
+
+def test_read_output_lines_without_newline_returns_no_lines():
+    output_buffer = flexmock(fileno=lambda: 3)
+    partial_lines = {output_buffer: bytearray()}
+    flexmock(module.os).should_receive('read').and_return(b'part')
+
+    lines = module.read_output_lines(output_buffer, partial_lines)
+
+    assert lines == ([], False)
+    assert partial_lines[output_buffer] == bytearray(b'part')
+
+
+def test_read_output_lines_at_end_of_output_returns_partial_line():
+    output_buffer = flexmock(fileno=lambda: 3)
+    partial_lines = {output_buffer: bytearray(b'part')}
+    flexmock(module.os).should_receive('read').and_return(b'')
+
+    lines = module.read_output_lines(output_buffer, partial_lines)
+
+    assert lines == (['part'], True)
+    assert partial_lines[output_buffer] == bytearray()
+
+
+def test_read_output_lines_at_end_of_output_without_partial_line_returns_no_lines():
+    output_buffer = flexmock(fileno=lambda: 3)
+    partial_lines = {output_buffer: bytearray()}
+    flexmock(module.os).should_receive('read').and_return(b'')
+
+    assert module.read_output_lines(output_buffer, partial_lines) == ([], True)
+
+
+def test_log_lines_logs_each_line_and_remembers_most_recent_lines():
+    flexmock(module.logger).should_receive('log').twice()
+    last_lines = module.collections.deque(['old'], maxlen=2)
+
+    module.log_lines(['foo', 'bar'], output_log_level=20, last_lines=last_lines)
+
+    assert list(last_lines) == ['foo', 'bar']
+
+
+def test_log_lines_with_output_line_handler_logs_handled_lines():
+    flexmock(module.logger).should_receive('log').with_args(20, 'FOO').once()
+    flexmock(module.logger).should_receive('log').with_args(20, 'BAR').once()
+    last_lines = module.collections.deque(maxlen=5)
+    handled_lines = {'foo': 'FOO\nBAR', 'baz': None}
+
+    module.log_lines(
+        ['foo', 'baz'],
+        output_log_level=20,
+        last_lines=last_lines,
+        output_line_handler=handled_lines.get,
+    )
+
+    assert list(last_lines) == ['FOO', 'BAR']
+
+
+def test_execute_command_with_output_line_handler_passes_it_for_process():
+    full_command = ['foo', 'bar']
+    process = flexmock(stdout=None)
+    handler = flexmock()
+    flexmock(module.subprocess).should_receive('Popen').and_return(process)
+    flexmock(module).should_receive('log_outputs').with_args(
+        (process,),
+        (None, None),
+        logging.INFO,
+        borg_local_path=None,
+        output_line_handlers={process: handler},
+    ).once()
+
+    module.execute_command(full_command, output_line_handler=handler)
+
+
 def test_execute_command_calls_full_command():
     full_command = ['foo', 'bar']
     flexmock(module.os, environ={'a': 'b'})
@@ -195,6 +448,21 @@ def test_execute_command_calls_full_command_with_working_directory():
     assert output is None
 
 
+def test_execute_command_calls_full_command_with_umask():
+    full_command = ['foo', 'bar']
+    flexmock(module.os, environ={'a': 'b'})
+    flexmock(module.subprocess).should_receive('Popen').replace_with(
+        lambda command, **kwargs: flexmock(stdout=None, preexec_fn=kwargs['preexec_fn'])
+    ).once()
+    flexmock(module).should_receive('log_outputs')
+    flexmock(module.os).should_receive('umask').with_args(0o77).never()
+
+    process = module.execute_command(full_command, umask=0o77, run_to_completion=False)
+
+    flexmock(module.os).should_receive('umask').with_args(0o77).once()
+    process.preexec_fn()
+
+
 def test_execute_command_without_run_to_completion_returns_process():
     full_command = ['foo', 'bar']
     process = flexmock()
@@ -217,22 +485,36 @@ def test_execute_command_captures_output():
     full_command = ['foo', 'bar']
     expected_output = '[]'
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('check_output').with_args(
-        full_command, shell=False, env=None, cwd=None
-    ).and_return(flexmock(decode=lambda: expected_output)).once()
+    flexmock(module).should_receive('start_process').with_args(
+        full_command, stdout=module.subprocess.PIPE, shell=False, env=None, cwd=None,
+    ).and_return(flexmock(stdout=io.BytesIO(expected_output.encode()))).once()
+    flexmock(module).should_receive('reap_process').and_return(0)
 
     output = module.execute_command(full_command, output_log_level=None)
 
     assert output == expected_output
 
 
+def test_execute_command_captures_output_raises_on_error():
+    full_command = ['foo', 'bar']
+    flexmock(module.os, environ={'a': 'b'})
+    flexmock(module).should_receive('start_process').and_return(
+        flexmock(stdout=io.BytesIO(b'error'), args=full_command)
+    )
+    flexmock(module).should_receive('reap_process').and_return(1)
+
+    with pytest.raises(subprocess.CalledProcessError):
+        module.execute_command(full_command, output_log_level=None)
+
+
 def test_execute_command_captures_output_with_shell():
     full_command = ['foo', 'bar']
     expected_output = '[]'
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('check_output').with_args(
-        'foo bar', shell=True, env=None, cwd=None
-    ).and_return(flexmock(decode=lambda: expected_output)).once()
+    flexmock(module).should_receive('start_process').with_args(
+        'foo bar', stdout=module.subprocess.PIPE, shell=True, env=None, cwd=None,
+    ).and_return(flexmock(stdout=io.BytesIO(expected_output.encode()))).once()
+    flexmock(module).should_receive('reap_process').and_return(0)
 
     output = module.execute_command(full_command, output_log_level=None, shell=True)
 
@@ -243,9 +525,14 @@ def test_execute_command_captures_output_with_extra_environment():
     full_command = ['foo', 'bar']
     expected_output = '[]'
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('check_output').with_args(
-        full_command, shell=False, env={'a': 'b', 'c': 'd'}, cwd=None
-    ).and_return(flexmock(decode=lambda: expected_output)).once()
+    flexmock(module).should_receive('start_process').with_args(
+        full_command,
+        stdout=module.subprocess.PIPE,
+        shell=False,
+        env={'a': 'b', 'c': 'd'},
+        cwd=None,
+    ).and_return(flexmock(stdout=io.BytesIO(expected_output.encode()))).once()
+    flexmock(module).should_receive('reap_process').and_return(0)
 
     output = module.execute_command(
         full_command, output_log_level=None, shell=False, extra_environment={'c': 'd'}
@@ -258,9 +545,10 @@ def test_execute_command_captures_output_with_working_directory():
     full_command = ['foo', 'bar']
     expected_output = '[]'
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('check_output').with_args(
-        full_command, shell=False, env=None, cwd='/working'
-    ).and_return(flexmock(decode=lambda: expected_output)).once()
+    flexmock(module).should_receive('start_process').with_args(
+        full_command, stdout=module.subprocess.PIPE, shell=False, env=None, cwd='/working',
+    ).and_return(flexmock(stdout=io.BytesIO(expected_output.encode()))).once()
+    flexmock(module).should_receive('reap_process').and_return(0)
 
     output = module.execute_command(
         full_command, output_log_level=None, shell=False, working_directory='/working'
@@ -269,166 +557,266 @@ def test_execute_command_captures_output_with_working_directory():
     assert output == expected_output
 
 
-def test_execute_command_with_processes_calls_full_command():
+def test_execute_command_with_processes_runs_async_engine():
     full_command = ['foo', 'bar']
     processes = (flexmock(),)
+    coroutine = flexmock()
+    flexmock(module).should_receive('execute_command_with_processes_async').with_args(
+        full_command, processes, logging.INFO, None, None, False, None, None, 'borg', None
+    ).and_return(coroutine).once()
+    flexmock(module.asyncio).should_receive('run').with_args(coroutine).and_return(None).once()
+
+    output = module.execute_command_with_processes(full_command, processes, borg_local_path='borg')
+
+    assert output is None
+
+
+def test_start_command_process_starts_command_with_output_piped():
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command,
+    process = flexmock()
+    flexmock(module).should_receive('start_process').with_args(
+        ['foo', 'bar'],
         stdin=None,
         stdout=module.subprocess.PIPE,
         stderr=module.subprocess.STDOUT,
         shell=False,
         env=None,
         cwd=None,
-    ).and_return(flexmock(stdout=None)).once()
-    flexmock(module).should_receive('log_outputs')
-
-    output = module.execute_command_with_processes(full_command, processes)
+    ).and_return(process).once()
 
-    assert output is None
+    assert module.start_command_process(['foo', 'bar'], None, None, False, None, None) == process
 
 
-def test_execute_command_with_processes_calls_full_command_with_output_file():
-    full_command = ['foo', 'bar']
-    processes = (flexmock(),)
-    output_file = flexmock(name='test')
+def test_start_command_process_with_output_file_pipes_stderr():
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command,
+    output_file = flexmock(name='test')
+    flexmock(module).should_receive('start_process').with_args(
+        ['foo', 'bar'],
         stdin=None,
         stdout=output_file,
         stderr=module.subprocess.PIPE,
         shell=False,
         env=None,
         cwd=None,
-    ).and_return(flexmock(stderr=None)).once()
-    flexmock(module).should_receive('log_outputs')
-
-    output = module.execute_command_with_processes(full_command, processes, output_file=output_file)
+    ).once()
 
-    assert output is None
+    module.start_command_process(['foo', 'bar'], output_file, None, False, None, None)
 
 
-def test_execute_command_with_processes_calls_full_command_without_capturing_output():
-    full_command = ['foo', 'bar']
-    processes = (flexmock(),)
+def test_start_command_process_without_capturing_output_does_not_pipe():
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command, stdin=None, stdout=None, stderr=None, shell=False, env=None, cwd=None
-    ).and_return(flexmock(wait=lambda: 0)).once()
-    flexmock(module).should_receive('exit_code_indicates_error').and_return(False)
-    flexmock(module).should_receive('log_outputs')
+    flexmock(module).should_receive('start_process').with_args(
+        ['foo', 'bar'], stdin=None, stdout=None, stderr=None, shell=False, env=None, cwd=None,
+    ).once()
 
-    output = module.execute_command_with_processes(
-        full_command, processes, output_file=module.DO_NOT_CAPTURE
-    )
-
-    assert output is None
+    module.start_command_process(['foo', 'bar'], module.DO_NOT_CAPTURE, None, False, None, None)
 
 
-def test_execute_command_with_processes_calls_full_command_with_input_file():
-    full_command = ['foo', 'bar']
-    processes = (flexmock(),)
-    input_file = flexmock(name='test')
+def test_start_command_process_with_input_file_passes_it_as_stdin():
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command,
+    input_file = flexmock(name='test')
+    flexmock(module).should_receive('start_process').with_args(
+        ['foo', 'bar'],
         stdin=input_file,
         stdout=module.subprocess.PIPE,
         stderr=module.subprocess.STDOUT,
         shell=False,
         env=None,
         cwd=None,
-    ).and_return(flexmock(stdout=None)).once()
-    flexmock(module).should_receive('log_outputs')
+    ).once()
 
-    output = module.execute_command_with_processes(full_command, processes, input_file=input_file)
-
-    assert output is None
+    module.start_command_process(['foo', 'bar'], None, input_file, False, None, None)
 
 
-def test_execute_command_with_processes_calls_full_command_with_shell():
-    full_command = ['foo', 'bar']
-    processes = (flexmock(),)
+def test_start_command_process_with_shell_starts_command_within_shell():
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        ' '.join(full_command),
+    flexmock(module).should_receive('start_process').with_args(
+        'foo bar',
         stdin=None,
         stdout=module.subprocess.PIPE,
         stderr=module.subprocess.STDOUT,
         shell=True,
         env=None,
         cwd=None,
-    ).and_return(flexmock(stdout=None)).once()
-    flexmock(module).should_receive('log_outputs')
-
-    output = module.execute_command_with_processes(full_command, processes, shell=True)
+    ).once()
 
-    assert output is None
+    module.start_command_process(['foo', 'bar'], None, None, True, None, None)
 
 
-def test_execute_command_with_processes_calls_full_command_with_extra_environment():
-    full_command = ['foo', 'bar']
-    processes = (flexmock(),)
+def test_start_command_process_with_extra_environment_and_working_directory_passes_them():
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command,
+    flexmock(module).should_receive('start_process').with_args(
+        ['foo', 'bar'],
         stdin=None,
         stdout=module.subprocess.PIPE,
         stderr=module.subprocess.STDOUT,
         shell=False,
         env={'a': 'b', 'c': 'd'},
-        cwd=None,
-    ).and_return(flexmock(stdout=None)).once()
-    flexmock(module).should_receive('log_outputs')
+        cwd='/working',
+    ).once()
+
+    module.start_command_process(['foo', 'bar'], None, None, False, {'c': 'd'}, '/working')
+
+
+def test_start_command_process_with_capture_output_pipes_only_stdout():
+    flexmock(module.os, environ={'a': 'b'})
+    flexmock(module).should_receive('start_process').with_args(
+        ['foo', 'bar'], stdin=None, stdout=module.subprocess.PIPE, shell=False, env=None, cwd=None
+    ).once()
+
+    module.start_command_process(['foo', 'bar'], None, None, False, None, None, capture_output=True)
+
 
-    output = module.execute_command_with_processes(
-        full_command, processes, extra_environment={'c': 'd'}
+def test_kill_processes_kills_only_unreaped_processes():
+    running_process = flexmock(returncode=None)
+    running_process.should_receive('kill').once()
+    exited_process = flexmock(returncode=0)
+    exited_process.should_receive('kill').never()
+
+    module.kill_processes((running_process, exited_process))
+
+
+async def async_return(value=None):
+    return value
+
+
+def test_execute_command_with_processes_async_logs_outputs_of_processes_and_command():
+    full_command = ['foo', 'bar']
+    processes = (flexmock(stdout=flexmock()),)
+    command_process = flexmock()
+    flexmock(module).should_receive('start_command_process').and_return(command_process)
+    flexmock(module).should_receive('log_outputs_async').with_args(
+        processes + (command_process,), (None, None), logging.INFO, None, None
+    ).and_return(async_return()).once()
+
+    asyncio.run(module.execute_command_with_processes_async(full_command, processes))
+
+
+def test_execute_command_with_processes_async_with_output_line_handler_passes_it_for_command():
+    full_command = ['foo', 'bar']
+    processes = (flexmock(stdout=flexmock()),)
+    command_process = flexmock()
+    handler = flexmock()
+    flexmock(module).should_receive('start_command_process').and_return(command_process)
+    flexmock(module).should_receive('log_outputs_async').with_args(
+        processes + (command_process,), (None, None), logging.INFO, None, {command_process: handler}
+    ).and_return(async_return()).once()
+
+    asyncio.run(
+        module.execute_command_with_processes_async(
+            full_command, processes, output_line_handler=handler
+        )
     )
 
-    assert output is None
+
+def test_execute_command_with_processes_async_closes_producer_pipe_after_starting_command():
+    full_command = ['foo', 'bar']
+    input_file = flexmock()
+    input_file.should_receive('close').once()
+    processes = (flexmock(stdout=input_file),)
+    command_process = flexmock()
+    flexmock(module).should_receive('start_command_process').and_return(command_process)
+    flexmock(module).should_receive('log_outputs_async').and_return(async_return())
+
+    asyncio.run(
+        module.execute_command_with_processes_async(full_command, processes, input_file=input_file)
+    )
 
 
-def test_execute_command_with_processes_calls_full_command_with_working_directory():
+def test_execute_command_with_processes_async_does_not_close_other_input_file():
+    full_command = ['foo', 'bar']
+    input_file = flexmock()
+    input_file.should_receive('close').never()
+    processes = (flexmock(stdout=flexmock()),)
+    flexmock(module).should_receive('start_command_process').and_return(flexmock())
+    flexmock(module).should_receive('log_outputs_async').and_return(async_return())
+
+    asyncio.run(
+        module.execute_command_with_processes_async(full_command, processes, input_file=input_file)
+    )
+
+
+def test_execute_command_with_processes_async_without_output_log_level_captures_output():
+    full_command = ['foo', 'bar']
+    processes = (flexmock(stdout=flexmock()),)
+    command_process = flexmock(stdout=flexmock())
+    flexmock(module).should_receive('start_command_process').with_args(
+        full_command, None, None, False, None, None, True
+    ).and_return(command_process).once()
+    reader = flexmock(read=lambda: async_return(b'{"archive": {}}'))
+    transport = flexmock()
+    transport.should_receive('close').once()
+    flexmock(module).should_receive('open_pipe_reader').with_args(
+        command_process.stdout
+    ).and_return(async_return((reader, transport)))
+    flexmock(module).should_receive('log_outputs_async').with_args(
+        processes + (command_process,),
+        (None, None, command_process.stdout),
+        logging.INFO,
+        None,
+        None,
+    ).and_return(async_return()).once()
+
+    output = asyncio.run(
+        module.execute_command_with_processes_async(full_command, processes, output_log_level=None)
+    )
+
+    assert output == '{"archive": {}}'
+
+
+def test_execute_command_with_processes_async_kills_processes_on_error():
     full_command = ['foo', 'bar']
     processes = (flexmock(),)
-    flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command,
-        stdin=None,
-        stdout=module.subprocess.PIPE,
-        stderr=module.subprocess.STDOUT,
-        shell=False,
-        env=None,
-        cwd='/working',
-    ).and_return(flexmock(stdout=None)).once()
-    flexmock(module).should_receive('log_outputs')
 
-    output = module.execute_command_with_processes(
-        full_command, processes, working_directory='/working'
+    flexmock(module).should_receive('start_command_process').and_raise(
+        subprocess.CalledProcessError(1, full_command, 'error')
     )
+    flexmock(module).should_receive('kill_processes').with_args(processes).once()
+    flexmock(module).should_receive('log_outputs_async').never()
 
-    assert output is None
+    with pytest.raises(subprocess.CalledProcessError):
+        asyncio.run(module.execute_command_with_processes_async(full_command, processes))
 
 
-def test_execute_command_with_processes_kills_processes_on_error():
+def test_execute_command_async_logs_output():
+    full_command = ['foo', 'bar']
+    flexmock(module).should_receive('execute_command_with_processes_async').with_args(
+        full_command, (), logging.INFO, None, None, False, None, None, None
+    ).and_return(async_return()).once()
+
+    assert asyncio.run(module.execute_command_async(full_command)) is None
+
+
+def test_execute_command_async_without_output_log_level_captures_output():
     full_command = ['foo', 'bar']
-    process = flexmock(stdout=flexmock(read=lambda count: None))
-    process.should_receive('poll')
-    process.should_receive('kill').once()
-    processes = (process,)
     flexmock(module.os, environ={'a': 'b'})
-    flexmock(module.subprocess).should_receive('Popen').with_args(
-        full_command,
-        stdin=None,
-        stdout=module.subprocess.PIPE,
-        stderr=module.subprocess.STDOUT,
-        shell=False,
-        env=None,
-        cwd=None,
-    ).and_raise(subprocess.CalledProcessError(1, full_command, 'error')).once()
-    flexmock(module).should_receive('log_outputs').never()
+    process = flexmock(stdout=flexmock(), args=full_command)
+    flexmock(module).should_receive('start_process').with_args(
+        full_command, stdin=None, stdout=module.subprocess.PIPE, shell=False, env=None, cwd=None,
+    ).and_return(process)
+    reader = flexmock(read=lambda: async_return(b'output'))
+    transport = flexmock()
+    transport.should_receive('close').once()
+    flexmock(module).should_receive('open_pipe_reader').and_return(
+        async_return((reader, transport))
+    )
+    flexmock(module).should_receive('wait_for_process_async').and_return(async_return(0))
+    flexmock(module).should_receive('execute_command_with_processes_async').never()
+
+    output = asyncio.run(module.execute_command_async(full_command, output_log_level=None))
+
+    assert output == 'output'
+
+
+def test_execute_command_async_without_output_log_level_raises_on_error():
+    full_command = ['foo', 'bar']
+    process = flexmock(stdout=flexmock(), args=full_command)
+    flexmock(module).should_receive('start_process').and_return(process)
+    reader = flexmock(read=lambda: async_return(b'error'))
+    flexmock(module).should_receive('open_pipe_reader').and_return(
+        async_return((reader, flexmock(close=lambda: None)))
+    )
+    flexmock(module).should_receive('wait_for_process_async').and_return(async_return(1))
 
     with pytest.raises(subprocess.CalledProcessError):
-        module.execute_command_with_processes(full_command, processes)
+        asyncio.run(module.execute_command_async(full_command, output_log_level=None))
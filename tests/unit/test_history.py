@@ -0,0 +1,184 @@
+import sqlite3
+
+from flexmock import flexmock
+
+from borgmatic import history as module
+
+
+def make_result(**overrides):
+    result = dict(
+        {column: None for column in module.COLUMNS},
+        timestamp=1000,
+        config_filename='test.yaml',
+        repository='repo',
+        success=1,
+        original_size=1000,
+        create_seconds=10,
+    )
+    result.update(overrides)
+
+    return result
+
+
+def make_connection(throughputs):
+    connection = sqlite3.connect(':memory:')
+    connection.row_factory = sqlite3.Row
+    connection.executescript(module.SCHEMA)
+
+    for throughput in throughputs:
+        connection.execute(
+            'INSERT INTO runs (timestamp, config_filename, repository, success, original_size, create_seconds) VALUES (0, ?, ?, 1, ?, 1)',
+            ('test.yaml', 'repo', throughput),
+        )
+
+    return connection
+
+
+def test_collect_results_combines_samples_and_spans_per_repository():
+    flexmock(module.metrics).should_receive('get_samples').with_args(('test.yaml',)).and_return(
+        [
+            module.metrics.Sample(
+                'borgmatic_database_dump_duration_seconds',
+                (('config', 'test.yaml'), ('repository', 'repo'), ('hook', 'postgresql_databases')),
+                1,
+            ),
+            module.metrics.Sample(
+                'borgmatic_database_dump_duration_seconds',
+                (('config', 'test.yaml'), ('repository', 'repo'), ('hook', 'postgresql_databases')),
+                2,
+            ),
+            module.metrics.Sample(
+                'borgmatic_database_dump_duration_seconds',
+                (('config', 'test.yaml'), ('repository', 'repo'), ('hook', 'mysql_databases')),
+                3,
+            ),
+            module.metrics.Sample(
+                'borgmatic_archive_original_size_bytes',
+                (('config', 'test.yaml'), ('repository', 'repo')),
+                1000,
+            ),
+            module.metrics.Sample(
+                'borgmatic_repository_last_run_timestamp_seconds',
+                (('config', 'test.yaml'), ('repository', 'repo')),
+                1000,
+            ),
+            module.metrics.Sample(
+                'borgmatic_repository_success', (('config', 'test.yaml'), ('repository', 'repo')), 1
+            ),
+            module.metrics.Sample(
+                'borgmatic_archive_files', (('config', 'test.yaml'), ('repository', 'other')), 5
+            ),
+        ]
+    )
+    flexmock(module.timing).should_receive('total_spans').and_return(
+        {('test.yaml', 'repo'): {'create': 5, 'prune': 2}, ('test.yaml', None): {'hook': 1}}
+    )
+
+    assert module.collect_results('test.yaml', 1234) == [
+        {
+            'timestamp': 1234,
+            'config_filename': 'test.yaml',
+            'repository': 'repo',
+            'success': 1,
+            'duration_seconds': 7,
+            'create_seconds': None,
+            'original_size': 1000,
+            'compressed_size': None,
+            'deduplicated_size': None,
+            'file_count': None,
+            'dump_seconds': 5,
+        }
+    ]
+
+
+def test_throughput_without_size_or_duration_returns_none():
+    assert module.throughput(100, 4) == 25
+    assert module.throughput(None, 4) is None
+    assert module.throughput(100, 0) is None
+
+
+def test_find_throughput_regression_with_large_drop_returns_message():
+    message = module.find_throughput_regression(
+        make_connection((300, 100, 200)), make_result(original_size=50, create_seconds=1), 50, 10
+    )
+
+    assert '75% below the median of 200 B/s over the last 3 runs' in message
+
+
+def test_find_throughput_regression_with_small_drop_returns_none():
+    assert (
+        module.find_throughput_regression(
+            make_connection((300, 100, 200)),
+            make_result(original_size=150, create_seconds=1),
+            50,
+            10,
+        )
+        is None
+    )
+
+
+def test_find_throughput_regression_only_considers_given_number_of_runs():
+    assert (
+        module.find_throughput_regression(
+            make_connection((10000, 10000, 100, 100, 100)),
+            make_result(original_size=90, create_seconds=1),
+            50,
+            3,
+        )
+        is None
+    )
+
+
+def test_find_throughput_regression_with_too_few_earlier_runs_returns_none():
+    assert (
+        module.find_throughput_regression(
+            make_connection((300, 200)), make_result(original_size=1, create_seconds=1), 50, 10
+        )
+        is None
+    )
+
+
+def test_find_throughput_regression_for_failed_run_returns_none():
+    assert (
+        module.find_throughput_regression(
+            make_connection((300, 100, 200)),
+            make_result(success=0, original_size=1, create_seconds=1),
+            50,
+            10,
+        )
+        is None
+    )
+
+
+def test_find_throughput_regression_without_throughput_returns_none():
+    assert (
+        module.find_throughput_regression(
+            make_connection((300, 100, 200)), make_result(original_size=None), 50, 10
+        )
+        is None
+    )
+
+
+def test_record_run_without_results_does_not_open_database():
+    flexmock(module).should_receive('collect_results').and_return([])
+    flexmock(module).should_receive('open_database').never()
+
+    assert module.record_run('history.db', 'test.yaml') == []
+
+
+def test_record_run_with_database_error_warns():
+    flexmock(module).should_receive('collect_results').and_return([make_result()])
+    flexmock(module).should_receive('open_database').and_raise(sqlite3.OperationalError)
+    flexmock(module.logger).should_receive('warning').once()
+
+    assert module.record_run('history.db', 'test.yaml') == []
+
+
+def test_format_history_formats_missing_values_as_dashes():
+    lines = module.format_history(
+        [make_result(), make_result(success=0, original_size=None, create_seconds=None)]
+    )
+
+    assert lines[0].split()[:2] == ['Time', 'Result']
+    assert lines[1].split()[2:] == ['success', '-', '10.0s', '1000', 'B', '-', '-', '100', 'B/s']
+    assert lines[2].split()[2:] == ['failed', '-', '-', '-', '-', '-', '-']
@@ -277,3 +277,33 @@ def test_configure_logging_skips_logfile_if_argument_is_none():
     flexmock(module.logging.handlers).should_receive('WatchedFileHandler').never()
 
     module.configure_logging(console_log_level=logging.INFO, log_file=None)
+
+
+def test_add_log_prefix_without_prefix_passes_message_through():
+    module.set_log_prefix(None)
+
+    assert module.add_log_prefix('message') == 'message'
+
+
+def test_add_log_prefix_with_prefix_prepends_it():
+    module.set_log_prefix('repo')
+
+    try:
+        assert module.add_log_prefix('message') == 'repo: message'
+    finally:
+        module.set_log_prefix(None)
+
+
+def test_get_log_config_filename_returns_config_filename_set_for_current_thread():
+    module.set_log_config_filename('test.yaml')
+
+    try:
+        assert module.get_log_config_filename() == 'test.yaml'
+    finally:
+        module.set_log_config_filename(None)
+
+
+def test_get_log_config_filename_without_config_filename_set_returns_none():
+    module.set_log_config_filename(None)
+
+    assert module.get_log_config_filename() is None
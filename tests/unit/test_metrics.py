@@ -0,0 +1,159 @@
+import pytest
+from flexmock import flexmock
+
+from borgmatic import metrics as module
+
+
+def test_record_sample_adds_config_and_repository_labels():
+    samples = []
+    flexmock(module, SAMPLES=samples)
+
+    module.record_sample('borgmatic_foo', 5, 'test.yaml', 'repo', hook='postgresql_databases')
+
+    assert samples == [
+        module.Sample(
+            'borgmatic_foo',
+            (('config', 'test.yaml'), ('repository', 'repo'), ('hook', 'postgresql_databases')),
+            5,
+        )
+    ]
+
+
+def test_record_repository_result_records_success_and_timestamp():
+    flexmock(module.time).should_receive('time').and_return(1234.5)
+    flexmock(module).should_receive('record_sample').with_args(
+        'borgmatic_repository_success', 0, 'test.yaml', 'repo'
+    ).once()
+    flexmock(module).should_receive('record_sample').with_args(
+        'borgmatic_repository_last_run_timestamp_seconds', 1234.5, 'test.yaml', 'repo'
+    ).once()
+
+    module.record_repository_result('test.yaml', 'repo', succeeded=False)
+
+
+def test_record_archive_stats_records_duration_sizes_and_file_count():
+    flexmock(module).should_receive('record_sample').with_args(
+        'borgmatic_archive_duration_seconds', 2.5, 'test.yaml', 'repo'
+    ).once()
+    for metric_name, value in (
+        ('borgmatic_archive_original_size_bytes', 100),
+        ('borgmatic_archive_compressed_size_bytes', 50),
+        ('borgmatic_archive_deduplicated_size_bytes', 10),
+        ('borgmatic_archive_files', 3),
+    ):
+        flexmock(module).should_receive('record_sample').with_args(
+            metric_name, value, 'test.yaml', 'repo'
+        ).once()
+
+    module.record_archive_stats(
+        'test.yaml',
+        'repo',
+        '{"archive": {"duration": 2.5, "stats": {"original_size": 100, "compressed_size": 50, '
+        '"deduplicated_size": 10, "nfiles": 3}}}',
+    )
+
+
+def test_record_archive_stats_ignores_missing_stats():
+    flexmock(module).should_receive('record_sample').never()
+
+    module.record_archive_stats('test.yaml', 'repo', '{"repository": {}}')
+
+
+def test_record_archive_stats_with_invalid_json_warns():
+    flexmock(module).should_receive('record_sample').never()
+    flexmock(module.logger).should_receive('warning').once()
+
+    module.record_archive_stats('test.yaml', 'repo', 'not json')
+
+
+def test_record_database_dump_durations_records_total_wall_time_per_hook():
+    processes = (flexmock(), flexmock(), flexmock())
+    flexmock(module.execute).should_receive('usage_for_process').with_args(processes[0]).and_return(
+        flexmock(wall_seconds=1.5)
+    )
+    flexmock(module.execute).should_receive('usage_for_process').with_args(processes[1]).and_return(
+        flexmock(wall_seconds=2.0)
+    )
+    flexmock(module.execute).should_receive('usage_for_process').with_args(processes[2]).and_return(
+        None
+    )
+    flexmock(module).should_receive('record_sample').with_args(
+        'borgmatic_database_dump_duration_seconds',
+        3.5,
+        'test.yaml',
+        'repo',
+        hook='postgresql_databases',
+    ).once()
+
+    module.record_database_dump_durations(
+        'test.yaml',
+        'repo',
+        {'postgresql_databases': processes[:2], 'mysql_databases': processes[2:]},
+    )
+
+
+@pytest.mark.parametrize(
+    'value,expected_value',
+    (('plain', 'plain'), ('a"b', 'a\\"b'), ('a\\b', 'a\\\\b'), ('a\nb', 'a\\nb'), (None, 'None')),
+)
+def test_escape_label_value_escapes_special_characters(value, expected_value):
+    assert module.escape_label_value(value) == expected_value
+
+
+def test_format_sample_formats_labels_and_value():
+    sample = module.Sample('borgmatic_foo', (('config', 'test.yaml'), ('repository', 'repo')), 5)
+
+    assert module.format_sample(sample) == 'borgmatic_foo{config="test.yaml",repository="repo"} 5.0'
+
+
+def test_format_textfile_includes_samples_and_phase_durations_for_given_configs():
+    flexmock(
+        module,
+        SAMPLES=[
+            module.Sample('borgmatic_repository_success', (('config', 'test.yaml'),), 1),
+            module.Sample('borgmatic_repository_success', (('config', 'other.yaml'),), 0),
+        ],
+    )
+    totals = {('test.yaml', None): {'monitor start ping': 0.5}}
+    totals[('other.yaml', 'repo')] = {'create': 1.0}
+    flexmock(module.timing).should_receive('total_spans').and_return(totals)
+
+    assert module.format_textfile(['test.yaml']).splitlines() == [
+        '# HELP borgmatic_phase_duration_seconds Seconds that each phase of the last run took',
+        '# TYPE borgmatic_phase_duration_seconds gauge',
+        'borgmatic_phase_duration_seconds{config="test.yaml",repository="",phase="monitor start ping"} 0.5',
+        '# HELP borgmatic_repository_success Whether actions for the repository last succeeded',
+        '# TYPE borgmatic_repository_success gauge',
+        'borgmatic_repository_success{config="test.yaml"} 1.0',
+    ]
+
+
+def test_format_textfile_without_metrics_returns_empty_string():
+    flexmock(module, SAMPLES=[])
+    flexmock(module.timing).should_receive('total_spans').and_return({})
+
+    assert module.format_textfile(['test.yaml']) == ''
+
+
+def test_write_textfiles_writes_metrics_for_configs_sharing_each_path():
+    flexmock(module).should_receive('format_textfile').with_args(
+        ['foo.yaml', 'baz.yaml']
+    ).and_return('shared')
+    flexmock(module).should_receive('format_textfile').with_args(['bar.yaml']).and_return('bar')
+    flexmock(module).should_receive('write_textfile').with_args('/shared.prom', 'shared').once()
+    flexmock(module).should_receive('write_textfile').with_args('/bar.prom', 'bar').once()
+
+    module.write_textfiles(
+        {
+            'foo.yaml': {'hooks': {'metrics_textfile': '/shared.prom'}},
+            'bar.yaml': {'hooks': {'metrics_textfile': '/bar.prom'}},
+            'baz.yaml': {'hooks': {'metrics_textfile': '/shared.prom'}},
+            'quux.yaml': {},
+        }
+    )
+
+
+def test_write_textfiles_without_metrics_textfile_writes_nothing():
+    flexmock(module).should_receive('write_textfile').never()
+
+    module.write_textfiles({'foo.yaml': {'hooks': {}}})
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic import timing as module
+
+
+def test_span_records_elapsed_time():
+    spans = []
+    flexmock(module, SPANS=spans)
+    flexmock(module.time).should_receive('monotonic').and_return(10.0).and_return(12.5)
+    flexmock(module.trace).should_receive('record_event').with_args(
+        'create', 'action', 10.0, 12.5, args={'config_filename': 'test.yaml', 'repository': 'repo'}
+    ).once()
+
+    with module.span('test.yaml', 'repo', 'create'):
+        pass
+
+    assert spans == [module.Span('test.yaml', 'repo', 'create', 2.5)]
+
+
+def test_span_records_elapsed_time_when_code_raises():
+    spans = []
+    flexmock(module, SPANS=spans)
+    flexmock(module.time).should_receive('monotonic').and_return(10.0).and_return(11.0)
+    flexmock(module.trace).should_receive('record_event')
+
+    with pytest.raises(ValueError):
+        with module.span('test.yaml', 'repo', 'create'):
+            raise ValueError()
+
+    assert spans == [module.Span('test.yaml', 'repo', 'create', 1.0)]
+
+
+def test_total_spans_adds_repeated_phases_and_puts_config_level_spans_first():
+    flexmock(
+        module,
+        SPANS=[
+            module.Span('test.yaml', 'repo', 'create', 1.0),
+            module.Span('test.yaml', 'repo', 'remove database dumps', 0.5),
+            module.Span('test.yaml', 'repo', 'create', 2.0),
+            module.Span('test.yaml', None, 'monitor finish ping', 0.25),
+            module.Span('other.yaml', 'repo', 'prune', 3.0),
+        ],
+    )
+
+    totals = module.total_spans()
+
+    assert list(totals.items()) == [
+        (('test.yaml', None), {'monitor finish ping': 0.25}),
+        (('test.yaml', 'repo'), {'create': 3.0, 'remove database dumps': 0.5}),
+        (('other.yaml', 'repo'), {'prune': 3.0}),
+    ]
+
+
+def test_format_timings_breaks_down_phases_per_config_and_repository():
+    flexmock(module).should_receive('total_spans').and_return(
+        {
+            ('test.yaml', None): {'monitor start ping': 0.25},
+            ('test.yaml', 'repo'): {'create': 3.0, 'prune': 1.5},
+        }
+    )
+
+    assert module.format_timings().splitlines() == [
+        'Timings for test.yaml:',
+        '  monitor start ping                 0.25s',
+        '  repo:',
+        '    create                           3.00s',
+        '    prune                            1.50s',
+        '    total                            4.50s',
+    ]
+
+
+def test_format_timings_without_spans_returns_empty_string():
+    flexmock(module).should_receive('total_spans').and_return({})
+
+    assert module.format_timings() == ''
+
+
+def test_format_timings_json_outputs_list_of_phases_per_config_and_repository():
+    flexmock(module).should_receive('total_spans').and_return(
+        {('test.yaml', None): {'monitor start ping': 0.25}, ('test.yaml', 'repo'): {'create': 3.0}}
+    )
+
+    assert json.loads(module.format_timings_json()) == [
+        {
+            'config_filename': 'test.yaml',
+            'repository': None,
+            'phases': {'monitor start ping': 0.25},
+        },
+        {'config_filename': 'test.yaml', 'repository': 'repo', 'phases': {'create': 3.0}},
+    ]
@@ -0,0 +1,79 @@
+import json
+
+import pytest
+from flexmock import flexmock
+
+from borgmatic import trace as module
+
+
+def test_record_event_defaults_to_borgmatic_process_and_current_thread():
+    events = []
+    flexmock(module, EVENTS=events)
+    flexmock(module.os).should_receive('getpid').and_return(100)
+    flexmock(module.threading).should_receive('get_ident').and_return(200)
+
+    module.record_event('create', 'action', 1.0, 2.0)
+
+    assert events == [module.Event('create', 'action', 1.0, 2.0, 100, 200, {})]
+
+
+def test_record_event_with_pid_and_thread_id_uses_them():
+    events = []
+    flexmock(module, EVENTS=events)
+
+    module.record_event('borg', 'process', 1.0, 2.0, pid=5, thread_id=5, args={'exit_code': 0})
+
+    assert events == [module.Event('borg', 'process', 1.0, 2.0, 5, 5, {'exit_code': 0})]
+
+
+def test_event_records_event_when_code_raises():
+    flexmock(module.time).should_receive('monotonic').and_return(1.0).and_return(3.0)
+    flexmock(module).should_receive('record_event').with_args(
+        'postgresql_databases dump_databases', 'hook', 1.0, 3.0, args={'log_prefix': 'repo'}
+    ).once()
+
+    with pytest.raises(ValueError):
+        with module.event('postgresql_databases dump_databases', 'hook', log_prefix='repo'):
+            raise ValueError()
+
+
+def test_microseconds_converts_seconds():
+    assert module.microseconds(1.5) == 1500000
+
+
+def test_format_trace_outputs_complete_events_in_start_order_and_names_processes():
+    flexmock(module.os).should_receive('getpid').and_return(100)
+    flexmock(
+        module,
+        EVENTS=[
+            module.Event('pg_dump', 'process', 1.5, 2.0, 5, 5, {'exit_code': 0}),
+            module.Event('create', 'action', 1.0, 3.0, 100, 200, {}),
+        ],
+    )
+
+    trace = json.loads(module.format_trace())
+
+    assert trace['traceEvents'] == [
+        {'name': 'process_name', 'ph': 'M', 'pid': 100, 'args': {'name': 'borgmatic'}},
+        {'name': 'process_name', 'ph': 'M', 'pid': 5, 'args': {'name': 'pg_dump'}},
+        {
+            'name': 'create',
+            'cat': 'action',
+            'ph': 'X',
+            'ts': 1000000,
+            'dur': 2000000,
+            'pid': 100,
+            'tid': 200,
+            'args': {},
+        },
+        {
+            'name': 'pg_dump',
+            'cat': 'process',
+            'ph': 'X',
+            'ts': 1500000,
+            'dur': 500000,
+            'pid': 5,
+            'tid': 5,
+            'args': {'exit_code': 0},
+        },
+    ]